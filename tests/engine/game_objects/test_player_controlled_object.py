@@ -4,6 +4,7 @@ import pytest
 
 from thegame.engine import BaseGame, Map
 from thegame.engine.game_objects import (
+    GameObject,
     InteractiveGameObject,
     PlayerCharacter,
     PlayerControlledObject,
@@ -217,3 +218,44 @@ def test_player_character_interacts_with_topmost_igo():
 
     assert igo.interact.called
     assert not igo2.interact.called
+
+
+@pytest.mark.parametrize(
+    "up, down, left, right", [(True, False, False, False), (False, False, True, False)]
+)
+def test_player_character_cannot_move_off_the_map(up, down, left, right):
+    pc = PlayerCharacter("sprite.png")
+    sheet = [[None, None], [None, None]]
+    test_map = Map(sheet, [[pc, None], [None, None]], sheet, sheet)
+    game = BaseGame(initial_map=test_map)
+    game.register_player_controlled_object(pc, 0, 0)
+
+    pc.move(game, up, down, left, right)
+
+    assert game.player_controlled_objects[pc] == (0, 0)
+
+
+def test_player_character_cannot_move_onto_the_foreground():
+    pc = PlayerCharacter("sprite.png")
+    sheet = [[None, None]]
+    test_map = Map([[None, GameObject("wall.png")]], [[pc, None]], sheet, sheet)
+    game = BaseGame(initial_map=test_map)
+    game.register_player_controlled_object(pc, 0, 0)
+
+    pc.move(game, right=True)
+
+    assert game.player_controlled_objects[pc] == (0, 0)
+    assert test_map.character_sheet == [[pc, None]]
+
+
+def test_player_character_moving_updates_passability():
+    pc = PlayerCharacter("sprite.png")
+    sheet = [[None, None]]
+    test_map = Map(sheet, [[pc, None]], sheet, sheet)
+    game = BaseGame(initial_map=test_map)
+    game.register_player_controlled_object(pc, 0, 0)
+
+    pc.move(game, right=True)
+
+    assert test_map.is_passable(0, 0)
+    assert not test_map.is_passable(1, 0)
@@ -0,0 +1,147 @@
+import pytest
+
+from tests.engine.network.test_server import (
+    connect,
+    generate_game,
+    leave,
+    spawn,
+    step,
+)
+from thegame.engine import Map
+from thegame.engine.camera import Camera
+from thegame.engine.game_objects import GameObject
+from thegame.engine.network import GameServer, protocol
+from thegame.engine.network.interest import InterestGrid
+
+
+def test_only_subscribers_whose_area_covers_a_tile_are_interested():
+    grid = InterestGrid(40, 40, cell_size=8)
+    grid.subscribe("a", 0, 0, 10, 10)
+    grid.subscribe("b", 5, 5, 10, 10)
+
+    assert grid.interested(2, 2) == ["a"]
+    assert sorted(grid.interested(7, 7)) == ["a", "b"]
+    assert grid.interested(12, 12) == ["b"]
+    assert grid.interested(30, 30) == []
+    assert grid.interested(-1, 0) == []
+
+
+def test_resubscribing_replaces_the_area():
+    grid = InterestGrid(40, 40, cell_size=8)
+    grid.subscribe("a", 0, 0, 10, 10)
+
+    assert grid.subscribe("a", 30, 30, 20, 20) == (30, 30, 40, 40)
+    assert grid.interested(2, 2) == []
+    assert grid.interested(39, 39) == ["a"]
+
+    grid.unsubscribe("a")
+
+    assert "a" not in grid
+    assert grid.interested(39, 39) == []
+
+
+def test_cells_only_hold_nearby_subscribers():
+    grid = InterestGrid(64, 64, cell_size=8)
+    for subscriber in range(64):
+        x, y = subscriber % 8, subscriber // 8
+        grid.subscribe(subscriber, x * 8, y * 8, 8, 8)
+
+    assert all(len(cell) == 1 for cell in grid._cells)
+    assert grid.interested(20, 20) == [2 * 8 + 2]
+
+
+def test_cells_must_be_at_least_a_tile():
+    with pytest.raises(ValueError):
+        InterestGrid(10, 10, cell_size=0)
+
+
+@pytest.fixture
+def server():
+    server = GameServer(
+        generate_game(40, 40),
+        spawn=spawn,
+        leave=leave,
+        interest_margin=1,
+        interest_cell_size=8,
+    )
+    yield server
+    server.close()
+
+
+def watch(server, client, camera_x, camera_y):
+    """ Send a 5x5 view around camera_x, camera_y, and wait for the server to
+        take it into account."""
+    client.send_view(Camera(5, 5, camera_x, camera_y))
+    connection = server.clients[client.client_id]
+    for _ in range(1000):
+        server.tick()
+        if connection.view == client.view and not connection.view_changed:
+            break
+    assert client.wait_for(lambda: client.server_tick == server.tick_count)
+
+
+def test_clients_are_only_sent_changes_they_can_see(server):
+    near = connect(server)
+    far = connect(server)
+    watch(server, near, 2, 2)
+    watch(server, far, 30, 30)
+    step(server, near, far)
+
+    # The players on row 1 are out of the far client's view.
+    assert len(near.entities) == 2
+    assert far.entities == {}
+
+    server.game.active_screen.swap((0, 0), (3, 3), Map.FOREGROUND_SHEET_INDEX)
+    step(server, near, far)
+
+    assert near.game_map.foreground_sheet[3][3].sprite_location == "wall.png"
+    assert far.game_map.foreground_sheet[0][0].sprite_location == "wall.png"
+    far_state_size = server.clients[far.client_id].last_state_size
+    assert far_state_size == protocol.STATE_HEADER.size
+
+    server.game.active_screen.set_tile(
+        (30, 30), Map.FOREGROUND_SHEET_INDEX, GameObject("rock.png")
+    )
+    step(server, near, far)
+
+    assert far.game_map.foreground_sheet[30][30].sprite_location == "rock.png"
+    assert near.game_map.foreground_sheet[30][30] is None
+
+    near.close()
+    far.close()
+
+
+def test_moving_a_view_sends_what_came_into_it(server):
+    near = connect(server)
+    far = connect(server)
+    watch(server, far, 30, 30)
+    server.game.active_screen.swap((0, 0), (3, 3), Map.FOREGROUND_SHEET_INDEX)
+    step(server, near, far)
+
+    watch(server, far, 2, 2)
+
+    assert far.game_map.foreground_sheet[0][0] is None
+    assert far.game_map.foreground_sheet[3][3].sprite_location == "wall.png"
+    assert len(far.entities) == 2
+
+    near.close()
+    far.close()
+
+
+def test_entities_leaving_a_view_are_removed(server):
+    near = connect(server)
+    watch(server, near, 2, 2)
+    player = server.clients[near.client_id].player
+
+    server.game.active_screen.swap((1, 1), (20, 1), Map.CHARACTER_SHEET_INDEX)
+    server.game.player_controlled_objects[player] = (20, 1)
+    step(server, near)
+
+    assert player.entity not in near.entities
+
+    server.game.active_screen.swap((20, 1), (1, 1), Map.CHARACTER_SHEET_INDEX)
+    server.game.player_controlled_objects[player] = (1, 1)
+    step(server, near)
+
+    assert near.entities[player.entity][:2] == (1, 1)
+    near.close()
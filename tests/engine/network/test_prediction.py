@@ -0,0 +1,215 @@
+import time
+
+import pygame
+
+from tests.engine.network.test_server import generate_game, leave, spawn
+from thegame.engine import Map
+from thegame.engine.camera import Camera
+from thegame.engine.game_objects import GameObject, PlayerCharacter
+from thegame.engine.network import (
+    ClientPrediction,
+    GameClient,
+    GameServer,
+    LatencyProxy,
+    protocol,
+)
+from thegame.engine.scroll_buffer import ScrollBuffer
+from thegame.engine.tile_renderer import TileRenderer
+
+
+class FakeClient:
+    """ Stands in for a GameClient, with messages given by the test."""
+
+    def __init__(self, game_map):
+        self.game_map = game_map
+        self.entities = {}
+        self.server_tick = 0
+        self.acknowledged = 0
+        self.player_entity = None
+        self.input_sequence = 0
+        self.listeners = []
+
+    def register_message_listener(self, listener):
+        self.listeners.append(listener)
+
+    def send_input(self, pressed_keys):
+        self.input_sequence += 1
+        return self.input_sequence
+
+    def receive(self, kind, **attributes):
+        for name, value in attributes.items():
+            setattr(self, name, value)
+
+        for listener in self.listeners:
+            listener(kind)
+
+
+def generate_client():
+    """ A fake client controlling entity 0, at 1,1 of a 4x4 map with a wall at
+        0,1."""
+    game_map = Map(*[[[None] * 4 for _ in range(4)] for _ in range(4)], validate=False)
+    game_map.set_tile((0, 1), Map.FOREGROUND_SHEET_INDEX, GameObject("wall.png"))
+    game_map.set_tile((1, 1), Map.CHARACTER_SHEET_INDEX, GameObject("pc.png"))
+
+    client = FakeClient(game_map)
+    client.receive(
+        protocol.WORLD_MESSAGE, entities={0: (1, 1, PlayerCharacter.NORTH)}
+    )
+    client.receive(protocol.ACK_MESSAGE, player_entity=0)
+
+    return client
+
+
+def test_inputs_are_predicted_before_the_server_handles_them():
+    client = generate_client()
+    prediction = ClientPrediction(client)
+
+    prediction.send_input(["s"])
+    prediction.send_input(["a"])
+
+    assert prediction.positions()[0] == (0, 2, PlayerCharacter.NORTH)
+    assert len(prediction.pending) == 2
+
+
+def test_predictions_stop_at_impassable_tiles():
+    client = generate_client()
+    prediction = ClientPrediction(client)
+
+    prediction.send_input(["a"])
+
+    assert prediction.predicted_position == (1, 1)
+
+
+def test_unacknowledged_inputs_are_replayed_over_the_server_position():
+    client = generate_client()
+    prediction = ClientPrediction(client)
+    for keys in (["s"], ["s"], ["d"]):
+        prediction.send_input(keys)
+
+    client.receive(
+        protocol.STATE_MESSAGE,
+        server_tick=1,
+        entities={0: (1, 2, PlayerCharacter.NORTH)},
+    )
+    client.receive(protocol.ACK_MESSAGE, acknowledged=1)
+
+    assert prediction.predicted_position == (2, 3)
+    assert [sequence for sequence, _, _ in prediction.pending] == [2, 3]
+    assert prediction.corrections == 0
+
+    # The server refuses the last move.
+    client.receive(
+        protocol.STATE_MESSAGE,
+        server_tick=2,
+        entities={0: (1, 3, PlayerCharacter.NORTH)},
+    )
+    client.receive(protocol.ACK_MESSAGE, acknowledged=3)
+
+    assert prediction.predicted_position == (1, 3)
+    assert not prediction.pending
+    assert prediction.corrections == 1
+    assert prediction.report().inputs == 3
+
+
+def test_other_entities_are_interpolated_between_states():
+    now = [0]
+    client = generate_client()
+    prediction = ClientPrediction(
+        client, tick_length=1, interpolation_ticks=2, clock=lambda: now[0]
+    )
+
+    client.receive(
+        protocol.STATE_MESSAGE,
+        server_tick=1,
+        entities={0: (1, 1, PlayerCharacter.NORTH), 5: (0, 3, PlayerCharacter.EAST)},
+    )
+    now[0] = 10
+    client.receive(
+        protocol.STATE_MESSAGE,
+        server_tick=3,
+        entities={0: (1, 1, PlayerCharacter.NORTH), 5: (2, 3, PlayerCharacter.EAST)},
+    )
+
+    # It only started moving after tick 2, where it still was at 0,3.
+    now[0] = 10.5
+    assert prediction.positions()[5] == (0, 3, PlayerCharacter.EAST)
+    now[0] = 11.5
+    assert prediction.positions()[5] == (1, 3, PlayerCharacter.EAST)
+    now[0] = 13
+    assert prediction.positions()[5] == (2, 3, PlayerCharacter.EAST)
+
+
+def test_drawn_frames_show_predicted_moves_before_they_are_acknowledged():
+    client = generate_client()
+    prediction = ClientPrediction(client)
+
+    tile_images = {}
+    for sprite_location, colour in (("wall.png", (0, 0, 255)), ("pc.png", (255, 0, 0))):
+        tile_images[sprite_location] = pygame.Surface((8, 8))
+        tile_images[sprite_location].fill(colour)
+    scroll_buffer = ScrollBuffer(
+        Camera(3, 3, 1, 1, 8, 8),
+        TileRenderer(tile_images, skipped_sheets=(Map.CHARACTER_SHEET_INDEX,)),
+    )
+    screen = pygame.Surface((24, 24))
+
+    prediction.send_input(["s"])
+    scroll_buffer.update(client.game_map)
+    scroll_buffer.draw(screen, sprites=prediction.sprites())
+
+    assert prediction.pending
+    assert screen.get_at((8, 16)) == (255, 0, 0, 255)
+    assert screen.get_at((8, 8)) == (0, 0, 0, 255)
+    assert screen.get_at((0, 8)) == (0, 0, 255, 255)
+
+
+def pump(server, prediction, condition, timeout=5.0):
+    """ Tick the server and poll the client until condition() is true."""
+
+    deadline = time.perf_counter() + timeout
+    while not condition():
+        assert time.perf_counter() < deadline
+
+        server.tick()
+        prediction.poll()
+        time.sleep(0.002)
+
+
+def test_prediction_hides_the_latency_of_a_slow_connection():
+    server = GameServer(generate_game(), spawn=spawn, leave=leave)
+    proxy = LatencyProxy(server.address, latency=0.05).start()
+    client = GameClient(*proxy.address)
+    prediction = ClientPrediction(client)
+    pump(server, prediction, lambda: prediction.predicted_position is not None)
+
+    prediction.send_input(["s"])
+    entity = client.player_entity
+
+    # Drawn moved straight away, though the server hasn't seen the input.
+    assert prediction.positions()[entity][:2] == (1, 2)
+    assert client.entities[entity][:2] == (1, 1)
+
+    pump(server, prediction, lambda: not prediction.pending)
+
+    assert client.entities[entity][:2] == (1, 2)
+    report = prediction.report()
+    assert report.inputs == 1
+    assert report.corrections == 0
+    assert report.mean_confirmation >= 0.1
+    assert report.max_display < report.mean_confirmation
+
+    # A move the server refuses is undone once it says so.
+    prediction.send_input(["s"])
+    server.game.active_screen.set_tile(
+        (1, 3), Map.FOREGROUND_SHEET_INDEX, GameObject("wall.png")
+    )
+    assert prediction.predicted_position == (1, 3)
+
+    pump(server, prediction, lambda: not prediction.pending)
+
+    assert prediction.predicted_position == (1, 2)
+    assert prediction.report().corrections == 1
+
+    client.close()
+    proxy.close()
+    server.close()
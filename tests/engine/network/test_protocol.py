@@ -0,0 +1,61 @@
+import numpy
+
+from thegame.engine.network import protocol
+
+
+def test_world_messages_round_trip():
+    tile_ids = numpy.arange(4 * 2 * 3, dtype=numpy.int32).reshape(4, 2, 3)
+    entities = numpy.array([(7, 1, 2, 3)], dtype=protocol.ENTITY)
+
+    message = protocol.encode_world(5, 2, tile_ids, ["a.png", "b.png"], entities)
+    tick, client_id, decoded_ids, palette, decoded_entities = protocol.decode_world(
+        message
+    )
+
+    assert protocol.message_kind(message) == protocol.WORLD_MESSAGE
+    assert (tick, client_id, palette) == (5, 2, ["a.png", "b.png"])
+    assert numpy.array_equal(decoded_ids, tile_ids)
+    assert decoded_entities.tolist() == [(7, 1, 2, 3)]
+
+
+def test_state_messages_round_trip():
+    tiles = numpy.array([(1, 2, 3, -1), (0, 4, 5, 0)], dtype=protocol.TILE)
+    entities = numpy.array([(1, -1, 9, 2)], dtype=protocol.ENTITY)
+
+    message = protocol.encode_state(9, [(0, "wall.png")], tiles, entities, [3, 4])
+    tick, palette_entries, decoded_tiles, decoded_entities, removed = (
+        protocol.decode_state(message)
+    )
+
+    assert tick == 9
+    assert palette_entries == [(0, "wall.png")]
+    assert decoded_tiles.tolist() == [(1, 2, 3, -1), (0, 4, 5, 0)]
+    assert decoded_entities.tolist() == [(1, -1, 9, 2)]
+    assert removed.tolist() == [3, 4]
+
+
+def test_empty_states_are_just_a_header():
+    message = protocol.encode_state(
+        1,
+        [],
+        numpy.zeros(0, dtype=protocol.TILE),
+        numpy.zeros(0, dtype=protocol.ENTITY),
+        [],
+    )
+
+    assert len(message) == protocol.STATE_HEADER.size
+
+
+def test_input_messages_round_trip():
+    message = protocol.encode_input(12, ["w", "\r"])
+
+    assert protocol.decode_input(message) == (12, ["w", "\r"])
+
+
+def test_reader_waits_for_whole_messages():
+    reader = protocol.MessageReader()
+    data = protocol.frame(b"first") + protocol.frame(b"second")
+
+    assert reader.feed(data[:7]) == []
+    assert reader.feed(data[7:12]) == [b"first"]
+    assert reader.feed(data[12:]) == [b"second"]
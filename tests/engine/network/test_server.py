@@ -0,0 +1,152 @@
+import pytest
+
+from thegame.engine import BaseGame, Map
+from thegame.engine.game_objects import GameObject, PlayerCharacter
+from thegame.engine.network import GameClient, GameServer
+
+
+def generate_game(width=20, height=20):
+    """ A game on a grass map with a wall at 0,0."""
+    foreground_sheet = [[None] * width for _ in range(height)]
+    foreground_sheet[0][0] = GameObject("wall.png")
+    background_sheet = [
+        [GameObject("grass.png") for _ in range(width)] for _ in range(height)
+    ]
+
+    return BaseGame(
+        initial_map=Map(
+            foreground_sheet,
+            [[None] * width for _ in range(height)],
+            [[None] * width for _ in range(height)],
+            background_sheet,
+        )
+    )
+
+
+def spawn(game, client_id):
+    """ Put a player character for each client on the second row."""
+    player = PlayerCharacter("pc.png", name=f"client {client_id}")
+    game.active_screen.set_tile((client_id, 1), Map.CHARACTER_SHEET_INDEX, player)
+    game.register_player_controlled_object(player, client_id, 1)
+
+    return player
+
+
+def leave(game, client_id, player):
+    x, y = game.player_controlled_objects[player]
+    del game.player_controlled_objects[player]
+    game.active_screen.set_tile((x, y), Map.CHARACTER_SHEET_INDEX, None)
+
+
+@pytest.fixture
+def server():
+    server = GameServer(generate_game(), spawn=spawn, leave=leave)
+    yield server
+    server.close()
+
+
+def connect(server):
+    client = GameClient(*server.address)
+    server.tick()
+    assert client.wait_for(lambda: client.server_tick == server.tick_count)
+
+    return client
+
+
+def step(server, *clients):
+    """ Run a server tick, and wait for every client to catch up with it."""
+    server.tick()
+    for client in clients:
+        assert client.wait_for(lambda: client.server_tick == server.tick_count)
+
+
+def sprite_location(game_map, sheet, x, y):
+    tile = game_map.tile_sheets[sheet][y][x]
+    return tile and tile.sprite_location
+
+
+def test_joining_clients_get_the_whole_world(server):
+    client = connect(server)
+
+    assert client.client_id == 1
+    assert sprite_location(client.game_map, Map.FOREGROUND_SHEET_INDEX, 0, 0) == (
+        "wall.png"
+    )
+    assert sprite_location(client.game_map, Map.CHARACTER_SHEET_INDEX, 1, 1) == (
+        "pc.png"
+    )
+    assert sprite_location(client.game_map, Map.BACKGROUND_SHEET_INDEX, 5, 5) == (
+        "grass.png"
+    )
+    assert list(client.entities.values()) == [(1, 1, PlayerCharacter.NORTH)]
+    client.close()
+
+
+def test_inputs_move_the_clients_player(server):
+    client = connect(server)
+
+    client.send_input(["s"])
+    # The input can arrive after the next tick has started, so give it two.
+    for _ in range(2):
+        step(server, client)
+
+    assert list(client.entities.values()) == [(1, 2, PlayerCharacter.NORTH)]
+    assert sprite_location(client.game_map, Map.CHARACTER_SHEET_INDEX, 1, 1) is None
+    assert sprite_location(client.game_map, Map.CHARACTER_SHEET_INDEX, 1, 2) == (
+        "pc.png"
+    )
+    assert server.clients[1].acknowledged == 1
+    client.close()
+
+
+def test_every_client_sees_the_others_changes(server):
+    first = connect(server)
+    second = connect(server)
+    step(server, first, second)
+
+    assert first.game_map.character_sheet[1][2] is not None
+    assert len(first.entities) == len(second.entities) == 2
+
+    second.close()
+    for _ in range(2):
+        step(server, first)
+
+    assert 2 not in server.clients
+    assert len(first.entities) == 1
+    assert first.game_map.character_sheet[1][2] is None
+    first.close()
+
+
+@pytest.mark.parametrize("size", [20, 200])
+def test_deltas_grow_with_changes_not_map_size(size):
+    server = GameServer(generate_game(size, size))
+    client = connect(server)
+
+    step(server, client)
+    unchanged_size = server.last_state_size
+
+    server.game.active_screen.swap((0, 0), (3, 3), Map.FOREGROUND_SHEET_INDEX)
+    step(server, client)
+
+    # A header, and then 9 bytes for each of the two tiles which changed.
+    assert server.last_state_size == unchanged_size + 2 * 9
+    assert client.game_map.foreground_sheet[3][3].sprite_location == "wall.png"
+    assert client.game_map.foreground_sheet[0][0] is None
+
+    client.close()
+    server.close()
+
+
+def test_serving_a_new_map_resends_the_world():
+    server = GameServer(generate_game())
+    client = connect(server)
+    new_map = Map([[GameObject("new.png")]], [[None]], [[None]], [[None]])
+    server.game.register_map("new", new_map)
+    server.game.active_screen = new_map
+
+    step(server, client)
+
+    assert (client.game_map.width, client.game_map.height) == (1, 1)
+    assert client.game_map.foreground_sheet[0][0].sprite_location == "new.png"
+    client.close()
+    server.close()
@@ -0,0 +1,190 @@
+from unittest.mock import Mock
+
+import pygame
+import pytest
+
+from thegame.engine import Button, Map
+from thegame.engine.animation import Animation, AnimationClock, AnimationLayer
+from thegame.engine.camera import Camera
+from thegame.engine.game_objects import GameObject
+from thegame.engine.scroll_buffer import ScrollBuffer
+from thegame.engine.tile_renderer import TileRenderer
+
+RED = (255, 0, 0, 255)
+GREEN = (0, 255, 0, 255)
+BLUE = (0, 0, 255, 255)
+
+
+def generate_sprite_sheet():
+    """ A 2x2 sheet of 4x4 frames, coloured red, green, blue and then red."""
+    sheet = pygame.Surface((8, 8))
+    sheet.fill(RED)
+    sheet.fill(GREEN, (4, 0, 4, 4))
+    sheet.fill(BLUE, (0, 4, 4, 4))
+
+    return sheet
+
+
+def generate_clock(**animation_options):
+    animation = Animation("flicker.png", 4, 4, **animation_options)
+    animation.decode(generate_sprite_sheet())
+
+    clock = AnimationClock()
+    clock.register("flicker", animation)
+
+    return clock
+
+
+def generate_renderer(clock):
+    images = {"grass.png": pygame.Surface((4, 4))}
+    for index, frame in enumerate(clock.animations["flicker"].frames):
+        images[clock.image_key("flicker", index)] = frame
+
+    return TileRenderer(images, animations=clock)
+
+
+def generate_animated_map(width, height):
+    """ A map of grass, with a flickering tile on every other column."""
+    background_sheet = [
+        [
+            GameObject("grass.png", animation="flicker" if x % 2 else None)
+            for x in range(width)
+        ]
+        for _ in range(height)
+    ]
+
+    return Map(
+        [[None] * width for _ in range(height)],
+        [[None] * width for _ in range(height)],
+        [[None] * width for _ in range(height)],
+        background_sheet,
+    )
+
+
+def test_decode_cuts_every_frame_from_the_sheet():
+    animation = Animation("flicker.png", 4, 4)
+
+    frames = animation.decode(generate_sprite_sheet())
+
+    assert animation.frame_count == 4
+    assert [frame.get_at((0, 0)) for frame in frames] == [RED, GREEN, BLUE, RED]
+    assert all(frame.get_parent() is not None for frame in frames)
+
+
+def test_decode_raises_when_the_sheet_is_too_small():
+    animation = Animation("flicker.png", 4, 4, frame_count=5)
+
+    with pytest.raises(Animation.SpriteSheetTooSmallException):
+        animation.decode(generate_sprite_sheet())
+
+
+def test_frames_are_shown_for_their_ticks():
+    animation = Animation("flicker.png", 4, 4, frame_ticks=(1, 2, 3))
+
+    assert [animation.frame_at(tick) for tick in range(7)] == [0, 1, 1, 2, 2, 2, 0]
+
+
+def test_animations_which_do_not_loop_stay_on_their_last_frame():
+    animation = Animation("flicker.png", 4, 4, frame_ticks=2, frame_count=2, loop=False)
+
+    assert animation.frame_at(3) == 1
+    assert animation.frame_at(100) == 1
+
+
+def test_clock_reports_only_the_animations_that_changed_frame():
+    clock = generate_clock(frame_ticks=2)
+    clock.register("still", Animation("still.png", 4, 4, frame_count=1))
+
+    clock.tick()
+    assert clock.changed == frozenset()
+
+    clock.tick()
+    assert clock.changed == {"flicker"}
+    assert clock.frame_key("flicker") == ("flicker", 1)
+
+
+def test_played_animations_start_from_their_first_frame_and_stop():
+    clock = generate_clock(frame_ticks=1, loop=False)
+    button = object()
+
+    for _ in range(2):
+        clock.tick()
+    clock.play("flicker", button)
+    clock.tick()
+
+    assert clock.playing_frame_key(button) == ("flicker", 1)
+    assert clock.frame_key("flicker") == ("flicker", 3)
+
+    for _ in range(3):
+        clock.tick()
+
+    assert not clock.is_playing(button)
+    assert clock.playing_frame_key(button) is None
+
+
+def test_renderer_draws_the_current_frame_of_animated_tiles():
+    clock = generate_clock(frame_ticks=1)
+    renderer = generate_renderer(clock)
+    renderer.set_map(generate_animated_map(2, 1))
+
+    assert renderer.cell_layers(1, 0) == (AnimationLayer("flicker"),)
+    assert renderer.cell_animations(0, 0) == ()
+    assert renderer.tile_surface(1, 0, 4, 4).get_at((0, 0)) == RED
+
+    clock.tick()
+
+    assert renderer.tile_surface(1, 0, 4, 4).get_at((0, 0)) == GREEN
+
+
+def test_animated_tiles_share_a_surface_for_each_frame():
+    clock = generate_clock(frame_ticks=1)
+    renderer = generate_renderer(clock)
+    renderer.set_map(generate_animated_map(10, 10))
+
+    for _ in range(4):
+        surfaces = {id(renderer.tile_surface(x, y, 4, 4)) for x, y in ((1, 1), (3, 7))}
+        assert len(surfaces) == 1
+        clock.tick()
+
+    # One for each frame, shared by both tiles.
+    assert renderer.composites_built == 4
+
+
+def test_objects_with_unregistered_animations_are_drawn_with_their_sprite():
+    renderer = generate_renderer(generate_clock())
+    game_map = generate_animated_map(1, 1)
+    game_map.background_sheet[0][0].animation = "unknown"
+    renderer.set_map(game_map)
+
+    assert renderer.cell_layers(0, 0) == ("grass.png",)
+
+
+def test_scroll_buffer_redraws_only_visible_animated_tiles_that_changed():
+    clock = generate_clock(frame_ticks=2)
+    renderer = generate_renderer(clock)
+    scroll_buffer = ScrollBuffer(Camera(4, 4, 2, 2, 8, 8), renderer)
+    game_map = generate_animated_map(100, 100)
+
+    scroll_buffer.update(game_map)
+    clock.tick()
+    scroll_buffer.update(game_map)
+    assert scroll_buffer.tiles_drawn == 0
+
+    clock.tick()
+    scroll_buffer.update(game_map)
+
+    # Only the three animated columns of the buffer's 6x6 cells are redrawn, and
+    # nothing off screen costs anything.
+    assert scroll_buffer.tiles_drawn == 3 * 6
+    assert scroll_buffer.surface.get_at((8, 0)) == GREEN
+
+
+def test_button_plays_its_animation_when_pressed():
+    clock = generate_clock()
+    interaction = Mock()
+    button = Button(0, 0, 1, 1, interaction, button_animation="flicker")
+
+    button._interaction(game_context=Mock(animations=clock))
+
+    assert clock.is_playing(button)
+    assert interaction.called
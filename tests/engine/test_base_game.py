@@ -5,6 +5,7 @@ import pytest
 
 from tests.test_utils import generate_sheet, generate_valid_map, get_base_menu
 from thegame.engine import BaseGame, Map
+from thegame.engine.camera import Camera
 from thegame.engine.game_objects import GameObject, PlayerControlledObject
 
 
@@ -234,3 +235,26 @@ def test_load_player_controlled_objects_loads_them():
     assert pco2 in game.player_controlled_objects
     assert game.player_controlled_objects[pco1] == (0, 0)
     assert game.player_controlled_objects[pco2] == (1, 0)
+
+
+def test_add_viewport_adds_a_camera_drawn_at_a_screen_position():
+    game = BaseGame(initial_map=generate_valid_map())
+    camera = Camera(3, 3, 0, 0)
+
+    viewport = game.add_viewport(camera, 100, 50)
+
+    assert game.viewports == [game.viewports[0], viewport]
+    assert viewport.camera is camera
+    assert viewport.screen_position == (100, 50)
+
+
+def test_follow_sets_the_controller_of_the_given_viewport():
+    game = BaseGame(initial_map=generate_valid_map())
+    viewport = game.add_viewport(Camera(3, 3, 0, 0), 0, 0)
+    pco = PlayerControlledObject("sprite.png")
+
+    controller = game.follow(pco, viewport=viewport)
+
+    assert viewport.controller is controller
+    assert controller.camera is viewport.camera
+    assert game.camera_controller is None
@@ -102,3 +102,66 @@ def test_camera_fov_produces_borders_and_reduces_map(
     fov = camera.get_camera_fov(test_map)
 
     assert fov == [output_sheet, output_sheet, output_sheet, output_sheet]
+
+
+@pytest.mark.parametrize(
+    "delta_x, delta_y, tile_delta, camera_position, offset",
+    [
+        (3, 0, (0, 0), (5, 5), (3, 0)),
+        (10, 0, (1, 0), (6, 5), (0, 0)),
+        (13, 25, (1, 2), (6, 7), (3, 5)),
+        (-1, 0, (-1, 0), (4, 5), (9, 0)),
+        (0, -21, (0, -3), (5, 2), (0, 9)),
+    ],
+)
+def test_camera_scroll_carries_whole_tiles_into_camera_position(
+    delta_x, delta_y, tile_delta, camera_position, offset
+):
+    camera = Camera(3, 3, 5, 5, tile_width=10, tile_height=10)
+
+    assert camera.scroll(delta_x, delta_y) == tile_delta
+    assert (camera.camera_x, camera.camera_y) == camera_position
+    assert (camera.offset_x, camera.offset_y) == offset
+
+
+@pytest.mark.parametrize(
+    "zoom, tile_size, camera_size",
+    [(1, 10, 5), (0.5, 5, 9), (2, 20, 1), (1 / 16, 1, 49), (1 / 100, 1, 49)],
+)
+def test_set_zoom_scales_tiles_and_keeps_the_view_size(zoom, tile_size, camera_size):
+    camera = Camera(5, 5, 10, 10, tile_width=10, tile_height=10)
+
+    camera.set_zoom(zoom)
+
+    assert (camera.tile_width, camera.tile_height) == (tile_size, tile_size)
+    assert (camera.camera_width, camera.camera_height) == (camera_size, camera_size)
+    assert camera.visible_columns * camera.tile_width <= 50
+    assert camera.visible_rows * camera.tile_height <= 50
+    assert (camera.camera_x, camera.camera_y) == (10, 10)
+
+
+@pytest.mark.parametrize("zoom", [0.5, 1.5, 2, 3])
+def test_zoomed_views_never_outgrow_the_unzoomed_view(zoom):
+    camera = Camera(5, 5, 10, 10, tile_width=32, tile_height=32)
+
+    camera.set_zoom(zoom)
+
+    assert camera.visible_columns * camera.tile_width <= 160
+    assert camera.visible_rows * camera.tile_height <= 160
+
+
+def test_set_zoom_scales_the_sub_tile_offset():
+    camera = Camera(5, 5, 10, 10, tile_width=10, tile_height=10)
+    camera.scroll(4, 8)
+
+    camera.set_zoom(0.5)
+
+    assert (camera.offset_x, camera.offset_y) == (2, 4)
+
+
+@pytest.mark.parametrize("zoom", [0, -1])
+def test_set_zoom_to_a_non_positive_zoom_raises_value_error(zoom):
+    camera = Camera(5, 5, 10, 10)
+
+    with pytest.raises(ValueError):
+        camera.set_zoom(zoom)
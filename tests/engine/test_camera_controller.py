@@ -0,0 +1,126 @@
+from unittest.mock import MagicMock, Mock
+
+import pytest
+
+from tests.test_utils import generate_valid_map
+from thegame.engine import BaseGame, Map
+from thegame.engine.camera import Camera
+from thegame.engine.camera_controller import CameraController
+from thegame.engine.game_objects import PlayerControlledObject
+
+
+def generate_large_map(width, height):
+    return Map(
+        *[[[None for _ in range(width)] for _ in range(height)] for _ in range(4)]
+    )
+
+
+def generate_following_game(camera_x=10, camera_y=10, **controller_options):
+    pco = PlayerControlledObject("sprite.png")
+    game = BaseGame(
+        initial_map=generate_large_map(30, 30),
+        camera_width=5,
+        camera_height=5,
+        camera_x=camera_x,
+        camera_y=camera_y,
+        base_sprite_width=10,
+        base_sprite_height=10,
+    )
+    game.register_player_controlled_object(pco, 10, 10)
+    game.follow(pco, **controller_options)
+
+    return game, pco
+
+
+@pytest.mark.parametrize("target_position", [(10, 10), (11, 10), (9, 11), (11, 9)])
+def test_moving_inside_the_dead_zone_does_not_move_the_camera(target_position):
+    game, pco = generate_following_game(dead_zone_width=3, dead_zone_height=3)
+
+    game.player_controlled_objects[pco] = target_position
+
+    assert game.camera_controller.update(game) == (0, 0)
+    assert (game.camera.camera_x, game.camera.camera_y) == (10, 10)
+
+
+@pytest.mark.parametrize(
+    "target_position, camera_position",
+    [((13, 10), (12, 10)), ((7, 10), (8, 10)), ((10, 14), (10, 13))],
+)
+def test_leaving_the_dead_zone_moves_the_camera_to_its_edge(
+    target_position, camera_position
+):
+    game, pco = generate_following_game(dead_zone_width=3, dead_zone_height=3)
+
+    game.player_controlled_objects[pco] = target_position
+    game.camera_controller.update(game)
+
+    assert (game.camera.camera_x, game.camera.camera_y) == camera_position
+
+
+def test_scroll_listeners_are_told_the_exact_scroll():
+    game, pco = generate_following_game()
+    listener = Mock()
+    game.camera_controller.register_scroll_listener(listener)
+
+    game.player_controlled_objects[pco] = (12, 9)
+    game.camera_controller.update(game)
+
+    listener.assert_called_once_with(20, -10)
+
+
+def test_scroll_speed_limits_how_far_the_camera_moves_per_update():
+    game, pco = generate_following_game(scroll_speed=4)
+
+    game.player_controlled_objects[pco] = (11, 10)
+
+    assert game.camera_controller.update(game) == (4, 0)
+    assert game.camera_controller.update(game) == (4, 0)
+    assert game.camera_controller.update(game) == (2, 0)
+    assert (game.camera.camera_x, game.camera.camera_y) == (11, 10)
+    assert (game.camera.offset_x, game.camera.offset_y) == (0, 0)
+
+
+def test_look_ahead_leads_the_camera_in_the_direction_of_movement():
+    game, pco = generate_following_game(look_ahead=2)
+
+    game.camera_controller.update(game)
+    game.player_controlled_objects[pco] = (11, 10)
+    game.camera_controller.update(game)
+
+    assert (game.camera.camera_x, game.camera.camera_y) == (13, 10)
+
+
+@pytest.mark.parametrize(
+    "target_position, camera_position",
+    [((0, 0), (2, 2)), ((29, 29), (27, 27)), ((1, 28), (2, 27))],
+)
+def test_camera_is_clamped_to_the_map(target_position, camera_position):
+    game, pco = generate_following_game()
+
+    game.player_controlled_objects[pco] = target_position
+    game.camera_controller.update(game)
+
+    assert (game.camera.camera_x, game.camera.camera_y) == camera_position
+
+
+def test_camera_is_centered_on_maps_smaller_than_the_view():
+    camera = Camera(5, 5, 0, 0, tile_width=10, tile_height=10)
+    pco = PlayerControlledObject("sprite.png")
+    context = MagicMock()
+    context.player_controlled_objects = {pco: (0, 0)}
+    context.active_screen = generate_valid_map()
+
+    CameraController(camera, pco).update(context)
+
+    # The 2x2 map is centered in the 5x5 view, so the view starts
+    # one and a half tiles before the map.
+    assert camera.leftmost_tile * 10 + camera.offset_x == -15
+    assert camera.topmost_tile * 10 + camera.offset_y == -15
+
+
+def test_untracked_target_does_not_move_the_camera():
+    game, pco = generate_following_game()
+
+    game.clear_player_controlled_objects()
+
+    assert game.camera_controller.update(game) == (0, 0)
@@ -0,0 +1,79 @@
+import pytest
+
+from thegame.engine import Map
+from thegame.engine.compiled_map import (
+    PLAYER_KIND,
+    TILE_KIND,
+    CompiledMap,
+    load_compiled_map,
+)
+from thegame.engine.game_objects import GameObject, PlayerCharacter
+
+WALL = (TILE_KIND, "wall.png")
+GRASS = (TILE_KIND, "grass.png")
+PLAYER = (PLAYER_KIND, "pc.png")
+
+
+def generate_layers():
+    """ A 3x2 map of grass, with a wall at 0,0 and a player at 2,1."""
+    return [
+        [[WALL, None, None], [None, None, None]],
+        [[None, None, None], [None, None, PLAYER]],
+        [[None, None, None], [None, None, None]],
+        [[GRASS, GRASS, GRASS], [GRASS, GRASS, GRASS]],
+    ]
+
+
+def test_compiling_dedupes_tiles_into_a_palette():
+    compiled = CompiledMap.compile(generate_layers())
+
+    assert compiled.palette == [WALL, PLAYER, GRASS]
+    assert (compiled.width, compiled.height) == (3, 2)
+    assert compiled.tiles[Map.BACKGROUND_SHEET_INDEX].tolist() == [[3, 3, 3]] * 2
+    assert compiled.passability == bytes([0, 1, 1, 1, 1, 0])
+    assert compiled.positions(2).tolist() == [(Map.CHARACTER_SHEET_INDEX, 2, 1)]
+    assert len(compiled.positions(3)) == 6
+    assert compiled.positions_of_kind(PLAYER_KIND) == [
+        (Map.CHARACTER_SHEET_INDEX, 2, 1)
+    ]
+    assert compiled.sprite_locations() == ["grass.png", "pc.png", "wall.png"]
+
+
+def test_compiled_maps_round_trip_through_files(tmp_path):
+    path = str(tmp_path / "test.tgmap")
+    compiled = CompiledMap.compile(generate_layers())
+
+    compiled.write(path)
+    read = CompiledMap.read(path)
+
+    assert read.palette == compiled.palette
+    assert read.tiles.tolist() == compiled.tiles.tolist()
+    assert read.passability == compiled.passability
+    assert read.index_offsets.tolist() == compiled.index_offsets.tolist()
+    assert read.index_positions.tolist() == compiled.index_positions.tolist()
+
+
+def test_loading_shares_plain_tiles_and_gives_players_their_own_objects(tmp_path):
+    path = str(tmp_path / "test.tgmap")
+    layers = generate_layers()
+    layers[Map.CHARACTER_SHEET_INDEX][1][0] = PLAYER
+    CompiledMap.compile(layers).write(path)
+
+    game_map = load_compiled_map(path)
+
+    assert isinstance(game_map.foreground_sheet[0][0], GameObject)
+    assert game_map.foreground_sheet[0][0].sprite_location == "wall.png"
+    assert game_map.background_sheet[0][0] is game_map.background_sheet[1][2]
+    assert isinstance(game_map.character_sheet[1][2], PlayerCharacter)
+    assert game_map.character_sheet[1][2] is not game_map.character_sheet[1][0]
+    assert not game_map.is_passable(0, 0)
+    assert not game_map.is_passable(2, 1)
+    assert game_map.is_passable(1, 0)
+
+
+def test_reading_something_else_raises(tmp_path):
+    path = tmp_path / "test.tgmap"
+    path.write_bytes(b"not a map at all")
+
+    with pytest.raises(CompiledMap.InvalidCompiledMapException):
+        CompiledMap.read(str(path))
@@ -1,3 +1,4 @@
+import time
 from threading import Thread
 from unittest.mock import MagicMock, Mock, call, patch
 
@@ -11,7 +12,9 @@ from tests.test_utils import (
     generate_valid_map,
 )
 from thegame.engine import BaseGame, BaseMenu, Engine, Map
+from thegame.engine.camera import Camera
 from thegame.engine.game_objects import GameObject, PlayerControlledObject
+from thegame.engine.tile_renderer import TileRenderer
 
 
 def generate_keypress_pattern(characters, convert_to_keystroke=True):
@@ -50,12 +53,16 @@ def generate_keystroke_list(characters_pressed):
 @patch("thegame.engine.engine.pygame.quit", Mock())
 @patch("thegame.engine.engine.Engine._main_loop", Mock())
 def test_engine_start_initializes_game_window(display_mock, init_mock):
+    display_mock.get_init.return_value = False
 
     Engine(MagicMock()).start()
 
     assert display_mock.set_caption.called
     assert display_mock.set_mode.called
-    assert init_mock.called
+
+    # Only the display is initialized, not every pygame subsystem.
+    assert display_mock.init.called
+    assert not init_mock.called
 
 
 @patch("thegame.engine.engine.pygame.init", Mock())
@@ -203,6 +210,38 @@ def test_mouse_button_up_calls_interaction_in_menu(event_get_mock):
     assert mock_interaction.called
 
 
+@patch("thegame.engine.engine.pygame.init", Mock())
+@patch("thegame.engine.engine.pygame.display", Mock())
+@patch("thegame.engine.engine.pygame.key.get_pressed", MagicMock())
+@patch("thegame.engine.engine.pygame.mouse.get_pos", lambda: (0, 0))
+@patch("thegame.engine.engine.pygame.event.get")
+def test_mouse_button_events_are_handled_in_order(event_get_mock):
+    event_get_mock.return_value = [
+        DummyEvent(pygame.MOUSEBUTTONDOWN),
+        DummyEvent(pygame.MOUSEBUTTONUP),
+        DummyEvent(pygame.QUIT),
+    ]
+
+    engine = Engine(MagicMock())
+    handle_event = engine._handle_event
+    handled = []
+
+    def slow_handle_event(event):
+        # Would let the button up overtake the button down if run in the pool.
+        if event.type == pygame.MOUSEBUTTONDOWN:
+            time.sleep(0.05)
+        handle_event(event)
+        handled.append((event.type, engine.mouse_down_pos))
+
+    engine._handle_event = slow_handle_event
+    engine.start()
+
+    assert handled[:2] == [
+        (pygame.MOUSEBUTTONDOWN, (0, 0)),
+        (pygame.MOUSEBUTTONUP, None),
+    ]
+
+
 @patch("thegame.engine.engine.pygame.init", Mock())
 @patch("thegame.engine.engine.pygame.display", Mock())
 @patch("thegame.engine.engine.pygame.event.get", MagicMock())
@@ -349,13 +388,15 @@ def test_loading_a_game_with_no_menu_loads_the_active_map(
 @patch("thegame.engine.engine.Engine._handle_keystrokes", Mock())
 @patch("pygame.image.load")
 @patch("thegame.engine.engine.pygame.event.get")
-@patch("pygame.sprite.Group.add")
+@patch("thegame.engine.scroll_buffer.pygame.Surface")
+@patch("thegame.engine.engine.image_is_opaque", Mock(return_value=False))
 def test_onscreen_sprites_are_correctly_added(
-    sprite_group_mock, event_get_mock, image_load_mock
+    surface_mock, event_get_mock, image_load_mock
 ):
     event_get_mock.return_value = [DummyEvent(pygame.QUIT)]
 
     sprite_mock = Mock(name="sprite_mock")
+    sprite_mock.get_size.return_value = (30, 30)
     convert_alpha_mock = Mock()
     convert_alpha_mock.convert_alpha.return_value = sprite_mock
 
@@ -379,11 +420,15 @@ def test_onscreen_sprites_are_correctly_added(
     engine = Engine(game)
     engine.start()
 
-    call_args = sprite_group_mock.call_args
+    call_args = surface_mock.return_value.blit.call_args_list
+    layer_blits = [call_arg for call_arg in call_args if call_arg[0][0] is sprite_mock]
 
-    # Ignore empty calls.
+    # Every layer drawn should be a loaded image. There are only 3 distinct
+    # tiles on the map, so the 4 layers of each are only drawn once.
+    assert len(layer_blits) == 3 * 4
     assert all(
-        call_arg[0].image is sprite_mock for call_arg in call_args if len(call_arg) >= 1
+        call_arg[0][0] in (sprite_mock, surface_mock.return_value)
+        for call_arg in call_args
     )
 
 
@@ -392,6 +437,7 @@ def test_onscreen_sprites_are_correctly_added(
 @patch("thegame.engine.engine.pygame.event.get", MagicMock())
 @patch("pygame.image.load", MagicMock())
 @patch("thegame.engine.engine.pygame.key.get_pressed")
+@patch("thegame.engine.engine.image_is_opaque", Mock(return_value=False))
 def test_handle_keystrokes_calls_each_player_controlled_objects_interaction(
     keypress_mock
 ):
@@ -433,6 +479,7 @@ def test_handle_keystrokes_calls_each_player_controlled_objects_interaction(
 @patch("pygame.image.load", MagicMock())
 @patch("thegame.engine.engine.pygame.key.get_pressed", MagicMock())
 @patch("thegame.engine.engine.pygame.event.get")
+@patch("thegame.engine.engine.image_is_opaque", Mock(return_value=False))
 def test_initializing_engine_with_game_loads_player_controlled_objects(event_queue):
     pco1 = PlayerControlledObject("sprite.png")
     pco2 = PlayerControlledObject("sprite.png")
@@ -463,3 +510,92 @@ def test_initializing_engine_with_game_loads_player_controlled_objects(event_que
     assert pco2 in engine.context.player_controlled_objects
     assert engine.context.player_controlled_objects[pco1] == (0, 0)
     assert engine.context.player_controlled_objects[pco2] == (1, 0)
+
+
+@patch("thegame.engine.engine.pygame.init", Mock())
+@patch("thegame.engine.engine.pygame.display")
+@patch("thegame.engine.engine.pygame.key.get_pressed", MagicMock())
+@patch("thegame.engine.engine.pygame.event.get")
+def test_each_viewport_is_drawn_at_its_screen_position(event_get_mock, display_mock):
+    event_get_mock.return_value = [DummyEvent(pygame.QUIT)]
+
+    game = BaseGame(initial_map=generate_valid_map(), camera_width=3, camera_height=3)
+    game.add_viewport(Camera(3, 3, 0, 0), 100, 0)
+    engine = Engine(game)
+
+    engine.start()
+
+    display_blits = display_mock.set_mode.return_value.blit.call_args_list
+    blit_positions = [call_arg[0][1] for call_arg in display_blits]
+
+    assert len(engine.scroll_buffers) == 2
+    assert (0, 0) in blit_positions
+    assert (100, 0) in blit_positions
+
+
+@patch("thegame.engine.engine.pygame.init", Mock())
+@patch("thegame.engine.engine.pygame.display", Mock())
+@patch("pygame.image.load")
+def test_loading_map_sprites_records_which_are_opaque(image_load_mock):
+    opaque = pygame.Surface((2, 2), pygame.SRCALPHA)
+    opaque.fill((255, 0, 0, 255))
+    translucent = pygame.Surface((2, 2), pygame.SRCALPHA)
+    translucent.fill((255, 0, 0, 255))
+    translucent.set_at((1, 1), (255, 0, 0, 128))
+
+    images = {"opaque.png": opaque, "translucent.png": translucent}
+    image_load_mock.side_effect = lambda location: Mock(
+        convert_alpha=Mock(return_value=images[location])
+    )
+
+    game_map = Map(
+        [[GameObject("opaque.png"), GameObject("translucent.png")]],
+        [[None, None]],
+        [[None, None]],
+        [[None, None]],
+    )
+    engine = Engine(BaseGame(initial_map=game_map))
+    engine._load_map_sprites()
+
+    assert engine.context.object_opacity == {
+        "opaque.png": True,
+        "translucent.png": False,
+    }
+
+
+@patch("thegame.engine.engine.pygame.init", Mock())
+@patch("thegame.engine.engine.pygame.display", Mock())
+def test_zooming_detaches_the_old_scroll_buffer_from_the_map():
+    game_map = Map(*[[[None] * 10 for _ in range(10)] for _ in range(4)])
+    game = BaseGame(initial_map=game_map, camera_width=3, camera_height=3)
+    engine = Engine(game)
+    engine.tile_renderer = TileRenderer({})
+    viewport = game.viewports[0]
+
+    engine._get_scroll_buffer(viewport).update(game_map)
+    listener_count = len(game_map._region_listeners)
+    for zoom in [1 / 2, 1 / 4, 1 / 2, 1]:
+        viewport.camera.set_zoom(zoom)
+        engine._get_scroll_buffer(viewport).update(game_map)
+
+    assert len(game_map._region_listeners) == listener_count
+
+
+@patch("thegame.engine.engine.pygame.init", Mock())
+@patch("thegame.engine.engine.pygame.display", Mock())
+def test_removed_viewports_scroll_buffers_are_dropped():
+    game_map = Map(*[[[None] * 10 for _ in range(10)] for _ in range(4)])
+    game = BaseGame(initial_map=game_map, camera_width=3, camera_height=3)
+    engine = Engine(game)
+    engine.tile_renderer = TileRenderer({})
+    viewport = game.add_viewport(Camera(3, 3, 0, 0), 100, 0)
+
+    engine._get_scroll_buffer(game.viewports[0]).update(game_map)
+    listener_count = len(game_map._region_listeners)
+    engine._get_scroll_buffer(viewport).update(game_map)
+    game.remove_viewport(viewport)
+    engine._prune_scroll_buffers()
+
+    assert viewport not in engine.scroll_buffers
+    assert len(engine.scroll_buffers) == 1
+    assert len(game_map._region_listeners) == listener_count
@@ -0,0 +1,172 @@
+from unittest.mock import Mock
+
+import numpy
+import pytest
+
+from thegame.engine import BaseGame, Map
+from thegame.engine.entities import (
+    EAST,
+    NORTH,
+    SOUTH,
+    WEST,
+    EntityStore,
+    MovementSystem,
+    System,
+)
+from thegame.engine.game_objects import GameObject, PlayerCharacter
+
+
+def generate_open_map(width, height, walls=()):
+    foreground_sheet = [
+        [GameObject("wall.png") if (x, y) in walls else None for x in range(width)]
+        for y in range(height)
+    ]
+    empty_sheet = [[None] * width for _ in range(height)]
+
+    return Map(
+        foreground_sheet,
+        [list(row) for row in empty_sheet],
+        [list(row) for row in empty_sheet],
+        [list(row) for row in empty_sheet],
+    )
+
+
+def test_created_entities_fill_the_columns():
+    store = EntityStore()
+    game_object = GameObject("npc.png")
+
+    entity = store.create((3, 4), velocity=(1, 0), facing=EAST, game_object=game_object)
+
+    assert len(store) == 1
+    assert store.position[entity].tolist() == [3, 4]
+    assert store.velocity[entity].tolist() == [1, 0]
+    assert store.facing[entity] == EAST
+    assert store.sprite_location(store.sprite[entity]) == "npc.png"
+    assert store.entity_of(game_object) == entity
+    assert game_object.entity_store is store
+    assert game_object.entity == entity
+
+
+def test_store_grows_and_reuses_destroyed_entities():
+    store = EntityStore(capacity=2)
+    entities = [store.create((index, 0)) for index in range(5)]
+
+    assert entities == [0, 1, 2, 3, 4]
+    assert store.capacity == 8
+    assert store.position[:5, 0].tolist() == [0, 1, 2, 3, 4]
+
+    store.destroy(2)
+    assert len(store) == 4
+    assert store.entities().tolist() == [0, 1, 3, 4]
+    assert store.create((9, 9)) == 2
+
+
+def test_objects_can_only_have_one_entity():
+    store = EntityStore()
+    game_object = GameObject("npc.png")
+    store.create((0, 0), game_object=game_object)
+
+    with pytest.raises(EntityStore.DuplicateEntityException):
+        store.create((1, 1), game_object=game_object)
+
+
+def test_systems_are_run_over_selected_entities_in_batches():
+    store = EntityStore()
+    for index in range(10):
+        store.create((index, 0), velocity=(index % 2, 0))
+
+    system = Mock(spec=System)
+    system.select.return_value = store.velocity.any(axis=1)
+
+    assert store.run(system, batch_size=2) == 5
+
+    batches = [call[0][1].tolist() for call in system.update.call_args_list]
+    assert batches == [[1, 3], [5, 7], [9]]
+
+
+def test_player_controlled_objects_act_like_a_dictionary():
+    store = EntityStore()
+    pco = Mock()
+    npc = store.create((5, 5), game_object=GameObject("npc.png"))
+
+    store.player_controlled_objects[pco] = (1, 2)
+
+    assert store.player_controlled_objects == {pco: (1, 2)}
+    assert store.player_controlled_objects.get(npc) is None
+    assert list(store.player_controlled_objects.keys()) == [pco]
+
+    store.player_controlled_objects[pco] = (2, 2)
+    assert store.position[store.entity_of(pco)].tolist() == [2, 2]
+
+    store.player_controlled_objects.clear()
+    assert store.player_controlled_objects == {}
+    assert pco not in store
+    assert len(store) == 1
+
+
+def test_player_character_facing_is_kept_in_its_entity():
+    game = BaseGame(initial_map=generate_open_map(2, 2))
+    pc = PlayerCharacter("pc.png", facing_direction=WEST)
+
+    game.register_player_controlled_object(pc, 0, 0)
+    entity = game.entities.entity_of(pc)
+    assert game.entities.facing[entity] == WEST
+
+    game.entities.facing[entity] = SOUTH
+    assert pc.facing == SOUTH
+
+    pc.facing = NORTH
+    assert game.entities.facing[entity] == NORTH
+
+    game.clear_player_controlled_objects()
+    assert pc.entity_store is None
+    assert pc.facing == NORTH
+
+
+def test_movement_system_moves_entities_without_a_map():
+    store = EntityStore()
+    still = store.create((0, 0))
+    moving = store.create((0, 0), velocity=(0, -2))
+
+    store.run(MovementSystem())
+
+    assert store.position[still].tolist() == [0, 0]
+    assert store.position[moving].tolist() == [0, -2]
+    assert store.facing[moving] == NORTH
+
+
+def test_movement_system_moves_objects_on_the_map():
+    game_map = generate_open_map(4, 3, walls={(2, 1)})
+    game = BaseGame(initial_map=game_map)
+    store = game.entities
+
+    npcs = [GameObject("npc.png") for _ in range(5)]
+    starts = [(0, 0), (1, 1), (3, 0), (3, 2), (1, 2)]
+    velocities = [(1, 0), (1, 0), (0, 1), (0, -1), (-1, 0)]
+    for npc, (x, y), velocity in zip(npcs, starts, velocities):
+        game_map.character_sheet[y][x] = npc
+        store.create((x, y), velocity=velocity, game_object=npc)
+
+    store.run(MovementSystem(), game)
+
+    # The first NPC moves, the second walks into a wall, the third and fourth both
+    # want (3, 1) so neither moves, and the last moves west.
+    positions = [tuple(store.position[store.entity_of(npc)]) for npc in npcs]
+    assert positions == [(1, 0), (1, 1), (3, 0), (3, 2), (0, 2)]
+    assert game_map.character_sheet[0][1] is npcs[0]
+    assert game_map.character_sheet[0][0] is None
+    assert game_map.character_sheet[2][0] is npcs[4]
+    assert not game_map.is_passable(1, 0)
+    assert store.facing[store.entity_of(npcs[0])] == EAST
+    assert store.facing[store.entity_of(npcs[4])] == WEST
+
+
+def test_movement_system_moves_many_entities_at_once():
+    store = EntityStore()
+    for index in range(10000):
+        store.create((index, 0), velocity=(0, 1))
+
+    store.run(MovementSystem())
+
+    numpy.testing.assert_array_equal(store.position[:10000, 1], 1)
+    assert (store.facing[:10000] == SOUTH).all()
@@ -0,0 +1,137 @@
+import numpy
+import pytest
+
+from thegame.engine import Map
+from thegame.engine.flow_field import FlowField
+
+from .test_pathfinding import generate_map
+
+WALLED_LAYOUT = [
+    ".....",
+    ".###.",
+    "...#.",
+    "##.#.",
+    ".....",
+]
+
+
+def follow(field, position, limit=100):
+    """ Return the tiles an agent following field from position steps through."""
+    tiles = [position]
+    for _ in range(limit):
+        next_position = field.next_position(*tiles[-1])
+        if next_position == tiles[-1]:
+            break
+        tiles.append(next_position)
+
+    return tiles
+
+
+def test_integration_field_is_the_cost_to_the_target():
+    field = FlowField(generate_map(WALLED_LAYOUT), (4, 4))
+
+    assert field.cost(4, 4) == 0
+    assert field.cost(0, 2) == 6
+    assert field.cost(0, 0) == 8
+    assert field.cost(1, 1) == numpy.inf
+    assert field.cost(9, 9) == numpy.inf
+
+
+def test_following_the_field_reaches_the_target():
+    field = FlowField(generate_map(WALLED_LAYOUT), (4, 4))
+
+    tiles = follow(field, (0, 2))
+
+    assert tiles[-1] == (4, 4)
+    assert len(tiles) == 7
+    assert field.direction(4, 4) == (0, 0)
+
+
+def test_unreachable_tiles_stay_put():
+    field = FlowField(generate_map(["..#..", "..#.."]), (4, 0))
+
+    assert field.direction(0, 0) == (0, 0)
+    assert field.cost(0, 0) == numpy.inf
+
+
+def test_diagonal_fields_dont_cut_corners():
+    field = FlowField(generate_map(["..", "#."]), (1, 1), diagonal=True)
+
+    assert follow(field, (0, 0)) == [(0, 0), (1, 0), (1, 1)]
+
+
+def test_directions_for_many_agents():
+    field = FlowField(generate_map(WALLED_LAYOUT), (4, 4))
+
+    steps = field.directions([(0, 2), (4, 0), (4, 4), (-1, 0)])
+
+    assert steps.tolist() == [[1, 0], [0, 1], [0, 0], [0, 0]]
+
+
+def test_path_costs_steer_the_field():
+    paths = {(0, 0), (0, 1), (0, 2), (1, 2), (2, 2), (3, 2), (4, 2), (4, 1), (4, 0)}
+    game_map = generate_map(["....."] * 3, paths)
+
+    field = FlowField(game_map, (4, 0), path_cost=1, terrain_cost=5)
+
+    assert set(follow(field, (0, 0))) == paths
+
+
+@pytest.mark.parametrize("diagonal", [False, True])
+def test_moving_the_target_matches_a_new_field(diagonal):
+    game_map = generate_map(WALLED_LAYOUT)
+    field = FlowField(game_map, (4, 4), diagonal=diagonal)
+
+    for target in [(4, 3), (2, 4), (0, 4), (0, 0), (2, 2)]:
+        field.set_targets(target)
+        new_field = FlowField(game_map, target, diagonal=diagonal)
+
+        numpy.testing.assert_array_equal(field.integration, new_field.integration)
+        numpy.testing.assert_array_equal(field.step_x, new_field.step_x)
+        numpy.testing.assert_array_equal(field.step_y, new_field.step_y)
+
+
+def test_moving_the_target_only_updates_tiles_that_get_closer():
+    field = FlowField(generate_map(["." * 20]), (10, 0))
+    field.set_targets((11, 0))
+
+    # Only the tiles to the right of the new target got closer to it.
+    assert field.tiles_updated == 8
+
+
+def test_foreground_changes_rebuild_the_field():
+    game_map = generate_map(WALLED_LAYOUT)
+    field = FlowField(game_map, (4, 4))
+
+    # Open a way through the bottom left wall.
+    game_map.swap((0, 3), (0, 4), Map.FOREGROUND_SHEET_INDEX)
+    game_map.swap((1, 3), (1, 4), Map.FOREGROUND_SHEET_INDEX)
+
+    assert field.cost(0, 2) == 6
+    assert field.cost(0, 3) == 5
+
+
+def test_characters_dont_block_the_field():
+    game_map = generate_map(["....."])
+    field = FlowField(game_map, (4, 0))
+    game_map.character_sheet[0][2] = object()
+    game_map.swap((2, 0), (3, 0), Map.CHARACTER_SHEET_INDEX)
+
+    assert follow(field, (0, 0))[-1] == (4, 0)
+    assert not field._dirty
+
+
+def test_field_to_warp_zone():
+    game_map = generate_map(WALLED_LAYOUT)
+    game_map.register_warp_zone(3, 4, game_map, 0, 0, final_x_pos=4, final_y_pos=4)
+
+    field = FlowField.to_warp_zone(game_map, game_map.warp_zones[0])
+
+    assert field.cost(3, 4) == field.cost(4, 4) == 0
+    assert field.cost(2, 4) == 1
+    assert field.cost(4, 2) == 2
+
+
+def test_targets_off_the_map_raise_value_error():
+    with pytest.raises(ValueError):
+        FlowField(generate_map(WALLED_LAYOUT), (5, 5))
@@ -0,0 +1,106 @@
+import numpy
+import pytest
+
+from thegame.engine.compiled_map import EMPTY_TILE, TILE_KIND
+from thegame.engine.generation import (
+    NOISE_FUNCTIONS,
+    CaveField,
+    MapGenerator,
+    NoiseField,
+    tile_positions,
+)
+from thegame.engine.map import Map
+
+GRASS = (TILE_KIND, "grass.png")
+WATER = (TILE_KIND, "water.png")
+ROCK = (TILE_KIND, "rock.png")
+FLOWER = (TILE_KIND, "flower.png")
+
+
+def island_generator(seed=3, chunk_size=256):
+    generator = MapGenerator(seed=seed, chunk_size=chunk_size)
+    generator.add_field("height", NoiseField(scale=16, octaves=3))
+    generator.add_field("caves", CaveField())
+    generator.add_rule(Map.BACKGROUND_SHEET_INDEX, GRASS)
+    generator.add_rule(Map.FOREGROUND_SHEET_INDEX, WATER, height=(0, 0.4))
+    generator.add_rule(Map.FOREGROUND_SHEET_INDEX, ROCK, caves=(1, 2))
+    generator.add_rule(Map.PATH_SHEET_INDEX, FLOWER, chance=0.1)
+
+    return generator
+
+
+@pytest.mark.parametrize("kind", NOISE_FUNCTIONS)
+def test_noise_is_smooth_and_in_range(kind):
+    field = NoiseField(kind, scale=8)
+
+    values = field(0, 0, 64, 64, seed=1)
+
+    assert values.shape == (64, 64)
+    assert 0 <= values.min() and values.max() <= 1
+    assert values.std() > 0.05
+    # Neighbouring tiles are close together, unlike white noise.
+    assert numpy.abs(numpy.diff(values, axis=1)).max() < 0.35
+
+
+@pytest.mark.parametrize("field", [NoiseField(scale=8, octaves=3), CaveField()])
+def test_fields_only_depend_on_position(field):
+    whole = field(10, 20, 48, 32, seed=5)
+
+    assert numpy.array_equal(field(30, 28, 16, 8, seed=5), whole[8:16, 20:36])
+    assert not numpy.array_equal(field(10, 20, 48, 32, seed=6), whole)
+
+
+def test_noise_broadcasts_over_any_positions():
+    xs, ys = tile_positions(0, 0, 16, 16)
+    full_xs, full_ys = numpy.broadcast_arrays(xs / 4, ys / 4)
+
+    for noise in NOISE_FUNCTIONS.values():
+        assert numpy.allclose(noise(xs / 4, ys / 4, 2), noise(full_xs, full_ys, 2))
+
+
+def test_caves_are_smoothed_into_walls_and_floor():
+    walls = CaveField(steps=5)(0, 0, 64, 64, seed=9)
+
+    assert set(numpy.unique(walls)) == {0, 1}
+    assert 0.2 < walls.mean() < 0.8
+
+
+def test_rules_fill_the_sheets_in_order():
+    generated = island_generator().generate(64, 64, processes=1)
+    ids = {tile: tile_id for tile_id, tile in enumerate(generated.palette, start=1)}
+
+    assert generated.palette == [GRASS, WATER, ROCK, FLOWER]
+    assert (generated.tiles[Map.BACKGROUND_SHEET_INDEX] == ids[GRASS]).all()
+    assert (generated.tiles[Map.CHARACTER_SHEET_INDEX] == EMPTY_TILE).all()
+
+    foreground = generated.tiles[Map.FOREGROUND_SHEET_INDEX]
+    assert set(numpy.unique(foreground)) == {EMPTY_TILE, ids[WATER], ids[ROCK]}
+
+    flowers = (generated.tiles[Map.PATH_SHEET_INDEX] == ids[FLOWER]).mean()
+    assert 0.05 < flowers < 0.15
+
+    game_map = generated.to_map()
+    assert game_map.is_passable(*numpy.argwhere(foreground == EMPTY_TILE)[0][::-1])
+    assert not game_map.is_passable(*numpy.argwhere(foreground != EMPTY_TILE)[0][::-1])
+
+
+def test_maps_are_the_same_however_they_are_chunked():
+    whole = island_generator(chunk_size=128).generate(100, 70, processes=1)
+    chunked = island_generator(chunk_size=16).generate(100, 70, processes=1)
+    parallel = island_generator(chunk_size=32).generate(100, 70, processes=2)
+
+    assert numpy.array_equal(whole.tiles, chunked.tiles)
+    assert numpy.array_equal(whole.tiles, parallel.tiles)
+    assert whole.passability == parallel.passability
+
+
+def test_invalid_rules_raise():
+    generator = MapGenerator()
+    generator.add_field("height", NoiseField())
+
+    with pytest.raises(ValueError):
+        generator.add_rule(4, GRASS)
+    with pytest.raises(ValueError):
+        generator.add_rule(Map.FOREGROUND_SHEET_INDEX, ROCK, depth=(0, 1))
+    with pytest.raises(ValueError):
+        NoiseField("worley")
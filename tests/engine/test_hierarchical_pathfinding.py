@@ -0,0 +1,123 @@
+import random
+
+import pytest
+
+from thegame.engine import Map
+from thegame.engine.hierarchical_pathfinding import HierarchicalPathfinder
+from thegame.engine.pathfinding import GridSearch
+
+from .test_pathfinding import assert_valid_path, generate_map
+
+# Four 4x4 clusters. The only ways between the left and right halves are through
+# the gaps at (3, 1) -> (4, 1) and (3, 6) -> (4, 6), and the right hand clusters
+# are walled off from each other.
+ROOMS_LAYOUT = [
+    "........",
+    "........",
+    "...#....",
+    "...#####",
+    "...#....",
+    "...#....",
+    "........",
+    "...#....",
+]
+
+
+def test_borders_have_transitions_for_each_entrance():
+    pathfinder = HierarchicalPathfinder(generate_map(ROOMS_LAYOUT), cluster_size=4)
+
+    # The top left to top right border is open for two tiles, so the transition is
+    # the middle one of them.
+    assert pathfinder._borders[((0, 0), (1, 0))] == [((3, 1), (4, 1))]
+    assert pathfinder._borders[((0, 1), (1, 1))] == [((3, 6), (4, 6))]
+    assert pathfinder._borders[((1, 0), (1, 1))] == []
+    assert pathfinder.clusters[(1, 1)].nodes == {(4, 6)}
+
+
+def test_long_entrances_get_a_transition_at_each_end():
+    pathfinder = HierarchicalPathfinder(generate_map(["." * 16] * 8), cluster_size=8)
+
+    assert pathfinder._borders[((0, 0), (1, 0))] == [
+        ((7, 0), (8, 0)),
+        ((7, 7), (8, 7)),
+    ]
+
+
+def test_path_through_the_cluster_graph():
+    game_map = generate_map(ROOMS_LAYOUT)
+    path = HierarchicalPathfinder(game_map, cluster_size=4).find_path((7, 0), (7, 4))
+
+    assert_valid_path(game_map, path, (7, 0), (7, 4))
+    assert (3, 6) in path
+
+
+def test_unreachable_goals_have_no_path():
+    game_map = generate_map(["..#...", "..#...", "..#..."])
+    pathfinder = HierarchicalPathfinder(game_map, cluster_size=2)
+
+    assert pathfinder.find_path((0, 0), (5, 2)) is None
+    assert pathfinder.find_path((0, 0), (6, 0)) is None
+
+
+def test_paths_start_from_impassable_tiles():
+    """ NPCs stand on the character sheet, so the tile they start on is impassable
+        and isn't a node of the graph."""
+    game_map = generate_map(ROOMS_LAYOUT)
+    game_map.character_sheet[0][4] = object()
+    game_map.passability.update_tile(Map.CHARACTER_SHEET_INDEX, 4, 0)
+
+    path = HierarchicalPathfinder(game_map, cluster_size=4).find_path((4, 0), (7, 7))
+
+    assert_valid_path(game_map, path, (4, 0), (7, 7))
+
+
+@pytest.mark.parametrize("seed, diagonal", [(0, False), (1, True), (2, True)])
+def test_finds_a_path_whenever_one_exists(seed, diagonal):
+    random_generator = random.Random(seed)
+    layout = [
+        "".join("#" if random_generator.random() < 0.3 else "." for _ in range(24))
+        for _ in range(24)
+    ]
+    game_map = generate_map(layout)
+    pathfinder = HierarchicalPathfinder(game_map, cluster_size=6, diagonal=diagonal)
+    grid_search = GridSearch(24, 24, game_map.passability.cells, [1] * 576, diagonal)
+
+    for _ in range(30):
+        start = (random_generator.randrange(24), random_generator.randrange(24))
+        goal = (random_generator.randrange(24), random_generator.randrange(24))
+
+        path = pathfinder.find_path(start, goal)
+        assert (path is None) == (grid_search.find_path(start, goal) is None)
+        if path is not None:
+            assert_valid_path(game_map, path, start, goal, diagonal)
+
+
+def test_long_paths_only_search_the_start_and_goal_clusters():
+    game_map = generate_map(["." * 64] * 64)
+    pathfinder = HierarchicalPathfinder(game_map, cluster_size=8)
+    pathfinder.precompute()
+    pathfinder.tiles_searched = 0
+
+    path = pathfinder.find_path((0, 0), (63, 63))
+
+    assert_valid_path(game_map, path, (0, 0), (63, 63))
+    # The start and goal are in corners, so there are only two neighbouring
+    # clusters of each to search too.
+    assert pathfinder.tiles_searched <= 6 * 8 * 8
+
+
+def test_swapping_tiles_only_rebuilds_the_clusters_they_touch():
+    game_map = generate_map(ROOMS_LAYOUT)
+    pathfinder = HierarchicalPathfinder(game_map, cluster_size=4)
+    pathfinder.precompute()
+    assert pathfinder.clusters_rebuilt == 4
+
+    # Close the gap between the bottom clusters, and open one between the right
+    # hand clusters.
+    game_map.swap((3, 6), (5, 3), Map.FOREGROUND_SHEET_INDEX)
+    path = pathfinder.find_path((7, 0), (7, 4))
+
+    assert_valid_path(game_map, path, (7, 0), (7, 4))
+    assert (5, 3) in path
+    assert pathfinder._borders[((0, 1), (1, 1))] == []
+    assert pathfinder.clusters_rebuilt <= 4 + 3
@@ -0,0 +1,99 @@
+from unittest.mock import MagicMock, Mock, patch
+
+import pygame
+import pytest
+
+from tests.test_utils import DummyEvent
+from thegame.engine import Engine
+from thegame.engine.input_recording import InputRecorder, InputReplay
+
+
+def generate_keystroke_list(characters_pressed):
+    key_presses = [0 for _ in range(355)]
+
+    for key in characters_pressed:
+        key_presses[ord(key)] = True
+
+    return key_presses
+
+
+def test_replay_reads_back_each_tick_as_recorded(tmp_path):
+    path = str(tmp_path / "input.log")
+    recorder = InputRecorder(path)
+    recorder.record_keystrokes(["w", "a"])
+    recorder.record_events(
+        [pygame.event.Event(pygame.MOUSEBUTTONDOWN, pos=(3, 4), button=1)], (3, 4)
+    )
+    recorder.record_keystrokes([])
+    recorder.record_events([DummyEvent("not a pygame event")])
+    recorder.close()
+
+    replay = InputReplay(path)
+
+    assert replay.next_keystrokes() == ["w", "a"]
+    (event,) = replay.next_events()
+    assert event.type == pygame.MOUSEBUTTONDOWN
+    assert (event.pos, event.button) == ((3, 4), 1)
+    assert not hasattr(event, "key")
+    assert replay.mouse_position == (3, 4)
+
+    assert replay.next_keystrokes() == []
+    assert replay.next_events() == []
+    assert replay.mouse_position is None
+    assert not replay.finished
+
+
+def test_replay_quits_once_the_log_runs_out(tmp_path):
+    path = str(tmp_path / "input.log")
+    InputRecorder(path).close()
+    replay = InputReplay(path)
+
+    assert replay.next_keystrokes() == []
+    assert [event.type for event in replay.next_events()] == [pygame.QUIT]
+    assert replay.finished
+
+
+def test_replaying_something_other_than_an_input_log_raises(tmp_path):
+    path = tmp_path / "input.log"
+    path.write_bytes(b"Not an input log.")
+
+    with pytest.raises(InputReplay.InvalidInputLogException):
+        InputReplay(str(path))
+
+
+@patch("thegame.engine.engine.pygame.init", Mock())
+@patch("thegame.engine.engine.pygame.display", Mock())
+@patch("thegame.engine.engine.pygame.mouse.get_pos", lambda: (5, 6))
+def test_engine_replays_recorded_input_exactly(tmp_path):
+    path = str(tmp_path / "input.log")
+    keystrokes = [["w"], ["w"], [], ["d"], []]
+
+    with patch("thegame.engine.engine.pygame.key.get_pressed") as get_pressed, patch(
+        "thegame.engine.engine.pygame.event.get"
+    ) as get_events, patch(
+        "thegame.engine.Engine._handle_keystrokes"
+    ) as recorded_handling:
+        get_pressed.side_effect = [generate_keystroke_list(keys) for keys in keystrokes]
+        get_events.side_effect = [[]] * (len(keystrokes) - 1) + [
+            [pygame.event.Event(pygame.QUIT)]
+        ]
+
+        engine = Engine(MagicMock())
+        engine.record_input(path)
+        engine.start()
+
+    with patch("thegame.engine.engine.pygame.key.get_pressed") as get_pressed, patch(
+        "thegame.engine.engine.pygame.event.get"
+    ) as get_events, patch(
+        "thegame.engine.Engine._handle_keystrokes"
+    ) as replayed_handling:
+        engine = Engine(MagicMock())
+        engine.replay_input(path)
+        engine.start()
+
+        assert not get_pressed.called
+        assert not get_events.called
+
+    assert replayed_handling.call_args_list == recorded_handling.call_args_list
+    assert engine.input_replay.ticks == len(keystrokes)
+    assert engine.context.scheduler.frame_budget == float("inf")
@@ -2,7 +2,8 @@ import pytest
 
 from tests.test_utils import generate_sheet, generate_valid_map
 from thegame.engine import Map
-from thegame.engine.game_objects import PlayerControlledObject
+from thegame.engine.game_objects import GameObject, PlayerControlledObject
+from thegame.engine.map import TileRegion
 
 
 @pytest.mark.parametrize(
@@ -143,3 +144,218 @@ def test_swap_done_on_sheet_greater_than_3_raises_value_error():
 
     with pytest.raises(ValueError):
         test_map.swap((0, 1), (0, 1), Map.BACKGROUND_SHEET_INDEX + 1)
+
+
+def test_swap_notifies_tile_listeners():
+    test_map = Map([[1, 2]], [[1, 2]], [[1, 2]], [[1, 2]], validate=False)
+    changes = []
+
+    test_map.register_tile_listener(lambda *change: changes.append(change))
+    test_map.swap((0, 0), (1, 0), Map.PATH_SHEET_INDEX)
+
+    assert changes == [(Map.PATH_SHEET_INDEX, 0, 0), (Map.PATH_SHEET_INDEX, 1, 0)]
+
+
+def test_set_tile_replaces_the_tile_and_notifies_tile_listeners():
+    test_map = Map([[1, 2]], [[1, 2]], [[1, 2]], [[1, 2]], validate=False)
+    changes = []
+    version = test_map.version
+
+    test_map.register_tile_listener(lambda *change: changes.append(change))
+    test_map.set_tile((1, 0), Map.CHARACTER_SHEET_INDEX, 3)
+
+    assert test_map.character_sheet == [[1, 3]]
+    assert test_map.version == version + 1
+    assert changes == [(Map.CHARACTER_SHEET_INDEX, 1, 0)]
+
+
+def test_set_tile_on_sheet_greater_than_3_raises_value_error():
+    test_map = Map([[1, 2]], [[1, 2]], [[1, 2]], [[1, 2]], validate=False)
+
+    with pytest.raises(ValueError):
+        test_map.set_tile((0, 0), Map.BACKGROUND_SHEET_INDEX + 1, 3)
+
+
+def generate_lettered_map(width=4, height=3):
+    """ A map with the letters of each tile's x,y on its path sheet, ie "a0"."""
+    return Map(
+        [[None] * width for _ in range(height)],
+        [[None] * width for _ in range(height)],
+        [["abcdefgh"[x] + str(y) for x in range(width)] for y in range(height)],
+        [[None] * width for _ in range(height)],
+        validate=False,
+    )
+
+
+def record_changes(test_map):
+    """ Returns:
+            The lists the map's tile and region listeners append to."""
+    tiles = []
+    regions = []
+    test_map.register_tile_listener(lambda *tile: tiles.append(tile))
+    test_map.register_region_listener(regions.append)
+
+    return tiles, regions
+
+
+def test_fill_covers_the_part_of_the_rectangle_on_the_map():
+    test_map = generate_lettered_map()
+    tiles, regions = record_changes(test_map)
+
+    test_map.fill(Map.FOREGROUND_SHEET_INDEX, 2, 1, 5, 5, "wall")
+
+    assert test_map.foreground_sheet == [
+        [None] * 4,
+        [None, None, "wall", "wall"],
+        [None, None, "wall", "wall"],
+    ]
+    assert len(tiles) == 4
+    assert regions == [TileRegion(frozenset({Map.FOREGROUND_SHEET_INDEX}), 2, 1, 2, 2)]
+    assert test_map.version == 4
+
+
+def test_fill_can_make_each_tile_its_own_object():
+    test_map = generate_lettered_map()
+
+    test_map.fill(Map.PATH_SHEET_INDEX, 0, 0, 2, 1, lambda x, y: f"new {x},{y}")
+    test_map.fill(Map.PATH_SHEET_INDEX, 9, 9, 2, 2, "off the map")
+
+    assert test_map.path_sheet[0] == ["new 0,0", "new 1,0", "c0", "d0"]
+    assert test_map.version == 2
+
+
+def test_blit_copies_a_region_even_onto_itself():
+    test_map = generate_lettered_map()
+    tiles, regions = record_changes(test_map)
+
+    test_map.blit(test_map, 1, 1, source_area=(0, 0, 3, 2))
+
+    assert test_map.path_sheet == [
+        ["a0", "b0", "c0", "d0"],
+        ["a1", "a0", "b0", "c0"],
+        ["a2", "a1", "b1", "c1"],
+    ]
+    assert len(tiles) == 6
+    assert regions == [TileRegion(frozenset({Map.PATH_SHEET_INDEX}), 1, 1, 3, 2)]
+
+
+def test_blit_copies_each_object():
+    source = Map(*[[[GameObject("tile.png")]] for _ in range(4)])
+    destination = generate_lettered_map()
+
+    destination.blit(source, -1, 2, sheets=(Map.PATH_SHEET_INDEX,))
+    destination.blit(source, 3, 0, sheets=(Map.PATH_SHEET_INDEX,))
+
+    assert destination.path_sheet[2][0] == "a2"
+    copied = destination.path_sheet[0][3]
+    assert copied.sprite_location == "tile.png"
+    assert copied is not source.path_sheet[0][0]
+    assert destination.foreground_sheet[0][3] is None
+
+
+def test_stamp_leaves_the_tiles_under_empty_pattern_tiles():
+    test_map = generate_lettered_map()
+    tiles, regions = record_changes(test_map)
+
+    test_map.stamp(Map.PATH_SHEET_INDEX, 2, 1, [["x", None, "y"], [None, "z"]])
+
+    assert test_map.path_sheet == [
+        ["a0", "b0", "c0", "d0"],
+        ["a1", "b1", "x", "d1"],
+        ["a2", "b2", "c2", "z"],
+    ]
+    assert tiles == [(Map.PATH_SHEET_INDEX, 2, 1), (Map.PATH_SHEET_INDEX, 3, 2)]
+    assert regions == [
+        TileRegion(frozenset({Map.PATH_SHEET_INDEX}), 2, 1, 1, 1),
+        TileRegion(frozenset({Map.PATH_SHEET_INDEX}), 3, 2, 1, 1),
+    ]
+
+
+def test_a_batch_tells_the_listeners_once_it_ends():
+    test_map = generate_lettered_map()
+    tiles, regions = record_changes(test_map)
+    cursor = test_map.journal.subscribe()
+
+    with test_map.batch():
+        test_map.swap((0, 0), (3, 2), Map.PATH_SHEET_INDEX)
+        test_map.set_tile((0, 0), Map.CHARACTER_SHEET_INDEX, "pc")
+        test_map.set_tile((0, 0), Map.CHARACTER_SHEET_INDEX, None)
+        assert tiles == regions == []
+
+    assert tiles == [
+        (Map.PATH_SHEET_INDEX, 0, 0),
+        (Map.PATH_SHEET_INDEX, 3, 2),
+        (Map.CHARACTER_SHEET_INDEX, 0, 0),
+    ]
+    assert regions == [
+        TileRegion(
+            frozenset({Map.PATH_SHEET_INDEX, Map.CHARACTER_SHEET_INDEX}), 0, 0, 1, 1
+        ),
+        TileRegion(frozenset({Map.PATH_SHEET_INDEX}), 3, 2, 1, 1),
+    ]
+    assert len(cursor.read()) == 4
+
+
+def test_a_batch_tells_region_listeners_about_each_run_of_changed_tiles():
+    test_map = Map(*[[[None] * 20 for _ in range(3)] for _ in range(4)], validate=False)
+    tiles, regions = record_changes(test_map)
+
+    with test_map.batch():
+        test_map.fill(Map.PATH_SHEET_INDEX, 0, 0, 2, 2, "x")
+        test_map.set_tile((15, 1), Map.PATH_SHEET_INDEX, "y")
+        test_map.set_tile((15, 2), Map.PATH_SHEET_INDEX, "y")
+        # Close enough to be one run.
+        test_map.set_tile((0, 2), Map.PATH_SHEET_INDEX, "z")
+        test_map.set_tile((3, 2), Map.PATH_SHEET_INDEX, "z")
+
+    assert regions == [
+        TileRegion(frozenset({Map.PATH_SHEET_INDEX}), 0, 0, 2, 2),
+        TileRegion(frozenset({Map.PATH_SHEET_INDEX}), 15, 1, 1, 2),
+        TileRegion(frozenset({Map.PATH_SHEET_INDEX}), 0, 2, 4, 1),
+    ]
+
+
+def test_a_batch_which_raises_is_undone():
+    test_map = generate_lettered_map()
+    tiles, regions = record_changes(test_map)
+
+    with pytest.raises(KeyError):
+        with test_map.batch():
+            test_map.set_tile((1, 1), Map.PATH_SHEET_INDEX, "kept")
+            try:
+                with test_map.batch():
+                    test_map.fill(Map.PATH_SHEET_INDEX, 0, 0, 4, 3, None)
+                    raise ValueError()
+            except ValueError:
+                pass
+            assert test_map.path_sheet[0][0] == "a0"
+            assert test_map.path_sheet[1][1] == "kept"
+            raise KeyError()
+
+    assert test_map.path_sheet[1][1] == "b1"
+    assert tiles == regions == []
+    assert test_map.version == 0
+
+
+def test_move_tiles_moves_every_object_in_one_batch():
+    test_map = generate_lettered_map()
+    tiles, regions = record_changes(test_map)
+    cursor = test_map.journal.subscribe()
+
+    # The first object moves onto where the second one was, as it moves away.
+    test_map.move_tiles(Map.PATH_SHEET_INDEX, [((0, 0), (1, 0)), ((1, 0), (2, 0))])
+
+    assert test_map.path_sheet[0][:3] == [None, "a0", "b0"]
+    assert regions == [TileRegion(frozenset({Map.PATH_SHEET_INDEX}), 0, 0, 3, 1)]
+    assert test_map.version == len(cursor.read()) == 4
+
+
+def test_set_tiles_puts_the_objects_as_they_are():
+    test_map = generate_lettered_map()
+    tile = GameObject("tile.png")
+
+    test_map.set_tiles(Map.PATH_SHEET_INDEX, 3, 1, [[tile, "off the map"], [None]])
+
+    assert test_map.path_sheet[1][3] is tile
+    assert test_map.path_sheet[2][3] is None
+    assert test_map.version == 2
@@ -0,0 +1,103 @@
+import tracemalloc
+
+from thegame.engine import Map
+from thegame.engine.game_objects import GameObject, PlayerCharacter
+
+
+def generate_dungeon(width=64, height=64):
+    """ A map of walls around its edge, with a player character at 1,1."""
+    edges = {0, width - 1}, {0, height - 1}
+    foreground_sheet = [
+        [
+            GameObject("wall.png") if x in edges[0] or y in edges[1] else None
+            for x in range(width)
+        ]
+        for y in range(height)
+    ]
+    character_sheet = [[None] * width for _ in range(height)]
+    character_sheet[1][1] = PlayerCharacter("pc.png")
+
+    return Map(
+        foreground_sheet,
+        character_sheet,
+        [[None] * width for _ in range(height)],
+        [[GameObject("floor.png") for _ in range(width)] for _ in range(height)],
+    )
+
+
+def test_forks_share_rows_until_they_are_written_to():
+    dungeon = generate_dungeon()
+    instance = dungeon.fork()
+
+    assert instance.background_sheet is not dungeon.background_sheet
+    assert instance.background_sheet[5] is dungeon.background_sheet[5]
+
+    instance.set_tile((5, 5), Map.FOREGROUND_SHEET_INDEX, GameObject("rock.png"))
+    dungeon.fill(Map.BACKGROUND_SHEET_INDEX, 0, 10, 64, 1, None)
+
+    assert dungeon.foreground_sheet[5][5] is None
+    assert instance.foreground_sheet[5][5].sprite_location == "rock.png"
+    assert instance.foreground_sheet[6] is dungeon.foreground_sheet[6]
+    assert instance.background_sheet[10][0].sprite_location == "floor.png"
+    assert dungeon.background_sheet[10][0] is None
+
+
+def test_forks_have_their_own_characters():
+    dungeon = generate_dungeon()
+    player = dungeon.character_sheet[1][1]
+
+    instance = dungeon.fork()
+    instance.swap((1, 1), (2, 1), Map.CHARACTER_SHEET_INDEX)
+
+    assert instance.character_sheet[1][2] is not player
+    assert isinstance(instance.character_sheet[1][2], PlayerCharacter)
+    assert dungeon.character_sheet[1][1] is player
+    assert instance.character_sheet[2] is dungeon.character_sheet[2]
+
+
+def test_forks_of_forks_are_independent():
+    dungeon = generate_dungeon()
+    first = dungeon.fork()
+    second = first.fork()
+
+    first.set_tile((3, 3), Map.PATH_SHEET_INDEX, GameObject("path.png"))
+    second.set_tile((4, 3), Map.PATH_SHEET_INDEX, GameObject("path.png"))
+
+    rows = [game_map.path_sheet[3][3:5] for game_map in (dungeon, first, second)]
+    assert rows == [
+        [None, None],
+        [first.path_sheet[3][3], None],
+        [None, second.path_sheet[3][4]],
+    ]
+
+
+def test_forks_start_with_the_maps_passability_and_warp_zones():
+    dungeon = generate_dungeon()
+    other = generate_dungeon(4, 4)
+    dungeon.register_warp_zone(2, 2, other, 1, 1)
+    listened = []
+    dungeon.register_tile_listener(lambda *tile: listened.append(tile))
+    assert not dungeon.is_passable(0, 0)
+
+    instance = dungeon.fork()
+    instance.set_tile((0, 0), Map.FOREGROUND_SHEET_INDEX, None)
+
+    assert instance.is_passable(0, 0)
+    assert not dungeon.is_passable(0, 0)
+    assert instance.warp_zones == dungeon.warp_zones
+    assert instance.version == 1 and dungeon.version == 0
+    assert listened == []
+
+
+def test_a_hundred_forks_cost_little_more_than_one_map():
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    dungeon = generate_dungeon(128, 128)
+    map_memory = tracemalloc.get_traced_memory()[0] - before
+
+    instances = [dungeon.fork() for _ in range(100)]
+    fork_memory = tracemalloc.get_traced_memory()[0] - before - map_memory
+    tracemalloc.stop()
+
+    assert len(instances) == 100
+    assert fork_memory < map_memory
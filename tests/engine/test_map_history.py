@@ -0,0 +1,122 @@
+from thegame.engine import Map
+from thegame.engine.map_history import MapHistory
+
+
+def generate_map(width=40, height=40):
+    return Map(
+        [[None] * width for _ in range(height)],
+        [[None] * width for _ in range(height)],
+        [[f"{x},{y}" for x in range(width)] for y in range(height)],
+        [[None] * width for _ in range(height)],
+        validate=False,
+    )
+
+
+def sheets(game_map):
+    return [[list(row) for row in sheet] for sheet in game_map.tile_sheets]
+
+
+def test_edits_are_undone_and_redone():
+    game_map = generate_map()
+    history = MapHistory(game_map)
+    original = sheets(game_map)
+
+    with history.edit("walls"):
+        game_map.fill(Map.FOREGROUND_SHEET_INDEX, 10, 10, 20, 1, "wall")
+    walled = sheets(game_map)
+    game_map.swap((0, 0), (39, 39), Map.PATH_SHEET_INDEX)
+    swapped = sheets(game_map)
+
+    # The swap isn't committed, so it's committed as an edit of its own.
+    assert history.undo().label is None
+    assert sheets(game_map) == walled
+    assert history.undo().label == "walls"
+    assert sheets(game_map) == original
+    assert history.undo() is None
+    assert not history.can_undo
+
+    assert history.redo().label == "walls"
+    assert history.redo().label is None
+    assert sheets(game_map) == swapped
+    assert not history.can_redo
+
+
+def test_undone_objects_are_the_original_objects():
+    game_map = generate_map()
+    history = MapHistory(game_map)
+    tile = game_map.path_sheet[5][5]
+
+    game_map.set_tile((5, 5), Map.PATH_SHEET_INDEX, None)
+    history.undo()
+
+    assert game_map.path_sheet[5][5] is tile
+
+
+def test_new_edits_forget_what_could_be_redone():
+    game_map = generate_map()
+    history = MapHistory(game_map)
+
+    game_map.set_tile((1, 1), Map.FOREGROUND_SHEET_INDEX, "wall")
+    history.undo()
+    game_map.set_tile((2, 2), Map.FOREGROUND_SHEET_INDEX, "rock")
+    history.commit()
+
+    assert history.redo() is None
+    assert game_map.foreground_sheet[1][1] is None
+    assert game_map.foreground_sheet[2][2] == "rock"
+
+
+def test_entries_only_hold_the_chunks_they_changed():
+    game_map = generate_map()
+    history = MapHistory(game_map, chunk_size=8)
+
+    for step in range(3):
+        game_map.set_tile((step, 0), Map.FOREGROUND_SHEET_INDEX, "wall")
+        history.commit()
+    game_map.set_tile((0, 0), Map.FOREGROUND_SHEET_INDEX, "wall")
+
+    assert not history.commit()
+    assert [list(entry.chunks) for entry in history.undo_entries] == [
+        [(Map.FOREGROUND_SHEET_INDEX, 0, 0)]
+    ] * 3
+
+    # Each entry's after chunk is the next one's before chunk.
+    first, second, third = history.undo_entries
+    assert first.chunks[(0, 0, 0)][1] is second.chunks[(0, 0, 0)][0]
+    assert second.chunks[(0, 0, 0)][1] is third.chunks[(0, 0, 0)][0]
+    assert len(history._chunk_references) == 4
+
+
+def test_the_oldest_entries_are_forgotten_over_the_memory_cap():
+    game_map = generate_map()
+    history = MapHistory(game_map, chunk_size=8)
+    game_map.set_tile((0, 0), Map.FOREGROUND_SHEET_INDEX, "wall")
+    history.commit()
+    history.max_memory = history.memory * 3
+
+    for x in range(8, 40, 8):
+        game_map.set_tile((x, 0), Map.FOREGROUND_SHEET_INDEX, "wall")
+        history.commit()
+
+    # Each entry holds two chunks, so only three of the five fit.
+    assert [list(entry.chunks) for entry in history.undo_entries] == [
+        [(Map.FOREGROUND_SHEET_INDEX, x, 0)] for x in (2, 3, 4)
+    ]
+    assert history.memory <= history.max_memory
+
+    history.clear()
+    assert history.memory == 0
+    assert not history._chunk_references and not history._latest
+
+
+def test_history_is_cleared_if_changes_are_discarded():
+    game_map = generate_map()
+    history = MapHistory(game_map)
+    game_map.set_tile((0, 0), Map.FOREGROUND_SHEET_INDEX, "wall")
+    history.commit()
+    game_map.journal.max_changes = 10
+
+    game_map.fill(Map.FOREGROUND_SHEET_INDEX, 0, 0, 40, 40, "wall")
+
+    assert not history.commit()
+    assert not history.can_undo
@@ -0,0 +1,85 @@
+import gc
+
+import pytest
+
+from thegame.engine.map import Map
+from thegame.engine.map_journal import MapJournal, TileChange
+
+
+def test_cursors_read_the_changes_made_since_they_last_read():
+    journal = MapJournal()
+    journal.record(0, 1, 1, "old", "new")
+    first = journal.subscribe()
+    journal.record(1, 2, 3, None, "tile")
+    second = journal.subscribe()
+    journal.record(1, 2, 3, "tile", None)
+
+    assert first.pending == 2
+    assert first.read() == [
+        TileChange(2, 1, 2, 3, None, "tile"),
+        TileChange(3, 1, 2, 3, "tile", None),
+    ]
+    assert first.read() == []
+    assert second.changed_tiles() == {(1, 2, 3)}
+    assert journal.version == 3
+
+
+def test_changes_every_cursor_has_read_are_dropped():
+    journal = MapJournal()
+    journal.record(0, 0, 0, None, None)
+    assert len(journal) == 0
+
+    fast = journal.subscribe()
+    slow = journal.subscribe()
+    for x in range(10):
+        journal.record(0, x, 0, None, None)
+    fast.read()
+    assert len(journal) == 10
+
+    slow.read()
+    assert len(journal) == 0
+
+    journal.record(0, 0, 0, None, None)
+    slow.close()
+    fast.skip()
+    assert len(journal) == 0
+
+
+def test_forgotten_cursors_stop_holding_changes():
+    journal = MapJournal()
+    journal.subscribe()
+    gc.collect()
+
+    journal.record(0, 0, 0, None, None)
+
+    assert len(journal) == 0
+
+
+def test_a_cursor_too_far_behind_is_told_its_changes_were_discarded():
+    journal = MapJournal(max_changes=4)
+    behind = journal.subscribe()
+    for x in range(6):
+        journal.record(0, x, 0, None, None)
+
+    assert len(journal) == 4
+    with pytest.raises(MapJournal.ChangesDiscardedException):
+        behind.read()
+
+    # The cursor carries on from the latest change.
+    journal.record(0, 9, 9, None, None)
+    assert behind.changed_tiles() == {(0, 9, 9)}
+
+
+def test_maps_journal_their_changes():
+    test_map = Map([[1, 2]], [[1, 2]], [[1, 2]], [[1, 2]], validate=False)
+    cursor = test_map.journal.subscribe()
+
+    test_map.swap((0, 0), (1, 0), Map.PATH_SHEET_INDEX)
+    test_map.set_tile((1, 0), Map.FOREGROUND_SHEET_INDEX, None)
+
+    assert cursor.read() == [
+        TileChange(1, Map.PATH_SHEET_INDEX, 0, 0, 1, 2),
+        TileChange(2, Map.PATH_SHEET_INDEX, 1, 0, 2, 1),
+        TileChange(3, Map.FOREGROUND_SHEET_INDEX, 1, 0, 2, None),
+    ]
+    assert test_map.version == 3
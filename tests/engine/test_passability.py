@@ -0,0 +1,130 @@
+import pytest
+
+from thegame.engine import Map
+from thegame.engine.game_objects import GameObject
+
+
+def generate_walled_map():
+    """ A 3x3 map with a wall in the foreground down the middle column, and a
+        character in the top left corner.
+
+            C # .
+            . # .
+            . . .
+    """
+    wall = GameObject("wall.png")
+    foreground_sheet = [[None, wall, None], [None, wall, None], [None, None, None]]
+    character_sheet = [[GameObject("pc.png"), None, None]] + [
+        [None, None, None] for _ in range(2)
+    ]
+    path_sheet = [[GameObject("path.png") for _ in range(3)] for _ in range(3)]
+    background_sheet = [[GameObject("grass.png") for _ in range(3)] for _ in range(3)]
+
+    return Map(foreground_sheet, character_sheet, path_sheet, background_sheet)
+
+
+@pytest.mark.parametrize(
+    "x, y, passable",
+    [
+        (0, 0, False),
+        (1, 0, False),
+        (1, 1, False),
+        (2, 0, True),
+        (0, 1, True),
+        (1, 2, True),
+        (-1, 0, False),
+        (0, -1, False),
+        (3, 0, False),
+        (0, 3, False),
+    ],
+)
+def test_passability_comes_from_the_foreground_and_character_sheets(x, y, passable):
+    assert generate_walled_map().is_passable(x, y) is passable
+
+
+def test_swapping_tiles_updates_passability():
+    game_map = generate_walled_map()
+    game_map.passability
+
+    game_map.swap((0, 0), (0, 1), Map.CHARACTER_SHEET_INDEX)
+    game_map.swap((1, 1), (1, 2), Map.FOREGROUND_SHEET_INDEX)
+
+    assert game_map.is_passable(0, 0)
+    assert not game_map.is_passable(0, 1)
+    assert game_map.is_passable(1, 1)
+    assert not game_map.is_passable(1, 2)
+
+
+def test_passable_positions_filters_in_bulk():
+    grid = generate_walled_map().passability
+
+    assert grid.passable_positions([(0, 0), (2, 2), (5, 5), (0, 1)]) == [
+        (2, 2),
+        (0, 1),
+    ]
+
+
+def test_region_treats_outside_the_map_as_impassable():
+    grid = generate_walled_map().passability
+
+    assert grid.region(-1, 1, 3, 3) == [
+        [False, True, False],
+        [False, True, True],
+        [False, False, False],
+    ]
+
+
+@pytest.mark.parametrize(
+    "diagonal, expected",
+    [
+        (False, [(2, 1), (1, 2), (0, 1)]),
+        (True, [(2, 1), (1, 2), (0, 1), (2, 2), (0, 2)]),
+    ],
+)
+def test_neighbours_does_not_cut_corners(diagonal, expected):
+    foreground_sheet = [[None, None, None], [None, None, None], [None, None, None]]
+    foreground_sheet[0][1] = GameObject("wall.png")
+    empty = [[None, None, None] for _ in range(3)]
+    game_map = Map(foreground_sheet, empty, empty, empty)
+
+    assert game_map.passability.neighbours(1, 1, diagonal=diagonal) == expected
+
+
+def generate_open_map_with_cells(cells):
+    return Map(
+        [[None, None]],
+        [[None, None]],
+        [[None, None]],
+        [[None, None]],
+        validate=False,
+        passability_cells=cells,
+    )
+
+
+def test_given_cells_are_used_until_a_tile_changes():
+    # Cells which disagree with the sheets, so it's clear which are used.
+    test_map = generate_open_map_with_cells(bytes([0, 1]))
+
+    assert not test_map.is_passable(0, 0)
+
+    stale_map = generate_open_map_with_cells(bytes([0, 1]))
+    stale_map.swap((0, 0), (1, 0), Map.PATH_SHEET_INDEX)
+
+    assert stale_map.is_passable(0, 0)
+
+
+def test_cells_must_match_the_map_size():
+    with pytest.raises(ValueError):
+        generate_open_map_with_cells(bytes([1])).passability
+
+
+def test_bulk_changes_update_the_grid_once():
+    test_map = generate_open_map_with_cells(None)
+    grid = test_map.passability
+
+    test_map.fill(Map.FOREGROUND_SHEET_INDEX, 0, 0, 2, 1, "wall")
+    assert bytes(grid.cells) == bytes([0, 0])
+
+    test_map.fill(Map.PATH_SHEET_INDEX, 0, 0, 2, 1, "path")
+    test_map.set_tile((1, 0), Map.FOREGROUND_SHEET_INDEX, None)
+    assert bytes(grid.cells) == bytes([0, 1])
@@ -0,0 +1,238 @@
+import random
+
+import pytest
+
+from thegame.engine import Map
+from thegame.engine.game_objects import GameObject
+from thegame.engine.pathfinding import MAX_JUMP, GridSearch, Pathfinder
+
+
+def generate_map(layout, paths=()):
+    """ Build a map from a list of strings, where # is a wall in the foreground and
+        anything else is open. Any x,y in paths gets a tile on the path sheet."""
+    height = len(layout)
+    width = len(layout[0])
+
+    foreground_sheet = [
+        [GameObject("wall.png") if tile == "#" else None for tile in row]
+        for row in layout
+    ]
+    character_sheet = [[None] * width for _ in range(height)]
+    path_sheet = [
+        [GameObject("path.png") if (x, y) in paths else None for x in range(width)]
+        for y in range(height)
+    ]
+    background_sheet = [[GameObject("grass.png")] * width for _ in range(height)]
+
+    return Map(foreground_sheet, character_sheet, path_sheet, background_sheet)
+
+
+WALLED_LAYOUT = [
+    ".....",
+    ".###.",
+    "...#.",
+    "##.#.",
+    ".....",
+]
+
+
+def path_length(path):
+    return sum(
+        1 if x == next_x or y == next_y else 2 ** 0.5
+        for (x, y), (next_x, next_y) in zip(path, path[1:])
+    )
+
+
+def assert_valid_path(game_map, path, start, goal, diagonal=False):
+    assert path[0] == start
+    assert path[-1] == goal
+
+    for (x, y), (next_x, next_y) in zip(path, path[1:]):
+        step_x = next_x - x
+        step_y = next_y - y
+        assert max(abs(step_x), abs(step_y)) == 1
+        assert game_map.is_passable(next_x, next_y) or (next_x, next_y) == goal
+
+        if step_x and step_y:
+            assert diagonal
+            assert game_map.is_passable(x + step_x, y)
+            assert game_map.is_passable(x, y + step_y)
+
+
+def test_path_goes_around_walls():
+    game_map = generate_map(WALLED_LAYOUT)
+    path = Pathfinder(game_map).find_path((0, 2), (4, 4))
+
+    assert_valid_path(game_map, path, (0, 2), (4, 4))
+    assert len(path) == 7
+
+
+def test_no_path_returns_none():
+    game_map = generate_map(["..#..", "..#..", "..#.."])
+    pathfinder = Pathfinder(game_map, diagonal=True)
+
+    assert pathfinder.find_path((0, 0), (4, 2)) is None
+    assert pathfinder.find_path((0, 0), (9, 9)) is None
+
+
+def test_start_and_goal_are_walkable_even_when_occupied():
+    game_map = generate_map(["#..#"])
+
+    assert Pathfinder(game_map).find_path((0, 0), (3, 0)) == [
+        (0, 0),
+        (1, 0),
+        (2, 0),
+        (3, 0),
+    ]
+
+
+def test_diagonal_paths_dont_cut_corners():
+    game_map = generate_map(["..", "#."])
+    path = Pathfinder(game_map, diagonal=True).find_path((0, 0), (1, 1))
+
+    assert path == [(0, 0), (1, 0), (1, 1)]
+
+
+@pytest.mark.parametrize("max_jump", [None, 3])
+@pytest.mark.parametrize("seed", range(5))
+def test_jump_point_search_matches_a_star(seed, max_jump):
+    random_generator = random.Random(seed)
+    layout = [
+        "".join("#" if random_generator.random() < 0.25 else "." for _ in range(20))
+        for _ in range(20)
+    ]
+    game_map = generate_map(layout)
+    passability = game_map.passability
+
+    jump_point_search = GridSearch(
+        20, 20, passability.cells, diagonal=True, max_jump=max_jump
+    )
+    a_star = GridSearch(20, 20, passability.cells, [1] * 400, diagonal=True)
+
+    for _ in range(20):
+        start = (random_generator.randrange(20), random_generator.randrange(20))
+        goal = (random_generator.randrange(20), random_generator.randrange(20))
+
+        jump_path = jump_point_search.find_path(start, goal)
+        a_star_path = a_star.find_path(start, goal)
+
+        assert (jump_path is None) == (a_star_path is None)
+        if jump_path is not None:
+            assert_valid_path(game_map, jump_path, start, goal, diagonal=True)
+            assert path_length(jump_path) == pytest.approx(path_length(a_star_path))
+
+
+def test_jumps_across_open_maps_are_bounded():
+    grid_search = GridSearch(64, 64, bytes([1] * 64 * 64), diagonal=True)
+
+    path = grid_search.find_path((0, 0), (63, 40))
+
+    assert len(path) == 64
+    # Rather than running on to the edge of the map.
+    assert grid_search._jump(1, 0, 1, 0) == (1 + MAX_JUMP, 0)
+
+
+def test_paths_are_cached_until_the_map_changes():
+    game_map = generate_map(WALLED_LAYOUT)
+    pathfinder = Pathfinder(game_map)
+
+    first_path = pathfinder.find_path((0, 2), (4, 4))
+    assert pathfinder.find_path((0, 2), (4, 4)) is first_path
+    assert pathfinder.cache_hits == 1
+
+    # Open up the wall below the start.
+    game_map.swap((0, 3), (0, 4), Map.FOREGROUND_SHEET_INDEX)
+    game_map.swap((1, 3), (1, 4), Map.FOREGROUND_SHEET_INDEX)
+
+    new_path = pathfinder.find_path((0, 2), (4, 4))
+    assert pathfinder.cache_hits == 1
+    assert len(new_path) == 7
+    assert_valid_path(game_map, new_path, (0, 2), (4, 4))
+
+
+def test_cache_is_kept_when_passability_doesnt_change():
+    game_map = generate_map(WALLED_LAYOUT)
+    pathfinder = Pathfinder(game_map)
+    path = pathfinder.find_path((0, 2), (4, 4))
+
+    game_map.swap((0, 0), (4, 4), Map.BACKGROUND_SHEET_INDEX)
+
+    assert pathfinder.find_path((0, 2), (4, 4)) is path
+    assert pathfinder.cache_hits == 1
+
+
+def test_cache_is_limited_in_size():
+    pathfinder = Pathfinder(generate_map(["....."]), cache_size=2)
+
+    for goal in range(1, 5):
+        pathfinder.find_path((0, 0), (goal, 0))
+
+    assert len(pathfinder._cache) == 2
+
+
+def test_path_sheet_costs_steer_paths():
+    layout = [".....", ".....", "....."]
+    paths = {(0, 0), (0, 1), (0, 2), (1, 2), (2, 2), (3, 2), (4, 2), (4, 1), (4, 0)}
+    game_map = generate_map(layout, paths)
+
+    straight = Pathfinder(game_map).find_path((0, 0), (4, 0))
+    along_the_path = Pathfinder(game_map, path_cost=1, terrain_cost=5).find_path(
+        (0, 0), (4, 0)
+    )
+
+    assert len(straight) == 5
+    assert set(along_the_path) == paths
+
+
+def test_path_costs_follow_swapped_path_tiles():
+    game_map = generate_map(["...", "..."], {(0, 1), (1, 1), (2, 1)})
+    pathfinder = Pathfinder(game_map, path_cost=1, terrain_cost=10)
+
+    assert pathfinder._costs == [10, 10, 10, 1, 1, 1]
+    game_map.swap((1, 0), (1, 1), Map.PATH_SHEET_INDEX)
+    assert pathfinder._costs == [10, 1, 10, 1, 10, 1]
+
+
+@pytest.mark.parametrize("processes", [1, 2])
+def test_find_paths_in_bulk(processes):
+    game_map = generate_map(WALLED_LAYOUT)
+    pathfinder = Pathfinder(game_map, diagonal=True)
+    requests = [((0, 0), (4, 4)), ((0, 2), (4, 4)), ((0, 4), (2, 2)), ((0, 0), (0, 4))]
+
+    paths = pathfinder.find_paths(requests, processes=processes)
+
+    assert set(paths) == set(requests)
+    for start, goal in requests:
+        assert paths[(start, goal)] == pathfinder.find_path(start, goal)
+
+    assert pathfinder.cache_hits == len(requests)
+    pathfinder.close()
+
+
+def test_find_paths_keeps_one_pool_of_workers():
+    game_map = generate_map(WALLED_LAYOUT)
+    pathfinder = Pathfinder(game_map)
+
+    pathfinder.find_paths([((0, 0), (4, 4)), ((0, 2), (4, 4))], processes=2)
+    pool = pathfinder._pool
+    pathfinder.find_paths([((0, 4), (2, 2)), ((0, 0), (0, 4))], processes=2)
+
+    assert pathfinder._pool is pool
+    pathfinder.close()
+    assert pathfinder._pool is None
+
+
+def test_find_paths_leaves_what_doesnt_fit_in_the_frame_budget_pending():
+    game_map = generate_map(WALLED_LAYOUT)
+    # Each path found takes a second.
+    pathfinder = Pathfinder(game_map, clock=iter(range(100)).__next__)
+    requests = [((0, 0), (4, 4)), ((0, 2), (4, 4)), ((0, 4), (2, 2))]
+
+    paths = pathfinder.find_paths(requests, frame_budget=1.5)
+    assert list(paths) == requests[:2]
+    assert pathfinder.pending == requests[2:]
+
+    paths = pathfinder.find_paths(frame_budget=1.5)
+    assert list(paths) == requests[2:]
+    assert pathfinder.pending == []
+    assert paths[requests[2]] == pathfinder.find_path(*requests[2])
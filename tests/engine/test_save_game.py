@@ -0,0 +1,215 @@
+import os
+
+import pytest
+
+from thegame.engine import BaseGame, Map, save_game
+from thegame.engine.game_objects import GameObject, PlayerCharacter
+from thegame.engine.save_game import (
+    FULL_SNAPSHOT,
+    TILES_RECORD,
+    SaveFile,
+    SaveManager,
+)
+
+
+def generate_world(width=40, height=40):
+    """ A game on a grass map with a wall along the top row, a player character
+        at 1,1, and a warp zone to a second, empty, map."""
+    foreground_sheet = [[None] * width for _ in range(height)]
+    foreground_sheet[0] = [GameObject("wall.png") for _ in range(width)]
+    character_sheet = [[None] * width for _ in range(height)]
+    player = PlayerCharacter("pc.png", name="player")
+    character_sheet[1][1] = player
+    background_sheet = [
+        [GameObject("grass.png") for _ in range(width)] for _ in range(height)
+    ]
+
+    grass_map = Map(
+        foreground_sheet,
+        character_sheet,
+        [[None] * width for _ in range(height)],
+        background_sheet,
+    )
+    empty_map = Map(*[[[None] * 4 for _ in range(4)] for _ in range(4)])
+    grass_map.register_warp_zone(2, 2, empty_map, 1, 1, 3, 3)
+
+    game = BaseGame(initial_map=grass_map, initial_map_name="grass")
+    game.register_map("empty", empty_map)
+    game.load_player_controlled_objects(grass_map)
+
+    return game, player
+
+
+def load(path):
+    game = BaseGame(initial_map=Map([[None]], [[None]], [[None]], [[None]]))
+    game.load_game(path)
+
+    return game
+
+
+def sprite_locations(sheet):
+    return [[tile and tile.sprite_location for tile in row] for row in sheet]
+
+
+def test_full_snapshot_restores_maps_entities_and_warp_zones(tmp_path):
+    game, player = generate_world()
+    player.facing = PlayerCharacter.EAST
+    saves = SaveManager(game, str(tmp_path), chunk_size=16)
+
+    path = saves.save().result()
+    loaded = load(path)
+
+    grass_map = loaded.maps["grass"]
+    assert loaded.active_screen is grass_map
+    for sheet, loaded_sheet in zip(
+        game.maps["grass"].tile_sheets, grass_map.tile_sheets
+    ):
+        assert sprite_locations(sheet) == sprite_locations(loaded_sheet)
+
+    loaded_player = grass_map.character_sheet[1][1]
+    assert loaded_player is not player
+    assert loaded.player_controlled_objects[loaded_player] == (1, 1)
+    assert loaded_player.facing == PlayerCharacter.EAST
+
+    (warp_zone,) = grass_map.warp_zones
+    assert warp_zone[:4] == (2, 2, 3, 3)
+    assert warp_zone[Map.WARP_ZONE_LOCATION] is loaded.maps["empty"]
+
+
+def test_identical_tiles_share_a_palette_entry(tmp_path):
+    game, _ = generate_world()
+    saves = SaveManager(game, str(tmp_path))
+
+    save_file = SaveFile(saves.save().result())
+
+    # Wall, pc and grass.
+    assert len(save_file.palette) == 3
+    save_file.close()
+
+
+def test_deltas_hold_only_the_chunks_changed_since_the_full_snapshot(tmp_path):
+    game, _ = generate_world()
+    saves = SaveManager(game, str(tmp_path), chunk_size=16)
+    saves.save()
+
+    game.maps["grass"].swap((0, 0), (0, 1), Map.FOREGROUND_SHEET_INDEX)
+    path = saves.save().result()
+    save_file = SaveFile(path)
+
+    tile_records = [key for key in save_file._records if key[0] == TILES_RECORD]
+    assert save_file.base_id == 1
+    assert tile_records == [(TILES_RECORD, 0, 0, 0)]
+    save_file.close()
+
+    loaded = load(path)
+    assert loaded.maps["grass"].foreground_sheet[0][0] is None
+    assert loaded.maps["grass"].foreground_sheet[1][0].sprite_location == "wall.png"
+    assert loaded.maps["grass"].foreground_sheet[0][1].sprite_location == "wall.png"
+
+
+def test_maps_registered_after_the_full_snapshot_are_saved_whole(tmp_path):
+    game, _ = generate_world()
+    saves = SaveManager(game, str(tmp_path), chunk_size=16)
+    saves.save()
+
+    game.register_map("new", Map(*[[[GameObject("new.png")]] for _ in range(4)]))
+    saves.save()
+    path = saves.save().result()
+
+    assert load(path).maps["new"].foreground_sheet[0][0].sprite_location == "new.png"
+
+
+def test_maps_with_discarded_changes_are_saved_whole(tmp_path):
+    game, _ = generate_world()
+    saves = SaveManager(game, str(tmp_path), chunk_size=16)
+    saves.save()
+
+    grass_map = game.maps["grass"]
+    grass_map.journal.max_changes = 1
+    grass_map.swap((0, 0), (0, 1), Map.FOREGROUND_SHEET_INDEX)
+    grass_map.swap((39, 39), (39, 0), Map.FOREGROUND_SHEET_INDEX)
+    save_file = SaveFile(saves.save().result())
+
+    tile_records = [key for key in save_file._records if key[0] == TILES_RECORD]
+    assert len(tile_records) == 9
+    save_file.close()
+
+
+def test_saves_are_of_the_game_when_they_were_started(tmp_path):
+    game, _ = generate_world()
+    saves = SaveManager(game, str(tmp_path))
+
+    future = saves.save()
+    game.maps["grass"].swap((0, 0), (0, 1), Map.FOREGROUND_SHEET_INDEX)
+
+    assert load(future.result()).maps["grass"].foreground_sheet[0][0] is not None
+
+
+def test_loading_something_other_than_a_save_raises(tmp_path):
+    path = tmp_path / "notes.txt"
+    path.write_bytes(b"Not a save file, but long enough to have a footer.")
+
+    with pytest.raises(SaveFile.InvalidSaveException):
+        SaveFile(str(path))
+
+
+def test_deltas_without_their_full_snapshot_raise(tmp_path, monkeypatch):
+    game, _ = generate_world()
+    saves = SaveManager(game, str(tmp_path))
+    os.remove(saves.save().result())
+    delta_path = saves.save().result()
+    saves.close()
+
+    opened = []
+
+    def tracked_open(*args, **kwargs):
+        opened.append(open(*args, **kwargs))
+        return opened[-1]
+
+    monkeypatch.setattr(save_game, "open", tracked_open, raising=False)
+    with pytest.raises(SaveFile.InvalidSaveException):
+        SaveFile(delta_path)
+
+    assert opened and all(save_file.closed for save_file in opened)
+
+
+def test_closing_after_a_failed_save_stops_tracking_the_maps(tmp_path):
+    game, _ = generate_world()
+    saves = SaveManager(game, str(tmp_path / "missing"))
+    saves.save()
+
+    with pytest.raises(OSError):
+        saves.close()
+
+    game.maps["grass"].swap((0, 0), (0, 1), Map.FOREGROUND_SHEET_INDEX)
+    assert len(game.maps["grass"].journal) == 0
+
+
+def test_saves_hold_objects_as_they_were_when_started(tmp_path):
+    game, player = generate_world()
+    saves = SaveManager(game, str(tmp_path))
+    wall = game.maps["grass"].foreground_sheet[0][0]
+    capture = saves._capture(full=True)
+
+    wall.sprite_location = "moved.png"
+    player.facing = PlayerCharacter.WEST
+    path = str(tmp_path / "save.sav")
+    save_game._write_snapshot(path, FULL_SNAPSHOT, 1, 1, capture)
+
+    loaded = load(path).maps["grass"]
+    assert loaded.foreground_sheet[0][0].sprite_location == "wall.png"
+    assert loaded.character_sheet[1][1].facing == PlayerCharacter.NORTH
+
+
+def test_autosaves_are_written_as_deltas(tmp_path):
+    game, _ = generate_world()
+    game.enable_saves(str(tmp_path), autosave_interval=2)
+
+    for _ in range(4):
+        game.scheduler.tick(game)
+    game.saves.close()
+
+    assert sorted(path.name for path in tmp_path.iterdir()) == [
+        "delta-000002.sav",
+        "snapshot-000001.sav",
+    ]
@@ -0,0 +1,137 @@
+from itertools import count
+from unittest.mock import Mock
+
+import pytest
+
+from tests.test_utils import generate_valid_map
+from thegame.engine import BaseGame
+from thegame.engine.game_objects import GameObject
+from thegame.engine.scheduler import UpdateScheduler
+
+
+def test_updates_run_every_interval_ticks():
+    scheduler = UpdateScheduler()
+    every_tick = Mock()
+    every_third_tick = Mock()
+    scheduler.schedule(None, every_tick)
+    scheduler.schedule(None, every_third_tick, interval=3)
+
+    for _ in range(6):
+        scheduler.tick("context")
+
+    assert every_tick.call_count == 6
+    assert every_third_tick.call_count == 2
+    every_third_tick.assert_called_with("context", 3)
+
+
+def test_updates_must_run_at_most_once_a_tick():
+    with pytest.raises(ValueError):
+        UpdateScheduler().schedule(None, Mock(), interval=0)
+
+
+def test_cancelled_updates_stop_running():
+    scheduler = UpdateScheduler()
+    callback = Mock()
+    update = scheduler.schedule(None, callback)
+
+    scheduler.tick(None)
+    scheduler.cancel(update)
+    scheduler.tick(None)
+
+    assert callback.call_count == 1
+
+
+def test_updates_over_budget_are_deferred_by_priority():
+    # Every check of the clock moves it on a second, with a budget of 2 seconds.
+    clock = count()
+    scheduler = UpdateScheduler(frame_budget=2, clock=lambda: next(clock))
+    ran = []
+    for priority in [3, 1, 2, 0]:
+        scheduler.schedule(
+            None,
+            lambda context, elapsed, priority=priority: ran.append((priority, elapsed)),
+            priority=priority,
+        )
+
+    scheduler.tick(None)
+    assert [priority for priority, _ in ran] == [0, 1]
+    assert scheduler.behind
+
+    # The deferred updates are first in line the next tick, and catch up on the
+    # ticks they missed.
+    ran.clear()
+    scheduler.tick(None)
+    assert ran == [(2, 1), (3, 1)]
+
+
+def test_a_due_update_always_runs_even_without_budget():
+    scheduler = UpdateScheduler(frame_budget=0)
+    callback = Mock()
+    scheduler.schedule(None, callback)
+
+    scheduler.tick(None)
+
+    callback.assert_called_once()
+
+
+def generate_game_with_npc(position):
+    game = BaseGame(initial_map=generate_valid_map(), camera_width=3, camera_height=3)
+    game.camera.camera_x = 0
+    game.camera.camera_y = 0
+
+    npc = GameObject("npc.png")
+    game.entities.create(position, game_object=npc)
+
+    return game, npc
+
+
+def test_updates_of_far_objects_sleep_until_a_camera_comes_near():
+    game, npc = generate_game_with_npc((20, 0))
+    scheduler = UpdateScheduler(sleep_distance=5)
+    callback = Mock()
+    scheduler.schedule(npc, callback)
+
+    scheduler.tick(game)
+    scheduler.tick(game)
+    callback.assert_not_called()
+
+    game.camera.camera_x = 14
+    scheduler.tick(game)
+
+    callback.assert_called_once_with(game, 1)
+
+
+def test_near_objects_dont_sleep():
+    game, npc = generate_game_with_npc((6, 0))
+    scheduler = UpdateScheduler(sleep_distance=5)
+    callback = Mock()
+    scheduler.schedule(npc, callback)
+
+    scheduler.tick(game)
+
+    callback.assert_called_once()
+
+
+def test_sleeping_updates_are_woken_by_wake_and_events():
+    game, npc = generate_game_with_npc((20, 0))
+    scheduler = UpdateScheduler(sleep_distance=5)
+    woken_by_object = Mock()
+    woken_by_event = Mock()
+    scheduler.schedule(npc, woken_by_object)
+    scheduler.schedule(npc, woken_by_event, wake_on=("alarm",))
+    scheduler.tick(game)
+
+    scheduler.post("alarm")
+    scheduler.tick(game)
+    assert woken_by_event.call_count == 1
+    woken_by_object.assert_not_called()
+
+    scheduler.wake(npc)
+    scheduler.tick(game)
+    assert woken_by_object.call_count == 1
+
+    # Still far from the camera, so both go back to sleep.
+    scheduler.tick(game)
+    scheduler.tick(game)
+    assert woken_by_event.call_count == 1
+    assert woken_by_object.call_count == 1
@@ -0,0 +1,198 @@
+import pygame
+import pytest
+
+from thegame.engine import Map
+from thegame.engine.camera import Camera
+from thegame.engine.game_objects import GameObject
+from thegame.engine.scroll_buffer import ScrollBuffer
+from thegame.engine.tile_renderer import TileRenderer
+
+RED = (255, 0, 0, 255)
+BLUE = (0, 0, 255, 255)
+BLACK = (0, 0, 0, 255)
+
+TILE = 8
+
+
+def generate_tile_images():
+    red = pygame.Surface((TILE, TILE))
+    red.fill(RED)
+    blue = pygame.Surface((TILE, TILE))
+    blue.fill(BLUE)
+
+    return {"red.png": red, "blue.png": blue}
+
+
+def generate_scroll_buffer(camera_x, camera_y, tile_size=TILE):
+    camera = Camera(3, 3, camera_x, camera_y, tile_size, tile_size)
+    return camera, ScrollBuffer(camera, TileRenderer(generate_tile_images()))
+
+
+def generate_striped_map(width, height):
+    """ Generate a map with red tiles on even columns and blue tiles on odd ones."""
+    background_sheet = [
+        [GameObject("red.png" if x % 2 == 0 else "blue.png") for x in range(width)]
+        for _ in range(height)
+    ]
+    empty_sheet = [[None for _ in range(width)] for _ in range(height)]
+
+    return Map(
+        [list(row) for row in empty_sheet],
+        [list(row) for row in empty_sheet],
+        [list(row) for row in empty_sheet],
+        background_sheet,
+    )
+
+
+def test_first_update_draws_the_whole_buffer():
+    camera, scroll_buffer = generate_scroll_buffer(5, 5)
+
+    scroll_buffer.update(generate_striped_map(10, 10))
+
+    assert scroll_buffer.tiles_drawn == 4 * 4
+
+
+@pytest.mark.parametrize(
+    "delta_x, delta_y, expected_tiles_drawn",
+    [(1, 0, 4), (-1, 0, 4), (0, 1, 4), (0, -1, 4), (1, 1, 7), (0, 0, 0)],
+)
+def test_scrolling_only_draws_exposed_tiles(delta_x, delta_y, expected_tiles_drawn):
+    camera, scroll_buffer = generate_scroll_buffer(5, 5)
+    game_map = generate_striped_map(10, 10)
+
+    scroll_buffer.update(game_map)
+    camera.camera_x += delta_x
+    camera.camera_y += delta_y
+    scroll_buffer.update(game_map)
+
+    assert scroll_buffer.tiles_drawn == expected_tiles_drawn
+
+
+def test_jumping_further_than_the_buffer_redraws_everything():
+    camera, scroll_buffer = generate_scroll_buffer(5, 5)
+    game_map = generate_striped_map(20, 20)
+
+    scroll_buffer.update(game_map)
+    camera.camera_x += 10
+    scroll_buffer.update(game_map)
+
+    assert scroll_buffer.tiles_drawn == 4 * 4
+
+
+@pytest.mark.parametrize("scroll_steps", [1, 2, 3, 7, 13])
+def test_scrolled_view_matches_the_map(scroll_steps):
+    """ Scroll a few pixels at a time, and check that the view drawn from the ring
+        buffer is the same as the striped map it's looking at."""
+    camera, scroll_buffer = generate_scroll_buffer(5, 5)
+    game_map = generate_striped_map(20, 20)
+    screen = pygame.Surface((3 * TILE, 3 * TILE))
+
+    scroll_buffer.update(game_map)
+    for _ in range(scroll_steps):
+        camera.scroll(3, 0)
+        scroll_buffer.update(game_map)
+
+    scroll_buffer.draw(screen)
+
+    # The world pixel shown at the left edge of the screen.
+    world_x = camera.leftmost_tile * TILE + camera.offset_x
+    for screen_x in range(3 * TILE):
+        expected = RED if ((world_x + screen_x) // TILE) % 2 == 0 else BLUE
+        assert screen.get_at((screen_x, 0)) == expected
+
+
+def test_draw_wraps_around_the_buffer_edges():
+    camera, scroll_buffer = generate_scroll_buffer(5, 5)
+    game_map = generate_striped_map(10, 10)
+    screen = pygame.Surface((3 * TILE, 3 * TILE))
+
+    # The camera's left edge is at tile 4, so the buffer starts at column 0.
+    scroll_buffer.update(game_map)
+    assert scroll_buffer.draw(screen) == 1
+
+    camera.camera_x += 2
+    camera.camera_y += 2
+    scroll_buffer.update(game_map)
+    assert scroll_buffer.draw(screen) == 4
+
+
+def test_tiles_outside_the_map_are_drawn_black():
+    camera, scroll_buffer = generate_scroll_buffer(0, 0)
+    screen = pygame.Surface((3 * TILE, 3 * TILE))
+
+    scroll_buffer.update(generate_striped_map(10, 10))
+    scroll_buffer.draw(screen)
+
+    assert screen.get_at((0, 0)) == BLACK
+    assert screen.get_at((TILE, TILE)) == RED
+    assert screen.get_at((2 * TILE, TILE)) == BLUE
+
+
+def test_swapped_tiles_are_redrawn():
+    camera, scroll_buffer = generate_scroll_buffer(1, 1)
+    game_map = generate_striped_map(10, 10)
+    screen = pygame.Surface((3 * TILE, 3 * TILE))
+
+    scroll_buffer.update(game_map)
+    game_map.swap((0, 0), (1, 0), Map.BACKGROUND_SHEET_INDEX)
+    scroll_buffer.update(game_map)
+    scroll_buffer.draw(screen)
+
+    assert scroll_buffer.tiles_drawn == 2
+    assert screen.get_at((0, 0)) == BLUE
+    assert screen.get_at((TILE, 0)) == RED
+
+
+def test_zoomed_out_cameras_draw_chunk_thumbnails():
+    camera = Camera(30, 30, 40, 40, TILE, TILE)
+    camera.set_zoom(1 / 4)
+    renderer = TileRenderer(generate_tile_images())
+    scroll_buffer = ScrollBuffer(camera, renderer)
+    screen = pygame.Surface((121 * 2, 121 * 2))
+
+    scroll_buffer.update(generate_striped_map(100, 100))
+    scroll_buffer.draw(screen)
+
+    # The 121x121 tile view is drawn from a 9x9 grid of 16x16 tile chunks.
+    assert scroll_buffer.cell_tiles == TileRenderer.CHUNK_SIZE
+    assert scroll_buffer.tiles_drawn == 9 * 9
+
+    world_x = camera.leftmost_tile * 2
+    for screen_x in range(0, 242, 5):
+        tile_x = (world_x + screen_x) // 2
+        if 0 <= tile_x < 100:
+            expected = RED if tile_x % 2 == 0 else BLUE
+        else:
+            expected = BLACK
+        assert screen.get_at((screen_x, 121)) == expected
+
+
+def test_swaps_only_redraw_the_chunk_they_are_in():
+    camera = Camera(30, 30, 40, 40, TILE, TILE)
+    camera.set_zoom(1 / 4)
+    renderer = TileRenderer(generate_tile_images())
+    scroll_buffer = ScrollBuffer(camera, renderer)
+    game_map = generate_striped_map(100, 100)
+
+    scroll_buffer.update(game_map)
+    thumbnails_built = renderer.thumbnails_built
+    game_map.swap((40, 40), (41, 40), Map.BACKGROUND_SHEET_INDEX)
+    scroll_buffer.update(game_map)
+
+    assert scroll_buffer.tiles_drawn == 1
+    assert renderer.thumbnails_built == thumbnails_built + 1
+
+
+def test_fills_redraw_their_region_once():
+    camera, scroll_buffer = generate_scroll_buffer(1, 1)
+    game_map = generate_striped_map(10, 10)
+    screen = pygame.Surface((3 * TILE, 3 * TILE))
+
+    scroll_buffer.update(game_map)
+    game_map.fill(Map.BACKGROUND_SHEET_INDEX, 0, 0, 2, 10, GameObject("red.png"))
+    scroll_buffer.update(game_map)
+    scroll_buffer.draw(screen)
+
+    # Of the filled tiles, only the 2 columns of 4 rows the buffer holds.
+    assert scroll_buffer.tiles_drawn == 8
+    assert screen.get_at((0, 0)) == RED
@@ -0,0 +1,77 @@
+import subprocess
+import sys
+import types
+from unittest.mock import patch
+
+from thegame.engine import startup
+
+
+def test_lazy_imports_run_the_module_when_first_used():
+    assert "wave" not in sys.modules
+
+    try:
+        wave = startup.lazy_import("wave")
+
+        assert type(wave) is not types.ModuleType
+        assert wave.WAVE_FORMAT_PCM == 1
+        assert type(wave) is types.ModuleType
+        assert startup.lazy_import("wave") is wave
+    finally:
+        sys.modules.pop("wave", None)
+
+
+def test_importing_the_engine_does_not_load_pygame():
+    result = subprocess.run(
+        [
+            sys.executable,
+            "-c",
+            "import sys, types;"
+            "from thegame.engine import BaseGame, Map;"
+            "pygame = sys.modules.get('pygame');"
+            "print(pygame is None or type(pygame) is not types.ModuleType)",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    assert result.stdout.strip() == "True"
+
+
+@patch("thegame.engine.startup.pygame.mixer")
+def test_subsystems_are_only_initialized_once(mixer_mock):
+    mixer_mock.get_init.return_value = False
+
+    startup.init_subsystem("mixer")
+    mixer_mock.get_init.return_value = True
+    startup.init_subsystem("mixer")
+
+    assert mixer_mock.init.call_count == 1
+    assert "mixer" in startup.subsystems()
+
+
+def test_marks_are_only_recorded_the_first_time():
+    startup.mark("test mark")
+    first = startup.marks()["test mark"]
+    startup.mark("test mark")
+
+    assert startup.marks()["test mark"] == first
+
+
+@patch("thegame.engine.startup.subprocess.run")
+def test_import_times_are_read_from_importtime(run_mock):
+    run_mock.return_value.stderr = (
+        "import time: self [us] | cumulative | imported package\n"
+        "import time:       100 |        100 |   map\n"
+        "import time:      2000 |       2100 | engine\n"
+    )
+
+    times = startup.import_times("engine")
+
+    assert times == [
+        startup.ImportTime("engine", 0.002, 0.0021),
+        startup.ImportTime("map", 0.0001, 0.0001),
+    ]
+    assert "engine" in startup.format_report(
+        startup.StartupReport(times, {}, {"first frame": 1.0})
+    )
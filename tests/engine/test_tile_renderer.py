@@ -0,0 +1,224 @@
+import pygame
+
+from thegame.engine import Map
+from thegame.engine.camera import Camera
+from thegame.engine.game_objects import GameObject
+from thegame.engine.scroll_buffer import ScrollBuffer
+from thegame.engine.tile_renderer import TileRenderer, image_is_opaque
+
+RED = (255, 0, 0, 255)
+BLUE = (0, 0, 255, 255)
+
+
+def generate_tile_images():
+    red = pygame.Surface((4, 4))
+    red.fill(RED)
+    blue = pygame.Surface((4, 4), pygame.SRCALPHA)
+    blue.fill((0, 0, 0, 0))
+    blue.fill(BLUE, (0, 0, 2, 2))
+
+    return {"red.png": red, "blue.png": blue}
+
+
+def generate_layered_map(width, height):
+    """ A map with red background tiles everywhere, and a blue path tile
+        in the top left corner."""
+    background_sheet = [
+        [GameObject("red.png") for _ in range(width)] for _ in range(height)
+    ]
+    path_sheet = [[None for _ in range(width)] for _ in range(height)]
+    path_sheet[0][0] = GameObject("blue.png")
+
+    return Map(
+        [[None for _ in range(width)] for _ in range(height)],
+        [[None for _ in range(width)] for _ in range(height)],
+        path_sheet,
+        background_sheet,
+    )
+
+
+def test_tile_surface_composes_layers_bottom_first():
+    renderer = TileRenderer(generate_tile_images())
+    renderer.set_map(generate_layered_map(3, 3))
+
+    surface = renderer.tile_surface(0, 0, 4, 4)
+
+    assert surface.get_at((0, 0)) == BLUE
+    assert surface.get_at((3, 3)) == RED
+
+
+def test_tiles_with_the_same_layers_share_a_surface():
+    renderer = TileRenderer(generate_tile_images())
+    renderer.set_map(generate_layered_map(3, 3))
+
+    assert renderer.tile_surface(1, 1, 4, 4) is renderer.tile_surface(2, 2, 4, 4)
+    assert renderer.composites_built == 1
+
+
+def test_empty_and_outside_tiles_have_no_surface():
+    renderer = TileRenderer(generate_tile_images())
+    renderer.set_map(Map([[None]], [[None]], [[None]], [[None]]))
+
+    assert renderer.tile_surface(0, 0, 4, 4) is None
+    assert renderer.tile_surface(-1, 5, 4, 4) is None
+
+
+def test_images_are_scaled_once_per_size():
+    renderer = TileRenderer(generate_tile_images())
+    renderer.set_map(generate_layered_map(3, 3))
+
+    small = renderer.tile_surface(1, 1, 2, 2)
+
+    assert small.get_size() == (2, 2)
+    assert renderer.scaled_image("red.png", 2, 2) is renderer.scaled_image(
+        "red.png", 2, 2
+    )
+    assert renderer.scaled_image("red.png", 4, 4) is renderer.tile_images["red.png"]
+
+
+def test_swapped_tiles_are_looked_up_again():
+    renderer = TileRenderer(generate_tile_images())
+    game_map = generate_layered_map(3, 3)
+    renderer.set_map(game_map)
+
+    assert renderer.cell_layers(0, 0) == ("red.png", "blue.png")
+
+    game_map.swap((0, 0), (1, 0), Map.PATH_SHEET_INDEX)
+
+    assert renderer.cell_layers(0, 0) == ("red.png",)
+    assert renderer.cell_layers(1, 0) == ("red.png", "blue.png")
+
+
+
+def test_filled_regions_are_looked_up_again():
+    renderer = TileRenderer(generate_tile_images())
+    game_map = generate_layered_map(40, 40)
+    renderer.set_map(game_map)
+    assert renderer.cell_layers(0, 0) == ("red.png", "blue.png")
+    assert renderer.cell_layers(39, 39) == ("red.png",)
+
+    game_map.fill(Map.PATH_SHEET_INDEX, 0, 0, 20, 40, GameObject("blue.png"))
+
+    assert renderer.cell_layers(19, 39) == ("red.png", "blue.png")
+    assert renderer.cell_layers(39, 39) == ("red.png",)
+    # The thumbnails of the 2 by 3 chunks filled are redrawn.
+    assert len(renderer._chunk_versions) == 6
+
+def test_least_recently_used_surfaces_are_dropped_over_the_memory_budget():
+    # Enough memory for only one 4x4 surface.
+    renderer = TileRenderer(generate_tile_images(), memory_budget=4 * 4 * 4)
+    renderer.set_map(generate_layered_map(3, 3))
+
+    first = renderer.tile_surface(0, 0, 4, 4)
+    renderer.tile_surface(1, 1, 4, 4)
+
+    assert renderer.tile_surface(0, 0, 4, 4) is not first
+    assert renderer.cache.memory_used <= 4 * 4 * 4
+    assert renderer.cache.evictions == 2
+
+
+def test_shrinking_images_goes_through_the_mipmap_chain():
+    renderer = TileRenderer({"red.png": generate_tile_images()["red.png"]})
+    renderer.tile_images["big.png"] = pygame.Surface((64, 64))
+
+    renderer.scaled_image("big.png", 5, 5)
+
+    # 64 -> 32 -> 16 -> 8, and 8 -> 5.
+    for size in (32, 16, 8, 5):
+        assert renderer.cache.get(("image", "big.png", size, size)) is not None
+    assert renderer.cache.get(("image", "big.png", 4, 4)) is None
+
+
+def test_prescale_scales_every_image():
+    renderer = TileRenderer(generate_tile_images())
+
+    renderer.prescale(2, 2)
+
+    assert len(renderer.cache) == 2
+
+
+def test_overlapping_cameras_share_tile_work():
+    renderer = TileRenderer(generate_tile_images())
+    game_map = generate_layered_map(10, 10)
+
+    first = ScrollBuffer(Camera(5, 5, 2, 2, 8, 8), renderer)
+    second = ScrollBuffer(Camera(5, 5, 3, 3, 8, 8), renderer)
+    first.update(game_map)
+    second.update(game_map)
+
+    # Only two distinct tiles are on the map, so the second camera can reuse
+    # everything the first one composed.
+    assert renderer.composites_built == 2
+    assert second.tiles_drawn == 6 * 6
+
+
+def test_thumbnails_are_not_shared_between_maps():
+    renderer = TileRenderer(generate_tile_images())
+    renderer.set_map(generate_layered_map(3, 3))
+    first = renderer.chunk_surface(0, 0, 1, 1)
+
+    renderer.set_map(generate_layered_map(3, 3))
+
+    assert renderer.chunk_surface(0, 0, 1, 1) is not first
+
+
+def generate_occluded_map():
+    """ A 2x1 map where the left tile has an opaque red foreground over a blue
+        background, and the right tile has a translucent blue foreground."""
+    return Map(
+        [[GameObject("red.png"), GameObject("blue.png")]],
+        [[None, None]],
+        [[None, None]],
+        [[GameObject("blue.png"), GameObject("red.png")]],
+    )
+
+
+def test_layers_under_opaque_layers_are_culled():
+    renderer = TileRenderer(
+        generate_tile_images(), image_opacity={"red.png": True, "blue.png": False}
+    )
+    renderer.set_map(generate_occluded_map())
+
+    assert renderer.cell_layers(0, 0) == ("red.png",)
+    assert renderer.cell_layers(1, 0) == ("red.png", "blue.png")
+
+
+def test_tiles_with_the_same_visible_layers_share_a_composite():
+    renderer = TileRenderer(
+        generate_tile_images(), image_opacity={"red.png": True, "blue.png": False}
+    )
+    renderer.set_map(generate_occluded_map())
+
+    # Only the opaque red foreground of the left tile is visible, which is the same
+    # as a lone red background.
+    composite = renderer.tile_surface(0, 0, 4, 4)
+
+    assert composite.get_at((0, 0)) == RED
+    assert renderer.cache.get(("composite", ("red.png",), 4, 4)) is composite
+
+
+def test_overdraw_stats_count_culled_layers():
+    renderer = TileRenderer(
+        generate_tile_images(), image_opacity={"red.png": True, "blue.png": False}
+    )
+    renderer.set_map(generate_occluded_map())
+
+    renderer.tile_surface(0, 0, 4, 4)
+    renderer.tile_surface(1, 0, 4, 4)
+
+    assert renderer.overdraw_stats() == {
+        "layers_seen": 4,
+        "layers_culled": 1,
+        "layer_blits": 3,
+        "culled_ratio": 0.25,
+    }
+
+
+def test_image_is_opaque_checks_every_pixel():
+    opaque = pygame.Surface((2, 2))
+    translucent = pygame.Surface((2, 2), pygame.SRCALPHA)
+    translucent.fill((255, 0, 0, 255))
+    translucent.set_at((0, 1), (255, 0, 0, 254))
+
+    assert image_is_opaque(opaque)
+    assert not image_is_opaque(translucent)
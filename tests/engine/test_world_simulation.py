@@ -0,0 +1,119 @@
+import multiprocessing
+import sys
+import time
+
+import numpy
+import pytest
+
+from thegame.engine import BaseGame, Map
+from thegame.engine.game_objects import GameObject
+from thegame.engine.world_simulation import EMPTY_TILE, WorldSimulation
+
+
+def generate_corridor(width):
+    """ A one tile high map with an NPC at its left end."""
+    character_sheet = [[GameObject("npc.png")] + [None] * (width - 1)]
+    background_sheet = [[GameObject("grass.png") for _ in range(width)]]
+
+    return Map([[None] * width], character_sheet, [[None] * width], background_sheet)
+
+
+def walk_right(map_name, tiles, palette, tick):
+    """ Move every NPC on the character sheet one tile right, if it can."""
+    assert not tiles.flags.writeable
+
+    swaps = []
+    characters = tiles[Map.CHARACTER_SHEET_INDEX]
+    npc = palette.index("npc.png")
+    for y, x in zip(*numpy.nonzero(characters == npc)):
+        x, y = int(x), int(y)
+        if x + 1 < characters.shape[1] and characters[y, x + 1] == EMPTY_TILE:
+            swaps.append((Map.CHARACTER_SHEET_INDEX, (x, y), (x + 1, y)))
+
+    return swaps
+
+
+def update_until(simulation, active_map, condition, timeout=10):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline
+        simulation.update(active_map)
+        time.sleep(0.01)
+
+
+@pytest.fixture
+def simulation():
+    maps = {"active": generate_corridor(4), "inactive": generate_corridor(4)}
+    simulation = WorldSimulation(maps, walk_right, processes=2)
+
+    yield simulation
+
+    simulation.close()
+
+
+def npc_position(game_map):
+    return next(
+        x for x, tile in enumerate(game_map.character_sheet[0]) if tile is not None
+    )
+
+
+def test_inactive_maps_are_simulated(simulation):
+    active_map = simulation.maps["active"]
+    inactive_map = simulation.maps["inactive"]
+
+    update_until(simulation, active_map, lambda: npc_position(inactive_map) == 3)
+
+    assert npc_position(active_map) == 0
+    assert simulation.steps_applied >= 3
+
+
+def test_tiles_are_shared_as_palette_ids(simulation):
+    inactive_map = simulation.maps["inactive"]
+    simulation.update(None)
+
+    tiles = simulation.simulated_maps["inactive"].tiles
+    palette = list(simulation.palette)
+
+    assert palette[tiles[Map.CHARACTER_SHEET_INDEX, 0, 0]] == "npc.png"
+    assert tiles[Map.FOREGROUND_SHEET_INDEX, 0, 0] == EMPTY_TILE
+    assert palette[tiles[Map.BACKGROUND_SHEET_INDEX, 0, 3]] == "grass.png"
+
+    # Changes made in the main process reach the shared tiles.
+    inactive_map.swap((0, 0), (2, 0), Map.BACKGROUND_SHEET_INDEX)
+    background = tiles[Map.BACKGROUND_SHEET_INDEX]
+    assert background[0, 0] == background[0, 2]
+
+
+def test_steps_are_discarded_if_the_map_changed_meanwhile(simulation):
+    inactive_map = simulation.maps["inactive"]
+    simulation.update(None)
+
+    inactive_map.swap((0, 0), (2, 0), Map.CHARACTER_SHEET_INDEX)
+    update_until(
+        simulation,
+        None,
+        lambda: simulation.steps_discarded + simulation.steps_applied >= 2,
+    )
+
+    assert simulation.steps_discarded >= 1
+
+
+def test_base_game_simulates_inactive_maps():
+    game = BaseGame(initial_map=generate_corridor(3))
+    game.register_map("other", generate_corridor(3))
+
+    simulation = game.simulate_inactive_maps(walk_right, processes=1)
+    try:
+        assert game.world_simulation is simulation
+        assert simulation.maps is game.maps
+    finally:
+        simulation.close()
+
+
+def test_simulations_need_shared_memory(monkeypatch):
+    # As on Pythons before 3.8, where the engine still imports.
+    monkeypatch.setitem(sys.modules, "multiprocessing.shared_memory", None)
+    monkeypatch.delattr(multiprocessing, "shared_memory", raising=False)
+
+    with pytest.raises(WorldSimulation.SharedMemoryUnavailableException):
+        WorldSimulation({}, walk_right)
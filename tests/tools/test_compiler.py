@@ -0,0 +1,86 @@
+import os
+
+import pytest
+
+from thegame.engine.compiled_map import CompiledMap
+from thegame.tools.__main__ import main
+from thegame.tools.compiler import compile_all
+
+TOWN = """[legend]
+w = thegame/resources/TestBoxOne.png
+@ = player:thegame/resources/PC.png
+[foreground]
+w..
+[character]
+..@
+"""
+
+
+def write_maps(directory, count=3):
+    directory.mkdir()
+    for number in range(count):
+        (directory / f"town{number}.txt").write_text(TOWN)
+
+
+def test_every_map_is_compiled_in_parallel(tmp_path):
+    write_maps(tmp_path / "maps")
+
+    results = compile_all(
+        [str(tmp_path / "maps")], str(tmp_path / "out"), resource_root=".", processes=2
+    )
+
+    assert [os.path.basename(result.output) for result in results] == [
+        "town0.tgmap",
+        "town1.tgmap",
+        "town2.tgmap",
+    ]
+    assert not any(result.problems for result in results)
+    compiled = CompiledMap.read(results[0].output)
+    assert compiled.passability == bytes([0, 1, 0])
+
+
+def test_up_to_date_maps_are_skipped(tmp_path):
+    write_maps(tmp_path / "maps", count=1)
+    compile_all([str(tmp_path / "maps")], str(tmp_path / "out"))
+
+    (result,) = compile_all([str(tmp_path / "maps")], str(tmp_path / "out"))
+    assert result.skipped
+
+    (result,) = compile_all([str(tmp_path / "maps")], str(tmp_path / "out"), force=True)
+    assert not result.skipped
+
+
+def test_problems_are_reported_for_every_map(tmp_path):
+    maps = tmp_path / "maps"
+    maps.mkdir()
+    (maps / "missing.txt").write_text("[legend]\nw = nowhere.png\n[foreground]\nw\n")
+    (maps / "buried.txt").write_text(
+        "[legend]\n@ = player:pc.png\nw = wall.png\n[foreground]\nw\n[character]\n@\n"
+    )
+    (maps / "broken.txt").write_text("[foreground]\nw\n")
+
+    results = compile_all([str(maps)], resource_root=str(tmp_path), processes=1)
+
+    assert [len(result.problems) for result in results] == [1, 3, 1]
+    assert all(result.output is None for result in results)
+
+
+def test_the_command_line_compiles_and_validates(tmp_path, capsys):
+    write_maps(tmp_path / "maps", count=1)
+
+    assert main(["validate", str(tmp_path / "maps"), "-r", "."]) == 0
+    assert not (tmp_path / "out").exists()
+
+    assert main(["compile", str(tmp_path / "maps"), "-o", str(tmp_path / "out")]) == 0
+    assert (tmp_path / "out" / "town0.tgmap").exists()
+
+    (tmp_path / "maps" / "bad.txt").write_text("w\n")
+    assert main(["validate", str(tmp_path / "maps")]) == 1
+    assert "error:" in capsys.readouterr().err
+
+
+def test_the_command_line_needs_a_command(capsys):
+    with pytest.raises(SystemExit):
+        main([])
+
+    assert "required" in capsys.readouterr().err
@@ -0,0 +1,127 @@
+import pytest
+
+from thegame.engine.compiled_map import PLAYER_KIND, TILE_KIND
+from thegame.tools.map_sources import MapSource, find_sources
+
+TOWN = """# A small town
+[legend]
+w = wall.png
+g = grass.png
+@ = player: pc.png
+[background]
+ggg
+ggg
+[foreground]
+w..
+...
+[character]
+...
+..@
+"""
+
+TMX = """<?xml version="1.0" encoding="UTF-8"?>
+<map version="1.10" width="3" height="2" tilewidth="16" tileheight="16">
+ <tileset firstgid="1" name="town" tilewidth="16" tileheight="16" tilecount="2">
+  <tile id="0"><image width="16" height="16" source="sprites/grass.png"/></tile>
+  <tile id="1" type="player">
+   <image width="16" height="16" source="sprites/pc.png"/>
+  </tile>
+ </tileset>
+ <layer id="1" name="Background" width="3" height="2">
+  <data encoding="csv">
+1,1,1,
+1,1,1
+</data>
+ </layer>
+ <layer id="2" name="Character" width="3" height="2">
+  <data encoding="csv">
+0,0,0,
+0,0,2
+</data>
+ </layer>
+</map>
+"""
+
+
+def test_text_maps_are_read_through_their_legend(tmp_path):
+    path = tmp_path / "town.txt"
+    path.write_text(TOWN)
+
+    source = MapSource.read(str(path))
+    foreground, character, path_layer, background = source.layers
+
+    assert source.name == "town"
+    assert (source.width, source.height) == (3, 2)
+    assert foreground == [[(TILE_KIND, "wall.png"), None, None], [None, None, None]]
+    assert character[1][2] == (PLAYER_KIND, "pc.png")
+    assert path_layer == [[None] * 3] * 2
+    assert background[0][0] == (TILE_KIND, "grass.png")
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "[legend]\nw = wall.png\n[foreground]\nwx\n",
+        "[legend]\nw = wall.png\n[foreground]\nww\nw\n",
+        "[legend]\nw = wall.png\n[foreground]\nww\n[background]\nw\n",
+        "[legend]\nw = wall.png\n[roof]\nww\n",
+        "w\n",
+        "[legend]\n",
+    ],
+)
+def test_invalid_text_maps_raise(tmp_path, text):
+    path = tmp_path / "broken.txt"
+    path.write_text(text)
+
+    with pytest.raises(MapSource.InvalidMapSourceException):
+        MapSource.read(str(path))
+
+
+def test_csv_maps_are_read_from_a_file_per_layer(tmp_path):
+    (tmp_path / "field.background.csv").write_text("grass.png,grass.png\n")
+    (tmp_path / "field.character.csv").write_text(",player:pc.png\n")
+
+    source = MapSource.read(str(tmp_path / "field.character.csv"))
+
+    assert source.name == "field"
+    assert len(source.paths) == 2
+    assert source.layers[1] == [[None, (PLAYER_KIND, "pc.png")]]
+    assert source.layers[3] == [[(TILE_KIND, "grass.png")] * 2]
+
+
+def test_tmx_maps_are_read_with_their_tileset(tmp_path):
+    path = tmp_path / "town.tmx"
+    path.write_text(TMX)
+
+    source = MapSource.read(str(path))
+
+    assert source.layers[3][0][0] == (TILE_KIND, str(tmp_path / "sprites/grass.png"))
+    assert source.layers[1][1][2] == (PLAYER_KIND, str(tmp_path / "sprites/pc.png"))
+    assert source.layers[0] == [[None] * 3] * 2
+
+
+def test_flipped_tmx_tiles_are_rejected(tmp_path):
+    path = tmp_path / "town.tmx"
+    # Flip the grass at 1,0 horizontally.
+    path.write_text(TMX.replace("1,1,1,\n", f"1,{0x80000001},1,\n", 1))
+
+    with pytest.raises(MapSource.InvalidMapSourceException, match="1,0"):
+        MapSource.read(str(path))
+
+
+def test_each_map_in_a_directory_is_found_once(tmp_path):
+    (tmp_path / "maps").mkdir()
+    for file_name in (
+        "town.txt",
+        "field.background.csv",
+        "field.character.csv",
+        "notes.md",
+        "cave.tmx",
+    ):
+        (tmp_path / "maps" / file_name).write_text("")
+
+    assert [path.rpartition("/")[2] for path in find_sources(str(tmp_path))] == [
+        "cave.tmx",
+        "field.background.csv",
+        "town.txt",
+    ]
@@ -1,4 +1,39 @@
-from .base_game import BaseGame
-from .base_menu import BaseMenu, Button
-from .engine import Engine
-from .map import Map
+""" The engine's classes are imported from their modules the first time they're
+    used, so that importing one (ie Map, for a tool) doesn't import pygame and
+    everything else the engine uses."""
+import importlib
+import sys
+import types
+
+from . import startup
+
+_EXPORTS = {
+    "BaseGame": ".base_game",
+    "BaseMenu": ".base_menu",
+    "Button": ".base_menu",
+    "Engine": ".engine",
+    "Map": ".map",
+}
+
+__all__ = list(_EXPORTS)
+
+
+class _EngineModule(types.ModuleType):
+    """ This module, with the engine's classes imported the first time they're
+        looked up. A module class is used rather than a module level __getattr__,
+        which needs Python 3.7."""
+
+    def __getattr__(self, name):
+        module = _EXPORTS.get(name)
+        if module is None:
+            raise AttributeError(f"module '{self.__name__}' has no attribute '{name}'")
+
+        value = getattr(importlib.import_module(module, self.__name__), name)
+        setattr(self, name, value)
+        return value
+
+    def __dir__(self):
+        return sorted(set(super().__dir__()) | set(__all__))
+
+
+sys.modules[__name__].__class__ = _EngineModule
@@ -0,0 +1,226 @@
+""" Sprite sheet animations, played from one shared clock so that drawing an
+    animated tile costs no more than drawing a static one."""
+import logging
+from collections import namedtuple
+
+# The layer of a map tile showing an animation rather than a sprite. The tile
+# renderer swaps it for the animation's current frame as the tile is drawn.
+AnimationLayer = namedtuple("AnimationLayer", ["name"])
+
+
+class Animation:
+    """ The timeline of an animation whose frames are laid out on a sprite sheet,
+        left to right and then top to bottom.
+
+        The sheet is cut into frames once (see decode()), and the frame to show on
+        each tick is worked out up front, so every object playing the animation
+        shares the same frames and the same lookup."""
+
+    def __init__(
+        self,
+        sprite_sheet_location: str,
+        frame_width: int,
+        frame_height: int,
+        frame_ticks=6,
+        frame_count: int = None,
+        loop: bool = True,
+    ):
+        """ Args:
+                sprite_sheet_location(str): The image the frames are cut from.
+                frame_width(int): The width of each frame in pixels.
+                frame_height(int): The height of each frame in pixels.
+                frame_ticks: The number of ticks each frame is shown for, or a
+                             sequence of the ticks for each frame in turn.
+                frame_count(int): The number of frames on the sheet. None for as
+                                  many as there are ticks given, or if frame_ticks
+                                  is a number, every frame that fits on the sheet.
+                loop(bool): Whether to start again after the last frame, rather
+                            than staying on it."""
+        self.sprite_sheet_location = sprite_sheet_location
+        self.frame_width = frame_width
+        self.frame_height = frame_height
+        self.loop = loop
+
+        if isinstance(frame_ticks, int):
+            self._frame_ticks = frame_ticks
+        else:
+            self._frame_ticks = tuple(frame_ticks)
+            if frame_count is None:
+                frame_count = len(self._frame_ticks)
+
+        self.frame_count = frame_count
+        self.frames = None
+
+        # The frame to show on each tick of one play through, and its length.
+        self._timeline = None
+        self.duration = None
+
+        if frame_count is not None:
+            self._build_timeline()
+
+    def decode(self, sprite_sheet):
+        """ Cut the loaded sprite sheet into the animation's frames. The frames are
+            subsurfaces, sharing their pixels with the sheet.
+
+            Returns:
+                The list of frames."""
+
+        sheet_width, sheet_height = sprite_sheet.get_size()
+        columns = sheet_width // self.frame_width
+        rows = sheet_height // self.frame_height
+
+        if self.frame_count is None:
+            self.frame_count = columns * rows
+            self._build_timeline()
+
+        if self.frame_count > columns * rows:
+            raise self.SpriteSheetTooSmallException(
+                f"{self.sprite_sheet_location} holds {columns * rows} frames of "
+                f"{self.frame_width}x{self.frame_height}, not {self.frame_count}."
+            )
+
+        logging.debug(
+            f"Decoding {self.frame_count} frames from {self.sprite_sheet_location}."
+        )
+        self.frames = [
+            sprite_sheet.subsurface(
+                (
+                    (index % columns) * self.frame_width,
+                    (index // columns) * self.frame_height,
+                    self.frame_width,
+                    self.frame_height,
+                )
+            )
+            for index in range(self.frame_count)
+        ]
+
+        return self.frames
+
+    def frame_at(self, tick: int):
+        """ Return the index of the frame shown tick ticks into the animation."""
+
+        if tick >= self.duration:
+            if not self.loop:
+                return self._timeline[-1]
+
+            tick %= self.duration
+
+        return self._timeline[max(tick, 0)]
+
+    def _build_timeline(self):
+        if isinstance(self._frame_ticks, int):
+            frame_ticks = (self._frame_ticks,) * self.frame_count
+        else:
+            frame_ticks = self._frame_ticks
+
+        if len(frame_ticks) != self.frame_count or min(frame_ticks, default=0) < 1:
+            raise ValueError(
+                f"Can't show {self.frame_count} frames for {frame_ticks} ticks."
+            )
+
+        self._timeline = tuple(
+            index for index, ticks in enumerate(frame_ticks) for _ in range(ticks)
+        )
+        self.duration = len(self._timeline)
+
+    class SpriteSheetTooSmallException(Exception):
+        """ Raised when a sprite sheet can't hold all of an animation's frames."""
+
+        pass
+
+
+class AnimationClock:
+    """ The clock every animation in the game is played from.
+
+        Map tiles showing an animation all play it in step with the clock, so each
+        animation has only one current frame however many tiles show it. Ticking
+        the clock just works out which animations have changed frame (see
+        changed), which the scroll buffers use to redraw the animated tiles in
+        view. Tiles out of view cost nothing until they're next drawn, when the
+        clock says which frame they're on.
+
+        An animation can also be played once through for a single owner, ie a
+        Button when it's pressed, with play()."""
+
+    def __init__(self):
+        self.animations = {}
+        self.tick_count = 0
+
+        # The names of the animations which changed frame on the last tick.
+        self.changed = frozenset()
+
+        # The (animation name, starting tick) of each owner playing an animation.
+        self._playing = {}
+
+    def __contains__(self, name):
+        return name in self.animations
+
+    def register(self, name: str, animation: Animation):
+        """ Register an animation under the name given to objects' animation
+            arguments."""
+        self.animations[name] = animation
+
+    def tick(self):
+        """ Move every animation on by one tick."""
+
+        self.tick_count += 1
+        tick = self.tick_count
+
+        self.changed = frozenset(
+            name
+            for name, animation in self.animations.items()
+            if animation.duration is not None
+            and animation.duration > 1
+            and animation.frame_at(tick) != animation.frame_at(tick - 1)
+        )
+
+        for owner, (name, start) in list(self._playing.items()):
+            animation = self.animations[name]
+            if not animation.loop and tick - start >= animation.duration:
+                del self._playing[owner]
+
+    def frame(self, name: str, owner=None):
+        """ Return the index of the frame of the named animation showing now,
+            either for owner if it's playing it or else for the shared clock."""
+
+        start = 0
+        playing = self._playing.get(owner)
+        if playing is not None and playing[0] == name:
+            start = playing[1]
+
+        return self.animations[name].frame_at(self.tick_count - start)
+
+    def frame_key(self, name: str, owner=None):
+        """ Return the key of the frame showing now in BaseGame.object_images."""
+        return self.image_key(name, self.frame(name, owner))
+
+    @staticmethod
+    def image_key(name: str, frame: int):
+        """ Return the key of frame of the named animation in
+            BaseGame.object_images."""
+        return name, frame
+
+    def play(self, name: str, owner):
+        """ Play the named animation from its first frame for owner. An animation
+            that doesn't loop stops playing once it reaches its last frame."""
+
+        if name not in self.animations:
+            raise ValueError(f"No animation registered with name '{name}'")
+
+        self._playing[owner] = (name, self.tick_count)
+
+    def stop(self, owner):
+        self._playing.pop(owner, None)
+
+    def is_playing(self, owner):
+        return owner in self._playing
+
+    def playing_frame_key(self, owner):
+        """ Return the key of the frame showing for owner, or None if it isn't
+            playing anything."""
+
+        playing = self._playing.get(owner)
+        if playing is None:
+            return None
+
+        return self.frame_key(playing[0], owner)
@@ -1,10 +1,18 @@
 import logging
 
-import pygame
-
+from .animation import Animation, AnimationClock
 from .base_menu import BaseMenu
 from .camera import Camera
+from .camera_controller import CameraController
+from .entities import EntityStore
 from .map import Map
+from .save_game import SaveFile, SaveManager
+from .scheduler import UpdateScheduler
+from .startup import lazy_import
+from .viewport import Viewport
+from .world_simulation import WorldSimulation
+
+pygame = lazy_import("pygame")
 
 
 class BaseGame:
@@ -55,8 +63,15 @@ class BaseGame:
             camera_height=camera_height,
             camera_x=camera_x,
             camera_y=camera_y,
+            tile_width=base_sprite_width,
+            tile_height=base_sprite_height,
         )
 
+        # Each viewport is a camera drawn somewhere on the screen. The main camera
+        # fills the screen from the top left corner, more can be added for split
+        # screen, minimaps, etc. See add_viewport().
+        self.viewports = [Viewport(self.camera)]
+
         # Setup the active map and menu. Each of th
         self.active_menu = main_menu
 
@@ -72,7 +87,37 @@ class BaseGame:
             self.maps = {}
 
         self.object_images = {}
-        self.player_controlled_objects = {}
+
+        # Whether each loaded image is fully opaque, keyed the same as
+        # object_images. Used to skip drawing anything hidden beneath them.
+        self.object_opacity = {}
+
+        # The animations objects and buttons can play, and the clock they're all
+        # played from. See register_animation().
+        self.animations = AnimationClock()
+
+        # The components of every dynamic object in the game, and the systems run
+        # over them each frame. player_controlled_objects is a dictionary-like view
+        # of the player controlled objects in the store and their positions.
+        self.entities = EntityStore()
+        self.player_controlled_objects = self.entities.player_controlled_objects
+        self.systems = []
+
+        # Runs the callbacks objects have registered to be updated over time.
+        self.scheduler = UpdateScheduler()
+
+        # Simulates the maps the player isn't on. See simulate_inactive_maps().
+        self.world_simulation = None
+
+        # For a game playing a GameClient's copy of a server's world (as its active
+        # map), the ClientPrediction characters are drawn from instead of the
+        # character sheet.
+        self.prediction = None
+
+        # Writes save files of the game, and the scheduled update autosaving it.
+        # See enable_saves().
+        self.saves = None
+        self._autosave = None
 
     def load_active_map(self):
         for sheet in self.active_screen.tile_sheets:
@@ -91,12 +136,108 @@ class BaseGame:
                     if cell is not None:
                         cell.deregister_loaded_sprite()
 
+    @property
+    def camera_controller(self):
+        """ The controller moving the main camera, if any. """
+        return self.viewports[0].controller
+
+    def add_viewport(self, camera: Camera, screen_x: int, screen_y: int):
+        """ Draw another camera's view of the active map at screen_x, screen_y.
+
+            Returns:
+                The new Viewport."""
+        viewport = Viewport(camera, screen_x, screen_y)
+        self.viewports.append(viewport)
+
+        return viewport
+
+    def remove_viewport(self, viewport: Viewport):
+        self.viewports.remove(viewport)
+
+    def follow(self, target, viewport: Viewport = None, **controller_options):
+        """ Have a camera follow target around the active map.
+
+            Args:
+                target: The player controlled object to follow.
+                viewport(Viewport): The viewport whose camera should follow target,
+                                    defaults to the main camera.
+                controller_options: Any of the options accepted by CameraController,
+                                    ie dead_zone_width, look_ahead, etc."""
+        if viewport is None:
+            viewport = self.viewports[0]
+
+        viewport.controller = CameraController(
+            viewport.camera, target, **controller_options
+        )
+
+        return viewport.controller
+
     def register_map(self, map_name: str, new_map: Map):
         self.maps[map_name] = new_map
 
     def register_menu(self, menu_name: str, new_menu: BaseMenu):
         self.menus[menu_name] = new_menu
 
+    def register_animation(self, animation_name: str, animation: Animation):
+        """ Register an animation, to be played by any object or button created
+            with animation_name as its animation."""
+        self.animations.register(animation_name, animation)
+
+    def add_system(self, system):
+        """ Run system over the game's entities every frame a map is shown."""
+        self.systems.append(system)
+
+    def simulate_inactive_maps(self, step, processes: int = None):
+        """ Keep every registered map other than the active one simulating in
+            worker processes, running step on each. See WorldSimulation.
+
+            Returns:
+                The WorldSimulation."""
+        if self.world_simulation is not None:
+            self.world_simulation.close()
+
+        self.world_simulation = WorldSimulation(self.maps, step, processes)
+        return self.world_simulation
+
+    def enable_saves(
+        self, directory: str, autosave_interval: int = None, **save_options
+    ):
+        """ Start saving the game to directory. See SaveManager.
+
+            Args:
+                directory(str): The directory to write save files to.
+                autosave_interval(int): If given, save every this many ticks. After
+                                        the first save, each autosave is a delta.
+                save_options: Any of the options accepted by SaveManager.
+
+            Returns:
+                The SaveManager."""
+        if self.saves is not None:
+            self.saves.close()
+
+        if self._autosave is not None:
+            self.scheduler.cancel(self._autosave)
+            self._autosave = None
+
+        self.saves = SaveManager(self, directory, **save_options)
+
+        if autosave_interval is not None:
+            self._autosave = self.scheduler.schedule(
+                None,
+                lambda context, elapsed: self.saves.save(),
+                interval=autosave_interval,
+            )
+
+        return self.saves
+
+    def load_game(self, path: str):
+        """ Restore the maps, entities and active screen saved at path."""
+        save_file = SaveFile(path)
+        try:
+            save_file.restore(self)
+        finally:
+            save_file.close()
+
     def register_player_controlled_object(self, player_controlled_object, pos_x, pos_y):
         self.player_controlled_objects[player_controlled_object] = (pos_x, pos_y)
 
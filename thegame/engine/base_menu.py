@@ -1,6 +1,8 @@
 import logging
 
-import pygame
+from .startup import lazy_import
+
+pygame = lazy_import("pygame")
 
 
 class BaseMenu:
@@ -25,6 +27,10 @@ class BaseMenu:
         self.focused_zone = None
         self._interactive_zones = []
 
+        # The buttons registered with this menu, drawn over the menu image while
+        # they're playing an animation.
+        self.buttons = []
+
     def register_interactive_zone(
         self, init_x_pos, init_y_pos, final_x_pos, final_y_pos, interaction
     ):
@@ -178,10 +184,21 @@ class Button:
 
     def _interaction(self, **kwargs):
 
-        # TODO: Play self.animation.
+        # Play the button's animation over it, if it has one the game knows of.
+        game_context = kwargs.get("game_context")
+        animations = getattr(game_context, "animations", None)
+        if self.animation is not None and animations is not None:
+            if self.animation in animations:
+                animations.play(self.animation, self)
+            else:
+                logging.warning(
+                    f"Button animation '{self.animation}' isn't registered."
+                )
+
         self.interaction(kwargs)
 
     def register_with_menu(self, menu: BaseMenu):
+        menu.buttons.append(self)
         menu.register_interactive_zone(
             self.pos_x,
             self.pos_y,
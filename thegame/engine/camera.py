@@ -9,14 +9,115 @@ from .map import Map
 class Camera:
     """ A Camera class for dealing with the game camera."""
 
-    def __init__(self, camera_width, camera_height, camera_x, camera_y):
+    def __init__(
+        self,
+        camera_width,
+        camera_height,
+        camera_x,
+        camera_y,
+        tile_width: int = 1,
+        tile_height: int = 1,
+    ):
         """ In order to have a center of the screen, camera_width and camera_height
             act as if they are the next highest odd number (presuming they're even.)
-            If its odd, the value doesn't change."""
+            If its odd, the value doesn't change.
+
+            Args:
+                camera_width(int): The number of tiles the camera sees left to right.
+                camera_height(int): The number of tiles the camera sees top to bottom.
+                camera_x(int): The x position of the tile at the center of the camera.
+                camera_y(int): The y position of the tile at the center of the camera.
+                tile_width(int): The width of a single tile in pixels.
+                tile_height(int): The height of a single tile in pixels."""
         self.camera_width = camera_width
         self.camera_height = camera_height
         self.camera_x = camera_x
         self.camera_y = camera_y
+        self.tile_width = tile_width
+        self.tile_height = tile_height
+
+        # The tile size and view size (in pixels) at a zoom of 1. Zooming scales
+        # the tiles while keeping the view the same size on the screen.
+        self.zoom = 1
+        self.base_tile_width = tile_width
+        self.base_tile_height = tile_height
+        self._view_width = self.visible_columns * tile_width
+        self._view_height = self.visible_rows * tile_height
+
+        # The number of pixels the camera has scrolled past camera_x and camera_y.
+        # These are always kept in the range [0, tile_width) and [0, tile_height),
+        # any whole tiles scrolled are carried into camera_x and camera_y.
+        self.offset_x = 0
+        self.offset_y = 0
+
+    @property
+    def visible_columns(self):
+        """ The number of tile columns the camera shows (camera_width rounded up to
+            the next odd number.)"""
+        return (self.camera_width // 2) * 2 + 1
+
+    @property
+    def visible_rows(self):
+        """ The number of tile rows the camera shows (camera_height rounded up to
+            the next odd number.)"""
+        return (self.camera_height // 2) * 2 + 1
+
+    @property
+    def leftmost_tile(self):
+        return self.camera_x - (self.camera_width // 2)
+
+    @property
+    def topmost_tile(self):
+        return self.camera_y - (self.camera_height // 2)
+
+    def scroll(self, delta_x: int, delta_y: int):
+        """ Scroll the camera by a number of pixels in each direction.
+
+            Args:
+                delta_x(int): The number of pixels to scroll right (negative for left.)
+                delta_y(int): The number of pixels to scroll down (negative for up.)
+
+            Returns:
+                A tuple of the number of whole tiles that camera_x and camera_y
+                moved by as a result of this scroll."""
+
+        tile_delta_x, self.offset_x = divmod(self.offset_x + delta_x, self.tile_width)
+        tile_delta_y, self.offset_y = divmod(
+            self.offset_y + delta_y, self.tile_height
+        )
+
+        self.camera_x += tile_delta_x
+        self.camera_y += tile_delta_y
+
+        return tile_delta_x, tile_delta_y
+
+    def set_zoom(self, zoom: float):
+        """ Zoom the camera in (zoom > 1) or out (zoom < 1), keeping the same tile
+            at the center of the view and the view the same size on the screen.
+
+            Args:
+                zoom(float): The scale of each tile relative to its base size."""
+
+        if zoom <= 0:
+            raise ValueError(f"Camera zoom must be greater than 0, not {zoom}.")
+
+        previous_tile_width = self.tile_width
+        previous_tile_height = self.tile_height
+
+        self.zoom = zoom
+        self.tile_width = max(1, int(self.base_tile_width * zoom))
+        self.tile_height = max(1, int(self.base_tile_height * zoom))
+
+        # Show as many tiles as fit in the same view. The camera always shows an
+        # odd number of tiles (see visible_columns), so that's the largest odd
+        # number which fits.
+        self.camera_width = _largest_odd_at_most(self._view_width // self.tile_width)
+        self.camera_height = _largest_odd_at_most(
+            self._view_height // self.tile_height
+        )
+
+        self.offset_x = self.offset_x * self.tile_width // previous_tile_width
+        self.offset_y = self.offset_y * self.tile_height // previous_tile_height
 
     def get_camera_fov(self, game_map: Map):
         #  x x x x x
@@ -26,10 +127,10 @@ class Camera:
         # 1 - (3 // 2) = 2 - 1 = 1
         # 1 + (3 // 2) = 2 + 1 = 3
         #
-        leftmost_sprite = self.camera_x - (self.camera_width // 2)
+        leftmost_sprite = self.leftmost_tile
         rightmost_sprite = self.camera_x + (self.camera_width // 2)
 
-        topmost_sprite = self.camera_y - (self.camera_height // 2)
+        topmost_sprite = self.topmost_tile
         bottommost_sprite = self.camera_y + (self.camera_height // 2)
 
         # TODO: There may be a better way to do this.
@@ -99,3 +200,9 @@ class Camera:
         )
 
         return fov_tile_sheet
+
+
+def _largest_odd_at_most(count):
+    """ Returns:
+            The largest odd number no more than count, and at least 1."""
+    return max(1, (count - 1) // 2 * 2 + 1)
@@ -0,0 +1,162 @@
+""" A controller used by base_game to move the camera along with an object on the
+    active map."""
+import logging
+
+from .camera import Camera
+from .map import Map
+
+
+class CameraController:
+    """ Keeps a camera following a target object.
+
+        The target can move freely inside the dead zone, a rectangle in the middle
+        of the camera, without the camera moving at all. Once the target leaves the
+        dead zone the camera scrolls just far enough to bring it back to the edge of
+        it. The camera can also look ahead of the target in the direction it last
+        moved, and is kept from showing anything past the edges of the map."""
+
+    def __init__(
+        self,
+        camera: Camera,
+        target,
+        dead_zone_width: int = 0,
+        dead_zone_height: int = 0,
+        look_ahead: int = 0,
+        clamp_to_map: bool = True,
+        scroll_speed: int = None,
+    ):
+        """ Args:
+                camera(Camera): The camera to move.
+                target: The object to follow. Its position is looked up in
+                        BaseGame.player_controlled_objects.
+                dead_zone_width(int): The number of tiles the target can move left
+                                      and right of the camera's center without the
+                                      camera moving.
+                dead_zone_height(int): The number of tiles the target can move up and
+                                       down without the camera moving.
+                look_ahead(int): The number of tiles ahead of the target, in the
+                                 direction it last moved, that the camera aims for.
+                clamp_to_map(bool): If True, the camera never scrolls past the edges
+                                    of the map.
+                scroll_speed(int): The most pixels the camera scrolls in each
+                                   direction per update. None snaps the camera
+                                   straight to its destination."""
+        self.camera = camera
+        self.target = target
+        self.dead_zone_width = dead_zone_width
+        self.dead_zone_height = dead_zone_height
+        self.look_ahead = look_ahead
+        self.clamp_to_map = clamp_to_map
+        self.scroll_speed = scroll_speed
+
+        self._previous_target_position = None
+        self._direction = (0, 0)
+        self._scroll_listeners = []
+
+    def register_scroll_listener(self, listener):
+        """ Register a callable taking (delta_x, delta_y) which will be told the
+            exact number of pixels the camera scrolled whenever it moves."""
+        self._scroll_listeners.append(listener)
+
+    def deregister_scroll_listener(self, listener):
+        if listener in self._scroll_listeners:
+            self._scroll_listeners.remove(listener)
+
+    def update(self, context):
+        """ Move the camera towards the target.
+
+            Args:
+                context(BaseGame): The game the target is being played in.
+
+            Returns:
+                A tuple of the number of pixels the camera scrolled in x and y."""
+
+        position = context.player_controlled_objects.get(self.target)
+        if position is None:
+            return 0, 0
+
+        self._track_direction(position)
+
+        tile_width = self.camera.tile_width
+        tile_height = self.camera.tile_height
+        camera_pixel_x = self.camera.camera_x * tile_width + self.camera.offset_x
+        camera_pixel_y = self.camera.camera_y * tile_height + self.camera.offset_y
+
+        focus_x = (position[0] + self._direction[0] * self.look_ahead) * tile_width
+        focus_y = (position[1] + self._direction[1] * self.look_ahead) * tile_height
+
+        destination_x = self._follow_axis(
+            camera_pixel_x, focus_x, (self.dead_zone_width // 2) * tile_width
+        )
+        destination_y = self._follow_axis(
+            camera_pixel_y, focus_y, (self.dead_zone_height // 2) * tile_height
+        )
+
+        if self.clamp_to_map and isinstance(context.active_screen, Map):
+            destination_x = self._clamp_axis(
+                destination_x,
+                self.camera.camera_width // 2,
+                self.camera.visible_columns,
+                context.active_screen.width,
+                tile_width,
+            )
+            destination_y = self._clamp_axis(
+                destination_y,
+                self.camera.camera_height // 2,
+                self.camera.visible_rows,
+                context.active_screen.height,
+                tile_height,
+            )
+
+        delta_x = self._limit_speed(destination_x - camera_pixel_x)
+        delta_y = self._limit_speed(destination_y - camera_pixel_y)
+
+        if delta_x or delta_y:
+            logging.debug(f"Camera following {self.target} by ({delta_x}, {delta_y}).")
+            self.camera.scroll(delta_x, delta_y)
+
+            for listener in self._scroll_listeners:
+                listener(delta_x, delta_y)
+
+        return delta_x, delta_y
+
+    def _track_direction(self, position):
+        previous = self._previous_target_position
+        if previous is not None and previous != position:
+            self._direction = (
+                (position[0] > previous[0]) - (position[0] < previous[0]),
+                (position[1] > previous[1]) - (position[1] < previous[1]),
+            )
+
+        self._previous_target_position = position
+
+    def _limit_speed(self, delta):
+        if self.scroll_speed is None:
+            return delta
+
+        return max(-self.scroll_speed, min(self.scroll_speed, delta))
+
+    @staticmethod
+    def _follow_axis(camera_position, focus, dead_zone):
+        """ Return where the camera needs to be on one axis to keep focus within
+            dead_zone pixels of its center."""
+
+        if focus > camera_position + dead_zone:
+            return focus - dead_zone
+        elif focus < camera_position - dead_zone:
+            return focus + dead_zone
+
+        return camera_position
+
+    @staticmethod
+    def _clamp_axis(position, half_view, visible_tiles, map_tiles, tile_size):
+        """ Clamp the camera's position on one axis so that the view stays within
+            the map. If the map is smaller than the view, it's centered instead."""
+
+        lowest = half_view * tile_size
+        highest = (map_tiles - visible_tiles + half_view) * tile_size
+
+        if highest < lowest:
+            return (lowest + highest) // 2
+
+        return max(lowest, min(highest, position))
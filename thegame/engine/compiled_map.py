@@ -0,0 +1,271 @@
+""" Maps compiled ahead of time by `python -m thegame.tools compile` into a
+    compact file that loads without parsing or checking anything.
+
+    A compiled map is a header followed by a zlib compressed body of:
+        The palette: each distinct tile's kind and sprite location.
+        The tiles: a (sheet, y, x) array of palette ids, 0 for an empty tile.
+        The passability: the map's PassabilityGrid cells.
+        The index: the tiles of each palette id, as (sheet, x, y), so the tiles
+                   of a kind (ie the player characters) can be found without
+                   looking through the sheets."""
+import logging
+import os
+import struct
+import zlib
+
+import numpy
+
+from .game_objects import GameObject, PlayerCharacter
+from .map import Map
+
+COMPILED_MAP_MAGIC = b"TGMP"
+FORMAT_VERSION = 1
+
+# The file extension of compiled maps.
+COMPILED_MAP_EXTENSION = ".tgmap"
+
+# The magic, format version, width, height, and number of palette entries.
+HEADER = struct.Struct("<4sHHHH")
+
+# A palette entry's kind, and the length of its sprite location.
+PALETTE_ENTRY = struct.Struct("<BH")
+
+# The kinds of tile, and the class each is loaded as.
+TILE_KIND = 0
+PLAYER_KIND = 1
+KIND_CLASSES = {TILE_KIND: GameObject, PLAYER_KIND: PlayerCharacter}
+
+# The palette id of an empty tile.
+EMPTY_TILE = 0
+
+SHEETS = 4
+TILE_ID = numpy.dtype("<u2")
+INDEX_OFFSET = numpy.dtype("<u4")
+INDEX_POSITION = numpy.dtype([("sheet", "<u1"), ("x", "<u2"), ("y", "<u2")])
+
+
+class CompiledMap:
+    """ A map as compiled, which to_map() turns into a Map to play on."""
+
+    class InvalidCompiledMapException(Exception):
+        pass
+
+    def __init__(self, palette, tiles, passability=None, index=None):
+        """ Args:
+                palette(list): The (kind, sprite location) of each palette id from
+                               1 up, in order.
+                tiles: A (sheet, y, x) array of palette ids.
+                passability(bytes): The map's PassabilityGrid cells, worked out
+                                    from tiles if not given.
+                index(tuple): The (offsets, positions) of the tiles of each palette
+                              id, worked out from tiles if not given. The tiles of
+                              id i are positions[offsets[i] : offsets[i + 1]]."""
+        if len(palette) >= numpy.iinfo(TILE_ID).max:
+            raise self.InvalidCompiledMapException(
+                f"A compiled map can have at most {numpy.iinfo(TILE_ID).max - 1}"
+                f" distinct tiles, not {len(palette)}."
+            )
+
+        self.palette = list(palette)
+        self.tiles = numpy.ascontiguousarray(tiles, dtype=TILE_ID)
+        _, self.height, self.width = self.tiles.shape
+
+        if passability is None:
+            passability = (
+                (self.tiles[Map.FOREGROUND_SHEET_INDEX] == EMPTY_TILE)
+                & (self.tiles[Map.CHARACTER_SHEET_INDEX] == EMPTY_TILE)
+            ).astype(numpy.uint8).tobytes()
+        self.passability = bytes(passability)
+
+        if index is None:
+            index = self._build_index()
+        self.index_offsets, self.index_positions = index
+
+    @classmethod
+    def compile(cls, layers):
+        """ Compile a map's layers, deduplicating its tiles into a palette.
+
+            Args:
+                layers(list): The rows of each sheet, in the order of
+                              Map.tile_sheets, where each tile is None or a
+                              (kind, sprite location).
+
+            Returns:
+                The CompiledMap."""
+
+        palette_ids = {None: EMPTY_TILE}
+        palette = []
+        tiles = []
+        for sheet in layers:
+            sheet_ids = []
+            for row in sheet:
+                row_ids = []
+                for tile in row:
+                    tile_id = palette_ids.get(tile)
+                    if tile_id is None:
+                        palette.append(tile)
+                        tile_id = palette_ids[tile] = len(palette)
+                    row_ids.append(tile_id)
+                sheet_ids.append(row_ids)
+            tiles.append(sheet_ids)
+
+        height = len(tiles[0])
+        width = len(tiles[0][0]) if height else 0
+        return cls(
+            palette, numpy.array(tiles, dtype=TILE_ID).reshape(SHEETS, height, width)
+        )
+
+    @classmethod
+    def read(cls, path: str):
+        """ Read a compiled map from path."""
+
+        with open(path, "rb") as compiled_file:
+            data = compiled_file.read()
+
+        if len(data) < HEADER.size:
+            raise cls.InvalidCompiledMapException(f"{path} is too short.")
+
+        magic, version, width, height, palette_size = HEADER.unpack_from(data)
+        if magic != COMPILED_MAP_MAGIC:
+            raise cls.InvalidCompiledMapException(f"{path} isn't a compiled map.")
+        if version != FORMAT_VERSION:
+            raise cls.InvalidCompiledMapException(
+                f"{path} is version {version} of the compiled map format, not"
+                f" {FORMAT_VERSION}."
+            )
+
+        try:
+            body = zlib.decompress(data[HEADER.size :])
+        except zlib.error as e:
+            raise cls.InvalidCompiledMapException(f"{path} is corrupt: {e}")
+
+        palette = []
+        offset = 0
+        for _ in range(palette_size):
+            kind, length = PALETTE_ENTRY.unpack_from(body, offset)
+            offset += PALETTE_ENTRY.size
+            palette.append((kind, body[offset : offset + length].decode("utf-8")))
+            offset += length
+
+        tiles = numpy.frombuffer(body, TILE_ID, SHEETS * height * width, offset)
+        offset += tiles.nbytes
+        passability = body[offset : offset + width * height]
+        offset += width * height
+        index_offsets = numpy.frombuffer(body, INDEX_OFFSET, palette_size + 2, offset)
+        offset += index_offsets.nbytes
+        index_positions = numpy.frombuffer(
+            body, INDEX_POSITION, int(index_offsets[-1]), offset
+        )
+
+        return cls(
+            palette,
+            tiles.reshape(SHEETS, height, width),
+            passability,
+            (index_offsets, index_positions),
+        )
+
+    def write(self, path: str):
+        """ Write the compiled map to path, replacing it only once it is written
+            in full."""
+
+        body = [
+            PALETTE_ENTRY.pack(kind, len(location.encode("utf-8")))
+            + location.encode("utf-8")
+            for kind, location in self.palette
+        ]
+        body.append(self.tiles.tobytes())
+        body.append(self.passability)
+        body.append(numpy.ascontiguousarray(self.index_offsets, INDEX_OFFSET).tobytes())
+        body.append(
+            numpy.ascontiguousarray(self.index_positions, INDEX_POSITION).tobytes()
+        )
+
+        temporary_path = f"{path}.tmp"
+        with open(temporary_path, "wb") as compiled_file:
+            compiled_file.write(
+                HEADER.pack(
+                    COMPILED_MAP_MAGIC,
+                    FORMAT_VERSION,
+                    self.width,
+                    self.height,
+                    len(self.palette),
+                )
+            )
+            compiled_file.write(zlib.compress(b"".join(body)))
+        os.replace(temporary_path, path)
+
+    def sprite_locations(self):
+        """ Returns:
+                The distinct sprite locations used by the map, to load up front."""
+        return sorted({location for _, location in self.palette})
+
+    def positions(self, palette_id: int):
+        """ Returns:
+                An array of the (sheet, x, y) of every tile with palette_id."""
+        return self.index_positions[
+            self.index_offsets[palette_id] : self.index_offsets[palette_id + 1]
+        ]
+
+    def positions_of_kind(self, kind: int):
+        """ Returns:
+                A list of the (sheet, x, y) of every tile of kind."""
+
+        positions = []
+        for palette_id, (tile_kind, _) in enumerate(self.palette, start=1):
+            if tile_kind == kind:
+                positions.extend(self.positions(palette_id).tolist())
+
+        return positions
+
+    def to_map(self):
+        """ Returns:
+                A new Map of the compiled map. Plain tiles hold no state of their
+                own, so every tile of a palette id shares one object. Tiles of any
+                other kind (ie player characters, which move and face their own
+                way) are each their own object."""
+
+        objects = [None]
+        for kind, location in self.palette:
+            tile_class = KIND_CLASSES.get(kind)
+            if tile_class is None:
+                raise self.InvalidCompiledMapException(f"Unknown tile kind {kind}.")
+            objects.append(tile_class(location))
+
+        sheets = [
+            [list(map(objects.__getitem__, row)) for row in sheet]
+            for sheet in self.tiles.tolist()
+        ]
+        for palette_id, (kind, location) in enumerate(self.palette, start=1):
+            if kind != TILE_KIND:
+                for sheet, x, y in self.positions(palette_id).tolist():
+                    sheets[sheet][y][x] = KIND_CLASSES[kind](location)
+
+        logging.debug(
+            f"Loaded a compiled {self.width}x{self.height} map with"
+            f" {len(self.palette)} distinct tiles."
+        )
+
+        return Map(*sheets, validate=False, passability_cells=self.passability)
+
+    def _build_index(self):
+        sheets, ys, xs = numpy.nonzero(self.tiles)
+        ids = self.tiles[sheets, ys, xs]
+        order = numpy.argsort(ids, kind="stable")
+
+        positions = numpy.zeros(len(order), dtype=INDEX_POSITION)
+        positions["sheet"] = sheets[order]
+        positions["x"] = xs[order]
+        positions["y"] = ys[order]
+
+        # One offset for each palette id, the empty id included, and the end.
+        counts = numpy.bincount(ids, minlength=len(self.palette) + 1)
+        offsets = numpy.zeros(len(self.palette) + 2, dtype=INDEX_OFFSET)
+        offsets[1:] = numpy.cumsum(counts)
+
+        return offsets, positions
+
+
+def load_compiled_map(path: str):
+    """ Returns:
+            A new Map of the compiled map at path."""
+    return CompiledMap.read(path).to_map()
@@ -1,11 +1,16 @@
 import logging
-import pprint
+import os
 from multiprocessing.pool import ThreadPool
 
-import pygame
-
+from . import startup
 from .base_game import BaseGame
 from .base_menu import BaseMenu
+from .input_recording import InputRecorder, InputReplay
+from .map import Map
+from .scroll_buffer import ScrollBuffer
+from .tile_renderer import TileRenderer, image_is_opaque
+
+pygame = startup.lazy_import("pygame")
 
 
 class Engine:
@@ -23,21 +28,30 @@ class Engine:
 
         self.display = None
         self.buffer = None
+        self.tile_renderer = None
+        self.scroll_buffers = {}
         self.context = game
         self.width = game.screen_width
         self.height = game.screen_height
         self.size = self.width, self.height
         self.mouse_down_pos = None
 
+        # Where each tick's input is being recorded to, or replayed from. See
+        # record_input() and replay_input().
+        self.input_recorder = None
+        self.input_replay = None
+        self._tick_mouse_position = None
+
         # Each event should be independent of the other,
         # thus we can process each one as if the others
         # didn't happen.
         self.event_pool = ThreadPool(processes=event_thread_count)
 
-        pygame.init()
-
     def start(self):
 
+        # Only the display (which brings keyboard and mouse input with it) is
+        # used, so nothing else of pygame's is initialized.
+        startup.init_subsystem("display")
         pygame.display.set_caption(self.context.name)
         self.display = pygame.display.set_mode(self.size)
         self.buffer = pygame.Surface(self.size)
@@ -46,6 +60,20 @@ class Engine:
         # Load in the game and load the active map if not a menu.
         self._load_map_sprites()
         self._load_menu_sprites()
+        self._load_animations()
+
+        # The tile renderer is shared by every viewport's scroll buffer, so a
+        # tile seen by several cameras is only looked up and composed once.
+        self.tile_renderer = TileRenderer(
+            self.context.object_images,
+            self.context.object_opacity,
+            animations=self.context.animations,
+            skipped_sheets=(
+                (Map.CHARACTER_SHEET_INDEX,)
+                if self.context.prediction is not None
+                else ()
+            ),
+        )
 
         # Load the map if the game was not initialized with a
         # main menu.
@@ -67,12 +95,60 @@ class Engine:
             logging.info("Pygame successfully uninitialized.")
             self.running = False
 
+            if self.context.world_simulation is not None:
+                self.context.world_simulation.close()
+
+            if self.context.saves is not None:
+                self.context.saves.close()
+
+            if self.input_recorder is not None:
+                self.input_recorder.close()
+
+            if self.input_replay is not None:
+                self.input_replay.close()
+
+    def record_input(self, path: str):
+        """ Record every tick's input to path while the engine runs, so it can be
+            replayed with replay_input(). Call before start()."""
+
+        self.input_recorder = InputRecorder(path)
+        self._run_every_due_update()
+
+    def replay_input(self, path: str, real_time: bool = False, headless: bool = False):
+        """ Feed the input recorded at path to the engine in place of the keyboard
+            and mouse, stopping once it runs out. Call before start().
+
+            Replays only play out the same as the recording if the game only
+            depends on its input and the number of ticks passed, so the update
+            scheduler's time budget is ignored while recording and replaying. Maps
+            simulated in other processes are stepped as they finish, so they can
+            still differ.
+
+            Args:
+                path(str): The input log written by record_input().
+                real_time(bool): If True, replay at 60fps, otherwise as fast as
+                                 the ticks can be run.
+                headless(bool): If True, draw to a window that is never shown."""
+
+        if headless:
+            # Taken up when start() initializes the display.
+            os.environ["SDL_VIDEODRIVER"] = "dummy"
+            if pygame.display.get_init():
+                pygame.display.quit()
+
+        self.input_replay = InputReplay(path, real_time)
+        self._run_every_due_update()
+
+    def _run_every_due_update(self):
+        # How many updates fit in a frame depends on how fast the machine is,
+        # which a replay can't reproduce.
+        self.context.scheduler.frame_budget = float("inf")
+
     def _main_loop(self):
 
         previous_pressed_keys = None
         logging.info("main loop started.")
         game_clock = pygame.time.Clock()
-        game_sprites = pygame.sprite.Group()
 
         while self.running:
 
@@ -83,7 +159,7 @@ class Engine:
             #       auto-magically.
 
             # Get the keys that were pressed.
-            pressed_keys = self._get_keystrokes()
+            pressed_keys = self._poll_keystrokes()
 
             # Because this loop runs many times a second,
             # a "tap" is interpreted as a hold.
@@ -101,60 +177,97 @@ class Engine:
             # Get the events, and the number of them.
             # Get the number here as it is used multiple
             # times, speeding this up.
-            events = pygame.event.get()
+            events = self._poll_events()
 
             # Handle events if any have come in.
             if len(events) > 0:
 
                 self._schedule_events(events=events)
 
-            # TODO: Find a more efficient method of this.
-            #   clearing then re-adding all the sprites from
-            #   the group seems inefficient.
-            game_sprites.empty()
             self.display.blit(self.buffer, (0, 0))
 
+            # Every animation is played from the one clock, so this is all it takes
+            # to move them on, however many objects are showing them.
+            self.context.animations.tick()
+
+            # Pick up whatever the other maps did in their worker processes, and
+            # set them going again.
+            if self.context.world_simulation is not None:
+                self.context.world_simulation.update(self.context.active_screen)
+
             # Discover which portion of the screen needs to be drawn
             if self.context.active_menu is not None:
                 menu_sprite = self.context.active_menu.menu_image
-                game_sprites.add(menu_sprite)
+                self.display.blit(menu_sprite.image, menu_sprite.rect)
+                self._draw_button_animations(self.context.active_menu)
             else:
-                onscreen_sprites = []
-                fov_tile_sheet = self.context.camera.get_camera_fov(
-                    self.context.active_screen
-                )
-                logging.debug(
-                    f"Got the following fov_tile_sheet: {pprint.pformat(fov_tile_sheet, indent=4)}"
-                )
+                for system in self.context.systems:
+                    self.context.entities.run(system, self.context)
+
+                self.context.scheduler.tick(self.context)
+
+                # Characters predicted ahead of the server are drawn over the
+                # view, rather than from the map.
+                if self.context.prediction is not None:
+                    sprites = self.context.prediction.sprites()
+                else:
+                    sprites = ()
+
+                self._prune_scroll_buffers()
+                for viewport in self.context.viewports:
+                    if viewport.controller is not None:
+                        viewport.controller.update(self.context)
+
+                    # Only the tiles exposed by the camera moving, or changed on
+                    # the map, are drawn into the scroll buffer. The view is
+                    # then copied from the buffer to the screen.
+                    scroll_buffer = self._get_scroll_buffer(viewport)
+                    scroll_buffer.update(self.context.active_screen)
+                    scroll_buffer.draw(
+                        self.display, viewport.screen_position, sprites
+                    )
 
-                # Currently, this is done with (4 * camera_width * camera_height) loops.
-                # the only way to reduce this is to not loop over rows full of Nones, but
-                # this check isn't worth the gain.
-                # Updates each sprites' x and y position.
-                for layer in fov_tile_sheet[::-1]:
-                    for row_index, row in enumerate(layer):
-                        for cell_index, cell in enumerate(row):
-                            if cell is not None:
-                                logging.debug(
-                                    f"{cell_index}: Setting the position of a {type(cell).__name__} on the screen."
-                                )
-                                cell.set_sprite_position(
-                                    cell_index * self.context.base_sprite_width,
-                                    row_index * self.context.base_sprite_height,
-                                )
-
-                                onscreen_sprites.append(cell.get_sprite())
-
-                for sprite in onscreen_sprites:
-                    game_sprites.add(sprite)
-
-            game_sprites.draw(self.display)
-
-            # TODO: In conjunction with the above todo, a more efficient way of drawing should be found.
             pygame.display.flip()
+            startup.mark("first frame")
+
+            # Run at 60fps, unless fast forwarding through a replay.
+            if self.input_replay is None or self.input_replay.real_time:
+                game_clock.tick(60)
+
+    def _prune_scroll_buffers(self):
+        """ Forget the scroll buffers of viewports which have been removed,
+            detaching them from the map."""
+
+        for viewport in list(self.scroll_buffers):
+            if viewport not in self.context.viewports:
+                self.scroll_buffers.pop(viewport).invalidate()
+
+    def _get_scroll_buffer(self, viewport):
+        """ Get the scroll buffer for a viewport, creating one the first time the
+            viewport is drawn or after its camera has been zoomed."""
+
+        scroll_buffer = self.scroll_buffers.get(viewport)
+        if scroll_buffer is not None and not scroll_buffer.fits_camera:
+            # The camera has zoomed, so scale every tile to its new size up front
+            # rather than as each one scrolls into view.
+            self.tile_renderer.prescale(
+                viewport.camera.tile_width, viewport.camera.tile_height
+            )
+
+        if (
+            scroll_buffer is None
+            or not scroll_buffer.fits_camera
+            or scroll_buffer.camera is not viewport.camera
+        ):
+            # Detach the old buffer from the map, so it stops listening for
+            # changes to tiles it will never draw.
+            if scroll_buffer is not None:
+                scroll_buffer.invalidate()
 
-            # Run at 60fps
-            game_clock.tick(60)
+            scroll_buffer = ScrollBuffer(viewport.camera, self.tile_renderer)
+            self.scroll_buffers[viewport] = scroll_buffer
+
+        return scroll_buffer
 
     def _load_map_sprites(self):
 
@@ -172,7 +285,37 @@ class Engine:
         for game_object_location in game_object_list_set:
             image = pygame.image.load(game_object_location).convert_alpha()
 
+            opaque = image_is_opaque(image)
+
             self.context.object_images[game_object_location] = image
+            self.context.object_opacity[game_object_location] = opaque
+
+    def _draw_button_animations(self, menu):
+        animations = self.context.animations
+
+        for button in menu.buttons:
+            frame_key = animations.playing_frame_key(button)
+            if frame_key is not None:
+                self.display.blit(
+                    self.context.object_images[frame_key], (button.pos_x, button.pos_y)
+                )
+
+    def _load_animations(self):
+        """ Cut every registered animation's sprite sheet into its frames, which
+            are then loaded alongside the other images."""
+
+        animations = self.context.animations
+        sprite_sheets = {}
+
+        for name, animation in animations.animations.items():
+            location = animation.sprite_sheet_location
+            if location not in sprite_sheets:
+                sprite_sheets[location] = pygame.image.load(location).convert_alpha()
+
+            for index, frame in enumerate(animation.decode(sprite_sheets[location])):
+                image_key = animations.image_key(name, index)
+                self.context.object_images[image_key] = frame
+                self.context.object_opacity[image_key] = image_is_opaque(frame)
 
     def _load_menu_sprites(self):
         for menu in self.context.menus.values():
@@ -183,6 +326,28 @@ class Engine:
 
     def _schedule_events(self, events):
 
+        # Events handled in the pool can run in any order, so they are handled in
+        # turn on this thread instead while recording or replaying (which must
+        # play out the same every time), or when there are mouse button events,
+        # which depend on each other through mouse_down_pos.
+        mouse_buttons = (pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP)
+        if (
+            self.input_recorder is not None
+            or self.input_replay is not None
+            or any(event.type in mouse_buttons for event in events)
+        ):
+            for event in events:
+                if not self.running:
+                    break
+
+                try:
+                    self._handle_event(event)
+                except Exception as e:
+                    self._stop_after_event_exception(event, e)
+                    break
+
+            return
+
         # Because the events are running in a separate thread, an
         # exception thrown by them is hidden in the ThreadPool.
         # In order to tell if an exception occurred in any of the event
@@ -210,13 +375,16 @@ class Engine:
             try:
                 possible_exception.get()
             except Exception as e:
-                self.running = False
-                logging.exception(
-                    f"Caught exception while handling "
-                    f"'{pygame.event.event_name(event.type)}' event: '{e}'."
-                )
+                self._stop_after_event_exception(event, e)
                 break
 
+    def _stop_after_event_exception(self, event, exception):
+        self.running = False
+        logging.exception(
+            f"Caught exception while handling "
+            f"'{pygame.event.event_name(event.type)}' event: '{exception}'."
+        )
+
     def _handle_event(self, event):
         logging.debug(f"Got event of type {pygame.event.event_name(event.type)}")
 
@@ -229,7 +397,7 @@ class Engine:
             # Get the initial and final position positions of the mouse from when the click (and hold)
             # occurred.
             init_x, init_y = self.mouse_down_pos
-            final_x, final_y = pygame.mouse.get_pos()
+            final_x, final_y = self._mouse_position()
             self.mouse_down_pos = None
 
             logging.info(f"Mouse button released at position ({final_x}, {final_y})")
@@ -242,7 +410,7 @@ class Engine:
                 )
 
         elif event.type == pygame.MOUSEBUTTONDOWN:
-            self.mouse_down_pos = pygame.mouse.get_pos()
+            self.mouse_down_pos = self._mouse_position()
             press_x, press_y = self.mouse_down_pos
 
             logging.info(f"Mouse button pressed at position ({press_x}, {press_y})")
@@ -313,6 +481,40 @@ class Engine:
         keys_string = f"Pressed keys: {keystrokes}"
         logging.info(keys_string)
 
+    def _poll_keystrokes(self):
+        """ Get the keys held this tick, from the replay if there is one."""
+
+        if self.input_replay is not None:
+            return self.input_replay.next_keystrokes()
+
+        pressed_keys = self._get_keystrokes()
+        if self.input_recorder is not None:
+            self.input_recorder.record_keystrokes(pressed_keys)
+
+        return pressed_keys
+
+    def _poll_events(self):
+        """ Get this tick's events, from the replay if there is one."""
+
+        if self.input_replay is not None:
+            self._tick_mouse_position = self.input_replay.mouse_position
+            return self.input_replay.next_events()
+
+        events = pygame.event.get()
+        if self.input_recorder is not None:
+            # The mouse is read once per tick, so the position handlers see is the
+            # one recorded.
+            self._tick_mouse_position = pygame.mouse.get_pos()
+            self.input_recorder.record_events(events, self._tick_mouse_position)
+
+        return events
+
+    def _mouse_position(self):
+        if self.input_recorder is not None or self.input_replay is not None:
+            return self._tick_mouse_position
+
+        return pygame.mouse.get_pos()
+
     @staticmethod
     def _get_keystrokes():
         """TODO: As of current, pressing two keys at the same time
@@ -0,0 +1,354 @@
+""" Entity-component storage, so that thousands of moving objects can be updated
+    each tick with a few array operations rather than a method call apiece."""
+import logging
+from collections.abc import MutableMapping
+
+import numpy
+
+from .game_objects import GameObject
+from .map import Map
+
+NORTH = 0
+EAST = 1
+SOUTH = 2
+WEST = 3
+
+
+class EntityStore:
+    """ Every entity's components, stored as one array per component.
+
+        An entity is just an index into the component columns:
+            position: The x,y tile the entity is on.
+            velocity: The x,y tiles the entity moves each tick.
+            facing: The direction the entity faces (NORTH, EAST, SOUTH, WEST.)
+            sprite: The id of the entity's sprite. See sprite_location().
+            controlled: Whether the entity is a player controlled object.
+
+        An entity can also have a GameObject, which is the object drawn on the map
+        and handed to game code. The columns grow as entities are created, and the
+        indices of destroyed entities are reused."""
+
+    def __init__(self, capacity: int = 1024):
+        """ Args:
+                capacity(int): The number of entities to make room for up front."""
+        self.capacity = 0
+        self.count = 0
+
+        self.alive = numpy.zeros(0, dtype=bool)
+        self.position = numpy.zeros((0, 2), dtype=numpy.int32)
+        self.velocity = numpy.zeros((0, 2), dtype=numpy.int32)
+        self.facing = numpy.zeros(0, dtype=numpy.int8)
+        self.sprite = numpy.zeros(0, dtype=numpy.int32)
+        self.controlled = numpy.zeros(0, dtype=bool)
+        self.objects = []
+
+        self._free = []
+        self._entities_by_object = {}
+        self._sprite_ids = {}
+        self._sprite_locations = []
+
+        self._grow(capacity)
+
+        # The player controlled objects in this store, and their positions, as a
+        # dictionary-like view. See PlayerControlledObjects.
+        self.player_controlled_objects = PlayerControlledObjects(self)
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, game_object):
+        return game_object in self._entities_by_object
+
+    def create(
+        self,
+        position: tuple,
+        velocity: tuple = (0, 0),
+        facing: int = NORTH,
+        game_object=None,
+        controlled: bool = False,
+    ):
+        """ Create an entity and return its index.
+
+            Args:
+                position(tuple): The x,y tile the entity is on.
+                velocity(tuple): The x,y tiles the entity moves each tick.
+                facing(int): The direction the entity faces.
+                game_object: The object this entity represents, if any. Its sprite
+                             becomes the entity's sprite.
+                controlled(bool): Whether the entity is player controlled."""
+
+        if game_object is not None and game_object in self._entities_by_object:
+            raise self.DuplicateEntityException(
+                f"{game_object} already has an entity in this store."
+            )
+
+        if not self._free:
+            self._grow(self.capacity * 2)
+
+        entity = self._free.pop()
+        self.count += 1
+
+        self.alive[entity] = True
+        self.position[entity] = position
+        self.velocity[entity] = velocity
+        object_facing = getattr(game_object, "facing", None)
+        if isinstance(object_facing, int):
+            facing = object_facing
+        self.facing[entity] = facing
+        self.controlled[entity] = controlled
+        self.sprite[entity] = self.sprite_id(
+            getattr(game_object, "sprite_location", None)
+        )
+        self.objects[entity] = game_object
+
+        if game_object is not None:
+            self._entities_by_object[game_object] = entity
+
+            if isinstance(game_object, GameObject):
+                game_object.entity_store = self
+                game_object.entity = entity
+
+        return entity
+
+    def destroy(self, entity: int):
+        if not self.alive[entity]:
+            return
+
+        game_object = self.objects[entity]
+        if game_object is not None:
+            del self._entities_by_object[game_object]
+
+            if isinstance(game_object, GameObject):
+                facing = getattr(game_object, "facing", None)
+                game_object.entity_store = None
+                game_object.entity = None
+
+                # Hand the facing back, so the object still knows which way it's
+                # facing once it's no longer an entity.
+                if facing is not None:
+                    game_object.facing = facing
+
+        self.alive[entity] = False
+        self.controlled[entity] = False
+        self.velocity[entity] = 0
+        self.objects[entity] = None
+        self.count -= 1
+        self._free.append(entity)
+
+    def entity_of(self, game_object):
+        """ Return the index of game_object's entity, or None if it hasn't got one."""
+        return self._entities_by_object.get(game_object)
+
+    def entities(self, mask=None):
+        """ Return an array of the index of every live entity, or of those also
+            in a boolean mask over the columns."""
+
+        if mask is None:
+            return numpy.flatnonzero(self.alive)
+
+        return numpy.flatnonzero(self.alive & mask)
+
+    def sprite_id(self, sprite_location):
+        """ Return the id for sprite_location, giving it one if it hasn't got one.
+            Entities without a sprite share the id of None's sprite location."""
+
+        sprite_id = self._sprite_ids.get(sprite_location)
+        if sprite_id is None:
+            sprite_id = len(self._sprite_locations)
+            self._sprite_ids[sprite_location] = sprite_id
+            self._sprite_locations.append(sprite_location)
+
+        return sprite_id
+
+    def sprite_location(self, sprite_id):
+        return self._sprite_locations[sprite_id]
+
+    def run(self, system, context=None, batch_size: int = 4096):
+        """ Run a system over the entities it selects, batch_size at a time.
+
+            Returns:
+                The number of entities the system was run over."""
+
+        entities = self.entities(system.select(self))
+        for start in range(0, len(entities), batch_size):
+            system.update(self, entities[start : start + batch_size], context)
+
+        return len(entities)
+
+    def _grow(self, capacity):
+        capacity = max(capacity, 1)
+        added = capacity - self.capacity
+        logging.debug(f"Growing entity store to {capacity} entities.")
+
+        self.alive = numpy.concatenate([self.alive, numpy.zeros(added, dtype=bool)])
+        self.position = numpy.concatenate(
+            [self.position, numpy.zeros((added, 2), dtype=numpy.int32)]
+        )
+        self.velocity = numpy.concatenate(
+            [self.velocity, numpy.zeros((added, 2), dtype=numpy.int32)]
+        )
+        self.facing = numpy.concatenate(
+            [self.facing, numpy.zeros(added, dtype=numpy.int8)]
+        )
+        self.sprite = numpy.concatenate(
+            [self.sprite, numpy.zeros(added, dtype=numpy.int32)]
+        )
+        self.controlled = numpy.concatenate(
+            [self.controlled, numpy.zeros(added, dtype=bool)]
+        )
+        self.objects += [None] * added
+
+        # Hand out the lowest indices first.
+        self._free = list(range(capacity - 1, self.capacity - 1, -1)) + self._free
+        self.capacity = capacity
+
+    class DuplicateEntityException(Exception):
+        """ Raised when creating an entity for an object which already has one."""
+
+        pass
+
+
+class PlayerControlledObjects(MutableMapping):
+    """ The player controlled objects of an EntityStore and their x,y positions.
+
+        This behaves like the dictionary BaseGame.player_controlled_objects always
+        was, but reads and writes the store's columns. Setting the position of an
+        object not in the store creates a controlled entity for it, and deleting an
+        object destroys its entity."""
+
+    def __init__(self, store: EntityStore):
+        self.store = store
+
+    def __getitem__(self, game_object):
+        entity = self.store.entity_of(game_object)
+        if entity is None or not self.store.controlled[entity]:
+            raise KeyError(game_object)
+
+        x, y = self.store.position[entity]
+        return int(x), int(y)
+
+    def __setitem__(self, game_object, position):
+        entity = self.store.entity_of(game_object)
+
+        if entity is None:
+            self.store.create(position, game_object=game_object, controlled=True)
+        else:
+            self.store.position[entity] = position
+            self.store.controlled[entity] = True
+
+    def __delitem__(self, game_object):
+        entity = self.store.entity_of(game_object)
+        if entity is None or not self.store.controlled[entity]:
+            raise KeyError(game_object)
+
+        self.store.destroy(entity)
+
+    def __iter__(self):
+        for entity in self.store.entities(self.store.controlled):
+            yield self.store.objects[entity]
+
+    def __len__(self):
+        return int(numpy.count_nonzero(self.store.alive & self.store.controlled))
+
+    def clear(self):
+        for entity in self.store.entities(self.store.controlled):
+            self.store.destroy(entity)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({dict(self.items())})"
+
+
+class System:
+    """ Logic run over many entities at once. Subclasses pick which entities they
+        run over with select(), and update them a batch at a time in update()."""
+
+    def select(self, store: EntityStore):
+        """ Return a boolean mask over the store's columns of the entities to run
+            over, or None for every live entity."""
+        return None
+
+    def update(self, store: EntityStore, entities, context):
+        """ Update a batch of entities.
+
+            Args:
+                store(EntityStore): The store the entities are in.
+                entities: An array of the indices of the entities in this batch.
+                context(BaseGame): The game being run."""
+        raise NotImplementedError()
+
+
+class MovementSystem(System):
+    """ Moves every entity with a velocity, and turns it to face where it's going.
+
+        When the active screen is a map, an entity only moves if the tile it's
+        moving to is passable and no other entity is moving there in the same tick,
+        and its object is moved on the map's character sheet with it."""
+
+    def select(self, store):
+        return store.velocity.any(axis=1)
+
+    def update(self, store, entities, context):
+        velocity = store.velocity[entities]
+        destinations = store.position[entities] + velocity
+
+        # Face the direction of the larger part of the velocity, preferring
+        # north and south.
+        store.facing[entities] = numpy.select(
+            [
+                (abs(velocity[:, 1]) >= abs(velocity[:, 0])) & (velocity[:, 1] < 0),
+                (abs(velocity[:, 1]) >= abs(velocity[:, 0])) & (velocity[:, 1] > 0),
+                velocity[:, 0] > 0,
+            ],
+            [NORTH, SOUTH, EAST],
+            WEST,
+        )
+
+        game_map = getattr(context, "active_screen", None)
+        if not isinstance(game_map, Map):
+            store.position[entities] = destinations
+            return
+
+        moving = self._allowed_moves(game_map, destinations)
+        entities = entities[moving]
+        destinations = destinations[moving]
+
+        # Every object is moved at once, so the map's listeners are told about
+        # the tick's moves together.
+        character_sheet = game_map.character_sheet
+        objects = store.objects
+        game_map.move_tiles(
+            Map.CHARACTER_SHEET_INDEX,
+            [
+                (current, destination)
+                for entity, current, destination in zip(
+                    entities.tolist(),
+                    store.position[entities].tolist(),
+                    destinations.tolist(),
+                )
+                if objects[entity] is not None
+                and character_sheet[current[1]][current[0]] is objects[entity]
+            ],
+        )
+
+        store.position[entities] = destinations
+
+    @staticmethod
+    def _allowed_moves(game_map, destinations):
+        """ Return a mask of which destinations can be moved to."""
+
+        x = destinations[:, 0]
+        y = destinations[:, 1]
+        allowed = (x >= 0) & (x < game_map.width) & (y >= 0) & (y < game_map.height)
+
+        cells = numpy.frombuffer(game_map.passability.cells, dtype=numpy.uint8)
+        indices = y[allowed] * game_map.width + x[allowed]
+        allowed[allowed] = cells[indices] == 1
+
+        # Nobody moves onto a tile someone else is moving onto too.
+        indices = y * game_map.width + x
+        _, inverse, counts = numpy.unique(
+            indices, return_inverse=True, return_counts=True
+        )
+        allowed &= counts[inverse] == 1
+
+        return allowed
@@ -0,0 +1,358 @@
+""" Flow fields, so that any number of NPCs heading to the same place can share one
+    search rather than each finding their own path."""
+import logging
+
+import numpy
+
+from .map import Map
+from .pathfinding import DIAGONAL_COST, DIAGONAL_STEPS, STRAIGHT_STEPS
+
+
+class FlowField:
+    """ The direction to step from every tile of a map to reach a target.
+
+        The field is made of an integration field (the cost of reaching the target
+        from each tile) and a direction field (which neighbour each tile should
+        step to next.) Both are worked out once for the whole map, after which an
+        agent anywhere on it finds its next step with a single lookup.
+
+        Only the foreground sheet is treated as impassable. Characters move every
+        frame, and a field for a crowd shouldn't need rebuilding whenever a member
+        of the crowd takes a step, so avoiding each other is left to the agents.
+
+        When the target moves the field is updated from the old one, rather than
+        worked out again from scratch. When the foreground changes the whole field
+        is rebuilt, the next time it's used."""
+
+    def __init__(
+        self,
+        game_map: Map,
+        targets,
+        diagonal: bool = False,
+        path_cost: float = 1,
+        terrain_cost: float = 1,
+    ):
+        """ Args:
+                game_map(Map): The map the field covers.
+                targets: An x,y tuple of the target tile, or an iterable of them for
+                         a target covering several tiles (ie a warp zone.)
+                diagonal(bool): If True, agents can step diagonally as long as they
+                                don't cut the corner of an impassable tile.
+                path_cost(float): The cost of stepping onto a tile on a path.
+                terrain_cost(float): The cost of stepping onto any other tile."""
+        self.game_map = game_map
+        self.width = game_map.width
+        self.height = game_map.height
+        self.diagonal = diagonal
+
+        self.steps = [(step_x, step_y, 1) for step_x, step_y in STRAIGHT_STEPS]
+        if diagonal:
+            self.steps += [
+                (step_x, step_y, DIAGONAL_COST) for step_x, step_y in DIAGONAL_STEPS
+            ]
+
+        self.path_cost = path_cost
+        self.terrain_cost = terrain_cost
+
+        self.passable = None
+        self.costs = None
+        self._read_map()
+        self.targets = self._target_indices(targets)
+
+        # The cost of reaching the nearest target from each tile (inf where it
+        # can't be reached), and the x and y of the step to take from each tile.
+        # All three are flat arrays of the map's tiles, row by row.
+        self.integration = None
+        self.step_x = None
+        self.step_y = None
+
+        # The number of tiles whose cost was updated by the last update, to see
+        # what moving the target costs compared to a rebuild.
+        self.tiles_updated = 0
+
+        self._dirty = False
+        self._build()
+
+        game_map.register_tile_listener(self._tile_changed)
+
+    @classmethod
+    def to_warp_zone(cls, game_map: Map, warp_zone: tuple, **options):
+        """ Return a field leading to every tile of a warp zone of game_map (one of
+            Map.warp_zones.) Any other options are passed to the FlowField."""
+
+        first_x = warp_zone[Map.WARP_ZONE_INITIAL_X_POSITION]
+        first_y = warp_zone[Map.WARP_ZONE_INITIAL_Y_POSITION]
+        final_x = warp_zone[Map.WARP_ZONE_FINAL_X_POSITION]
+        final_y = warp_zone[Map.WARP_ZONE_FINAL_Y_POSITION]
+
+        return cls(
+            game_map,
+            [
+                (x, y)
+                for y in range(first_y, final_y + 1)
+                for x in range(first_x, final_x + 1)
+            ],
+            **options,
+        )
+
+    def close(self):
+        """ Stop following changes to the map, once the field is no longer used."""
+        self.game_map.deregister_tile_listener(self._tile_changed)
+
+    def set_targets(self, targets):
+        """ Move the target of the field.
+
+            Any tile's cost to reach the new target can't be more than its cost to
+            reach the old one plus the cost between the old and new targets, so the
+            old field (plus that cost) is a safe overestimate of the new one. Only
+            the tiles that estimate is too high for are then updated. That's only
+            true of a single, passable old target, with stepping each way between two
+            tiles costing the same, so otherwise (ie with path costs) the field is
+            rebuilt.
+
+            Args:
+                targets: An x,y tuple or iterable of them, as when creating the
+                         field."""
+
+        new_targets = self._target_indices(targets)
+        if numpy.array_equal(new_targets, self.targets):
+            return
+
+        old_targets = self.targets
+        self.targets = new_targets
+        if self._dirty:
+            self._refresh()
+            return
+
+        between = self.integration[new_targets].min()
+        if (
+            self.costs is not None
+            or len(old_targets) > 1
+            or not self.passable[old_targets[0]]
+            or not numpy.isfinite(between)
+        ):
+            self._build()
+            return
+
+        self.integration += between
+        self.integration[new_targets] = 0
+        self.tiles_updated = self._propagate(new_targets)
+        self._build_directions()
+
+    def cost(self, x, y):
+        """ Return the cost of reaching the target from x,y, or inf if it can't be
+            reached."""
+
+        self._refresh()
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return float(self.integration[y * self.width + x])
+
+        return float("inf")
+
+    def direction(self, x, y):
+        """ Return the x,y step to take from x,y towards the target. (0, 0) on the
+            target, and anywhere the target can't be reached from."""
+
+        self._refresh()
+        if 0 <= x < self.width and 0 <= y < self.height:
+            index = y * self.width + x
+            return int(self.step_x[index]), int(self.step_y[index])
+
+        return 0, 0
+
+    def next_position(self, x, y):
+        step_x, step_y = self.direction(x, y)
+        return x + step_x, y + step_y
+
+    def directions(self, positions):
+        """ Return the steps for many agents at once.
+
+            Args:
+                positions: A sequence of x,y positions, or an (n, 2) array of them.
+
+            Returns:
+                An (n, 2) array of the x,y step each agent should take."""
+
+        self._refresh()
+
+        positions = numpy.asarray(positions, dtype=numpy.intp).reshape(-1, 2)
+        x = positions[:, 0]
+        y = positions[:, 1]
+        on_map = (x >= 0) & (x < self.width) & (y >= 0) & (y < self.height)
+
+        steps = numpy.zeros(positions.shape, dtype=numpy.int8)
+        indices = y[on_map] * self.width + x[on_map]
+        steps[on_map, 0] = self.step_x[indices]
+        steps[on_map, 1] = self.step_y[indices]
+
+        return steps
+
+    def _read_map(self):
+        """ Read which tiles are passable, and what each costs to step onto, from
+            the map's sheets."""
+
+        self.passable = numpy.array(
+            [[tile is None for tile in row] for row in self.game_map.foreground_sheet],
+            dtype=bool,
+        ).ravel()
+
+        if self.path_cost != self.terrain_cost:
+            path_sheet = self.game_map.path_sheet
+            on_path = numpy.array(
+                [[tile is not None for tile in row] for row in path_sheet], dtype=bool
+            ).ravel()
+            self.costs = numpy.where(on_path, self.path_cost, self.terrain_cost).astype(
+                numpy.float64
+            )
+
+    def _target_indices(self, targets):
+        if len(targets) == 2 and all(isinstance(value, int) for value in targets):
+            targets = [targets]
+
+        indices = [
+            y * self.width + x
+            for x, y in targets
+            if 0 <= x < self.width and 0 <= y < self.height
+        ]
+        if not indices:
+            raise ValueError(f"None of the targets {targets} are on the map.")
+
+        return numpy.unique(numpy.array(indices, dtype=numpy.intp))
+
+    def _tile_changed(self, sheet, x, y):
+        """ Registered as a tile listener of the map."""
+
+        if sheet == Map.FOREGROUND_SHEET_INDEX:
+            self._dirty = True
+
+        elif sheet == Map.PATH_SHEET_INDEX and self.costs is not None:
+            # Path costs are only ever rebuilt with the rest of the field.
+            self._dirty = True
+
+    def _refresh(self):
+        if self._dirty:
+            self._read_map()
+            self._build()
+
+    def _build(self):
+        """ Work out the whole field from scratch."""
+
+        logging.debug(f"Building a flow field to {len(self.targets)} tiles.")
+
+        self._dirty = False
+        self.integration = numpy.full(self.width * self.height, numpy.inf)
+        self.integration[self.targets] = 0
+        self.tiles_updated = self._propagate(self.targets)
+        self._build_directions()
+
+    def _propagate(self, frontier):
+        """ Lower the cost of any tile that can be reached more cheaply through the
+            tiles of frontier, then through the tiles that lowered, and so on until
+            nothing changes.
+
+            Each round handles the whole frontier at once, so it's only ever as many
+            rounds as the longest path is long.
+
+            Returns:
+                The number of times a tile's cost was lowered."""
+
+        width = self.width
+        height = self.height
+        passable = self.passable
+        integration = self.integration
+        costs = self.costs
+        updated = 0
+
+        while frontier.size:
+            frontier_x = frontier % width
+            frontier_y = frontier // width
+            neighbour_indices = []
+            candidate_costs = []
+
+            for step_x, step_y, step in self.steps:
+                # The tiles that would step onto the frontier with this step.
+                x = frontier_x - step_x
+                y = frontier_y - step_y
+                on_map = numpy.flatnonzero(
+                    (x >= 0) & (x < width) & (y >= 0) & (y < height)
+                )
+                x = x[on_map]
+                y = y[on_map]
+                indices = y * width + x
+
+                keep = passable[indices]
+                if step_x and step_y:
+                    # No cutting corners.
+                    keep &= passable[y * width + x + step_x]
+                    keep &= passable[(y + step_y) * width + x]
+
+                stepped_onto = frontier[on_map[keep]]
+                entry_costs = step if self.costs is None else step * costs[stepped_onto]
+
+                neighbour_indices.append(indices[keep])
+                candidate_costs.append(integration[stepped_onto] + entry_costs)
+
+            neighbours = numpy.concatenate(neighbour_indices)
+            candidates = numpy.concatenate(candidate_costs)
+
+            improves = candidates < integration[neighbours]
+            neighbours = neighbours[improves]
+            candidates = candidates[improves]
+
+            numpy.minimum.at(integration, neighbours, candidates)
+            updated += neighbours.size
+            frontier = numpy.unique(neighbours)
+
+        return updated
+
+    def _build_directions(self):
+        """ Point each tile at the neighbour its cost came from."""
+
+        width = self.width
+        height = self.height
+        integration = self.integration.reshape(height, width)
+        passable = self.passable.reshape(height, width)
+        enterable = self.passable.copy()
+        enterable[self.targets] = True
+        enterable = enterable.reshape(height, width)
+        costs = None if self.costs is None else self.costs.reshape(height, width)
+
+        best = numpy.full((height, width), numpy.inf)
+        self.step_x = numpy.zeros(width * height, dtype=numpy.int8)
+        self.step_y = numpy.zeros(width * height, dtype=numpy.int8)
+        step_x_grid = self.step_x.reshape(height, width)
+        step_y_grid = self.step_y.reshape(height, width)
+
+        for step_x, step_y, step in self.steps:
+            # The cost through the neighbour at (x + step_x, y + step_y), for every
+            # tile that has one.
+            through = numpy.full((height, width), numpy.inf)
+            source = (
+                slice(max(0, -step_y), height - max(0, step_y)),
+                slice(max(0, -step_x), width - max(0, step_x)),
+            )
+            neighbour = (
+                slice(max(0, step_y), height + min(0, step_y)),
+                slice(max(0, step_x), width + min(0, step_x)),
+            )
+
+            entry = step if costs is None else step * costs[neighbour]
+            through[source] = integration[neighbour] + entry
+            through[source][~enterable[neighbour]] = numpy.inf
+
+            if step_x and step_y:
+                across_x = (source[0], neighbour[1])
+                across_y = (neighbour[0], source[1])
+                through[source][~(passable[across_x] & passable[across_y])] = numpy.inf
+
+            better = through < best
+            best[better] = through[better]
+            step_x_grid[better] = step_x
+            step_y_grid[better] = step_y
+
+        # Targets stay put, and so does anything that can't reach one.
+        self.step_x[self.targets] = 0
+        self.step_y[self.targets] = 0
+        unreachable = ~numpy.isfinite(self.integration)
+        self.step_x[unreachable] = 0
+        self.step_y[unreachable] = 0
@@ -41,6 +41,29 @@ class PlayerCharacter(PlayerControlledObject):
         )
         self.facing = facing_direction
 
+    @property
+    def facing(self):
+        """ The direction this PC is facing. Read from and written to the facing
+            column of the PC's entity, while it has one."""
+        if self.entity_store is not None:
+            return int(self.entity_store.facing[self.entity])
+
+        return self._facing
+
+    @facing.setter
+    def facing(self, facing_direction):
+        self._facing = facing_direction
+
+        if self.entity_store is not None:
+            self.entity_store.facing[self.entity] = facing_direction
+
+    def __getstate__(self):
+        state = super().__getstate__()
+
+        # Keep the facing held by the PC's entity, which is about to be dropped.
+        state["_facing"] = self.facing
+        return state
+
     def player_interaction(self, keystrokes, context):
 
         # Check if any of WASD were pressed, and if so move.
@@ -68,7 +91,8 @@ class PlayerCharacter(PlayerControlledObject):
             over going left and right, and going left takes priority over going right.
             This means that if up and down, then the PC will move up; if up and
             left, then the PC will move up; if down and right, then the PC will
-            move down; and if left and right, the PC will move left."""
+            move down; and if left and right, the PC will move left.
+            The PC won't move onto an impassable tile, or off of the map."""
 
         current_pos = context.player_controlled_objects[self]
         sheet = context.active_screen.CHARACTER_SHEET_INDEX
@@ -76,24 +100,38 @@ class PlayerCharacter(PlayerControlledObject):
             f"PlayerControlledObject at {current_pos} is moving with {(up, down, left, right)}. "
         )
 
-        if up:
-            new_pos = (current_pos[0], current_pos[1] - 1)
-
-        elif down:
-            new_pos = (current_pos[0], current_pos[1] + 1)
-
-        elif left:
-            new_pos = (current_pos[0] - 1, current_pos[1])
-
-        elif right:
-            new_pos = (current_pos[0] + 1, current_pos[1])
-        else:
+        new_pos = self.next_position(current_pos, up, down, left, right)
+        if new_pos is None:
             logging.warning("CharacterObject.move called with all parameters False.")
             return
 
+        if not context.active_screen.is_passable(*new_pos):
+            logging.debug(f"PlayerControlledObject blocked from moving to {new_pos}.")
+            return
+
         context.player_controlled_objects[self] = new_pos
         context.active_screen.swap(current_pos, new_pos, sheet)
 
+    @staticmethod
+    def next_position(position, up=False, down=False, left=False, right=False):
+        """ The tile a move from position goes to, with the priorities of move(),
+            or None if no direction is given. Whether the tile can be moved onto
+            isn't checked.
+
+            Args:
+                position(tuple): The x,y tile the move starts from."""
+
+        if up:
+            return (position[0], position[1] - 1)
+        elif down:
+            return (position[0], position[1] + 1)
+        elif left:
+            return (position[0] - 1, position[1])
+        elif right:
+            return (position[0] + 1, position[1])
+
+        return None
+
     def call_interaction(self, context):
 
         pc_location = context.player_controlled_objects[self]
@@ -8,6 +8,11 @@ class GameObject:
         self._loaded_sprite = None
         self.name = name
 
+        # The EntityStore holding this object's components, and the index of its
+        # entity in it, while it has one.
+        self.entity_store = None
+        self.entity = None
+
     def clone(self):
         clone = GameObject(
             sprite_location=self.sprite_location, animation=self.animation
@@ -15,6 +20,17 @@ class GameObject:
 
         return clone
 
+    def __getstate__(self):
+        """ The object's attributes, less its loaded sprite and entity, which
+            belong to the running game rather than to the object. Used when the
+            object is copied or saved."""
+        state = dict(self.__dict__)
+        state["_loaded_sprite"] = None
+        state["entity_store"] = None
+        state["entity"] = None
+
+        return state
+
     def register_loaded_sprite(self, loaded_sprite):
         self._loaded_sprite = loaded_sprite
 
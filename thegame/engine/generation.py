@@ -0,0 +1,466 @@
+""" Generating maps procedurally, with whole chunks of tiles worked out at once as
+    NumPy arrays rather than tile by tile.
+
+    A generator is made of fields, each giving a value for every tile (ie the
+    height of the terrain from noise, or whether a tile is cave wall), and rules,
+    which put a tile on a sheet wherever the fields are in given ranges:
+
+        generator = MapGenerator(seed=7)
+        generator.add_field("height", NoiseField(scale=64, octaves=4))
+        generator.add_field("caves", CaveField())
+        generator.add_rule(Map.BACKGROUND_SHEET_INDEX, (TILE_KIND, "grass.png"))
+        generator.add_rule(
+            Map.FOREGROUND_SHEET_INDEX, (TILE_KIND, "water.png"), height=(0, 0.3)
+        )
+        generator.add_rule(
+            Map.FOREGROUND_SHEET_INDEX, (TILE_KIND, "rock.png"), caves=(1, 2)
+        )
+        game_map = generator.generate(4096, 4096).to_map()
+
+    Every value depends only on the seed and the tile's position, so a map comes out
+    the same however it is split into chunks, and chunks are generated in parallel."""
+import logging
+import math
+from collections import namedtuple
+from multiprocessing import Pool
+
+import numpy
+
+from .compiled_map import EMPTY_TILE, SHEETS, TILE_ID, CompiledMap
+
+VALUE_NOISE = "value"
+PERLIN_NOISE = "perlin"
+SIMPLEX_NOISE = "simplex"
+
+# The constants skewing the square grid onto the simplex (triangle) grid and back.
+SIMPLEX_SKEW = (math.sqrt(3) - 1) / 2
+SIMPLEX_UNSKEW = (3 - math.sqrt(3)) / 6
+
+# A tile (kind, sprite location), or None to clear it, put on sheet wherever each
+# of the conditions' fields is in its [low, high) range, on that fraction (chance)
+# of those tiles.
+Rule = namedtuple("Rule", ["sheet", "tile", "conditions", "chance"])
+
+
+def hash_positions(xs, ys, seed: int):
+    """ Returns:
+            A uint32 array of a well mixed hash of each x,y position and seed."""
+
+    hashed = (xs.astype(numpy.uint32) * numpy.uint32(0x8DA6B343)) ^ (
+        ys.astype(numpy.uint32) * numpy.uint32(0xD8163841)
+    )
+    hashed ^= numpy.uint32(seed & 0xFFFFFFFF)
+    hashed ^= hashed >> numpy.uint32(16)
+    hashed *= numpy.uint32(0x7FEB352D)
+    hashed ^= hashed >> numpy.uint32(15)
+    hashed *= numpy.uint32(0x846CA68B)
+    hashed ^= hashed >> numpy.uint32(16)
+
+    return hashed
+
+
+def random_positions(xs, ys, seed: int):
+    """ Returns:
+            An array of a random number in [0, 1) for each x,y position."""
+    return hash_positions(xs, ys, seed) / 2.0 ** 32
+
+
+def tile_positions(x: int, y: int, width: int, height: int):
+    """ Returns:
+            The (xs, ys) of the tiles of the width by height area with x,y at its
+            top left, as a row of xs and a column of ys which broadcast together.
+            Keeping them apart means work done per column or per row (ie finding
+            the lattice cell of each x) is done once rather than once a tile."""
+    return numpy.meshgrid(
+        numpy.arange(x, x + width, dtype=numpy.int64),
+        numpy.arange(y, y + height, dtype=numpy.int64),
+        sparse=True,
+    )
+
+
+def _fade(offsets):
+    return offsets * offsets * offsets * (offsets * (offsets * 6 - 15) + 10)
+
+
+class _Lattice:
+    """ The random values of the whole positions around some sample positions,
+        hashed once per lattice position rather than once per sample."""
+
+    def __init__(self, lattice_xs, lattice_ys, seed: int):
+        self.left = int(lattice_xs.min())
+        self.top = int(lattice_ys.min())
+        self.lattice_xs = lattice_xs - self.left
+        self.lattice_ys = lattice_ys - self.top
+
+        xs, ys = tile_positions(
+            self.left,
+            self.top,
+            int(lattice_xs.max()) - self.left + 2,
+            int(lattice_ys.max()) - self.top + 2,
+        )
+        self.values = random_positions(xs, ys, seed)
+
+        angles = self.values * (2 * math.pi)
+        self.gradient_xs = numpy.cos(angles)
+        self.gradient_ys = numpy.sin(angles)
+
+    def corner(self, table, x_steps, y_steps):
+        """ Returns:
+                The value in table of the lattice position x_steps,y_steps from
+                each sample's."""
+        if self.lattice_ys.shape[-1] == 1 and self.lattice_xs.shape[0] == 1:
+            # A row of xs and a column of ys pick whole rows, then columns, which
+            # is much faster than picking each tile's value.
+            return table.take(self.lattice_ys[:, 0] + y_steps, axis=0).take(
+                self.lattice_xs[0] + x_steps, axis=1
+            )
+
+        return table[self.lattice_ys + y_steps, self.lattice_xs + x_steps]
+
+
+def value_noise(xs, ys, seed: int):
+    """ Random values at whole positions, smoothly blended between them.
+
+        Args:
+            xs(numpy.ndarray): The x positions to sample, in lattice units.
+            ys(numpy.ndarray): The y positions to sample, which broadcast with xs.
+            seed(int): The seed of the lattice's values.
+
+        Returns:
+            An array of the noise at each position, in [0, 1]."""
+
+    lattice_xs = numpy.floor(xs).astype(numpy.int64)
+    lattice_ys = numpy.floor(ys).astype(numpy.int64)
+    fade_xs = _fade(xs - lattice_xs)
+    fade_ys = _fade(ys - lattice_ys)
+    lattice = _Lattice(lattice_xs, lattice_ys, seed)
+
+    top_left = lattice.corner(lattice.values, 0, 0)
+    top_right = lattice.corner(lattice.values, 1, 0)
+    bottom_left = lattice.corner(lattice.values, 0, 1)
+    bottom_right = lattice.corner(lattice.values, 1, 1)
+
+    top = top_left + (top_right - top_left) * fade_xs
+    bottom = bottom_left + (bottom_right - bottom_left) * fade_xs
+    return top + (bottom - top) * fade_ys
+
+
+def perlin_noise(xs, ys, seed: int):
+    """ Gradient noise: a random gradient at each whole position, blended between.
+        See value_noise() for the arguments.
+
+        Returns:
+            An array of the noise at each position, in [0, 1]."""
+
+    lattice_xs = numpy.floor(xs).astype(numpy.int64)
+    lattice_ys = numpy.floor(ys).astype(numpy.int64)
+    offset_xs = xs - lattice_xs
+    offset_ys = ys - lattice_ys
+    lattice = _Lattice(lattice_xs, lattice_ys, seed)
+
+    def corner(x_step, y_step):
+        return lattice.corner(lattice.gradient_xs, x_step, y_step) * (
+            offset_xs - x_step
+        ) + lattice.corner(lattice.gradient_ys, x_step, y_step) * (offset_ys - y_step)
+
+    fade_xs = _fade(offset_xs)
+    fade_ys = _fade(offset_ys)
+    top_left = corner(0, 0)
+    bottom_left = corner(0, 1)
+    top = top_left + (corner(1, 0) - top_left) * fade_xs
+    bottom = bottom_left + (corner(1, 1) - bottom_left) * fade_xs
+    noise = top + (bottom - top) * fade_ys
+
+    # Perlin noise is within +-sqrt(1/2).
+    return numpy.clip(noise * math.sqrt(2) / 2 + 0.5, 0, 1)
+
+
+def simplex_noise(xs, ys, seed: int):
+    """ Gradient noise on a grid of triangles, which has fewer directional artifacts
+        than perlin_noise() and blends three corners rather than four. See
+        value_noise() for the arguments.
+
+        Returns:
+            An array of the noise at each position, in [0, 1]."""
+
+    xs, ys = numpy.broadcast_arrays(xs, ys)
+    skew = (xs + ys) * SIMPLEX_SKEW
+    cell_xs = numpy.floor(xs + skew).astype(numpy.int64)
+    cell_ys = numpy.floor(ys + skew).astype(numpy.int64)
+    unskew = (cell_xs + cell_ys) * SIMPLEX_UNSKEW
+    offset_xs = xs - (cell_xs - unskew)
+    offset_ys = ys - (cell_ys - unskew)
+    lattice = _Lattice(cell_xs, cell_ys, seed)
+
+    # Which of the cell's two triangles the position is in.
+    middle_x_steps = (offset_xs > offset_ys).astype(numpy.int64)
+    middle_y_steps = 1 - middle_x_steps
+
+    noise = numpy.zeros(xs.shape)
+    for x_steps, y_steps in (
+        (0, 0),
+        (middle_x_steps, middle_y_steps),
+        (1, 1),
+    ):
+        corner_xs = offset_xs - x_steps + (x_steps + y_steps) * SIMPLEX_UNSKEW
+        corner_ys = offset_ys - y_steps + (x_steps + y_steps) * SIMPLEX_UNSKEW
+        gradient_xs = lattice.corner(lattice.gradient_xs, x_steps, y_steps)
+        gradient_ys = lattice.corner(lattice.gradient_ys, x_steps, y_steps)
+
+        falloff = numpy.maximum(0.5 - corner_xs * corner_xs - corner_ys * corner_ys, 0)
+        falloff *= falloff
+        noise += falloff * falloff * (gradient_xs * corner_xs + gradient_ys * corner_ys)
+
+    return numpy.clip(noise * 35 + 0.5, 0, 1)
+
+
+NOISE_FUNCTIONS = {
+    VALUE_NOISE: value_noise,
+    PERLIN_NOISE: perlin_noise,
+    SIMPLEX_NOISE: simplex_noise,
+}
+
+
+class NoiseField:
+    """ A field of fractal noise: several octaves of noise, each finer and fainter
+        than the last, added together."""
+
+    def __init__(
+        self,
+        kind: str = PERLIN_NOISE,
+        scale: float = 32,
+        octaves: int = 1,
+        persistence: float = 0.5,
+        lacunarity: float = 2,
+        seed: int = 0,
+    ):
+        """ Args:
+                kind(str): VALUE_NOISE, PERLIN_NOISE or SIMPLEX_NOISE.
+                scale(float): The size of the coarsest octave's features, in tiles.
+                octaves(int): The number of octaves added together.
+                persistence(float): How much fainter each octave is than the last.
+                lacunarity(float): How much finer each octave is than the last.
+                seed(int): Added to the generator's seed, so fields of the same
+                           kind can differ."""
+        if kind not in NOISE_FUNCTIONS:
+            raise ValueError(
+                f"Unknown noise {kind}, expected one of"
+                f" {', '.join(NOISE_FUNCTIONS)}."
+            )
+
+        self.kind = kind
+        self.scale = scale
+        self.octaves = octaves
+        self.persistence = persistence
+        self.lacunarity = lacunarity
+        self.seed = seed
+
+    def __call__(self, x: int, y: int, width: int, height: int, seed: int):
+        """ Returns:
+                A height by width array of the field's value, in [0, 1], for each
+                tile of the area with x,y at its top left."""
+
+        noise_function = NOISE_FUNCTIONS[self.kind]
+        xs, ys = tile_positions(x, y, width, height)
+
+        total = numpy.zeros((height, width))
+        frequency = 1 / self.scale
+        amplitude = 1
+        amplitudes = 0
+        for octave in range(self.octaves):
+            total += amplitude * noise_function(
+                xs * frequency, ys * frequency, seed + self.seed + octave * 7919
+            )
+            amplitudes += amplitude
+            frequency *= self.lacunarity
+            amplitude *= self.persistence
+
+        return total / amplitudes
+
+
+class CaveField:
+    """ A field of caves, grown by a cellular automaton from random noise: 1 for a
+        tile of wall and 0 for open floor.
+
+        A tile starts as wall on chance of fill, then each step it becomes (or
+        stays) wall if enough of its 8 neighbours are wall. Neighbours smooth the
+        noise into connected caverns."""
+
+    def __init__(
+        self,
+        fill: float = 0.45,
+        steps: int = 4,
+        birth: int = 5,
+        survival: int = 4,
+        seed: int = 0,
+    ):
+        """ Args:
+                fill(float): The chance of a tile starting as wall.
+                steps(int): The number of steps the automaton is run for.
+                birth(int): The walls among its neighbours a floor tile needs to
+                            become wall.
+                survival(int): The walls among its neighbours a wall tile needs to
+                               stay wall.
+                seed(int): Added to the generator's seed."""
+        self.fill = fill
+        self.steps = steps
+        self.birth = birth
+        self.survival = survival
+        self.seed = seed
+
+    def __call__(self, x: int, y: int, width: int, height: int, seed: int):
+        """ See NoiseField.__call__()."""
+
+        # A tile depends on the tiles up to steps away, so the automaton starts
+        # from a margin that wide around the area, which shrinks by a tile each
+        # step. That way the area comes out the same whatever chunk it's in.
+        margin = self.steps
+        xs, ys = tile_positions(
+            x - margin, y - margin, width + 2 * margin, height + 2 * margin
+        )
+        walls = random_positions(xs, ys, seed + self.seed) < self.fill
+
+        for _ in range(self.steps):
+            walls = self._step(walls)
+
+        return walls.astype(numpy.float64)
+
+    def _step(self, walls):
+        height, width = walls.shape
+        neighbours = numpy.zeros((height - 2, width - 2), dtype=numpy.uint8)
+        for y_offset in range(3):
+            for x_offset in range(3):
+                if x_offset != 1 or y_offset != 1:
+                    neighbours += walls[
+                        y_offset : height - 2 + y_offset,
+                        x_offset : width - 2 + x_offset,
+                    ]
+
+        return numpy.where(
+            walls[1:-1, 1:-1], neighbours >= self.survival, neighbours >= self.birth
+        )
+
+
+class MapGenerator:
+    """ Generates maps from fields and rules. See the module's docstring."""
+
+    def __init__(self, seed: int = 0, chunk_size: int = 256):
+        """ Args:
+                seed(int): The seed of every field and rule, so the same seed always
+                           generates the same map.
+                chunk_size(int): The width and height of the chunks the map is
+                                 generated in, which bounds the memory used."""
+        self.seed = seed
+        self.chunk_size = chunk_size
+
+        self.fields = {}
+        self.rules = []
+
+    def add_field(self, name: str, field):
+        """ Args:
+                name(str): The name rules refer to the field by.
+                field: A callable taking (x, y, width, height, seed) and returning a
+                       height by width array of the field's value for each tile of
+                       the area with x,y at its top left. It's run in other
+                       processes, so must be picklable (ie not a lambda.)"""
+        self.fields[name] = field
+
+    def add_rule(self, sheet: int, tile, chance: float = 1.0, **conditions):
+        """ Put tile on sheet wherever every condition holds. Later rules replace the
+            tiles of earlier rules on the same sheet.
+
+            Args:
+                sheet(int): The index of the sheet, as in Map.tile_sheets.
+                tile(tuple): The tile's (kind, sprite location), as in
+                             CompiledMap's palette, or None to clear tiles.
+                chance(float): The chance of the tile being put on each tile where
+                               the conditions hold, to scatter it.
+                conditions: The [low, high) range of values of each field named."""
+
+        if not 0 <= sheet < SHEETS:
+            raise ValueError(
+                f"Attempted to add a rule for sheet level {sheet}, which is not a"
+                f" valid sheet. Please add rules for sheet [0-{SHEETS - 1}]."
+            )
+
+        unknown = set(conditions) - set(self.fields)
+        if unknown:
+            raise ValueError(f"Rule conditions on unknown fields: {sorted(unknown)}.")
+
+        self.rules.append(Rule(sheet, tile, conditions, chance))
+
+    def palette(self):
+        """ Returns:
+                The CompiledMap palette of the rules' tiles."""
+
+        palette = []
+        for rule in self.rules:
+            if rule.tile is not None and rule.tile not in palette:
+                palette.append(rule.tile)
+
+        return palette
+
+    def generate_chunk(self, x: int, y: int, width: int, height: int):
+        """ Returns:
+                A (sheet, y, x) array of the palette ids (see palette()) of the
+                tiles of the width by height area with x,y at its top left."""
+
+        palette_ids = {tile: tile_id for tile_id, tile in enumerate(self.palette(), 1)}
+        palette_ids[None] = EMPTY_TILE
+
+        values = {
+            name: field(x, y, width, height, self.seed)
+            for name, field in self.fields.items()
+        }
+        tiles = numpy.zeros((SHEETS, height, width), dtype=TILE_ID)
+        for rule_number, rule in enumerate(self.rules):
+            placed = numpy.ones((height, width), dtype=bool)
+            for name, (low, high) in rule.conditions.items():
+                placed &= (values[name] >= low) & (values[name] < high)
+
+            if rule.chance < 1:
+                xs, ys = tile_positions(x, y, width, height)
+                placed &= (
+                    random_positions(xs, ys, self.seed + 104729 * (rule_number + 1))
+                    < rule.chance
+                )
+
+            tiles[rule.sheet][placed] = palette_ids[rule.tile]
+
+        return tiles
+
+    def generate(self, width: int, height: int, processes: int = None):
+        """ Generate a whole map, chunk by chunk.
+
+            Args:
+                width(int): The width of the map in tiles.
+                height(int): The height of the map in tiles.
+                processes(int): The number of worker processes the chunks are
+                                shared out over, by default one per core. With 1
+                                the chunks are generated in this process.
+
+            Returns:
+                A CompiledMap of the map, which to_map() turns into a Map."""
+
+        chunks = [
+            (x, y, min(self.chunk_size, width - x), min(self.chunk_size, height - y))
+            for y in range(0, height, self.chunk_size)
+            for x in range(0, width, self.chunk_size)
+        ]
+
+        if processes == 1 or len(chunks) < 2:
+            generated = [self.generate_chunk(*chunk) for chunk in chunks]
+        else:
+            with Pool(processes) as pool:
+                generated = pool.starmap(self.generate_chunk, chunks)
+
+        tiles = numpy.zeros((SHEETS, height, width), dtype=TILE_ID)
+        for (x, y, chunk_width, chunk_height), chunk_tiles in zip(chunks, generated):
+            tiles[:, y : y + chunk_height, x : x + chunk_width] = chunk_tiles
+
+        logging.debug(
+            f"Generated a {width}x{height} map in {len(chunks)} chunks of"
+            f" {self.chunk_size}x{self.chunk_size}."
+        )
+
+        return CompiledMap(self.palette(), tiles)
@@ -0,0 +1,551 @@
+""" Hierarchical (HPA*) pathfinding, for paths across maps too big to search tile by
+    tile within a frame."""
+import logging
+import math
+from heapq import heappop, heappush
+
+from .map import Map
+from .pathfinding import DIAGONAL_COST, DIAGONAL_STEPS, STRAIGHT_STEPS
+
+# Entrances at least this long get a transition at each end rather than one in
+# the middle, so that paths along wide openings don't all bend through one tile.
+LONG_ENTRANCE = 6
+
+
+class Cluster:
+    """ A rectangle of the map, and the shortest paths between its entrances."""
+
+    def __init__(self, left, top, width, height):
+        self.left = left
+        self.top = top
+        self.width = width
+        self.height = height
+
+        # The tiles within this cluster which lead into a neighbouring cluster.
+        self.nodes = set()
+
+        # The nodes reachable from each node within the cluster and what it costs
+        # to reach them, and the parents of the search made from each node (which
+        # lead back to it from any other.) None until first needed, and again
+        # whenever a tile within the cluster changes.
+        self.edges = None
+        self.parents = None
+
+        # The walkable tiles next to each tile of the cluster. See
+        # HierarchicalPathfinder._cluster_neighbours.
+        self.neighbours = None
+
+    def contains(self, x, y):
+        return (
+            self.left <= x < self.left + self.width
+            and self.top <= y < self.top + self.height
+        )
+
+
+class HierarchicalPathfinder:
+    """ Finds paths across a map through a graph of the entrances between clusters.
+
+        The map is split into cluster_size x cluster_size clusters. Wherever two
+        neighbouring clusters can be walked between, a transition (a pair of tiles,
+        one either side of the border) is added to the graph, and the shortest
+        paths between the transitions of each cluster are worked out once and
+        remembered. A long path is then a search of that graph, plus a search of
+        only the clusters the start and goal are in.
+
+        Paths found this way are close to, but not always exactly, the shortest.
+        When a tile changes, only the clusters it's in (or borders) are rebuilt,
+        the next time a path is asked for."""
+
+    def __init__(self, game_map: Map, cluster_size: int = 16, diagonal: bool = False):
+        """ Args:
+                game_map(Map): The map to find paths on.
+                cluster_size(int): The width and height of each cluster in tiles.
+                diagonal(bool): If True, paths can move diagonally within clusters
+                                as long as they don't cut the corner of an
+                                impassable tile."""
+        self.game_map = game_map
+        self.cluster_size = cluster_size
+        self.diagonal = diagonal
+
+        self.passability = game_map.passability
+        self.width = game_map.width
+        self.height = game_map.height
+
+        self.clusters = {}
+        for top in range(0, self.height, cluster_size):
+            for left in range(0, self.width, cluster_size):
+                self.clusters[(left // cluster_size, top // cluster_size)] = Cluster(
+                    left,
+                    top,
+                    min(cluster_size, self.width - left),
+                    min(cluster_size, self.height - top),
+                )
+
+        # The transitions across each border, keyed by the pair of clusters either
+        # side of it, and the tiles each node can step across a border to.
+        self._borders = {}
+        self._transitions = {}
+
+        for cluster_x, cluster_y in self.clusters:
+            for border in self._cluster_borders(cluster_x, cluster_y):
+                if border not in self._borders:
+                    self._build_border(border)
+
+        self._dirty_clusters = set()
+        self._dirty_borders = set()
+
+        # Counters, to see how much work queries and map changes are causing.
+        self.clusters_rebuilt = 0
+        self.tiles_searched = 0
+
+        game_map.register_tile_listener(self._tile_changed)
+
+    def precompute(self):
+        """ Work out the paths within every cluster now, rather than as each is
+            first needed."""
+
+        self._rebuild_dirty()
+        for cluster in self.clusters.values():
+            if cluster.edges is None:
+                self._build_cluster(cluster)
+
+    def cluster_at(self, x, y):
+        return self.clusters.get((x // self.cluster_size, y // self.cluster_size))
+
+    def find_path(self, start, goal):
+        """ Return a list of x,y tuples from start to goal (both included), or None
+            if the goal can't be reached. As with Pathfinder, the start and goal are
+            always treated as passable."""
+
+        self._rebuild_dirty()
+
+        start_cluster = self.cluster_at(*start)
+        goal_cluster = self.cluster_at(*goal)
+        if start_cluster is None or goal_cluster is None:
+            return None
+
+        if start == goal:
+            return [start]
+
+        start_entries = self._entries(start, goal)
+
+        # Paths to somewhere close by don't need the graph, unless the only way
+        # there is further around than the clusters searched.
+        direct = [
+            (step + costs[goal], seed, parents)
+            for seed, step, costs, parents in start_entries
+            if goal in costs
+        ]
+        if direct:
+            _, seed, parents = min(direct)
+            return self._from_entry(start, seed, parents, goal)
+
+        goal_entries = self._entries(goal)
+
+        abstract_path, start_via, goal_via = self._search_graph(
+            start, goal, start_entries, goal_entries
+        )
+        if abstract_path is None:
+            return None
+
+        logging.debug(
+            f"Found a path from {start} to {goal} through "
+            f"{len(abstract_path) - 2} transitions."
+        )
+        return self._refine(abstract_path, start_via, goal_via)
+
+    def _entries(self, tile, target=None):
+        """ Search the cluster tile is in from it, along with the cluster of any
+            neighbour of tile just across a border.
+
+            As tile may not be passable (ie it's where a character is standing), it
+            can't be relied on to be one of the graph's nodes, so these searches are
+            how it's joined onto the graph for a single path.
+
+            Returns:
+                A list of (tile searched from, cost of stepping to it from tile,
+                costs, parents) for each search. See _search_cluster."""
+
+        cluster = self.cluster_at(*tile)
+        entries = [(tile, 0) + self._search_cluster(cluster, tile, target)]
+
+        x, y = tile
+        steps = [(step_x, step_y, 1) for step_x, step_y in STRAIGHT_STEPS]
+        if self.diagonal:
+            steps += [
+                (step_x, step_y, DIAGONAL_COST)
+                for step_x, step_y in DIAGONAL_STEPS
+                if self.passability.is_passable(x + step_x, y)
+                and self.passability.is_passable(x, y + step_y)
+            ]
+
+        for step_x, step_y, step in steps:
+            neighbour = (x + step_x, y + step_y)
+            neighbour_cluster = self.cluster_at(*neighbour)
+
+            if (
+                neighbour_cluster is not None
+                and neighbour_cluster is not cluster
+                and (self.passability.is_passable(*neighbour) or neighbour == target)
+            ):
+                entries.append(
+                    (neighbour, step)
+                    + self._search_cluster(neighbour_cluster, neighbour, target)
+                )
+
+        return entries
+
+    def _from_entry(self, tile, seed, parents, other):
+        """ Return the tiles from tile to other, through the search from seed."""
+
+        tiles = self._trace(parents, other)[::-1]
+        if seed != tile:
+            tiles.insert(0, tile)
+
+        return tiles
+
+    def _cluster_borders(self, cluster_x, cluster_y):
+        """ Return the borders of a cluster, each as a tuple of the cluster to its
+            left or above it, then the one to its right or below it."""
+
+        borders = []
+        for neighbour in (
+            (cluster_x - 1, cluster_y),
+            (cluster_x + 1, cluster_y),
+            (cluster_x, cluster_y - 1),
+            (cluster_x, cluster_y + 1),
+        ):
+            if neighbour in self.clusters:
+                borders.append(tuple(sorted(((cluster_x, cluster_y), neighbour))))
+
+        return borders
+
+    def _build_border(self, border):
+        """ Find the entrances across a border, replacing any found before."""
+
+        changed_tiles = set()
+        for first_tile, second_tile in self._borders.pop(border, ()):
+            self._transitions[first_tile].remove(second_tile)
+            self._transitions[second_tile].remove(first_tile)
+            changed_tiles.update((first_tile, second_tile))
+
+        first_cluster = self.clusters[border[0]]
+        second_cluster = self.clusters[border[1]]
+        is_passable = self.passability.is_passable
+
+        if border[0][1] == border[1][1]:
+            # Left and right of each other; the border runs down the column.
+            first_x = second_cluster.left - 1
+            pairs = [
+                ((first_x, y), (first_x + 1, y))
+                for y in range(
+                    first_cluster.top, first_cluster.top + first_cluster.height
+                )
+            ]
+        else:
+            first_y = second_cluster.top - 1
+            pairs = [
+                ((x, first_y), (x, first_y + 1))
+                for x in range(
+                    first_cluster.left, first_cluster.left + first_cluster.width
+                )
+            ]
+
+        transitions = []
+        entrance = []
+        for first_tile, second_tile in pairs + [(None, None)]:
+            if first_tile is not None and (
+                is_passable(*first_tile) and is_passable(*second_tile)
+            ):
+                entrance.append((first_tile, second_tile))
+                continue
+
+            if len(entrance) >= LONG_ENTRANCE:
+                transitions += [entrance[0], entrance[-1]]
+            elif entrance:
+                transitions.append(entrance[len(entrance) // 2])
+            entrance = []
+
+        self._borders[border] = transitions
+        for first_tile, second_tile in transitions:
+            self._transitions.setdefault(first_tile, []).append(second_tile)
+            self._transitions.setdefault(second_tile, []).append(first_tile)
+
+            changed_tiles.update((first_tile, second_tile))
+
+        # A tile can be a node of more than one border (ie in a cluster's corner),
+        # so it's only dropped from its cluster once it has no transitions left.
+        for tile in changed_tiles:
+            cluster = self.cluster_at(*tile)
+            if self._transitions.get(tile):
+                cluster.nodes.add(tile)
+            else:
+                self._transitions.pop(tile, None)
+                cluster.nodes.discard(tile)
+
+        for cluster in (first_cluster, second_cluster):
+            cluster.edges = None
+            cluster.parents = None
+
+    def _build_cluster(self, cluster):
+        """ Work out the shortest paths between every pair of a cluster's nodes."""
+
+        self.clusters_rebuilt += 1
+        cluster.edges = {node: [] for node in cluster.nodes}
+        cluster.parents = {}
+
+        for node in cluster.nodes:
+            costs, parents = self._search_cluster(cluster, node)
+            cluster.parents[node] = parents
+
+            for other in cluster.nodes:
+                if other != node and other in costs:
+                    cluster.edges[other].append((node, costs[other]))
+
+    def _tile_changed(self, sheet, x, y):
+        """ Mark the cluster (and any border) x,y is on to be rebuilt. Registered as
+            a tile listener of the map."""
+
+        if sheet not in (Map.FOREGROUND_SHEET_INDEX, Map.CHARACTER_SHEET_INDEX):
+            return
+
+        cluster_x = x // self.cluster_size
+        cluster_y = y // self.cluster_size
+        cluster_key = (cluster_x, cluster_y)
+        self._dirty_clusters.add(cluster_key)
+
+        cluster = self.clusters[cluster_key]
+        for border in self._cluster_borders(cluster_x, cluster_y):
+            other_x, other_y = border[0] if border[0] != cluster_key else border[1]
+
+            if (
+                (other_x < cluster_x and x == cluster.left)
+                or (other_x > cluster_x and x == cluster.left + cluster.width - 1)
+                or (other_y < cluster_y and y == cluster.top)
+                or (other_y > cluster_y and y == cluster.top + cluster.height - 1)
+            ):
+                self._dirty_borders.add(border)
+
+    def _rebuild_dirty(self):
+        for border in self._dirty_borders:
+            self._build_border(border)
+
+        for cluster_key in self._dirty_clusters:
+            cluster = self.clusters[cluster_key]
+            cluster.edges = None
+            cluster.parents = None
+            cluster.neighbours = None
+
+        self._dirty_borders.clear()
+        self._dirty_clusters.clear()
+
+    def _search_cluster(self, cluster, source, target=None):
+        """ Search outward from source without leaving the cluster. The source
+            and target (if given) are walkable even if they aren't passable.
+
+            Returns:
+                A dictionary of the cost to reach each tile reached, and one of the
+                tile each was reached from (towards source.)"""
+
+        left = cluster.left
+        top = cluster.top
+        width = cluster.width
+
+        if target is not None and cluster.contains(*target):
+            # Only the search from the start of a path has a target, so a one-off
+            # neighbour list with the target made walkable isn't worth keeping.
+            neighbours = self._cluster_neighbours(
+                cluster, (target[1] - top) * width + target[0] - left
+            )
+        else:
+            if cluster.neighbours is None:
+                cluster.neighbours = self._cluster_neighbours(cluster)
+            neighbours = cluster.neighbours
+
+        source_index = (source[1] - top) * width + source[0] - left
+        costs = {source_index: 0}
+        parents = {source_index: None}
+        open_heap = [(0, source_index)]
+
+        while open_heap:
+            cost, index = heappop(open_heap)
+            if cost > costs[index]:
+                continue
+
+            self.tiles_searched += 1
+
+            for next_index, step in neighbours[index]:
+                next_cost = cost + step
+                if next_cost < costs.get(next_index, math.inf):
+                    costs[next_index] = next_cost
+                    parents[next_index] = index
+                    heappush(open_heap, (next_cost, next_index))
+
+        tiles = {
+            index: (left + index % width, top + index // width) for index in costs
+        }
+        return (
+            {tiles[index]: cost for index, cost in costs.items()},
+            {
+                tiles[index]: None if parent is None else tiles[parent]
+                for index, parent in parents.items()
+            },
+        )
+
+    def _cluster_neighbours(self, cluster, walkable_index=None):
+        """ Return a list of the walkable tiles next to each tile of a cluster (and
+            the cost of stepping to them), indexed by the tile's index within the
+            cluster. The tile at walkable_index is walkable whether or not it's
+            passable."""
+
+        cells = self.passability.cells
+        left = cluster.left
+        top = cluster.top
+        width = cluster.width
+        height = cluster.height
+
+        walkable = bytearray(width * height)
+        for row in range(height):
+            row_start = (top + row) * self.width + left
+            walkable[row * width : (row + 1) * width] = cells[
+                row_start : row_start + width
+            ]
+
+        if walkable_index is not None:
+            walkable[walkable_index] = 1
+
+        def is_walkable(x, y):
+            return 0 <= x < width and 0 <= y < height and walkable[y * width + x]
+
+        neighbours = []
+        for index in range(width * height):
+            x = index % width
+            y = index // width
+            tile_neighbours = [
+                ((y + step_y) * width + x + step_x, 1)
+                for step_x, step_y in STRAIGHT_STEPS
+                if is_walkable(x + step_x, y + step_y)
+            ]
+
+            if self.diagonal:
+                tile_neighbours += [
+                    ((y + step_y) * width + x + step_x, DIAGONAL_COST)
+                    for step_x, step_y in DIAGONAL_STEPS
+                    if is_walkable(x + step_x, y + step_y)
+                    and is_walkable(x + step_x, y)
+                    and is_walkable(x, y + step_y)
+                ]
+
+            neighbours.append(tile_neighbours)
+
+        return neighbours
+
+    def _heuristic(self, node, goal):
+        distance_x = abs(node[0] - goal[0])
+        distance_y = abs(node[1] - goal[1])
+
+        if self.diagonal:
+            return max(distance_x, distance_y) + (DIAGONAL_COST - 1) * min(
+                distance_x, distance_y
+            )
+
+        return distance_x + distance_y
+
+    def _search_graph(self, start, goal, start_entries, goal_entries):
+        """ A* over the transitions between clusters, from start to goal.
+
+            Returns:
+                A tuple of the list of nodes the path passes through (start and goal
+                included, or None if there isn't a path), and the entries which
+                joined the start and goal to each node (see _entries.)"""
+
+        start_edges, start_via = self._entry_edges(start_entries)
+        goal_edges, goal_via = self._entry_edges(goal_entries)
+
+        parents = {start: None}
+        best_costs = {start: 0}
+        open_heap = [(self._heuristic(start, goal), 0, start)]
+        closed = set()
+
+        while open_heap:
+            _, cost, node = heappop(open_heap)
+
+            if node == goal:
+                return self._trace(parents, node)[::-1], start_via, goal_via
+
+            if node in closed:
+                continue
+            closed.add(node)
+
+            if node == start:
+                edges = list(start_edges.items())
+            else:
+                cluster = self.cluster_at(*node)
+                if cluster.edges is None:
+                    self._build_cluster(cluster)
+
+                edges = [(across, 1) for across in self._transitions.get(node, ())]
+                edges += cluster.edges[node]
+
+            # The start and goal are only ever joined onto the graph through their
+            # entries, even when they also happen to be nodes.
+            edges = [edge for edge in edges if edge[0] not in (start, goal)]
+            if node in goal_edges:
+                edges.append((goal, goal_edges[node]))
+
+            for next_node, step in edges:
+                next_cost = cost + step
+                if next_cost < best_costs.get(next_node, math.inf):
+                    best_costs[next_node] = next_cost
+                    parents[next_node] = node
+                    estimate = next_cost + self._heuristic(next_node, goal)
+                    heappush(open_heap, (estimate, next_cost, next_node))
+
+        return None, start_via, goal_via
+
+    def _entry_edges(self, entries):
+        """ Return the cost from the tile entries were searched for to each node
+            they reached, and the entry reaching each node most cheaply."""
+
+        edges = {}
+        via = {}
+
+        for seed, step, costs, parents in entries:
+            for node in self.cluster_at(*seed).nodes:
+                if node in costs and step + costs[node] < edges.get(node, math.inf):
+                    edges[node] = step + costs[node]
+                    via[node] = (seed, parents)
+
+        return edges, via
+
+    def _refine(self, abstract_path, start_via, goal_via):
+        """ Turn a path through the graph back into every tile along it."""
+
+        start = abstract_path[0]
+        goal = abstract_path[-1]
+        path = [start]
+
+        for node, next_node in zip(abstract_path, abstract_path[1:]):
+            if next_node == goal:
+                path += self._from_entry(goal, *goal_via[node], node)[-2::-1]
+            elif node == start:
+                path += self._from_entry(start, *start_via[next_node], next_node)[1:]
+            elif self.cluster_at(*node).contains(*next_node):
+                parents = self.cluster_at(*node).parents[next_node]
+                path += self._trace(parents, node)[1:]
+            else:
+                # Stepping across a border.
+                path.append(next_node)
+
+        return path
+
+    @staticmethod
+    def _trace(parents, tile):
+        """ Return the tiles from tile back to the source of a search."""
+
+        path = []
+        while tile is not None:
+            path.append(tile)
+            tile = parents[tile]
+
+        return path
@@ -0,0 +1,181 @@
+""" Recording the input the engine reads each tick, and replaying it, so that a
+    session can be played back exactly (ie under a profiler) as often as needed."""
+import gzip
+import logging
+import struct
+
+from .startup import lazy_import
+
+pygame = lazy_import("pygame")
+
+INPUT_LOG_MAGIC = b"TGIN"
+FORMAT_VERSION = 1
+
+HEADER = struct.Struct("<4sH")
+
+# The number of keys held, the number of events, and the mouse position (or
+# -1,-1 when it wasn't read) of each tick.
+TICK = struct.Struct("<HHhh")
+KEY = struct.Struct("<H")
+
+# An event's type, which of its attributes were set (see EVENT_ATTRIBUTES), and
+# its position, button, key and modifiers.
+EVENT = struct.Struct("<IBhhBiH")
+EVENT_ATTRIBUTES = ("pos", "button", "key", "mod")
+
+
+class InputRecorder:
+    """ Writes the keys held, events and mouse position of each tick to a
+        compressed binary log.
+
+        Only the event attributes the engine uses (pos, button, key and mod) are
+        kept, and events whose type isn't a pygame event type are dropped."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.ticks = 0
+
+        self._file = gzip.open(path, "wb")
+        self._file.write(HEADER.pack(INPUT_LOG_MAGIC, FORMAT_VERSION))
+
+        self._pressed_keys = []
+
+    def close(self):
+        self._file.close()
+
+    def record_keystrokes(self, pressed_keys):
+        """ Record the keys held this tick, as the characters the engine reads
+            them as."""
+        self._pressed_keys = [ord(key) for key in pressed_keys]
+
+    def record_events(self, events, mouse_position=None):
+        """ Record this tick's events and the mouse position, finishing the tick."""
+
+        encoded_events = []
+        for event in events:
+            if not isinstance(event.type, int):
+                logging.debug(f"Not recording event of type {event.type}.")
+                continue
+
+            flags = 0
+            for bit, attribute in enumerate(EVENT_ATTRIBUTES):
+                if hasattr(event, attribute):
+                    flags |= 1 << bit
+
+            x, y = getattr(event, "pos", (0, 0))
+            encoded_events.append(
+                EVENT.pack(
+                    event.type,
+                    flags,
+                    x,
+                    y,
+                    getattr(event, "button", 0),
+                    getattr(event, "key", 0),
+                    getattr(event, "mod", 0),
+                )
+            )
+
+        mouse_x, mouse_y = mouse_position if mouse_position is not None else (-1, -1)
+        self._file.write(
+            TICK.pack(len(self._pressed_keys), len(encoded_events), mouse_x, mouse_y)
+        )
+        self._file.write(b"".join(KEY.pack(key) for key in self._pressed_keys))
+        self._file.write(b"".join(encoded_events))
+
+        self._pressed_keys = []
+        self.ticks += 1
+
+
+class InputReplay:
+    """ Reads an InputRecorder's log back a tick at a time, in the same order the
+        engine read the input as it was recorded.
+
+        Once the log runs out, a QUIT event is replayed so the engine stops."""
+
+    def __init__(self, path: str, real_time: bool = False):
+        """ Args:
+                path(str): The log to replay.
+                real_time(bool): If True, replay at the engine's normal frame rate,
+                                 otherwise replay every tick as fast as it can be
+                                 run."""
+        self.path = path
+        self.real_time = real_time
+        self.ticks = 0
+        self.finished = False
+
+        self._file = gzip.open(path, "rb")
+        try:
+            magic, version = HEADER.unpack(self._read(HEADER.size))
+        except (OSError, self.InvalidInputLogException):
+            magic, version = None, None
+
+        if magic != INPUT_LOG_MAGIC or version != FORMAT_VERSION:
+            self._file.close()
+            raise self.InvalidInputLogException(
+                f"{path} isn't a version {FORMAT_VERSION} input log."
+            )
+
+        self._events = []
+        self.mouse_position = None
+
+    def close(self):
+        self._file.close()
+
+    def next_keystrokes(self):
+        """ Start the next tick, returning the keys held in it as characters."""
+
+        data = self._file.read(TICK.size)
+        if len(data) < TICK.size:
+            if not self.finished:
+                logging.info(f"Finished replaying {self.ticks} ticks of {self.path}.")
+
+            self.finished = True
+            self._events = [pygame.event.Event(pygame.QUIT)]
+            return []
+
+        key_count, event_count, mouse_x, mouse_y = TICK.unpack(data)
+        self.mouse_position = (mouse_x, mouse_y) if mouse_x >= 0 else None
+
+        keys_data = self._read(KEY.size * key_count)
+        pressed_keys = [chr(key) for (key,) in KEY.iter_unpack(keys_data)]
+
+        events_data = self._read(EVENT.size * event_count)
+        self._events = [
+            self._decode_event(*fields) for fields in EVENT.iter_unpack(events_data)
+        ]
+
+        self.ticks += 1
+        return pressed_keys
+
+    def next_events(self):
+        """ Return the events of the tick started by next_keystrokes()."""
+
+        events = self._events
+        self._events = []
+        return events
+
+    @staticmethod
+    def _decode_event(event_type, flags, x, y, button, key, mod):
+        values = {"pos": (x, y), "button": button, "key": key, "mod": mod}
+        return pygame.event.Event(
+            event_type,
+            {
+                attribute: values[attribute]
+                for bit, attribute in enumerate(EVENT_ATTRIBUTES)
+                if flags & (1 << bit)
+            },
+        )
+
+    def _read(self, size):
+        data = self._file.read(size)
+        if len(data) < size:
+            raise self.InvalidInputLogException(
+                f"{self.path} ends part way through a tick."
+            )
+
+        return data
+
+    class InvalidInputLogException(Exception):
+        """ Raised when a file can't be read as an input log."""
+
+        pass
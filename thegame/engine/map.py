@@ -1,5 +1,22 @@
+import contextlib
+import copy
+from collections import namedtuple
+
+import numpy
+
 from thegame.engine.game_objects import GameObject, PlayerControlledObject
 
+from .map_journal import MapJournal
+from .passability import PassabilityGrid
+
+# A rectangle of tiles on the given sheets (a frozenset of sheet indexes), which
+# region listeners are told has changed.
+TileRegion = namedtuple("TileRegion", ["sheets", "x", "y", "width", "height"])
+
+# The most unchanged tiles between two changed tiles on a row which are still
+# told to region listeners as one region. See Map._changed_regions().
+REGION_GAP = 8
+
 
 class Map:
     """ An object representing a location in the game. A map is made up of 4 "sheets".
@@ -38,7 +55,18 @@ class Map:
         path_sheet,
         background_sheet,
         validate=True,
+        passability_cells: bytes = None,
     ):
+        """ Args:
+                foreground_sheet(list): The rows of the foreground sheet.
+                character_sheet(list): The rows of the character sheet.
+                path_sheet(list): The rows of the path sheet.
+                background_sheet(list): The rows of the background sheet.
+                validate(bool): Whether to check that every tile is a GameObject
+                                or None.
+                passability_cells(bytes): The map's PassabilityGrid cells, if
+                                          they are already known (ie from a
+                                          compiled map.)"""
 
         self.foreground_sheet = foreground_sheet
         self.path_sheet = path_sheet
@@ -50,6 +78,59 @@ class Map:
 
         self._warp_zones = []
 
+        # Callables that are told whenever a tile on this map changes, and ones
+        # told once about the whole region changed by each batch.
+        self._tile_listeners = []
+        self._region_listeners = []
+
+        # The (sheet, x, y, old, new) of the changes made in the open batch, or
+        # None if there isn't one. See batch().
+        self._batch = None
+
+        # Every change to the map's tiles, for subscribers to read when they're
+        # ready to. See MapJournal.
+        self.journal = MapJournal()
+
+        # A bytearray for each sheet of whether each row may be shared with a
+        # fork of the map (or the map it was forked from), so must be copied
+        # before it's written to, or None if no row of the sheet is. See fork().
+        self._shared_rows = [None] * 4
+
+        # Built the first time passability is needed. See passability.
+        self._passability = None
+        self._passability_cells = passability_cells
+
+    @property
+    def width(self):
+        """ The number of tiles in each row of the map."""
+        return len(self.foreground_sheet[0]) if self.foreground_sheet else 0
+
+    @property
+    def height(self):
+        """ The number of rows of tiles in the map."""
+        return len(self.foreground_sheet)
+
+    @property
+    def version(self):
+        """ Incremented every time a tile changes, so anything derived from the
+            map's tiles can tell whether it's out of date."""
+        return self.journal.version
+
+    @property
+    def passability(self):
+        """ The PassabilityGrid of this map, built the first time it's needed and
+            kept up to date as tiles are swapped."""
+        if self._passability is None:
+            self._passability = PassabilityGrid(self, self._passability_cells)
+            self._passability_cells = None
+
+        return self._passability
+
+    def is_passable(self, x, y):
+        """ Return True if the tile at x,y is on the map, and has nothing on
+            its foreground or character sheets."""
+        return self.passability.is_passable(x, y)
+
     @property
     def tile_sheets(self):
         """ tile sheets is a tuple that the engine will
@@ -71,6 +152,11 @@ class Map:
             self.background_sheet,
         )
 
+    @property
+    def warp_zones(self):
+        """ The warp zones registered on this map. See register_warp_zone."""
+        return tuple(self._warp_zones)
+
     @property
     def player_controlled_objects(self):
 
@@ -107,8 +193,456 @@ class Map:
         first_tile = self.tile_sheets[sheet][tile_one_y][tile_one_x]
         second_tile = self.tile_sheets[sheet][tile_two_y][tile_two_x]
 
-        self.tile_sheets[sheet][tile_one_y][tile_one_x] = second_tile
-        self.tile_sheets[sheet][tile_two_y][tile_two_x] = first_tile
+        self._writable_row(sheet, tile_one_y)[tile_one_x] = second_tile
+        self._writable_row(sheet, tile_two_y)[tile_two_x] = first_tile
+
+        self._tile_changed(sheet, tile_one_x, tile_one_y, first_tile, second_tile)
+        self._tile_changed(sheet, tile_two_x, tile_two_y, second_tile, first_tile)
+
+    def set_tile(self, tile: tuple, sheet: int, game_object):
+        """ Put game_object (or None) on a tile, in place of whatever was there.
+
+            Args:
+                tile(tuple): x,y of the tile.
+                sheet(int): The sheet number the tile is on.
+                game_object(GameObject): The object to put there."""
+
+        if not 0 <= sheet <= 3:
+            raise ValueError(
+                f"Attempted to set a tile on sheet level {sheet}, which is not a valid"
+                " sheet. Please set tiles on sheet [0-3]."
+            )
+
+        old_object = self.tile_sheets[sheet][tile[1]][tile[0]]
+        self._writable_row(sheet, tile[1])[tile[0]] = game_object
+
+        self._tile_changed(sheet, tile[0], tile[1], old_object, game_object)
+
+    def move_tiles(self, sheet: int, moves):
+        """ Move the objects on many tiles of a sheet at once, as one batch (ie
+            every character moving in a tick.) Each tile moved from is left empty,
+            unless something else moves onto it, and whatever was on a tile moved
+            onto is replaced.
+
+            Args:
+                sheet(int): The sheet number to move objects on.
+                moves: An iterable of ((x, y), (to x, to y)) tuples."""
+
+        self._check_sheet(sheet, "move")
+        rows = self.tile_sheets[sheet]
+        moves = [(x, y, to_x, to_y, rows[y][x]) for (x, y), (to_x, to_y) in moves]
+
+        changes = []
+        for x, y, _, _, game_object in moves:
+            if game_object is not None:
+                self._writable_row(sheet, y)[x] = None
+                changes.append((sheet, x, y, game_object, None))
+
+        for _, _, x, y, game_object in moves:
+            row = self._writable_row(sheet, y)
+            old_object = row[x]
+            if old_object is not game_object:
+                row[x] = game_object
+                changes.append((sheet, x, y, old_object, game_object))
+
+        if self._batch is not None:
+            self._batch.extend(changes)
+        else:
+            self._commit(changes)
+
+    def fork(self, copied_sheets: tuple = (CHARACTER_SHEET_INDEX,)):
+        """ Make an instance of the map (ie a dungeon for each party) which starts
+            out the same, but changes separately.
+
+            The instance shares the map's rows rather than copying them, and
+            either map copies a shared row the first time it changes a tile on it.
+            So an instance costs a list of rows per sheet, plus the rows it
+            changes, however many instances there are. Rows are the unit copied,
+            rather than square chunks, so that tiles are still read from plain
+            lists at full speed.
+
+            Anything writing tiles must do so through the map (ie set_tile(),
+            fill() or batch()), as writing to a sheet's rows directly would change
+            every instance sharing them.
+
+            Args:
+                copied_sheets(tuple): The sheet numbers whose objects the instance
+                                      gets copies of (with copy.copy) rather than
+                                      sharing, for objects which change, like
+                                      characters. Only rows with an object on them
+                                      are copied.
+
+            Returns:
+                The new Map, of the same class, with none of this map's listeners
+                or journal."""
+
+        fork = copy.copy(self)
+        fork.foreground_sheet = list(self.foreground_sheet)
+        fork.character_sheet = list(self.character_sheet)
+        fork.path_sheet = list(self.path_sheet)
+        fork.background_sheet = list(self.background_sheet)
+
+        fork._shared_rows = [None] * 4
+        for sheet, rows in enumerate(fork.tile_sheets):
+            self._shared_rows[sheet] = bytearray(b"\x01" * self.height)
+            fork._shared_rows[sheet] = bytearray(b"\x01" * self.height)
+
+            if sheet in copied_sheets:
+                for y, row in enumerate(rows):
+                    if row.count(None) != len(row):
+                        rows[y] = [copy.copy(tile) for tile in row]
+                        fork._shared_rows[sheet][y] = 0
+
+        fork._warp_zones = list(self._warp_zones)
+        fork._tile_listeners = []
+        fork._region_listeners = []
+        fork._batch = None
+        fork.journal = MapJournal()
+
+        # The fork's copied objects are in the same places, so its passability
+        # is the same.
+        fork._passability = None
+        if self._passability is not None:
+            fork._passability_cells = bytes(self._passability.cells)
+
+        return fork
+
+    def fill(self, sheet: int, x: int, y: int, width: int, height: int, tile):
+        """ Put tile on every tile of a rectangle, in one batch.
+
+            Args:
+                sheet(int): The sheet number to fill.
+                x(int): The x of the rectangle's top left tile.
+                y(int): The y of the rectangle's top left tile.
+                width(int): The width of the rectangle. The part of it off the map
+                            is ignored.
+                height(int): The height of the rectangle.
+                tile: The GameObject (or None) to put on every tile, or a callable
+                      taking (x, y) and returning the object to put on each tile,
+                      so each tile can have its own object (or a pattern.)"""
+
+        self._check_sheet(sheet, "fill")
+        left, top, right, bottom = self._clip(x, y, width, height)
+
+        with self.batch():
+            for row_y in range(top, bottom):
+                if callable(tile):
+                    row = [tile(row_x, row_y) for row_x in range(left, right)]
+                else:
+                    row = [tile] * (right - left)
+                self._write_row(sheet, left, row_y, row)
+
+    def blit(
+        self,
+        source: "Map",
+        x: int,
+        y: int,
+        source_area: tuple = None,
+        sheets: tuple = None,
+    ):
+        """ Copy a region of source (which may be this map) onto this map, in one
+            batch. Each tile is copied with copy.copy, so the two regions don't
+            share objects.
+
+            Args:
+                source(Map): The map to copy from.
+                x(int): The x on this map to copy the region's top left tile to.
+                y(int): The y on this map to copy the region's top left tile to.
+                source_area(tuple): The x, y, width and height of the region of
+                                    source to copy, by default all of it.
+                sheets(tuple): The sheet numbers to copy, by default every sheet."""
+
+        if source_area is None:
+            source_area = (0, 0, source.width, source.height)
+        if sheets is None:
+            sheets = range(len(self.tile_sheets))
+        for sheet in sheets:
+            self._check_sheet(sheet, "blit")
+
+        source_left, source_top, source_right, source_bottom = source._clip(
+            *source_area
+        )
+        left, top, right, bottom = self._clip(
+            x, y, source_right - source_left, source_bottom - source_top
+        )
+        source_left += left - x
+        source_top += top - y
+
+        # The region is read before any of it is written, in case the source and
+        # destination overlap.
+        regions = {
+            sheet: [
+                [
+                    copy.copy(tile)
+                    for tile in source.tile_sheets[sheet][source_top + row][
+                        source_left : source_left + right - left
+                    ]
+                ]
+                for row in range(bottom - top)
+            ]
+            for sheet in sheets
+        }
+
+        with self.batch():
+            for sheet, rows in regions.items():
+                for row, tiles in enumerate(rows):
+                    self._write_row(sheet, left, top + row, tiles)
+
+    def stamp(self, sheet: int, x: int, y: int, pattern):
+        """ Put a copy of each tile of pattern onto the map, in one batch. Tiles
+            that are None in pattern leave the map's tile as it is.
+
+            Args:
+                sheet(int): The sheet number to stamp.
+                x(int): The x on the map of the pattern's top left tile.
+                y(int): The y on the map of the pattern's top left tile.
+                pattern(list): The rows of the pattern's tiles."""
+
+        self._check_sheet(sheet, "stamp")
+
+        with self.batch():
+            for row_y, pattern_row in enumerate(pattern, start=y):
+                if not 0 <= row_y < self.height:
+                    continue
+
+                for row_x, tile in enumerate(pattern_row, start=x):
+                    if tile is not None and 0 <= row_x < self.width:
+                        self._write_row(sheet, row_x, row_y, [copy.copy(tile)])
+
+    def set_tiles(self, sheet: int, x: int, y: int, rows):
+        """ Put rows of objects onto the map as they are (rather than copies, as
+            stamp() does), in one batch. Unlike stamp(), None clears a tile.
+
+            Args:
+                sheet(int): The sheet number to set tiles on.
+                x(int): The x on the map of the rows' first tile.
+                y(int): The y on the map of the first row.
+                rows(list): The rows of GameObjects (or None) to put on the map."""
+
+        self._check_sheet(sheet, "set")
+        width = max((len(row) for row in rows), default=0)
+        left, top, right, bottom = self._clip(x, y, width, len(rows))
+
+        with self.batch():
+            for row_y in range(top, bottom):
+                tiles = rows[row_y - y][left - x : right - x]
+                self._write_row(sheet, left, row_y, list(tiles))
+
+    @contextlib.contextmanager
+    def batch(self):
+        """ Group the changes made inside a with block into one transaction.
+
+            Listeners aren't told about the changes until the block ends, then each
+            tile listener is told once about each tile changed, and each region
+            listener once about each region of the changes. If the block raises,
+            its changes are undone and nothing is told about them. Batches can be
+            nested, in which case the outermost batch tells the listeners."""
+
+        outermost = self._batch is None
+        if outermost:
+            self._batch = []
+        start = len(self._batch)
+
+        try:
+            yield self
+        except BaseException:
+            for sheet, x, y, old_object, _ in reversed(self._batch[start:]):
+                self._writable_row(sheet, y)[x] = old_object
+            del self._batch[start:]
+            if outermost:
+                self._batch = None
+            raise
+
+        if outermost:
+            changes = self._batch
+            self._batch = None
+            self._commit(changes)
+
+    def register_tile_listener(self, listener):
+        """ Register a callable to be told about changes to this map's tiles as
+            they happen. To catch up on the changes later instead, subscribe to
+            the map's journal.
+
+            Args:
+                listener: A callable taking (sheet, x, y), called after the tile
+                          at x,y on the given sheet has been changed."""
+        self._tile_listeners.append(listener)
+
+    def deregister_tile_listener(self, listener):
+        if listener in self._tile_listeners:
+            self._tile_listeners.remove(listener)
+
+    def register_region_listener(self, listener):
+        """ Register a callable to be told about changes to this map's tiles a
+            region at a time, for things which can update a region at once (ie a
+            renderer's cache.)
+
+            Args:
+                listener: A callable taking a TileRegion, called after each change
+                          outside of a batch (with the one tile changed), and
+                          after each batch once for each region of the tiles
+                          changed (see _changed_regions().)"""
+        self._region_listeners.append(listener)
+
+    def deregister_region_listener(self, listener):
+        if listener in self._region_listeners:
+            self._region_listeners.remove(listener)
+
+    def _tile_changed(self, sheet, x, y, old_object, new_object):
+        if self._batch is not None:
+            self._batch.append((sheet, x, y, old_object, new_object))
+        else:
+            self._commit([(sheet, x, y, old_object, new_object)])
+
+    def _commit(self, changes):
+        if not changes:
+            return
+
+        self.journal.record_all(changes)
+
+        # Cells given for the passability grid are out of date once a tile
+        # changes before the grid is built.
+        self._passability_cells = None
+
+        # Region listeners are told first, as they include the map's own caches
+        # (ie its passability), which tile listeners may read.
+        tiles = dict.fromkeys((sheet, x, y) for sheet, x, y, _, _ in changes)
+        if self._region_listeners:
+            regions = self._changed_regions(tiles)
+            for listener in self._region_listeners:
+                for region in regions:
+                    listener(region)
+
+        for listener in self._tile_listeners:
+            for tile in tiles:
+                listener(*tile)
+
+    @staticmethod
+    def _changed_regions(tiles):
+        """ Returns:
+                A list of TileRegions covering tiles (a collection of distinct
+                (sheet, x, y)), top to bottom: one for each run of tiles changed
+                on a row (no more than REGION_GAP apart), grown down over the
+                rows below with the same run. A batch of scattered changes is
+                then a few small regions, rather than the rectangle around all of
+                them."""
+
+        # A batch filling a whole rectangle (ie fill() or blit()) is that
+        # rectangle.
+        sheets, xs, ys = zip(*tiles)
+        sheets = frozenset(sheets)
+        left = min(xs)
+        top = min(ys)
+        width = max(xs) - left + 1
+        height = max(ys) - top + 1
+        if len(tiles) == width * height * len(sheets):
+            return [TileRegion(sheets, left, top, width, height)]
+
+        sheets, xs, ys = numpy.array(list(tiles), dtype=numpy.int64).T
+        order = numpy.lexsort((xs, ys))
+        sheets, xs, ys = sheets[order], xs[order], ys[order]
+
+        # A run carries on over gaps of up to REGION_GAP unchanged tiles, as
+        # listeners look over a few more tiles faster than they take another
+        # region.
+        starts = numpy.flatnonzero(
+            numpy.concatenate(
+                (
+                    [True],
+                    (ys[1:] != ys[:-1]) | (xs[1:] - xs[:-1] > REGION_GAP + 1),
+                )
+            )
+        )
+        ends = numpy.append(starts[1:], len(xs)) - 1
+        masks = numpy.bitwise_or.reduceat(1 << sheets, starts)
+
+        regions = []
+
+        def finish(runs):
+            regions.extend(
+                TileRegion(sheets, x, top, width, height)
+                for (x, width, sheets), (top, height) in runs.items()
+            )
+
+        # The runs of the row above and of the row being read, by (x, width,
+        # sheets), as [top, height].
+        above = {}
+        row = {}
+        row_y = None
+        sheet_sets = {}
+        for y, left, right, mask in zip(
+            ys[starts].tolist(), xs[starts].tolist(), xs[ends].tolist(), masks.tolist()
+        ):
+            if y != row_y:
+                finish(above)
+                above = row
+                if row_y != y - 1:
+                    finish(above)
+                    above = {}
+                row = {}
+                row_y = y
+
+            sheets = sheet_sets.get(mask)
+            if sheets is None:
+                sheets = frozenset(
+                    sheet for sheet in range(mask.bit_length()) if mask >> sheet & 1
+                )
+                sheet_sets[mask] = sheets
+
+            key = (left, right - left + 1, sheets)
+            run = above.pop(key, None) or [y, 0]
+            run[1] += 1
+            row[key] = run
+
+        finish(above)
+        finish(row)
+        regions.sort(key=lambda region: (region.y, region.x))
+
+        return regions
+
+    def _write_row(self, sheet, x, y, tiles):
+        """ Put tiles on the tiles of row y from x onward, as one change per tile
+            which actually changed."""
+
+        row = self._writable_row(sheet, y)
+        old_tiles = row[x : x + len(tiles)]
+        row[x : x + len(tiles)] = tiles
+
+        for row_x, (old_object, new_object) in enumerate(zip(old_tiles, tiles), x):
+            if old_object is not new_object:
+                self._tile_changed(sheet, row_x, y, old_object, new_object)
+
+    def _writable_row(self, sheet, y):
+        """ Returns:
+                Row y of sheet, copied first if it may be shared with a fork."""
+
+        rows = self.tile_sheets[sheet]
+        shared = self._shared_rows[sheet]
+        if shared is not None and shared[y]:
+            rows[y] = list(rows[y])
+            shared[y] = 0
+
+        return rows[y]
+
+    def _clip(self, x, y, width, height):
+        """ Returns:
+                The left, top, right and bottom (exclusive) of the part of the
+                rectangle on the map."""
+        left = min(max(x, 0), self.width)
+        top = min(max(y, 0), self.height)
+        return (
+            left,
+            top,
+            max(min(x + width, self.width), left),
+            max(min(y + height, self.height), top),
+        )
+
+    def _check_sheet(self, sheet, action):
+        if not 0 <= sheet <= 3:
+            raise ValueError(
+                f"Attempted to {action} tiles on sheet level {sheet}, which is not a"
+                f" valid sheet. Please {action} on sheet [0-3]."
+            )
 
     def _validate(self):
         """ Validate that each sheet is valid, if its not, raise an appropriate exception. """
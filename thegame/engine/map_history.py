@@ -0,0 +1,230 @@
+""" Undo and redo of the changes made to a map, ie by a level editor.
+
+    History is kept a chunk at a time: each entry holds the chunks its edit
+    changed, as they were before and after it, as tuples of rows. Chunks are never
+    changed once made, so an entry's after chunk is the next entry's before chunk
+    whenever the same chunk is edited again, and the two share it. An entry only
+    costs the memory of the chunks it changed, whatever the size of the map."""
+import contextlib
+import logging
+import sys
+from collections import namedtuple
+
+from .map_journal import MapJournal
+
+# An edit which can be undone: its label, and the (before, after) chunks it
+# changed, keyed by (sheet, chunk x, chunk y).
+HistoryEntry = namedtuple("HistoryEntry", ["label", "chunks"])
+
+
+class MapHistory:
+    """ The undo and redo history of a map's edits.
+
+        Changes to the map (made by anything) are gathered from its journal, and
+        become an entry when commit() is called, or when an edit() block ends. The
+        history's memory is capped at max_memory, beyond which the oldest entries
+        are forgotten. Only the chunk copies are counted, as the objects in them
+        are shared with the map."""
+
+    def __init__(self, game_map, chunk_size: int = 16, max_memory: int = 1 << 26):
+        """ Args:
+                game_map(Map): The map to keep the history of.
+                chunk_size(int): The width and height, in tiles, of each chunk.
+                max_memory(int): The most bytes of chunk copies kept."""
+        self.game_map = game_map
+        self.chunk_size = chunk_size
+        self.max_memory = max_memory
+
+        self.undo_entries = []
+        self.redo_entries = []
+
+        # The bytes of the chunks kept, with each chunk held by several entries
+        # counted once.
+        self.memory = 0
+
+        # The chunk, number of holders and size of each chunk kept, by id.
+        self._chunk_references = {}
+
+        # The latest chunk kept for each key, as it is on the map now, for the next
+        # entry to share as its before chunk.
+        self._latest = {}
+
+        self._changes = game_map.journal.subscribe()
+
+    @property
+    def can_undo(self):
+        return bool(self.undo_entries) or self._changes.pending > 0
+
+    @property
+    def can_redo(self):
+        return bool(self.redo_entries)
+
+    @contextlib.contextmanager
+    def edit(self, label: str = None):
+        """ Make the changes in a with block one batch (see Map.batch()), and one
+            entry."""
+
+        with self.game_map.batch():
+            yield self
+        self.commit(label)
+
+    def commit(self, label: str = None):
+        """ Make the changes made since the last commit an entry, which can be
+            undone, and forget anything which could be redone.
+
+            Args:
+                label(str): A description of the edit, ie for an editor's menu.
+
+            Returns:
+                True if there were changes to make an entry of."""
+
+        try:
+            changes = self._changes.read()
+        except MapJournal.ChangesDiscardedException:
+            logging.warning(
+                "The map changed too much to undo since the last commit, so its"
+                " history has been cleared."
+            )
+            self.clear()
+            return False
+
+        changes_by_chunk = {}
+        for change in changes:
+            key = (
+                change.sheet,
+                change.x // self.chunk_size,
+                change.y // self.chunk_size,
+            )
+            changes_by_chunk.setdefault(key, []).append(change)
+
+        chunks = {}
+        for key, chunk_changes in changes_by_chunk.items():
+            after = self._read_chunk(key)
+            before = self._latest.get(key)
+            if before is None:
+                before = self._revert(key, after, chunk_changes)
+
+            if before != after:
+                chunks[key] = (before, after)
+
+        if not chunks:
+            return False
+
+        for entry in self.redo_entries:
+            self._release(entry)
+        self.redo_entries.clear()
+
+        entry = HistoryEntry(label, chunks)
+        self._hold(entry)
+        for key, (_, after) in chunks.items():
+            self._latest[key] = after
+        self.undo_entries.append(entry)
+
+        while self.memory > self.max_memory and self.undo_entries:
+            self._release(self.undo_entries.pop(0))
+
+        return True
+
+    def undo(self):
+        """ Undo the latest entry, committing any changes made since the last
+            commit first, so they're what is undone.
+
+            Returns:
+                The entry undone, or None if there was nothing to undo."""
+
+        self.commit()
+        if not self.undo_entries:
+            return None
+
+        entry = self.undo_entries.pop()
+        self._apply(entry, before=True)
+        self.redo_entries.append(entry)
+        return entry
+
+    def redo(self):
+        """ Redo the latest entry undone, unless anything has been committed since.
+
+            Returns:
+                The entry redone, or None if there was nothing to redo."""
+
+        self.commit()
+        if not self.redo_entries:
+            return None
+
+        entry = self.redo_entries.pop()
+        self._apply(entry, before=False)
+        self.undo_entries.append(entry)
+        return entry
+
+    def clear(self):
+        """ Forget every entry."""
+
+        for entry in self.undo_entries + self.redo_entries:
+            self._release(entry)
+        self.undo_entries.clear()
+        self.redo_entries.clear()
+        self._changes.skip()
+
+    def close(self):
+        """ Forget every entry, and stop following the map's changes."""
+
+        self.clear()
+        self._changes.close()
+
+    def _apply(self, entry, before):
+        """ Put the before (or after) chunks of entry back on the map."""
+
+        with self.game_map.batch():
+            for (sheet, chunk_x, chunk_y), chunks in entry.chunks.items():
+                chunk = chunks[0] if before else chunks[1]
+                self.game_map.set_tiles(
+                    sheet, chunk_x * self.chunk_size, chunk_y * self.chunk_size, chunk
+                )
+                self._latest[(sheet, chunk_x, chunk_y)] = chunk
+
+        # The history's own changes aren't an edit.
+        self._changes.skip()
+
+    def _read_chunk(self, key):
+        sheet, chunk_x, chunk_y = key
+        left = chunk_x * self.chunk_size
+        top = chunk_y * self.chunk_size
+        rows = self.game_map.tile_sheets[sheet][top : top + self.chunk_size]
+
+        return tuple(tuple(row[left : left + self.chunk_size]) for row in rows)
+
+    def _revert(self, key, chunk, changes):
+        """ Returns:
+                chunk as it was before changes, undone newest first."""
+
+        _, chunk_x, chunk_y = key
+        left = chunk_x * self.chunk_size
+        top = chunk_y * self.chunk_size
+
+        rows = [list(row) for row in chunk]
+        for change in reversed(changes):
+            rows[change.y - top][change.x - left] = change.old
+
+        return tuple(tuple(row) for row in rows)
+
+    def _hold(self, entry):
+        for chunks in entry.chunks.values():
+            for chunk in chunks:
+                reference = self._chunk_references.get(id(chunk))
+                if reference is None:
+                    size = sys.getsizeof(chunk) + sum(map(sys.getsizeof, chunk))
+                    self._chunk_references[id(chunk)] = [chunk, 1, size]
+                    self.memory += size
+                else:
+                    reference[1] += 1
+
+    def _release(self, entry):
+        for key, chunks in entry.chunks.items():
+            for chunk in chunks:
+                reference = self._chunk_references[id(chunk)]
+                reference[1] -= 1
+                if reference[1] == 0:
+                    del self._chunk_references[id(chunk)]
+                    self.memory -= reference[2]
+                    if self._latest.get(key) is chunk:
+                        del self._latest[key]
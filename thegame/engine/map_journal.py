@@ -0,0 +1,163 @@
+""" A journal of the changes to a map's tiles, for anything which keeps something
+    derived from the tiles (ie a save, or a network client's copy of the map) to
+    catch up on what changed since it last looked, rather than rescanning."""
+import weakref
+from collections import namedtuple
+
+# A change to the tile at x,y on sheet, from old to new, which made the map's
+# version (see MapJournal.version) version.
+TileChange = namedtuple("TileChange", ["version", "sheet", "x", "y", "old", "new"])
+
+
+class JournalCursor:
+    """ A subscriber's place in a MapJournal. See MapJournal.subscribe()."""
+
+    def __init__(self, journal: "MapJournal"):
+        self.journal = journal
+
+        # The version of the map this cursor has read up to.
+        self.version = journal.version
+
+    @property
+    def pending(self):
+        """ The number of changes made since the cursor last read."""
+        return self.journal.version - self.version
+
+    def read(self):
+        """ Returns:
+                A list of the TileChanges made since the cursor last read, oldest
+                first.
+
+            Raises:
+                MapJournal.ChangesDiscardedException: If some of the changes have
+                                                      been discarded, as the
+                                                      cursor fell too far behind.
+                                                      The cursor is then moved to
+                                                      the latest change, so the
+                                                      subscriber can rescan the
+                                                      map and carry on."""
+        return self.journal._read(self)
+
+    def changed_tiles(self):
+        """ Read the changes made since the cursor last read (see read()), with
+            the changes to each tile combined.
+
+            Returns:
+                A set of the (sheet, x, y) of each tile changed."""
+        return {(change.sheet, change.x, change.y) for change in self.read()}
+
+    def skip(self):
+        """ Move the cursor past every change made so far, without reading them."""
+        self.version = self.journal.version
+        self.journal._compact()
+
+    def close(self):
+        """ Stop following the journal, so changes aren't kept for the cursor."""
+        self.journal._cursors.discard(self)
+        self.journal._compact()
+
+
+class MapJournal:
+    """ An append-only list of the changes to a map's tiles.
+
+        Each change bumps the journal's version, and subscribers each have a
+        cursor of the version they've read up to. Changes every cursor has read are
+        dropped, so a journal with no subscribers keeps nothing. A cursor which
+        falls more than max_changes behind has the changes it missed dropped
+        anyway, and is told so when it next reads, so one forgotten subscriber
+        can't grow the journal without bound."""
+
+    class ChangesDiscardedException(Exception):
+        """ Raised when a cursor reads changes which were discarded before it
+            could read them."""
+
+        pass
+
+    def __init__(self, max_changes: int = 65536):
+        """ Args:
+                max_changes(int): The most changes kept for cursors which haven't
+                                  read them."""
+        self.max_changes = max_changes
+        self.version = 0
+
+        # The changes kept, of the versions after _base_version.
+        self._changes = []
+        self._base_version = 0
+
+        # Cursors no longer referenced by their subscriber stop holding changes.
+        self._cursors = weakref.WeakSet()
+
+    def __len__(self):
+        """ The number of changes kept."""
+        return len(self._changes)
+
+    def record(self, sheet: int, x: int, y: int, old, new):
+        """ Record a change to the tile at x,y on sheet, from old to new.
+
+            Returns:
+                The new version."""
+
+        self.version += 1
+        if not self._cursors:
+            self._changes.clear()
+            self._base_version = self.version
+            return self.version
+
+        self._changes.append(TileChange(self.version, sheet, x, y, old, new))
+        if len(self._changes) > self.max_changes:
+            self._discard(len(self._changes) - self.max_changes)
+
+        return self.version
+
+    def record_all(self, changes):
+        """ Record each of a list of changes, as (sheet, x, y, old, new), in order.
+
+            Returns:
+                The new version."""
+
+        if not self._cursors:
+            self.version += len(changes)
+            self._changes.clear()
+            self._base_version = self.version
+            return self.version
+
+        for change in changes:
+            self.record(*change)
+
+        return self.version
+
+    def subscribe(self):
+        """ Returns:
+                A JournalCursor at the latest change, which reads the changes made
+                from then on."""
+
+        cursor = JournalCursor(self)
+        self._cursors.add(cursor)
+        return cursor
+
+    def _read(self, cursor: JournalCursor):
+        if cursor.version < self._base_version:
+            missed = self._base_version - cursor.version
+            cursor.version = self.version
+            self._compact()
+            raise self.ChangesDiscardedException(
+                f"{missed} changes were discarded before they were read."
+            )
+
+        changes = self._changes[cursor.version - self._base_version :]
+        cursor.version = self.version
+        self._compact()
+        return changes
+
+    def _compact(self):
+        oldest = min((cursor.version for cursor in self._cursors), default=self.version)
+
+        # Changes are dropped from the front in batches, so compacting after every
+        # read doesn't shift the list every time.
+        read = oldest - self._base_version
+        if read > 0 and (read * 2 >= len(self._changes) or read >= 1024):
+            self._discard(read)
+
+    def _discard(self, count):
+        del self._changes[:count]
+        self._base_version += count
@@ -0,0 +1,4 @@
+from .client import GameClient
+from .latency import LatencyProxy
+from .prediction import ClientPrediction, LatencyReport
+from .server import GameServer
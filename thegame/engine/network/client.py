@@ -0,0 +1,234 @@
+""" A client of a GameServer, keeping a copy of the server's world up to date
+    from the deltas it sends."""
+import logging
+import socket
+import time
+
+from ..game_objects import GameObject
+from ..map import Map
+from . import protocol
+
+
+class GameClient:
+    """ Connects to a GameServer and keeps a copy of its active map and entities.
+
+        The copy of the map is an ordinary Map (so it can be drawn like any other)
+        whose tiles are plain GameObjects with the server's sprite locations. Tiles
+        with the same sprite share one object. The entities are kept as a
+        dictionary of entity to its x, y and facing.
+
+        Nothing is read from the server until poll() is called, and poll() never
+        waits for the server."""
+
+    def __init__(self, host: str, port: int, timeout: float = 5.0):
+        """ Args:
+                host(str): The address of the server.
+                port(int): The port the server is listening on.
+                timeout(float): The most seconds to wait to connect."""
+        self.socket = socket.create_connection((host, port), timeout=timeout)
+        self.socket.setblocking(False)
+        self.socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._reader = protocol.MessageReader()
+        self._outgoing = bytearray()
+
+        # Given by the server once the client has joined.
+        self.client_id = None
+
+        # The server tick the copy of the world is up to.
+        self.server_tick = None
+
+        self.game_map = None
+        self.entities = {}
+
+        # The object standing for each of the server's tile ids.
+        self._prototypes = {}
+
+        # The sequence number of the last input sent, and of the last the server
+        # has handled.
+        self.input_sequence = 0
+        self.acknowledged = 0
+
+        # The entity the server says this client controls, if any.
+        self.player_entity = None
+
+        # The rectangle of tiles last sent by send_view().
+        self.view = None
+
+        self._message_listeners = []
+
+        self.connected = True
+        self.bytes_received = 0
+
+    def close(self):
+        self.connected = False
+        self.socket.close()
+
+    def send_input(self, pressed_keys):
+        """ Send the keys held to the server, to be handed to the player
+            interaction of the object this client controls. As with the engine, a
+            key held over several ticks should only be sent once.
+
+            Returns:
+                The input's sequence number."""
+
+        self.input_sequence += 1
+        self._outgoing += protocol.frame(
+            protocol.encode_input(self.input_sequence, pressed_keys)
+        )
+        self._send()
+
+        return self.input_sequence
+
+    def send_view(self, camera):
+        """ Tell the server which tiles camera shows, so that it only sends the
+            changes near them. Until this is called the server sends every change.
+            Only sends anything if the camera has moved since it was last called.
+
+            Args:
+                camera(Camera): The camera the client draws the map with."""
+
+        view = (
+            camera.leftmost_tile,
+            camera.topmost_tile,
+            camera.visible_columns,
+            camera.visible_rows,
+        )
+        if view == self.view:
+            return
+
+        self.view = view
+        self._outgoing += protocol.frame(protocol.encode_view(*view))
+        self._send()
+
+    def register_message_listener(self, listener):
+        """ Register a callable to be called with the kind of each message from
+            the server (see protocol), after the message has been applied.
+
+            Args:
+                listener(callable): Takes the kind of the message."""
+        self._message_listeners.append(listener)
+
+    def deregister_message_listener(self, listener):
+        self._message_listeners.remove(listener)
+
+    def poll(self):
+        """ Apply every message received from the server so far.
+
+            Returns:
+                The number of messages applied."""
+
+        self._send()
+
+        applied = 0
+        while self.connected:
+            try:
+                data = self.socket.recv(65536)
+            except BlockingIOError:
+                break
+            except OSError as e:
+                logging.info(f"Lost the server: {e}")
+                self.close()
+                break
+
+            if not data:
+                logging.info("The server closed the connection.")
+                self.close()
+                break
+
+            self.bytes_received += len(data)
+            for message in self._reader.feed(data):
+                self._apply(message)
+                applied += 1
+
+        return applied
+
+    def wait_for(self, condition, timeout: float = 5.0):
+        """ Poll until condition() is true, ie until the world has arrived.
+
+            Returns:
+                Whether condition() became true before timeout seconds."""
+
+        deadline = time.perf_counter() + timeout
+        while not condition():
+            if time.perf_counter() > deadline or not self.connected:
+                return False
+
+            if not self.poll():
+                time.sleep(0.001)
+
+        return True
+
+    def _send(self):
+        if not self._outgoing or not self.connected:
+            return
+
+        try:
+            sent = self.socket.send(self._outgoing)
+        except BlockingIOError:
+            return
+        except OSError as e:
+            logging.info(f"Lost the server: {e}")
+            self.close()
+            return
+
+        del self._outgoing[:sent]
+
+    def _apply(self, message):
+        kind = protocol.message_kind(message)
+
+        if kind == protocol.WORLD_MESSAGE:
+            self._apply_world(*protocol.decode_world(message))
+        elif kind == protocol.STATE_MESSAGE:
+            self._apply_state(*protocol.decode_state(message))
+        elif kind == protocol.ACK_MESSAGE:
+            self._apply_ack(*protocol.decode_ack(message))
+        else:
+            logging.warning(f"Ignoring a message of kind {kind} from the server.")
+            return
+
+        for listener in self._message_listeners:
+            listener(kind)
+
+    def _apply_world(self, tick, client_id, tile_ids, palette, entities):
+        logging.info(f"Joined the server as client {client_id} on tick {tick}.")
+
+        self.client_id = client_id
+        self.server_tick = tick
+        self._prototypes = {
+            tile_id: GameObject(sprite_location)
+            for tile_id, sprite_location in enumerate(palette)
+        }
+        self._prototypes[protocol.EMPTY_TILE] = None
+
+        self.game_map = Map(
+            *[
+                [[self._prototypes[tile_id] for tile_id in row] for row in sheet]
+                for sheet in tile_ids.tolist()
+            ],
+            validate=False,
+        )
+
+        self.entities = {}
+        self._apply_entities(entities)
+
+    def _apply_state(self, tick, palette_entries, tiles, entities, removed):
+        self.server_tick = tick
+
+        for tile_id, sprite_location in palette_entries:
+            self._prototypes[tile_id] = GameObject(sprite_location)
+
+        if self.game_map is not None:
+            for sheet, x, y, tile_id in tiles.tolist():
+                self.game_map.set_tile((x, y), sheet, self._prototypes[tile_id])
+
+        self._apply_entities(entities)
+        for entity in removed.tolist():
+            self.entities.pop(entity, None)
+
+    def _apply_ack(self, tick, sequence, entity):
+        self.acknowledged = sequence
+        self.player_entity = None if entity < 0 else entity
+
+    def _apply_entities(self, entities):
+        for entity, x, y, facing in entities.tolist():
+            self.entities[entity] = (x, y, facing)
@@ -0,0 +1,109 @@
+""" Area of interest filtering, so each change on the server is only sent to the
+    clients which can see it."""
+
+
+class InterestGrid:
+    """ A spatial grid of subscribers, each interested in a rectangle of a map.
+
+        The map is split into square cells, and each cell holds the subscribers
+        whose rectangles overlap it. Finding who is interested in a tile looks at
+        one cell, so costs the number of subscribers near the tile rather than the
+        number of subscribers."""
+
+    def __init__(self, width: int, height: int, cell_size: int = 16):
+        """ Args:
+                width(int): The width of the map in tiles.
+                height(int): The height of the map in tiles.
+                cell_size(int): The width and height of a cell in tiles."""
+        if cell_size < 1:
+            raise ValueError(
+                f"Interest cells must be at least 1 tile, not {cell_size}."
+            )
+
+        self.width = width
+        self.height = height
+        self.cell_size = cell_size
+        self.columns = -(-width // cell_size)
+        self.rows = -(-height // cell_size)
+
+        self._cells = [set() for _ in range(self.columns * self.rows)]
+
+        # Each subscriber's rectangle, as (left, top, right, bottom), clamped to
+        # the map, with right and bottom exclusive.
+        self._areas = {}
+
+    def __contains__(self, subscriber):
+        return subscriber in self._areas
+
+    def __len__(self):
+        return len(self._areas)
+
+    def area(self, subscriber):
+        """ Returns:
+                The (left, top, right, bottom) tiles subscriber is interested in,
+                right and bottom exclusive, or None if it isn't subscribed."""
+        return self._areas.get(subscriber)
+
+    def subscribe(self, subscriber, x: int, y: int, width: int, height: int):
+        """ Set the rectangle subscriber is interested in, in place of any it had.
+
+            Args:
+                subscriber: Any hashable, ie a client id.
+                x(int): The leftmost tile of the rectangle.
+                y(int): The topmost tile of the rectangle.
+                width(int): The width of the rectangle in tiles.
+                height(int): The height of the rectangle in tiles.
+
+            Returns:
+                The rectangle as clamped to the map. See area()."""
+
+        area = (
+            max(0, x),
+            max(0, y),
+            min(self.width, x + width),
+            min(self.height, y + height),
+        )
+        if self._areas.get(subscriber) == area:
+            return area
+
+        self.unsubscribe(subscriber)
+        self._areas[subscriber] = area
+        for cell in self._cells_in(area):
+            self._cells[cell].add(subscriber)
+
+        return area
+
+    def unsubscribe(self, subscriber):
+        area = self._areas.pop(subscriber, None)
+        if area is None:
+            return
+
+        for cell in self._cells_in(area):
+            self._cells[cell].discard(subscriber)
+
+    def interested(self, x: int, y: int):
+        """ Returns:
+                A list of the subscribers interested in the tile at x,y."""
+
+        if not (0 <= x < self.width and 0 <= y < self.height):
+            return []
+
+        cell = (y // self.cell_size) * self.columns + x // self.cell_size
+        interested = []
+        for subscriber in self._cells[cell]:
+            left, top, right, bottom = self._areas[subscriber]
+            if left <= x < right and top <= y < bottom:
+                interested.append(subscriber)
+
+        return interested
+
+    def _cells_in(self, area):
+        left, top, right, bottom = area
+        if left >= right or top >= bottom:
+            return
+
+        for row in range(top // self.cell_size, (bottom - 1) // self.cell_size + 1):
+            for column in range(
+                left // self.cell_size, (right - 1) // self.cell_size + 1
+            ):
+                yield row * self.columns + column
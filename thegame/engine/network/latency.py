@@ -0,0 +1,173 @@
+""" A relay between clients and a server which holds back everything passing
+    through it, to try a networked game over loopback with a real network's lag."""
+import logging
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+
+
+class _Pipe:
+    """ One direction of a relayed connection."""
+
+    def __init__(self, source, destination):
+        self.source = source
+        self.destination = destination
+
+        # The data read from source, as (time it's due, data.)
+        self.delayed = deque()
+
+        # Data which is due, waiting to be written to destination.
+        self.outgoing = bytearray()
+
+        # Whether source has closed.
+        self.closed = False
+
+
+class LatencyProxy:
+    """ Listens for clients, connecting each to the server, and passes the bytes
+        each side sends on to the other latency seconds later. A round trip
+        through the proxy is therefore delayed by twice latency.
+
+        The relaying is done by a background thread, between start() and
+        close()."""
+
+    def __init__(
+        self,
+        server_address,
+        latency: float = 0.05,
+        host: str = "127.0.0.1",
+        port: int = 0,
+    ):
+        """ Args:
+                server_address(tuple): The host and port of the server.
+                latency(float): The seconds to hold back data in each direction.
+                host(str): The address to listen on.
+                port(int): The port to listen on, 0 for any free port."""
+        self.server_address = server_address
+        self.latency = latency
+
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind((host, port))
+        self._listener.listen()
+        self._listener.setblocking(False)
+
+        # The host and port for clients to connect to.
+        self.address = self._listener.getsockname()
+
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._listener, selectors.EVENT_READ)
+
+        # The pipes of each connection, in pairs.
+        self._connections = []
+
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        """ Start relaying.
+
+            Returns:
+                The proxy, so it can be started as it's made."""
+
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+        return self
+
+    def close(self):
+        self._running = False
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+        for pipes in self._connections:
+            for pipe in pipes:
+                pipe.source.close()
+        self._connections.clear()
+
+        self._selector.close()
+        self._listener.close()
+
+    def _run(self):
+        while self._running:
+            for key, _ in self._selector.select(timeout=0.001):
+                if key.fileobj is self._listener:
+                    self._accept()
+                else:
+                    self._read(key.data)
+
+            self._deliver()
+
+    def _accept(self):
+        try:
+            client, address = self._listener.accept()
+        except BlockingIOError:
+            return
+
+        try:
+            server = socket.create_connection(self.server_address)
+        except OSError as e:
+            logging.warning(f"Couldn't relay {address} to the server: {e}")
+            client.close()
+            return
+
+        for connection in (client, server):
+            connection.setblocking(False)
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+        pipes = (_Pipe(client, server), _Pipe(server, client))
+        for pipe in pipes:
+            self._selector.register(pipe.source, selectors.EVENT_READ, pipe)
+        self._connections.append(pipes)
+
+    def _read(self, pipe):
+        try:
+            data = pipe.source.recv(65536)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b""
+
+        if data:
+            pipe.delayed.append((time.perf_counter() + self.latency, data))
+        else:
+            pipe.closed = True
+            self._selector.unregister(pipe.source)
+
+    def _deliver(self):
+        now = time.perf_counter()
+        for pipes in list(self._connections):
+            for pipe in pipes:
+                while pipe.delayed and pipe.delayed[0][0] <= now:
+                    pipe.outgoing += pipe.delayed.popleft()[1]
+
+                if pipe.outgoing:
+                    try:
+                        sent = pipe.destination.send(pipe.outgoing)
+                    except BlockingIOError:
+                        sent = 0
+                    except OSError:
+                        pipe.closed = True
+                        pipe.delayed.clear()
+                        pipe.outgoing.clear()
+                        continue
+
+                    del pipe.outgoing[:sent]
+
+            # Once either side has closed, and what it sent has been passed on,
+            # close the other.
+            if any(
+                pipe.closed and not pipe.delayed and not pipe.outgoing
+                for pipe in pipes
+            ):
+                self._connections.remove(pipes)
+                for pipe in pipes:
+                    try:
+                        self._selector.unregister(pipe.source)
+                    except KeyError:
+                        pass
+                    pipe.source.close()
@@ -0,0 +1,314 @@
+""" Client-side prediction of a client's own player, and interpolation of every
+    other entity, so that a networked game doesn't play a round trip behind."""
+import logging
+import time
+from collections import deque, namedtuple
+
+from ..game_objects import PlayerCharacter
+from . import protocol
+
+# Input latencies in seconds: how long inputs took to be drawn (display), and to
+# be handled by the server (confirmation), which is how long they would take to
+# be drawn without prediction.
+LatencyReport = namedtuple(
+    "LatencyReport",
+    [
+        "inputs",
+        "mean_display",
+        "max_display",
+        "mean_confirmation",
+        "max_confirmation",
+        "corrections",
+    ],
+)
+
+
+class ClientPrediction:
+    """ Predicts where a GameClient's player is, and smooths where everyone else
+        is, for drawing.
+
+        Inputs sent through send_input() move the client's player straight away,
+        by the same rules as PlayerCharacter.move(), checked against the client's
+        copy of the map. The inputs are kept until the server acknowledges them.
+        Whenever it does, the predicted position is rebuilt from the server's
+        position for the player with the inputs it hasn't handled yet replayed on
+        top, so a move the server refused is undone without losing the moves made
+        since.
+
+        Every other entity is drawn interpolation_ticks behind the latest state
+        from the server, moving smoothly between the positions of the states
+        either side of that, rather than jumping whenever a state arrives.
+
+        The client's map is left exactly as the server sent it, so characters
+        should be drawn from positions() rather than from its character sheet:
+        sprites() gives them ready for ScrollBuffer.draw(), with the character
+        sheet skipped by the tile renderer."""
+
+    # The most latencies kept for report().
+    MAX_LATENCIES = 1000
+
+    def __init__(
+        self,
+        client,
+        tick_length: float = 1 / 60,
+        interpolation_ticks: float = 2,
+        clock=time.perf_counter,
+    ):
+        """ Args:
+                client(GameClient): The client to predict for.
+                tick_length(float): The seconds between the server's ticks.
+                interpolation_ticks(float): How many ticks behind the latest state
+                                            other entities are drawn. At least 1,
+                                            so there is a state either side.
+                clock(callable): Returns the time in seconds."""
+        self.client = client
+        self.tick_length = tick_length
+        self.interpolation_ticks = interpolation_ticks
+        self.clock = clock
+
+        # Inputs sent but not acknowledged, as (sequence, pressed keys, time sent.)
+        self.pending = deque()
+
+        # Where the client's player is predicted to be, once the server has said
+        # which entity it is.
+        self.predicted_position = None
+
+        # How many times the server disagreed with a prediction.
+        self.corrections = 0
+
+        self.display_latencies = deque(maxlen=self.MAX_LATENCIES)
+        self.confirmation_latencies = deque(maxlen=self.MAX_LATENCIES)
+
+        # When each input not yet drawn was sent.
+        self._undisplayed = []
+
+        # The states each other entity has been seen in, as (tick, x, y, facing.)
+        self._history = {}
+
+        # The latest server tick, and when it arrived.
+        self._latest_tick = None
+        self._latest_time = None
+
+        client.register_message_listener(self._message_applied)
+
+        # Start from the world the client has, if it has already joined.
+        if client.game_map is not None:
+            self._message_applied(protocol.WORLD_MESSAGE)
+
+    def close(self):
+        self.client.deregister_message_listener(self._message_applied)
+
+    def send_input(self, pressed_keys):
+        """ Send pressed_keys to the server, and predict their move.
+
+            Returns:
+                The input's sequence number."""
+
+        sequence = self.client.send_input(pressed_keys)
+        sent = self.clock()
+        self.pending.append((sequence, list(pressed_keys), sent))
+        self._undisplayed.append(sent)
+
+        if self.predicted_position is not None:
+            self.predicted_position = self._predict(
+                self.predicted_position, pressed_keys, self._server_position()
+            )
+
+        return sequence
+
+    def poll(self):
+        """ Apply everything received from the server. See GameClient.poll()."""
+        return self.client.poll()
+
+    def positions(self):
+        """ Where to draw every entity now. Call this once per frame drawn, as it
+            is what measures the display latency.
+
+            Returns:
+                A dictionary of entity to its (x, y, facing), where x and y are
+                tiles but may be fractional while an entity is between them."""
+
+        now = self.clock()
+        for sent in self._undisplayed:
+            self.display_latencies.append(now - sent)
+        self._undisplayed.clear()
+
+        positions = {}
+        if self._latest_tick is not None:
+            render_tick = min(
+                self._latest_tick,
+                self._latest_tick
+                + (now - self._latest_time) / self.tick_length
+                - self.interpolation_ticks,
+            )
+            for entity, history in self._history.items():
+                positions[entity] = self._interpolate(history, render_tick)
+
+        player = self.client.player_entity
+        if self.predicted_position is not None and player in self.client.entities:
+            x, y = self.predicted_position
+            positions[player] = (x, y, self.client.entities[player][2])
+
+        return positions
+
+    def sprites(self):
+        """ Where to draw every entity's sprite now. Like positions(), call this
+            once per frame drawn (instead of positions(), not as well.)
+
+            Returns:
+                A list of (x, y, sprite_location) tuples for ScrollBuffer.draw().
+                Each entity's sprite is that of the object on the client's
+                character sheet where the server has the entity."""
+
+        positions = self.positions()
+        game_map = self.client.game_map
+        if game_map is None:
+            return []
+
+        sprites = []
+        for entity, (x, y, _) in positions.items():
+            if entity not in self.client.entities:
+                continue
+
+            server_x, server_y, _ = self.client.entities[entity]
+            game_object = game_map.character_sheet[server_y][server_x]
+            if game_object is not None:
+                sprites.append((x, y, game_object.sprite_location))
+
+        return sprites
+
+    def report(self):
+        """ Returns:
+                A LatencyReport of the inputs measured so far."""
+
+        def mean(latencies):
+            return sum(latencies) / len(latencies) if latencies else None
+
+        return LatencyReport(
+            inputs=len(self.confirmation_latencies),
+            mean_display=mean(self.display_latencies),
+            max_display=max(self.display_latencies, default=None),
+            mean_confirmation=mean(self.confirmation_latencies),
+            max_confirmation=max(self.confirmation_latencies, default=None),
+            corrections=self.corrections,
+        )
+
+    def _message_applied(self, kind):
+        """ Registered as a message listener of the client."""
+
+        if kind == protocol.WORLD_MESSAGE:
+            self._history.clear()
+
+        if kind in (protocol.WORLD_MESSAGE, protocol.STATE_MESSAGE):
+            self._latest_tick = self.client.server_tick
+            self._latest_time = self.clock()
+            self._record_states()
+
+            # Without inputs in flight, the server's position is the prediction.
+            # With them, wait for the acknowledgement which follows the state.
+            if not self.pending:
+                self._reconcile()
+        elif kind == protocol.ACK_MESSAGE:
+            self._reconcile()
+
+    def _record_states(self):
+        tick = self._latest_tick
+        entities = self.client.entities
+        player = self.client.player_entity
+
+        for entity in [entity for entity in self._history if entity not in entities]:
+            del self._history[entity]
+
+        # The player is drawn where it's predicted to be, rather than from here.
+        self._history.pop(player, None)
+
+        for entity, state in entities.items():
+            if entity == player:
+                continue
+
+            history = self._history.get(entity)
+            if history is None:
+                self._history[entity] = deque([(tick, *state)])
+                continue
+
+            last_tick, *last_state = history[-1]
+            if tuple(last_state) == state:
+                continue
+
+            # States only carry entities which changed, so the entity was still
+            # where it last was on the tick before, and should only start moving
+            # from there.
+            if last_tick < tick - 1:
+                history.append((tick - 1, *last_state))
+            history.append((tick, *state))
+
+    def _reconcile(self):
+        """ Drop the inputs the server has handled, and predict the player's
+            position from where the server has it, replaying the others."""
+
+        now = self.clock()
+        while self.pending and self.pending[0][0] <= self.client.acknowledged:
+            _, _, sent = self.pending.popleft()
+            self.confirmation_latencies.append(now - sent)
+
+        server_position = self._server_position()
+        if server_position is None:
+            self.predicted_position = None
+            return
+
+        position = server_position
+        for _, pressed_keys, _ in self.pending:
+            position = self._predict(position, pressed_keys, server_position)
+
+        if self.predicted_position is not None and position != self.predicted_position:
+            logging.debug(
+                f"Server corrected the predicted position {self.predicted_position}"
+                f" to {position}."
+            )
+            self.corrections += 1
+
+        self.predicted_position = position
+
+    def _server_position(self):
+        player = self.client.player_entity
+        if player not in self.client.entities:
+            return None
+
+        x, y, _ = self.client.entities[player]
+        return (x, y)
+
+    def _predict(self, position, pressed_keys, server_position):
+        """ Where a PlayerCharacter at position moves with pressed_keys. The tile
+            the server has the player on is occupied by the player, on the
+            client's map, so is passable to it."""
+
+        game_map = self.client.game_map
+        new_position = PlayerCharacter.next_position(
+            position,
+            up="w" in pressed_keys,
+            down="s" in pressed_keys,
+            left="a" in pressed_keys,
+            right="d" in pressed_keys,
+        )
+        if new_position is None or game_map is None:
+            return position
+
+        if new_position == server_position or game_map.is_passable(*new_position):
+            return new_position
+
+        return position
+
+    @staticmethod
+    def _interpolate(history, render_tick):
+        # Drop the states no longer needed to interpolate from.
+        while len(history) > 1 and history[1][0] <= render_tick:
+            history.popleft()
+
+        tick, x, y, facing = history[0]
+        if len(history) == 1 or render_tick <= tick:
+            return (float(x), float(y), facing)
+
+        next_tick, next_x, next_y, _ = history[1]
+        fraction = (render_tick - tick) / (next_tick - tick)
+
+        return (x + (next_x - x) * fraction, y + (next_y - y) * fraction, facing)
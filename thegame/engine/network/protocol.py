@@ -0,0 +1,264 @@
+""" The messages sent between a GameServer and its clients.
+
+    Every message is framed by its length, and starts with a byte saying which
+    kind of message it is. Everything is little endian, and the bulky parts (the
+    tiles and entities) are packed as numpy record arrays."""
+import struct
+import zlib
+
+import numpy
+
+FRAME = struct.Struct("<I")
+
+# Sent by the server to a client as it joins, and whenever the map changes.
+WORLD_MESSAGE = 0
+
+# Sent by the server every tick, with what changed in it.
+STATE_MESSAGE = 1
+
+# Sent by a client whenever it has input for the server.
+INPUT_MESSAGE = 2
+
+# Sent by a client whenever the part of the map it shows changes.
+VIEW_MESSAGE = 4
+
+# Sent by the server to a client, after a tick's state, whenever the last of the
+# client's inputs handled or the entity it controls changes.
+ACK_MESSAGE = 3
+
+# The tick, client id, the width and height of the map, and the number of
+# palette entries, bytes of compressed tile ids, and entities that follow.
+WORLD_HEADER = struct.Struct("<BIIHHHII")
+
+# The tick, and the number of palette entries, tiles, changed entities and
+# removed entities that follow.
+STATE_HEADER = struct.Struct("<BIHIII")
+
+# The input's sequence number, and the number of keys held.
+INPUT_HEADER = struct.Struct("<BIH")
+
+# The tick, the sequence number of the last input handled, and the entity the
+# client controls, or -1.
+ACK_HEADER = struct.Struct("<BIIi")
+
+# The leftmost and topmost tiles a client shows, and how many tiles across and
+# down it shows.
+VIEW_HEADER = struct.Struct("<BiiHH")
+
+# A tile id, and the length of the sprite location that follows it.
+PALETTE_ENTRY = struct.Struct("<iH")
+
+# The id of an empty tile.
+EMPTY_TILE = -1
+
+TILE = numpy.dtype([("sheet", "<u1"), ("x", "<u2"), ("y", "<u2"), ("tile", "<i4")])
+ENTITY = numpy.dtype(
+    [("entity", "<u4"), ("x", "<i4"), ("y", "<i4"), ("facing", "<i1")]
+)
+REMOVED_ENTITY = numpy.dtype("<u4")
+KEY = numpy.dtype("<u2")
+
+
+def frame(payload: bytes):
+    """ Return payload prefixed with its length, ready to send."""
+    return FRAME.pack(len(payload)) + payload
+
+
+def message_kind(payload: bytes):
+    return payload[0]
+
+
+def encode_world(tick, client_id, tile_ids, palette, entities):
+    """ Encode the whole of a map and its entities, for a client to build its
+        copy of the world from.
+
+        Args:
+            tick(int): The server's tick.
+            client_id(int): The id of the client the message is for.
+            tile_ids: A (sheet, y, x) int32 array of the map's tile ids.
+            palette(list): The sprite location of each tile id.
+            entities: An array of ENTITY records."""
+
+    _, height, width = tile_ids.shape
+    tiles = zlib.compress(numpy.ascontiguousarray(tile_ids, dtype="<i4").tobytes())
+
+    return b"".join(
+        [
+            WORLD_HEADER.pack(
+                WORLD_MESSAGE,
+                tick,
+                client_id,
+                width,
+                height,
+                len(palette),
+                len(tiles),
+                len(entities),
+            ),
+            _encode_palette(enumerate(palette)),
+            tiles,
+            numpy.ascontiguousarray(entities, dtype=ENTITY).tobytes(),
+        ]
+    )
+
+
+def decode_world(payload: bytes):
+    """ Returns:
+            (tick, client id, tile ids, palette, entities), as given to
+            encode_world()."""
+
+    (_, tick, client_id, width, height, palettes, tiles_size, entities) = (
+        WORLD_HEADER.unpack_from(payload)
+    )
+    offset = WORLD_HEADER.size
+
+    palette_entries, offset = _decode_palette(payload, offset, palettes)
+    palette = [sprite_location for _, sprite_location in palette_entries]
+
+    tile_ids = numpy.frombuffer(
+        zlib.decompress(payload[offset : offset + tiles_size]), dtype="<i4"
+    ).reshape(4, height, width)
+    offset += tiles_size
+
+    entity_records = numpy.frombuffer(payload, ENTITY, entities, offset)
+
+    return tick, client_id, tile_ids, palette, entity_records
+
+
+def encode_state(tick, palette_entries, tiles, entities, removed):
+    """ Encode what changed in a tick.
+
+        Args:
+            tick(int): The server's tick.
+            palette_entries(list): The (tile id, sprite location) of each tile id
+                                   new this tick.
+            tiles: An array of TILE records of the tiles which changed.
+            entities: An array of ENTITY records of the entities which changed.
+            removed: An array of the entities which were removed."""
+
+    return b"".join(
+        [
+            STATE_HEADER.pack(
+                STATE_MESSAGE,
+                tick,
+                len(palette_entries),
+                len(tiles),
+                len(entities),
+                len(removed),
+            ),
+            _encode_palette(palette_entries),
+            numpy.ascontiguousarray(tiles, dtype=TILE).tobytes(),
+            numpy.ascontiguousarray(entities, dtype=ENTITY).tobytes(),
+            numpy.ascontiguousarray(removed, dtype=REMOVED_ENTITY).tobytes(),
+        ]
+    )
+
+
+def decode_state(payload: bytes):
+    """ Returns:
+            (tick, palette entries, tiles, entities, removed), as given to
+            encode_state()."""
+
+    _, tick, palettes, tiles, entities, removed = STATE_HEADER.unpack_from(payload)
+    palette_entries, offset = _decode_palette(payload, STATE_HEADER.size, palettes)
+
+    tile_records = numpy.frombuffer(payload, TILE, tiles, offset)
+    offset += tile_records.nbytes
+    entity_records = numpy.frombuffer(payload, ENTITY, entities, offset)
+    offset += entity_records.nbytes
+    removed_entities = numpy.frombuffer(payload, REMOVED_ENTITY, removed, offset)
+
+    return tick, palette_entries, tile_records, entity_records, removed_entities
+
+
+def encode_input(sequence: int, pressed_keys):
+    """ Encode the keys a client holds, as the characters the engine reads them
+        as. Inputs are numbered in the order they're sent."""
+
+    return INPUT_HEADER.pack(INPUT_MESSAGE, sequence, len(pressed_keys)) + (
+        numpy.array([ord(key) for key in pressed_keys], dtype=KEY).tobytes()
+    )
+
+
+def decode_input(payload: bytes):
+    """ Returns:
+            (sequence, pressed keys), as given to encode_input()."""
+
+    _, sequence, keys = INPUT_HEADER.unpack_from(payload)
+    key_codes = numpy.frombuffer(payload, KEY, keys, INPUT_HEADER.size)
+
+    return sequence, [chr(key) for key in key_codes.tolist()]
+
+
+def encode_ack(tick: int, sequence: int, entity: int):
+    """ Encode the last of a client's inputs the server has handled by the end of
+        tick, and the entity the client controls (-1 for none.)"""
+    return ACK_HEADER.pack(ACK_MESSAGE, tick, sequence, entity)
+
+
+def decode_ack(payload: bytes):
+    """ Returns:
+            (tick, sequence, entity), as given to encode_ack()."""
+
+    _, tick, sequence, entity = ACK_HEADER.unpack(payload)
+    return tick, sequence, entity
+
+
+def encode_view(x: int, y: int, width: int, height: int):
+    """ Encode the rectangle of tiles a client shows."""
+    return VIEW_HEADER.pack(VIEW_MESSAGE, x, y, width, height)
+
+
+def decode_view(payload: bytes):
+    """ Returns:
+            (x, y, width, height), as given to encode_view()."""
+
+    _, x, y, width, height = VIEW_HEADER.unpack(payload)
+    return x, y, width, height
+
+
+class MessageReader:
+    """ Splits the bytes received from a socket back into messages."""
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    def feed(self, data: bytes):
+        """ Add received bytes, and return a list of any messages they complete."""
+
+        self._buffer += data
+        messages = []
+        offset = 0
+
+        while len(self._buffer) - offset >= FRAME.size:
+            (length,) = FRAME.unpack_from(self._buffer, offset)
+            if len(self._buffer) - offset - FRAME.size < length:
+                break
+
+            start = offset + FRAME.size
+            messages.append(bytes(self._buffer[start : start + length]))
+            offset = start + length
+
+        del self._buffer[:offset]
+        return messages
+
+
+def _encode_palette(palette_entries):
+    encoded = []
+    for tile_id, sprite_location in palette_entries:
+        location = sprite_location.encode("utf-8")
+        encoded.append(PALETTE_ENTRY.pack(tile_id, len(location)))
+        encoded.append(location)
+
+    return b"".join(encoded)
+
+
+def _decode_palette(payload, offset, count):
+    palette_entries = []
+    for _ in range(count):
+        tile_id, length = PALETTE_ENTRY.unpack_from(payload, offset)
+        offset += PALETTE_ENTRY.size
+        location = payload[offset : offset + length].decode("utf-8")
+        offset += length
+        palette_entries.append((tile_id, location))
+
+    return palette_entries, offset
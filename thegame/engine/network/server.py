@@ -0,0 +1,616 @@
+""" A headless server running the authoritative copy of a game, which clients
+    connect to over TCP and are kept in step with by small per tick deltas."""
+import logging
+import selectors
+import socket
+import time
+
+import numpy
+
+from ..map import Map
+from ..map_journal import MapJournal
+from . import protocol
+from .interest import InterestGrid
+
+
+class ClientConnection:
+    """ A client connected to a GameServer."""
+
+    def __init__(self, client_id, connection, address):
+        self.client_id = client_id
+        self.socket = connection
+        self.address = address
+        self.reader = protocol.MessageReader()
+
+        # Bytes waiting to be sent to the client.
+        self.outgoing = bytearray()
+
+        # The object the client controls, if the server's spawn gave it one.
+        self.player = None
+
+        # Inputs received but not yet handled, as (sequence, pressed keys), and
+        # the sequence number of the last one handled.
+        self.inputs = []
+        self.acknowledged = 0
+
+        # The (sequence, entity) last sent to the client in an acknowledgement.
+        self.sent_acknowledgement = None
+
+        # The rectangle of tiles the client last said it shows, if it has, and
+        # whether that is yet to be taken into account.
+        self.view = None
+        self.view_changed = False
+
+        # The size of the last state sent to the client.
+        self.last_state_size = 0
+
+    @property
+    def player_entity(self):
+        """ The entity of the object the client controls, or -1 if it has none."""
+        if self.player is None or self.player.entity_store is None:
+            return -1
+
+        return self.player.entity
+
+
+class GameServer:
+    """ Runs a BaseGame without a display, for clients to connect to.
+
+        Each joining client is sent the whole active map and every entity once.
+        After that, each tick sends every client only what changed in it: the
+        tiles changed on the map (found with a tile listener), and the entities
+        which moved, turned, appeared or were removed (found by comparing the
+        entity columns with what was last sent.) The delta is encoded once and
+        the same bytes are queued for every client, so a tick costs little more
+        for many clients than for one, and the bytes sent grow with the changes
+        rather than the size of the map.
+
+        Clients send the keys they hold, which are handed to the
+        player_interaction() of the object the client controls on the server's
+        next tick. After each tick's state, a client is told the last of its inputs
+        handled and which entity it controls, whenever either changes, so that it
+        can predict its own moves (see ClientPrediction.) The server never blocks
+        on a client.
+
+        Clients which send the rectangle of tiles they show (see
+        GameClient.send_view()) are only sent the changes within it, plus
+        interest_margin tiles around it. Their interest is kept in an InterestGrid,
+        so each change costs the number of clients which can see it rather than
+        the number of clients. An entity leaving a client's view is removed from
+        it, and the tiles and entities which come into view as it moves are sent
+        as they are. Clients which haven't sent a view are sent everything, as
+        one state encoded once for them all."""
+
+    # A client which lets this many bytes back up unsent is disconnected.
+    MAX_OUTGOING_BYTES = 4 * 1024 * 1024
+
+    def __init__(
+        self,
+        game,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        spawn=None,
+        leave=None,
+        max_inputs_per_tick: int = 8,
+        interest_margin: int = 4,
+        interest_cell_size: int = 16,
+    ):
+        """ Args:
+                game(BaseGame): The game to run. Its active screen should be a map.
+                host(str): The address to listen on.
+                port(int): The port to listen on, 0 for any free port.
+                spawn: A callable taking (game, client_id), called when a client
+                       joins, returning the object the client controls or None.
+                leave: A callable taking (game, client_id, player), called when
+                       a client leaves.
+                max_inputs_per_tick(int): The most inputs of each client handled
+                                          in a tick. Any more wait for later
+                                          ticks.
+                interest_margin(int): How many tiles around a client's view it is
+                                      sent changes for.
+                interest_cell_size(int): The size in tiles of the cells of the
+                                         InterestGrid."""
+        self.game = game
+        self.spawn = spawn
+        self.leave = leave
+        self.max_inputs_per_tick = max_inputs_per_tick
+        self.interest_margin = interest_margin
+        self.interest_cell_size = interest_cell_size
+
+        self._listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._listener.bind((host, port))
+        self._listener.listen()
+        self._listener.setblocking(False)
+
+        # The host and port the server is listening on.
+        self.address = self._listener.getsockname()
+
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._listener, selectors.EVENT_READ)
+
+        self.clients = {}
+        self._next_client_id = 1
+        self.tick_count = 0
+        self.running = False
+
+        # The id of each sprite location sent to clients, and the ones given out
+        # since the last tick was sent.
+        self._palette = {}
+        self._palette_locations = []
+        self._new_palette_entries = []
+
+        # The map being served, its tile ids as last sent, and a cursor of its
+        # journal to find the tiles changed since.
+        self._game_map = None
+        self._tile_ids = None
+        self._map_changes = None
+
+        # The interest of the clients which have sent a view, on the served map.
+        self._interest = None
+
+        # The entity columns as they were last sent.
+        self._sent_alive = numpy.zeros(0, dtype=bool)
+        self._sent_position = numpy.zeros((0, 2), dtype=numpy.int32)
+        self._sent_facing = numpy.zeros(0, dtype=numpy.int8)
+
+        # Counters to see what the server is sending. last_state_size is the size
+        # of the last state sent to the clients without a view.
+        self.bytes_sent = 0
+        self.last_state_size = 0
+
+    def serve_forever(self, tick_rate: int = 60):
+        """ Run a tick every 1/tick_rate seconds until stop() is called."""
+
+        self.running = True
+        tick_length = 1 / tick_rate
+        while self.running:
+            started = time.perf_counter()
+            self.tick()
+
+            remaining = tick_length - (time.perf_counter() - started)
+            if remaining > 0:
+                time.sleep(remaining)
+
+    def stop(self):
+        self.running = False
+
+    def close(self):
+        """ Disconnect every client and stop listening."""
+
+        for client in list(self.clients.values()):
+            self._disconnect(client)
+
+        self._selector.unregister(self._listener)
+        self._selector.close()
+        self._listener.close()
+
+        if self._game_map is not None:
+            self._map_changes.close()
+            self._game_map = None
+
+    def tick(self):
+        """ Take in any new clients and input, run the game for a tick, and send
+            every client what changed."""
+
+        self.tick_count += 1
+        self._watch_map()
+        self._receive()
+        self._handle_inputs()
+        self._step_game()
+
+        if self._game_map is not None:
+            tiles = self._changed_tile_records()
+        else:
+            tiles = numpy.zeros(0, dtype=protocol.TILE)
+        changed_entities, removed = self._entity_changes()
+
+        # The clients with a view are each sent what they can see, and the rest
+        # are sent one state with everything.
+        states = self._views_changed() if self._interest is not None else {}
+        if states:
+            self._route(states, tiles, changed_entities, removed)
+
+        everything = None
+        for client in list(self.clients.values()):
+            if client.client_id in states:
+                state = self._encode_client_state(states[client.client_id])
+            else:
+                if everything is None:
+                    everything = protocol.encode_state(
+                        self.tick_count,
+                        self._new_palette_entries,
+                        tiles,
+                        self._entity_records(changed_entities),
+                        removed,
+                    )
+                    self.last_state_size = len(everything)
+                state = everything
+
+            client.last_state_size = len(state)
+            self._queue(client, state)
+
+            acknowledgement = (client.acknowledged, client.player_entity)
+            if acknowledgement != client.sent_acknowledgement:
+                client.sent_acknowledgement = acknowledgement
+                self._queue(
+                    client, protocol.encode_ack(self.tick_count, *acknowledgement)
+                )
+
+        self._new_palette_entries = []
+        self._remember_sent_entities()
+        self._send()
+
+    def _watch_map(self):
+        """ Follow the game's active map, sending every client the whole of it
+            whenever it changes."""
+
+        active_map = self.game.active_screen
+        if not isinstance(active_map, Map) or active_map is self._game_map:
+            return
+
+        if self._game_map is not None:
+            self._map_changes.close()
+
+        logging.info(f"Serving a new {active_map.width}x{active_map.height} map.")
+        self._serve_map(active_map)
+
+    def _serve_map(self, active_map):
+        """ Send every client the whole of active_map, and follow its changes."""
+
+        self._game_map = active_map
+        self._tile_ids = numpy.array(
+            [
+                [[self._tile_id(tile) for tile in row] for row in sheet]
+                for sheet in active_map.tile_sheets
+            ],
+            dtype=numpy.int32,
+        ).reshape(len(active_map.tile_sheets), active_map.height, active_map.width)
+        self._map_changes = active_map.journal.subscribe()
+
+        # Every client is sent the whole of the new map, so they all see all of
+        # it until their views are applied to it.
+        self._interest = InterestGrid(
+            active_map.width, active_map.height, self.interest_cell_size
+        )
+
+        self._new_palette_entries.clear()
+        for client in self.clients.values():
+            self._queue(client, self._encode_world(client))
+            client.view_changed = client.view is not None
+
+    def _tile_id(self, tile):
+        if tile is None:
+            return protocol.EMPTY_TILE
+
+        sprite_location = str(tile.sprite_location)
+        tile_id = self._palette.get(sprite_location)
+        if tile_id is None:
+            tile_id = len(self._palette_locations)
+            self._palette[sprite_location] = tile_id
+            self._palette_locations.append(sprite_location)
+            self._new_palette_entries.append((tile_id, sprite_location))
+
+        return tile_id
+
+    def _receive(self):
+        for key, _ in self._selector.select(timeout=0):
+            if key.fileobj is self._listener:
+                self._accept()
+                continue
+
+            client = key.data
+            try:
+                data = client.socket.recv(65536)
+            except BlockingIOError:
+                continue
+            except OSError as e:
+                logging.info(f"Lost client {client.client_id}: {e}")
+                self._disconnect(client)
+                continue
+
+            if not data:
+                logging.info(f"Client {client.client_id} disconnected.")
+                self._disconnect(client)
+                continue
+
+            for message in client.reader.feed(data):
+                kind = protocol.message_kind(message)
+                if kind == protocol.INPUT_MESSAGE:
+                    client.inputs.append(protocol.decode_input(message))
+                elif kind == protocol.VIEW_MESSAGE:
+                    client.view = protocol.decode_view(message)
+                    client.view_changed = True
+                else:
+                    logging.warning(
+                        f"Ignoring a message of kind {message[0]} from client "
+                        f"{client.client_id}."
+                    )
+
+    def _accept(self):
+        while True:
+            try:
+                connection, address = self._listener.accept()
+            except BlockingIOError:
+                return
+
+            connection.setblocking(False)
+            connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            client = ClientConnection(self._next_client_id, connection, address)
+            self._next_client_id += 1
+            self.clients[client.client_id] = client
+            self._selector.register(connection, selectors.EVENT_READ, client)
+            logging.info(f"Client {client.client_id} joined from {address}.")
+
+            if self.spawn is not None:
+                client.player = self.spawn(self.game, client.client_id)
+
+            if self._game_map is not None:
+                self._queue(client, self._encode_world(client))
+
+    def _disconnect(self, client):
+        self.clients.pop(client.client_id, None)
+        if self._interest is not None:
+            self._interest.unsubscribe(client.client_id)
+
+        try:
+            self._selector.unregister(client.socket)
+        except (KeyError, ValueError):
+            pass
+        client.socket.close()
+
+        if self.leave is not None:
+            self.leave(self.game, client.client_id, client.player)
+
+    def _handle_inputs(self):
+        for client in list(self.clients.values()):
+            inputs = client.inputs[: self.max_inputs_per_tick]
+            del client.inputs[: self.max_inputs_per_tick]
+
+            for sequence, pressed_keys in inputs:
+                if client.player is not None and pressed_keys:
+                    client.player.player_interaction(pressed_keys, self.game)
+                client.acknowledged = sequence
+
+    def _step_game(self):
+        """ Run everything the engine runs each frame, other than drawing."""
+
+        game = self.game
+        if game.world_simulation is not None:
+            game.world_simulation.update(game.active_screen)
+
+        if game.active_menu is None:
+            for system in game.systems:
+                game.entities.run(system, game)
+
+            game.scheduler.tick(game)
+
+    def _encode_world(self, client):
+        store = self.game.entities
+        entities = store.entities()
+
+        return protocol.encode_world(
+            self.tick_count,
+            client.client_id,
+            self._tile_ids,
+            self._palette_locations,
+            self._entity_records(entities),
+        )
+
+    def _changed_tile_records(self):
+        try:
+            changed = sorted(self._map_changes.changed_tiles())
+        except MapJournal.ChangesDiscardedException:
+            logging.warning("Lost track of the map's changes, sending it again.")
+            self._serve_map(self._game_map)
+            changed = []
+
+        tile_sheets = self._game_map.tile_sheets
+        for sheet, x, y in changed:
+            self._tile_ids[sheet, y, x] = self._tile_id(tile_sheets[sheet][y][x])
+
+        tiles = numpy.zeros(len(changed), dtype=protocol.TILE)
+        if changed:
+            sheets, xs, ys = numpy.array(changed).T
+            tiles["sheet"] = sheets
+            tiles["x"] = xs
+            tiles["y"] = ys
+            tiles["tile"] = self._tile_ids[sheets, ys, xs]
+
+        return tiles
+
+    def _entity_changes(self):
+        """ Return the entities which changed since the last tick was sent, and
+            those which were removed."""
+
+        store = self.game.entities
+        if len(self._sent_alive) < store.capacity:
+            added = store.capacity - len(self._sent_alive)
+            self._sent_alive = numpy.concatenate(
+                [self._sent_alive, numpy.zeros(added, dtype=bool)]
+            )
+            self._sent_position = numpy.concatenate(
+                [self._sent_position, numpy.zeros((added, 2), dtype=numpy.int32)]
+            )
+            self._sent_facing = numpy.concatenate(
+                [self._sent_facing, numpy.zeros(added, dtype=numpy.int8)]
+            )
+
+        changed = store.alive & (
+            ~self._sent_alive
+            | (store.position != self._sent_position).any(axis=1)
+            | (store.facing != self._sent_facing)
+        )
+        removed = numpy.flatnonzero(self._sent_alive & ~store.alive)
+
+        return numpy.flatnonzero(changed), removed
+
+    def _remember_sent_entities(self):
+        store = self.game.entities
+        self._sent_alive = store.alive.copy()
+        self._sent_position = store.position.copy()
+        self._sent_facing = store.facing.copy()
+
+    def _views_changed(self):
+        """ Subscribe the clients whose views changed to their new views, and start
+            a state for each client with a view.
+
+            A client knows of the entities which were in its view as they were
+            last sent, so moving the view sends it the entities it now sees and
+            removes those it no longer does, along with the tiles it now sees.
+
+            Returns:
+                A dictionary of client id to the client's state, as a list of tile
+                record arrays, and a dictionary of entity to whether it is to be
+                sent (True) or removed (False.)"""
+
+        states = {}
+        for client in self.clients.values():
+            if client.view_changed:
+                client.view_changed = False
+                states[client.client_id] = self._move_view(client)
+            elif client.client_id in self._interest:
+                states[client.client_id] = ([], {})
+
+        return states
+
+    def _move_view(self, client):
+        interest = self._interest
+        old_area = interest.area(client.client_id)
+        if old_area is None:
+            old_area = (0, 0, interest.width, interest.height)
+
+        x, y, width, height = client.view
+        margin = self.interest_margin
+        new_area = interest.subscribe(
+            client.client_id,
+            x - margin,
+            y - margin,
+            width + margin * 2,
+            height + margin * 2,
+        )
+
+        # The tiles in the new area which weren't in the old one.
+        left, top, right, bottom = new_area
+        exposed = numpy.ones((max(0, bottom - top), max(0, right - left)), dtype=bool)
+        old_left, old_top, old_right, old_bottom = old_area
+        exposed[
+            max(0, old_top - top) : max(0, old_bottom - top),
+            max(0, old_left - left) : max(0, old_right - left),
+        ] = False
+        ys, xs = numpy.nonzero(exposed)
+
+        sheets = len(self._tile_ids)
+        tiles = numpy.zeros(len(xs) * sheets, dtype=protocol.TILE)
+        tiles["sheet"] = numpy.repeat(numpy.arange(sheets), len(xs))
+        tiles["x"] = numpy.tile(xs + left, sheets)
+        tiles["y"] = numpy.tile(ys + top, sheets)
+        tiles["tile"] = self._tile_ids[tiles["sheet"], tiles["y"], tiles["x"]]
+
+        entities = {}
+        was_seen = self._sent_alive & self._in_area(self._sent_position, old_area)
+        is_seen = self._sent_alive & self._in_area(self._sent_position, new_area)
+        for entity in numpy.flatnonzero(is_seen & ~was_seen).tolist():
+            entities[entity] = True
+        for entity in numpy.flatnonzero(was_seen & ~is_seen).tolist():
+            entities[entity] = False
+
+        return [tiles], entities
+
+    @staticmethod
+    def _in_area(positions, area):
+        left, top, right, bottom = area
+        xs = positions[:, 0]
+        ys = positions[:, 1]
+        return (left <= xs) & (xs < right) & (top <= ys) & (ys < bottom)
+
+    def _route(self, states, tiles, changed_entities, removed):
+        """ Add each change to the states of the clients with views which see
+            it."""
+
+        interest = self._interest
+        routed_tiles = {client_id: [] for client_id in states}
+        for index, (_, x, y) in enumerate(tiles[["sheet", "x", "y"]].tolist()):
+            for client_id in interest.interested(x, y):
+                routed_tiles[client_id].append(index)
+
+        for client_id, indices in routed_tiles.items():
+            if indices:
+                states[client_id][0].append(tiles[indices])
+
+        # An entity which moved is sent to the clients which see where it is now,
+        # and removed from those which only saw where it was.
+        position = self.game.entities.position
+        for entity in changed_entities.tolist():
+            seeing = interest.interested(*position[entity].tolist())
+            for client_id in seeing:
+                states[client_id][1][entity] = True
+
+            if self._sent_alive[entity]:
+                for client_id in interest.interested(
+                    *self._sent_position[entity].tolist()
+                ):
+                    if client_id not in seeing:
+                        states[client_id][1][entity] = False
+
+        for entity in removed.tolist():
+            for client_id in interest.interested(*self._sent_position[entity].tolist()):
+                states[client_id][1][entity] = False
+
+    def _encode_client_state(self, state):
+        tile_records, entities = state
+        if tile_records:
+            tiles = numpy.concatenate(tile_records)
+        else:
+            tiles = numpy.zeros(0, dtype=protocol.TILE)
+
+        return protocol.encode_state(
+            self.tick_count,
+            self._new_palette_entries,
+            tiles,
+            self._entity_records(
+                numpy.array(
+                    [entity for entity, sent in entities.items() if sent],
+                    dtype=numpy.int64,
+                )
+            ),
+            [entity for entity, sent in entities.items() if not sent],
+        )
+
+    def _entity_records(self, entities):
+        store = self.game.entities
+        records = numpy.zeros(len(entities), dtype=protocol.ENTITY)
+        records["entity"] = entities
+        records["x"] = store.position[entities, 0]
+        records["y"] = store.position[entities, 1]
+        records["facing"] = store.facing[entities]
+
+        return records
+
+    def _queue(self, client, payload):
+        client.outgoing += protocol.frame(payload)
+
+    def _send(self):
+        for client in list(self.clients.values()):
+            if not client.outgoing:
+                continue
+
+            try:
+                sent = client.socket.send(client.outgoing)
+            except BlockingIOError:
+                sent = 0
+            except OSError as e:
+                logging.info(f"Lost client {client.client_id}: {e}")
+                self._disconnect(client)
+                continue
+
+            del client.outgoing[:sent]
+            self.bytes_sent += sent
+
+            if len(client.outgoing) > self.MAX_OUTGOING_BYTES:
+                logging.warning(
+                    f"Disconnecting client {client.client_id}, which has fallen "
+                    f"{len(client.outgoing)} bytes behind."
+                )
+                self._disconnect(client)
@@ -0,0 +1,148 @@
+""" A precomputed grid of which tiles of a map can be moved onto, so that movement
+    and pathfinding don't need to look through the map's sheets."""
+
+
+class PassabilityGrid:
+    """ A bitmap of the passable tiles of a map.
+
+        A tile is passable if there is nothing on it in either the foreground sheet
+        (which is always impassable) or the character sheet (as two characters can't
+        stand on the same tile.) The grid is built once, then kept up to date region
+        by region as the map tells it about changes."""
+
+    def __init__(self, game_map, cells: bytes = None):
+        """ Args:
+                game_map(Map): The map to build the grid for. The grid registers
+                               itself as a region listener of the map.
+                cells(bytes): The grid's cells (see below) if they are already
+                              known, ie from a compiled map, so the map's sheets
+                              don't need to be looked through."""
+        self.game_map = game_map
+        self.width = game_map.width
+        self.height = game_map.height
+
+        # One byte per tile, 1 if the tile is passable and 0 if it isn't, stored
+        # row by row.
+        if cells is not None:
+            if len(cells) != self.width * self.height:
+                raise ValueError(
+                    f"Got {len(cells)} passability cells for a {self.width}x"
+                    f"{self.height} map."
+                )
+            self.cells = bytearray(cells)
+        else:
+            self.cells = bytearray(self.width * self.height)
+            self._build()
+
+        game_map.register_region_listener(self.update_region)
+
+    def _build(self):
+        foreground_sheet = self.game_map.foreground_sheet
+        character_sheet = self.game_map.character_sheet
+        for y in range(self.height):
+            foreground_row = foreground_sheet[y]
+            character_row = character_sheet[y]
+            row_start = y * self.width
+
+            for x in range(self.width):
+                if foreground_row[x] is None and character_row[x] is None:
+                    self.cells[row_start + x] = 1
+
+    def is_passable(self, x, y):
+        """ Return True if x,y is on the map and can be moved onto."""
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return self.cells[y * self.width + x] == 1
+
+        return False
+
+    def update_tile(self, sheet, x, y):
+        """ Recheck the tile at x,y. The signature matches a Map tile listener."""
+
+        if sheet not in (
+            self.game_map.FOREGROUND_SHEET_INDEX,
+            self.game_map.CHARACTER_SHEET_INDEX,
+        ):
+            return
+
+        passable = (
+            self.game_map.foreground_sheet[y][x] is None
+            and self.game_map.character_sheet[y][x] is None
+        )
+        self.cells[y * self.width + x] = 1 if passable else 0
+
+    def update_region(self, region):
+        """ Recheck every tile of a TileRegion. Registered as a region listener
+            of the map."""
+
+        if not region.sheets & {
+            self.game_map.FOREGROUND_SHEET_INDEX,
+            self.game_map.CHARACTER_SHEET_INDEX,
+        }:
+            return
+
+        left = region.x
+        right = region.x + region.width
+        for y in range(region.y, region.y + region.height):
+            foreground_row = self.game_map.foreground_sheet[y]
+            character_row = self.game_map.character_sheet[y]
+            row_start = y * self.width
+
+            self.cells[row_start + left : row_start + right] = bytes(
+                foreground_row[x] is None and character_row[x] is None
+                for x in range(left, right)
+            )
+
+    def passable_positions(self, positions):
+        """ Return which of an iterable of x,y tuples are passable, in order."""
+
+        width = self.width
+        height = self.height
+        cells = self.cells
+
+        return [
+            (x, y)
+            for x, y in positions
+            if 0 <= x < width and 0 <= y < height and cells[y * width + x]
+        ]
+
+    def region(self, left, top, width, height):
+        """ Return the passability of a rectangle of the map as a list of rows of
+            booleans. Anything outside of the map is impassable."""
+
+        rows = []
+        for y in range(top, top + height):
+            if not 0 <= y < self.height:
+                rows.append([False] * width)
+                continue
+
+            row_start = y * self.width
+            rows.append(
+                [
+                    0 <= x < self.width and self.cells[row_start + x] == 1
+                    for x in range(left, left + width)
+                ]
+            )
+
+        return rows
+
+    def neighbours(self, x, y, diagonal=False):
+        """ Return the passable tiles next to x,y. Diagonal neighbours are only
+            included if diagonal is True, and both of the tiles either side of the
+            diagonal are passable too (no cutting corners.)"""
+
+        neighbours = [
+            (x + step_x, y + step_y)
+            for step_x, step_y in ((0, -1), (1, 0), (0, 1), (-1, 0))
+            if self.is_passable(x + step_x, y + step_y)
+        ]
+
+        if diagonal:
+            neighbours += [
+                (x + step_x, y + step_y)
+                for step_x, step_y in ((1, -1), (1, 1), (-1, 1), (-1, -1))
+                if self.is_passable(x + step_x, y + step_y)
+                and self.is_passable(x + step_x, y)
+                and self.is_passable(x, y + step_y)
+            ]
+
+        return neighbours
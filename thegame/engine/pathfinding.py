@@ -0,0 +1,594 @@
+""" Pathfinding over a map's passability grid, for NPCs and click-to-move."""
+import logging
+import math
+import os
+import time
+from collections import OrderedDict
+from heapq import heappop, heappush
+from multiprocessing import Pool
+
+from .map import Map
+
+DIAGONAL_COST = math.sqrt(2)
+
+STRAIGHT_STEPS = ((0, -1), (1, 0), (0, 1), (-1, 0))
+DIAGONAL_STEPS = ((1, -1), (1, 1), (-1, 1), (-1, -1))
+
+# The furthest Jump Point Search jumps in one go. See GridSearch.
+MAX_JUMP = 16
+
+
+class GridSearch:
+    """ A* and Jump Point Search over a flat grid of passable tiles.
+
+        This holds nothing but the grid itself, so it can be pickled and sent to
+        worker processes. Start and goal tiles are always treated as passable, as
+        they're usually occupied by whoever is looking for the path and whatever
+        they're looking for."""
+
+    def __init__(
+        self, width, height, passable, costs=None, diagonal=False, max_jump=MAX_JUMP
+    ):
+        """ Args:
+                width(int): The width of the grid in tiles.
+                height(int): The height of the grid in tiles.
+                passable: A bytes-like of width * height values, row by row, where
+                          a non-zero value is a passable tile.
+                costs: A list of the cost of moving onto each tile, in the same
+                       order as passable. None if every tile costs 1.
+                diagonal(bool): If True, diagonal steps are allowed as long as they
+                                don't cut the corner of an impassable tile.
+                max_jump(int): The furthest a jump goes before stopping at a jump
+                               point anyway. Unbounded jumps scan to the edge of
+                               open maps at every diagonal step. None for no
+                               limit."""
+        self.width = width
+        self.height = height
+        self.passable = passable
+        self.costs = costs
+        self.diagonal = diagonal
+        self.max_jump = max_jump
+
+        self.min_cost = min(costs) if costs else 1
+
+        # The number of tiles the last search expanded.
+        self.expanded = 0
+
+    def find_path(self, start, goal):
+        """ Return a list of x,y tuples from start to goal (both included), or None
+            if there is no way from one to the other.
+
+            Uniform cost grids with diagonal movement use Jump Point Search, which
+            skips over open areas rather than expanding every tile in them."""
+
+        self._start = start
+        self._goal = goal
+
+        if not (self._on_grid(*start) and self._on_grid(*goal)):
+            return None
+
+        if start == goal:
+            return [start]
+
+        if self.diagonal and self.costs is None:
+            return self._jump_point_search(start, goal)
+
+        return self._a_star(start, goal)
+
+    def _on_grid(self, x, y):
+        return 0 <= x < self.width and 0 <= y < self.height
+
+    def _walkable(self, x, y):
+        if 0 <= x < self.width and 0 <= y < self.height:
+            return (
+                self.passable[y * self.width + x] != 0
+                or (x, y) == self._goal
+                or (x, y) == self._start
+            )
+
+        return False
+
+    def _heuristic(self, x, y):
+        distance_x = abs(x - self._goal[0])
+        distance_y = abs(y - self._goal[1])
+
+        if self.diagonal:
+            # Octile distance.
+            distance = max(distance_x, distance_y) + (DIAGONAL_COST - 1) * min(
+                distance_x, distance_y
+            )
+        else:
+            distance = distance_x + distance_y
+
+        return distance * self.min_cost
+
+    def _steps(self, x, y):
+        """ Yield each x, y and step length that can be moved to from x,y."""
+
+        walkable = self._walkable
+
+        for step_x, step_y in STRAIGHT_STEPS:
+            if walkable(x + step_x, y + step_y):
+                yield x + step_x, y + step_y, 1
+
+        if self.diagonal:
+            for step_x, step_y in DIAGONAL_STEPS:
+                if (
+                    walkable(x + step_x, y + step_y)
+                    and walkable(x + step_x, y)
+                    and walkable(x, y + step_y)
+                ):
+                    yield x + step_x, y + step_y, DIAGONAL_COST
+
+    def _a_star(self, start, goal):
+        width = self.width
+        costs = self.costs
+
+        start_index = start[1] * width + start[0]
+        goal_index = goal[1] * width + goal[0]
+
+        open_heap = [(self._heuristic(*start), 0, start_index)]
+        best_costs = {start_index: 0}
+        parents = {start_index: None}
+        closed = set()
+        self.expanded = 0
+
+        while open_heap:
+            _, cost, index = heappop(open_heap)
+
+            if index == goal_index:
+                return self._build_path(parents, index)
+
+            if index in closed:
+                continue
+
+            closed.add(index)
+            self.expanded += 1
+            x = index % width
+            y = index // width
+
+            for next_x, next_y, step in self._steps(x, y):
+                next_index = next_y * width + next_x
+                next_cost = cost + step * (costs[next_index] if costs else 1)
+
+                if next_cost < best_costs.get(next_index, math.inf):
+                    best_costs[next_index] = next_cost
+                    parents[next_index] = index
+                    estimate = next_cost + self._heuristic(next_x, next_y)
+                    heappush(open_heap, (estimate, next_cost, next_index))
+
+        return None
+
+    def _build_path(self, parents, index):
+        width = self.width
+        path = []
+
+        while index is not None:
+            path.append((index % width, index // width))
+            index = parents[index]
+
+        path.reverse()
+        return path
+
+    def _jump_point_search(self, start, goal):
+        open_heap = [(self._heuristic(*start), 0, start)]
+        best_costs = {start: 0}
+        parents = {start: None}
+        closed = set()
+        self.expanded = 0
+
+        while open_heap:
+            _, cost, node = heappop(open_heap)
+
+            if node == goal:
+                return self._expand_jump_points(parents, node)
+
+            if node in closed:
+                continue
+
+            closed.add(node)
+            self.expanded += 1
+
+            for neighbour in self._pruned_neighbours(node, parents[node]):
+                jump_point = self._jump(
+                    neighbour[0],
+                    neighbour[1],
+                    neighbour[0] - node[0],
+                    neighbour[1] - node[1],
+                )
+                if jump_point is None or jump_point in closed:
+                    continue
+
+                distance_x = abs(jump_point[0] - node[0])
+                distance_y = abs(jump_point[1] - node[1])
+                next_cost = (
+                    cost
+                    + max(distance_x, distance_y)
+                    + (DIAGONAL_COST - 1) * min(distance_x, distance_y)
+                )
+
+                if next_cost < best_costs.get(jump_point, math.inf):
+                    best_costs[jump_point] = next_cost
+                    parents[jump_point] = node
+                    estimate = next_cost + self._heuristic(*jump_point)
+                    heappush(open_heap, (estimate, next_cost, jump_point))
+
+        return None
+
+    def _pruned_neighbours(self, node, parent):
+        """ Return the neighbours of node worth jumping towards, given the
+            direction it was reached from."""
+
+        x, y = node
+        if parent is None:
+            return [(next_x, next_y) for next_x, next_y, _ in self._steps(x, y)]
+
+        walkable = self._walkable
+        direction_x = (x > parent[0]) - (x < parent[0])
+        direction_y = (y > parent[1]) - (y < parent[1])
+        neighbours = []
+
+        if direction_x and direction_y:
+            vertical = walkable(x, y + direction_y)
+            horizontal = walkable(x + direction_x, y)
+
+            if vertical:
+                neighbours.append((x, y + direction_y))
+            if horizontal:
+                neighbours.append((x + direction_x, y))
+            if vertical and horizontal and walkable(x + direction_x, y + direction_y):
+                neighbours.append((x + direction_x, y + direction_y))
+
+        elif direction_x:
+            ahead = walkable(x + direction_x, y)
+            below = walkable(x, y + 1)
+            above = walkable(x, y - 1)
+
+            if ahead:
+                neighbours.append((x + direction_x, y))
+                if below and walkable(x + direction_x, y + 1):
+                    neighbours.append((x + direction_x, y + 1))
+                if above and walkable(x + direction_x, y - 1):
+                    neighbours.append((x + direction_x, y - 1))
+            if below:
+                neighbours.append((x, y + 1))
+            if above:
+                neighbours.append((x, y - 1))
+
+        else:
+            ahead = walkable(x, y + direction_y)
+            right = walkable(x + 1, y)
+            left = walkable(x - 1, y)
+
+            if ahead:
+                neighbours.append((x, y + direction_y))
+                if right and walkable(x + 1, y + direction_y):
+                    neighbours.append((x + 1, y + direction_y))
+                if left and walkable(x - 1, y + direction_y):
+                    neighbours.append((x - 1, y + direction_y))
+            if right:
+                neighbours.append((x + 1, y))
+            if left:
+                neighbours.append((x - 1, y))
+
+        return neighbours
+
+    def _jump(self, x, y, direction_x, direction_y):
+        """ Move from x,y in the given direction until reaching the goal, a tile
+            with a forced neighbour (a jump point), or a dead end (None.) A jump
+            which gets max_jump tiles without finding either stops there, as if it
+            had found a jump point, so the searches from a diagonal jump's tiles
+            don't each run to the edge of an open map.
+
+            This is done in a loop rather than recursively so that long jumps
+            across big maps can't hit the recursion limit."""
+
+        walkable = self._walkable
+        goal = self._goal
+        distance = 0
+
+        while True:
+            if not walkable(x, y):
+                return None
+
+            if (x, y) == goal or distance == self.max_jump:
+                return x, y
+
+            if direction_x and direction_y:
+                # A diagonal move stops wherever a straight jump from it would
+                # find something.
+                if (
+                    self._jump(x + direction_x, y, direction_x, 0) is not None
+                    or self._jump(x, y + direction_y, 0, direction_y) is not None
+                ):
+                    return x, y
+
+                if not (walkable(x + direction_x, y) and walkable(x, y + direction_y)):
+                    return None
+
+            elif direction_x:
+                if (walkable(x, y - 1) and not walkable(x - direction_x, y - 1)) or (
+                    walkable(x, y + 1) and not walkable(x - direction_x, y + 1)
+                ):
+                    return x, y
+
+            else:
+                if (walkable(x - 1, y) and not walkable(x - 1, y - direction_y)) or (
+                    walkable(x + 1, y) and not walkable(x + 1, y - direction_y)
+                ):
+                    return x, y
+
+            x += direction_x
+            y += direction_y
+            distance += 1
+
+    @staticmethod
+    def _expand_jump_points(parents, node):
+        """ Fill in every tile between the jump points of a path."""
+
+        jump_points = []
+        while node is not None:
+            jump_points.append(node)
+            node = parents[node]
+        jump_points.reverse()
+
+        path = [jump_points[0]]
+        for (x, y), (next_x, next_y) in zip(jump_points, jump_points[1:]):
+            step_x = (next_x > x) - (next_x < x)
+            step_y = (next_y > y) - (next_y < y)
+
+            while (x, y) != (next_x, next_y):
+                x += step_x
+                y += step_y
+                path.append((x, y))
+
+        return path
+
+
+def _find_paths_worker(grid_search, requests):
+    """ Find the path for each (start, goal) in requests in a worker process."""
+    return [grid_search.find_path(start, goal) for start, goal in requests]
+
+
+class Pathfinder:
+    """ Finds paths across a map, remembering them until the map changes.
+
+        Paths are cached by their start and goal, until the passability of a tile
+        (or the cost of moving onto it) changes, so asking for the same path again
+        is free until then. Changes to tiles which don't block the way or cost
+        anything, ie the background, keep the cache. Moving onto a tile with
+        something on its path sheet costs path_cost, and any other tile costs
+        terrain_cost, letting NPCs prefer to stick to paths."""
+
+    def __init__(
+        self,
+        game_map: Map,
+        diagonal: bool = False,
+        path_cost: float = 1,
+        terrain_cost: float = 1,
+        cache_size: int = 4096,
+        clock=time.perf_counter,
+    ):
+        """ Args:
+                game_map(Map): The map to find paths on.
+                diagonal(bool): If True, paths can move diagonally as long as they
+                                don't cut the corner of an impassable tile.
+                path_cost(float): The cost of moving onto a tile on a path.
+                terrain_cost(float): The cost of moving onto any other tile.
+                cache_size(int): The most paths to remember.
+                clock: A callable returning the current time in seconds, for
+                       find_paths()'s frame budget."""
+        self.game_map = game_map
+        self.diagonal = diagonal
+        self.path_cost = path_cost
+        self.terrain_cost = terrain_cost
+        self.cache_size = cache_size
+        self.clock = clock
+
+        self._costs = None
+        if path_cost != terrain_cost:
+            self._costs = [
+                path_cost if tile is not None else terrain_cost
+                for row in game_map.path_sheet
+                for tile in row
+            ]
+
+        # Bumped whenever a tile's passability or cost changes. Cached paths are
+        # only used while it's the same as when they were found.
+        self._grid_version = 0
+
+        self._cache = OrderedDict()
+        self._cache_version = self._grid_version
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+        # The (start, goal) of the paths find_paths() ran out of time for, to find
+        # first on its next call.
+        self.pending = []
+
+        # Kept between calls to find_paths(), as starting the worker processes
+        # costs more than finding most batches of paths.
+        self._pool = None
+        self._pool_processes = None
+
+        game_map.register_tile_listener(self._tile_changed)
+
+    @property
+    def grid_search(self):
+        """ A GridSearch over the map as it currently is."""
+        passability = self.game_map.passability
+
+        return GridSearch(
+            passability.width,
+            passability.height,
+            passability.cells,
+            self._costs,
+            self.diagonal,
+        )
+
+    def find_path(self, start, goal):
+        """ Return a list of x,y tuples from start to goal (both included), or None
+            if the goal can't be reached."""
+
+        cached, path = self._cached_path(start, goal)
+        if cached:
+            return path
+
+        path = self.grid_search.find_path(start, goal)
+        self._cache_path(start, goal, path)
+
+        return path
+
+    def find_paths(self, requests=(), processes: int = None, frame_budget=None):
+        """ Find many paths at once, spread across a pool of worker processes.
+
+            Any requests left pending by an earlier call are found first.
+
+            Args:
+                requests: An iterable of (start, goal) tuples.
+                processes(int): The number of worker processes to use. None uses one
+                                per CPU, and 1 finds the paths in this process.
+                frame_budget(float): If given, the most seconds to spend, finding
+                                     the paths in this process one at a time. At
+                                     least one path is always found. The requests
+                                     there isn't time for are kept in pending, so
+                                     calling this every tick (with no requests
+                                     once they've all been made) spreads them
+                                     across frames.
+
+            Returns:
+                A dictionary of each (start, goal) found to its path (or None.)"""
+
+        results = {}
+        missing = []
+
+        requests = self.pending + list(requests)
+        self.pending = []
+
+        for start, goal in requests:
+            cached, path = self._cached_path(start, goal)
+            if cached:
+                results[(start, goal)] = path
+            elif (start, goal) not in results:
+                results[(start, goal)] = None
+                missing.append((start, goal))
+
+        if not missing:
+            return results
+
+        grid_search = self.grid_search
+        if frame_budget is not None:
+            paths = self._find_within_budget(grid_search, missing, frame_budget)
+            for request in missing[len(paths) :]:
+                del results[request]
+                self.pending.append(request)
+        elif processes == 1 or len(missing) == 1:
+            paths = [grid_search.find_path(start, goal) for start, goal in missing]
+        else:
+            paths = self._find_in_pool(grid_search, missing, processes)
+
+        logging.debug(
+            f"Found {len(paths)} paths ({len(results)} requested, "
+            f"{len(self.pending)} left pending)."
+        )
+
+        for (start, goal), path in zip(missing, paths):
+            results[(start, goal)] = path
+            self._cache_path(start, goal, path)
+
+        return results
+
+    def clear_cache(self):
+        self._cache.clear()
+
+    def close(self):
+        """ Stop following changes to the map and shut down the worker processes,
+            once the pathfinder is no longer used."""
+
+        self.game_map.deregister_tile_listener(self._tile_changed)
+
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
+
+    def _find_within_budget(self, grid_search, requests, frame_budget):
+        """ Return the paths of as many of requests as can be found, in order,
+            within frame_budget seconds."""
+
+        deadline = self.clock() + frame_budget
+        paths = []
+
+        for start, goal in requests:
+            if paths and self.clock() >= deadline:
+                break
+
+            paths.append(grid_search.find_path(start, goal))
+
+        return paths
+
+    def _find_in_pool(self, grid_search, requests, processes):
+        processes = processes or os.cpu_count() or 1
+        if self._pool is not None and self._pool_processes != processes:
+            self._pool.terminate()
+            self._pool = None
+
+        if self._pool is None:
+            self._pool = Pool(processes=processes)
+            self._pool_processes = processes
+
+        # The grid is sent to the workers once per batch of requests, rather than
+        # once per request.
+        batch_size = -(-len(requests) // processes)
+        batches = [
+            requests[index : index + batch_size]
+            for index in range(0, len(requests), batch_size)
+        ]
+
+        return [
+            path
+            for batch_paths in self._pool.starmap(
+                _find_paths_worker, [(grid_search, batch) for batch in batches]
+            )
+            for path in batch_paths
+        ]
+
+    def _cached_path(self, start, goal):
+        """ Return a tuple of whether the path was cached, and the path."""
+
+        # Every cached path was found on the grid as it was, so once a tile's
+        # passability or cost has changed none of them can be used again.
+        if self._cache_version != self._grid_version:
+            self._cache.clear()
+            self._cache_version = self._grid_version
+
+        key = (start, goal)
+        if key in self._cache:
+            self.cache_hits += 1
+            self._cache.move_to_end(key)
+            return True, self._cache[key]
+
+        self.cache_misses += 1
+        return False, None
+
+    def _cache_path(self, start, goal, path):
+        self._cache[(start, goal)] = path
+
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def _tile_changed(self, sheet, x, y):
+        """ Keep the cost of x,y up to date, and note any change to the grid paths
+            are found on. Registered as a tile listener."""
+
+        if sheet in (
+            self.game_map.FOREGROUND_SHEET_INDEX,
+            self.game_map.CHARACTER_SHEET_INDEX,
+        ):
+            self._grid_version += 1
+
+        elif sheet == self.game_map.PATH_SHEET_INDEX and self._costs is not None:
+            tile = self.game_map.path_sheet[y][x]
+            self._costs[y * self.game_map.width + x] = (
+                self.path_cost if tile is not None else self.terrain_cost
+            )
+            self._grid_version += 1
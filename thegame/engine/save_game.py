@@ -0,0 +1,600 @@
+""" Saving and loading games as compact binary snapshots, with autosaves written
+    as deltas in a background thread so they never hold up a frame."""
+import copy
+import logging
+import os
+import pickle
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy
+
+from .map import Map
+from .map_journal import MapJournal
+
+SAVE_MAGIC = b"TGSV"
+FORMAT_VERSION = 1
+
+FULL_SNAPSHOT = 0
+DELTA_SNAPSHOT = 1
+
+# The kinds of record a save file is made of.
+META_RECORD = 0
+PALETTE_RECORD = 1
+TILES_RECORD = 2
+ENTITIES_RECORD = 3
+
+# The id of an empty tile in a chunk of tile ids.
+EMPTY_TILE = -1
+
+HEADER = struct.Struct("<4sHBII")
+INDEX_ENTRY = struct.Struct("<BHiiQI")
+FOOTER = struct.Struct("<QI4s")
+
+
+def snapshot_file_name(snapshot_id: int, kind: int = FULL_SNAPSHOT):
+    prefix = "snapshot" if kind == FULL_SNAPSHOT else "delta"
+    return f"{prefix}-{snapshot_id:06d}.sav"
+
+
+class SaveManager:
+    """ Saves a game's maps, entities, warp zones and active screen.
+
+        Each map's tiles are saved as chunks of tile ids, chunk_size tiles square,
+        along with a palette of the distinct objects the ids stand for. A full
+        snapshot holds every chunk. A delta holds only the chunks which have
+        changed since the last full snapshot (found by reading each map's journal),
+        and is loaded by reading every other chunk from that snapshot.
+
+        Saving copies what it needs from the game on the calling thread, which
+        for a delta is just the changed chunks and the entity columns, with each
+        object replaced by a copy of its state. Turning the copy into tile ids,
+        compressing it and writing it out is then done in a background thread,
+        one save at a time, which never touches the game's own objects."""
+
+    def __init__(self, game, directory: str, chunk_size: int = 32):
+        """ Args:
+                game(BaseGame): The game to save.
+                directory(str): The directory to write save files to.
+                chunk_size(int): The width and height, in tiles, of each chunk."""
+        self.game = game
+        self.directory = directory
+        self.chunk_size = chunk_size
+
+        # The id of the last save written, and of the last full snapshot.
+        self.snapshot_id = 0
+        self.full_snapshot_id = None
+
+        # The chunks of each map changed since the last full snapshot, keyed by
+        # map name, along with the map and a cursor of its journal.
+        self._tracked_maps = {}
+
+        # The names of the maps in the last full snapshot.
+        self._snapshot_maps = set()
+
+        self._writer = ThreadPoolExecutor(max_workers=1)
+        self._pending = []
+
+    def save(self, full: bool = False):
+        """ Save the game, as a delta if there's a full snapshot to base it on.
+
+            Args:
+                full(bool): Write a full snapshot even if a delta could be written.
+
+            Returns:
+                A Future of the path of the save file, done once it's written."""
+
+        full = full or self.full_snapshot_id is None
+        self.snapshot_id += 1
+        kind = FULL_SNAPSHOT if full else DELTA_SNAPSHOT
+        base_id = self.snapshot_id if full else self.full_snapshot_id
+
+        capture = self._capture(full)
+        if full:
+            self.full_snapshot_id = self.snapshot_id
+
+        path = os.path.join(self.directory, snapshot_file_name(self.snapshot_id, kind))
+        future = self._writer.submit(
+            _write_snapshot, path, kind, self.snapshot_id, base_id, capture
+        )
+
+        self._pending = [pending for pending in self._pending if not pending.done()]
+        self._pending.append(future)
+        return future
+
+    def wait(self):
+        """ Block until every save started so far has been written."""
+
+        for future in self._pending:
+            future.result()
+        self._pending.clear()
+
+    def close(self):
+        """ Finish writing any saves in progress, and stop tracking the maps. Raises
+            the exception of a save which failed, once the maps are untracked."""
+
+        self._writer.shutdown(wait=True)
+        try:
+            self.wait()
+        finally:
+            for _, cursor, _ in self._tracked_maps.values():
+                cursor.close()
+            self._tracked_maps.clear()
+
+    def _capture(self, full):
+        """ Copy everything the save needs out of the game, so the game can carry
+            on while it's written."""
+
+        maps = []
+        map_names = {}
+
+        # The captured state of each object seen so far, by id, as most objects
+        # are on many tiles.
+        states = {}
+
+        for name, game_map in self.game.maps.items():
+            map_names[id(game_map)] = name
+            tracked = self._tracked_maps.get(name)
+            if tracked is None or tracked[0] is not game_map:
+                self._track(name, game_map)
+                tracked = self._tracked_maps[name]
+
+            # A map not in the last full snapshot is saved whole, as is one with
+            # changes discarded before they were read.
+            _, cursor, changed = tracked
+            try:
+                changed.update(
+                    (x // self.chunk_size, y // self.chunk_size)
+                    for _, x, y in cursor.changed_tiles()
+                )
+            except MapJournal.ChangesDiscardedException:
+                logging.info(f"Lost track of the changes to {name}, saving it whole.")
+                self._snapshot_maps.discard(name)
+
+            if full or name not in self._snapshot_maps:
+                chunks = self._all_chunks(game_map)
+            else:
+                chunks = sorted(changed)
+
+            maps.append(
+                (
+                    name,
+                    game_map.width,
+                    game_map.height,
+                    {
+                        chunk: self._copy_chunk(game_map, *chunk, states)
+                        for chunk in chunks
+                    },
+                )
+            )
+
+        if full:
+            for _, _, changed in self._tracked_maps.values():
+                changed.clear()
+            self._snapshot_maps = set(self.game.maps)
+
+        warp_zones = {
+            name: [
+                warp_zone[: Map.WARP_ZONE_LOCATION]
+                + (map_names.get(id(warp_zone[Map.WARP_ZONE_LOCATION])),)
+                + warp_zone[Map.WARP_ZONE_LOCATION + 1 :]
+                for warp_zone in game_map.warp_zones
+            ]
+            for name, game_map in self.game.maps.items()
+        }
+
+        active_screen = self.game.active_screen
+        if isinstance(active_screen, Map):
+            active = ("map", map_names.get(id(active_screen)))
+        else:
+            menu_names = {id(menu): name for name, menu in self.game.menus.items()}
+            active = ("menu", menu_names.get(id(active_screen)))
+
+        return {
+            "chunk_size": self.chunk_size,
+            "maps": maps,
+            "warp_zones": warp_zones,
+            "active": active,
+            "entities": self._capture_entities(active_screen, states),
+        }
+
+    def _capture_entities(self, active_screen, states):
+        store = self.game.entities
+        entities = store.entities()
+
+        on_map = numpy.zeros(len(entities), dtype=bool)
+        objects = [store.objects[entity] for entity in entities.tolist()]
+
+        # Objects standing where their entity is on the active map are saved as
+        # that tile, rather than as an object of their own.
+        if isinstance(active_screen, Map):
+            character_sheet = active_screen.character_sheet
+            for index, (x, y) in enumerate(store.position[entities].tolist()):
+                if (
+                    objects[index] is not None
+                    and 0 <= x < active_screen.width
+                    and 0 <= y < active_screen.height
+                    and character_sheet[y][x] is objects[index]
+                ):
+                    on_map[index] = True
+
+        return {
+            "position": store.position[entities].copy(),
+            "velocity": store.velocity[entities].copy(),
+            "facing": store.facing[entities].copy(),
+            "controlled": store.controlled[entities].copy(),
+            "on_map": on_map,
+            "objects": [_capture_state(game_object, states) for game_object in objects],
+        }
+
+    def _track(self, name, game_map):
+        if name in self._tracked_maps:
+            self._tracked_maps[name][1].close()
+
+        self._snapshot_maps.discard(name)
+        self._tracked_maps[name] = (game_map, game_map.journal.subscribe(), set())
+
+    def _all_chunks(self, game_map):
+        return [
+            (chunk_x, chunk_y)
+            for chunk_y in range(-(-game_map.height // self.chunk_size))
+            for chunk_x in range(-(-game_map.width // self.chunk_size))
+        ]
+
+    def _copy_chunk(self, game_map, chunk_x, chunk_y, states):
+        """ Return a copy of the rows of each sheet within a chunk, of the
+            captured state of each tile (see _capture_state().)"""
+
+        left = chunk_x * self.chunk_size
+        top = chunk_y * self.chunk_size
+        right = left + self.chunk_size
+
+        return [
+            [
+                [_capture_state(tile, states) for tile in row[left:right]]
+                for row in sheet[top : top + self.chunk_size]
+            ]
+            for sheet in game_map.tile_sheets
+        ]
+
+
+def _capture_state(game_object, states):
+    """ Returns:
+            The type and state of game_object, as plain data the save thread can
+            read while the game carries on changing the object (None for no
+            object.) The state is a tuple of its items if they can be hashed, and
+            pickled otherwise, so the capture is also the object's palette key.
+            states remembers the capture of each object already seen, by id."""
+
+    if game_object is None:
+        return None
+
+    captured = states.get(id(game_object))
+    if captured is None:
+        state = game_object.__getstate__()
+        try:
+            captured = (type(game_object), tuple(state.items()))
+            hash(captured)
+        except TypeError:
+            captured = (type(game_object), pickle.dumps(state))
+
+        states[id(game_object)] = captured
+
+    return captured
+
+
+class _Palette:
+    """ Gives each distinct object on the saved maps an id, from their captured
+        states (see _capture_state().)"""
+
+    def __init__(self):
+        self.prototypes = []
+        self._ids_by_state = {}
+
+        # The id of each captured state already seen, by id, to save hashing the
+        # same state for every tile it's on.
+        self._ids_by_capture = {}
+
+    def tile_id(self, captured):
+        if captured is None:
+            return EMPTY_TILE
+
+        tile_id = self._ids_by_capture.get(id(captured))
+        if tile_id is not None:
+            return tile_id
+
+        tile_id = self._ids_by_state.get(captured)
+        if tile_id is None:
+            tile_id = len(self.prototypes)
+            self.prototypes.append(self._prototype(captured))
+            self._ids_by_state[captured] = tile_id
+
+        self._ids_by_capture[id(captured)] = tile_id
+        return tile_id
+
+    @staticmethod
+    def _prototype(captured):
+        """ Returns:
+                A new object of the captured type and state, made the way pickle
+                would make it."""
+
+        object_type, state = captured
+        state = dict(state) if isinstance(state, tuple) else pickle.loads(state)
+
+        prototype = object_type.__new__(object_type)
+        prototype.__dict__.update(state)
+        return prototype
+
+
+def _write_snapshot(path, kind, snapshot_id, base_id, capture):
+    """ Write a captured game to path. Run in the save manager's thread."""
+
+    logging.debug(f"Writing save {path}.")
+
+    palette = _Palette()
+    records = []
+
+    for map_index, (_, width, height, chunks) in enumerate(capture["maps"]):
+        for (chunk_x, chunk_y), sheets in chunks.items():
+            tile_ids = numpy.array(
+                [
+                    [[palette.tile_id(captured) for captured in row] for row in sheet]
+                    for sheet in sheets
+                ],
+                dtype=numpy.int32,
+            )
+            records.append(
+                (TILES_RECORD, map_index, chunk_x, chunk_y, tile_ids.tobytes())
+            )
+
+    entities = capture["entities"]
+    entities["objects"] = numpy.array(
+        [palette.tile_id(captured) for captured in entities["objects"]],
+        dtype=numpy.int32,
+    )
+    records.append((ENTITIES_RECORD, 0, 0, 0, pickle.dumps(entities)))
+
+    meta = {
+        "chunk_size": capture["chunk_size"],
+        "maps": [(name, width, height) for name, width, height, _ in capture["maps"]],
+        "warp_zones": capture["warp_zones"],
+        "active": capture["active"],
+    }
+    records.insert(0, (META_RECORD, 0, 0, 0, pickle.dumps(meta)))
+    records.insert(1, (PALETTE_RECORD, 0, 0, 0, pickle.dumps(palette.prototypes)))
+
+    # Write to a temporary file first, so a save interrupted part way through
+    # never replaces a good one.
+    temporary_path = path + ".tmp"
+    with open(temporary_path, "wb") as save_file:
+        save_file.write(
+            HEADER.pack(SAVE_MAGIC, FORMAT_VERSION, kind, snapshot_id, base_id)
+        )
+
+        index = []
+        for record_kind, map_index, chunk_x, chunk_y, payload in records:
+            compressed = zlib.compress(payload)
+            index.append(
+                INDEX_ENTRY.pack(
+                    record_kind,
+                    map_index,
+                    chunk_x,
+                    chunk_y,
+                    save_file.tell(),
+                    len(compressed),
+                )
+            )
+            save_file.write(compressed)
+
+        index_offset = save_file.tell()
+        save_file.write(b"".join(index))
+        save_file.write(FOOTER.pack(index_offset, len(index), SAVE_MAGIC))
+
+    os.replace(temporary_path, path)
+    return path
+
+
+class SaveFile:
+    """ A save file written by a SaveManager, read a record at a time.
+
+        Opening the file only reads its index and a little metadata. The chunks
+        of a map are read and decompressed one by one as the map is loaded, and
+        only for the map being loaded. Chunks a delta doesn't hold are read from
+        the full snapshot it's based on, which has to be in the same directory.
+
+        Save files hold pickled game objects, so only load saves you trust."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+
+        try:
+            magic, version, self.kind, self.snapshot_id, self.base_id = HEADER.unpack(
+                self._file.read(HEADER.size)
+            )
+            if magic != SAVE_MAGIC:
+                raise self.InvalidSaveException(f"{path} isn't a save file.")
+            if version != FORMAT_VERSION:
+                raise self.InvalidSaveException(
+                    f"{path} is a version {version} save, not {FORMAT_VERSION}."
+                )
+
+            self._file.seek(-FOOTER.size, os.SEEK_END)
+            index_offset, count, magic = FOOTER.unpack(self._file.read(FOOTER.size))
+            if magic != SAVE_MAGIC:
+                raise self.InvalidSaveException(f"{path} is incomplete.")
+
+            self._file.seek(index_offset)
+            index = self._file.read(INDEX_ENTRY.size * count)
+        except (struct.error, OSError) as e:
+            self._file.close()
+            raise self.InvalidSaveException(f"Couldn't read {path}: {e}")
+
+        self._records = {}
+        for entry in range(count):
+            kind, map_index, chunk_x, chunk_y, offset, length = INDEX_ENTRY.unpack_from(
+                index, entry * INDEX_ENTRY.size
+            )
+            self._records[(kind, map_index, chunk_x, chunk_y)] = (offset, length)
+
+        self.meta = pickle.loads(self._read(META_RECORD))
+        self.chunk_size = self.meta["chunk_size"]
+        self._map_indices = {
+            name: index for index, (name, _, _) in enumerate(self.meta["maps"])
+        }
+        self._palette = None
+
+        self.base = None
+        if self.kind == DELTA_SNAPSHOT:
+            base_path = os.path.join(
+                os.path.dirname(path), snapshot_file_name(self.base_id)
+            )
+            try:
+                self.base = SaveFile(base_path)
+            except (OSError, self.InvalidSaveException) as e:
+                self._file.close()
+                raise self.InvalidSaveException(
+                    f"{path} is a delta of {base_path}, which couldn't be read: {e}"
+                )
+
+    @property
+    def map_names(self):
+        return tuple(self._map_indices)
+
+    @property
+    def palette(self):
+        """ The prototype of each tile id, read the first time it's needed."""
+        if self._palette is None:
+            self._palette = pickle.loads(self._read(PALETTE_RECORD))
+
+        return self._palette
+
+    def close(self):
+        self._file.close()
+        if self.base is not None:
+            self.base.close()
+
+    def chunks(self, map_name: str):
+        """ Yield the (chunk x, chunk y, tile ids, palette) of each chunk of a map in
+            turn, where tile ids is a (sheet, y, x) array of the chunk's ids and
+            palette is the prototype of each id."""
+
+        map_index = self._map_indices[map_name]
+        _, width, height = self.meta["maps"][map_index]
+        columns = -(-width // self.chunk_size)
+        rows = -(-height // self.chunk_size)
+
+        for chunk_y in range(rows):
+            for chunk_x in range(columns):
+                source = self
+                if (TILES_RECORD, map_index, chunk_x, chunk_y) not in self._records:
+                    source = self.base
+
+                if source is None or map_name not in source._map_indices:
+                    raise self.InvalidSaveException(
+                        f"Chunk {chunk_x},{chunk_y} of {map_name} is missing."
+                    )
+
+                tile_ids = source._chunk(map_name, chunk_x, chunk_y)
+                yield chunk_x, chunk_y, tile_ids, source.palette
+
+    def load_map(self, map_name: str):
+        """ Build a new Map from the saved tiles of map_name. Each tile is a copy
+            of its prototype in the palette. Warp zones are left to restore(), as
+            they can lead to other maps."""
+
+        _, width, height = self.meta["maps"][self._map_indices[map_name]]
+        sheets = [[[None] * width for _ in range(height)] for _ in range(4)]
+
+        for chunk_x, chunk_y, tile_ids, palette in self.chunks(map_name):
+            left = chunk_x * self.chunk_size
+            top = chunk_y * self.chunk_size
+
+            for sheet, sheet_ids in zip(sheets, tile_ids.tolist()):
+                for y, row_ids in enumerate(sheet_ids, top):
+                    sheet[y][left : left + len(row_ids)] = [
+                        None if tile_id == EMPTY_TILE else copy.copy(palette[tile_id])
+                        for tile_id in row_ids
+                    ]
+
+        return Map(*sheets, validate=False)
+
+    def restore(self, game):
+        """ Replace the game's saved maps with the ones in this file, and restore
+            its entities and active screen. Every saved map is built, not only the
+            active one, as warp zones hold the maps they lead to."""
+
+        logging.info(f"Loading save {self.path}.")
+        if game.active_menu is None and game.object_images:
+            game.unload_active_map()
+
+        maps = {name: self.load_map(name) for name in self.map_names}
+        for name, warp_zones in self.meta["warp_zones"].items():
+            for warp_zone in warp_zones:
+                (x, y, final_x, final_y, location, warp_x, warp_y) = warp_zone
+                if location in maps:
+                    maps[name].register_warp_zone(
+                        x, y, maps[location], warp_x, warp_y, final_x, final_y
+                    )
+
+        game.maps.update(maps)
+
+        screen_kind, screen_name = self.meta["active"]
+        if screen_kind == "map" and screen_name in maps:
+            game.active_screen = maps[screen_name]
+            game.active_menu = None
+        elif screen_name in game.menus:
+            game.active_screen = game.menus[screen_name]
+            game.active_menu = game.active_screen
+
+        self._restore_entities(game)
+
+        if game.active_menu is None and game.object_images:
+            game.load_active_map()
+
+    def _restore_entities(self, game):
+        store = game.entities
+        for entity in store.entities().tolist():
+            store.destroy(entity)
+
+        entities = pickle.loads(self._read(ENTITIES_RECORD))
+        active_map = game.active_screen if isinstance(game.active_screen, Map) else None
+
+        for index, tile_id in enumerate(entities["objects"].tolist()):
+            x, y = entities["position"][index].tolist()
+
+            if entities["on_map"][index] and active_map is not None:
+                game_object = active_map.character_sheet[y][x]
+            elif tile_id != EMPTY_TILE:
+                game_object = copy.copy(self.palette[tile_id])
+            else:
+                game_object = None
+
+            store.create(
+                (x, y),
+                velocity=entities["velocity"][index],
+                facing=int(entities["facing"][index]),
+                game_object=game_object,
+                controlled=bool(entities["controlled"][index]),
+            )
+
+    def _chunk(self, map_name, chunk_x, chunk_y):
+        map_index = self._map_indices[map_name]
+        _, width, height = self.meta["maps"][map_index]
+        chunk_width = min(self.chunk_size, width - chunk_x * self.chunk_size)
+        chunk_height = min(self.chunk_size, height - chunk_y * self.chunk_size)
+
+        return numpy.frombuffer(
+            self._read(TILES_RECORD, map_index, chunk_x, chunk_y), dtype=numpy.int32
+        ).reshape(4, chunk_height, chunk_width)
+
+    def _read(self, kind, map_index=0, chunk_x=0, chunk_y=0):
+        offset, length = self._records[(kind, map_index, chunk_x, chunk_y)]
+        self._file.seek(offset)
+        return zlib.decompress(self._file.read(length))
+
+    class InvalidSaveException(Exception):
+        """ Raised when a file can't be read as a save."""
+
+        pass
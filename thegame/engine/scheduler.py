@@ -0,0 +1,243 @@
+""" The update scheduler runs objects' callbacks over time, spreading them across
+    frames so that however many there are, each frame only spends its budget."""
+import logging
+import time
+from collections import deque
+from heapq import heappop, heappush
+from itertools import count
+
+
+class ScheduledUpdate:
+    """ A callback registered with an UpdateScheduler. Returned by schedule() so it
+        can be cancelled."""
+
+    def __init__(self, game_object, callback, interval, priority, wake_on):
+        self.game_object = game_object
+        self.callback = callback
+        self.interval = interval
+        self.priority = priority
+        self.wake_on = wake_on
+
+        # The tick the callback should next run on, and the tick it last ran on.
+        self.due = 0
+        self.last_run = None
+
+        self.asleep = False
+        self.cancelled = False
+
+        # Counts the times the update has been put to sleep, to tell its current
+        # place in the sleeping queue from any it was woken from.
+        self.sleeps = 0
+
+        # Set when woken by wake() or an event, so it runs once even if it's still
+        # far from every camera.
+        self.woken = False
+
+
+class UpdateScheduler:
+    """ Runs registered callbacks every tick, or every few ticks, within a time
+        budget for each frame.
+
+        Due callbacks are kept in a priority queue ordered by the tick they're due
+        on and then their priority (lower first.) Each tick runs as many due
+        callbacks as fit in the frame's budget; any left over stay at the front of
+        the queue for the next tick, and are told how many ticks passed since they
+        last ran so they can catch up.
+
+        Callbacks of objects further than sleep_distance tiles outside the view of
+        every camera are put to sleep rather than run. A few sleepers are checked
+        each tick and woken once a camera comes near, and any sleeper can be woken
+        straight away by wake() or by posting an event it's waiting on."""
+
+    def __init__(
+        self,
+        frame_budget: float = 0.004,
+        sleep_distance: int = None,
+        wake_checks_per_tick: int = 256,
+        clock=time.perf_counter,
+    ):
+        """ Args:
+                frame_budget(float): The most seconds to spend on callbacks each tick.
+                                     At least one due callback is always run, so
+                                     the queue can't stall.
+                sleep_distance(int): How many tiles outside every camera's view an
+                                     object can be before its callbacks sleep. None
+                                     never sleeps anything.
+                wake_checks_per_tick(int): How many sleeping callbacks to check each
+                                           tick for whether they should wake.
+                clock: A callable returning the current time in seconds."""
+        self.frame_budget = frame_budget
+        self.sleep_distance = sleep_distance
+        self.wake_checks_per_tick = wake_checks_per_tick
+        self.clock = clock
+
+        self.tick_count = 0
+
+        self._queue = []
+        self._sequence = count()
+
+        # Sleeping updates as (update.sleeps, update), oldest first.
+        self._sleeping = deque()
+        self._waiting_on = {}
+
+        # The number of updates run by the last tick, and whether any due updates
+        # had to be left for the next one.
+        self.updates_run = 0
+        self.behind = False
+
+    def schedule(
+        self,
+        game_object,
+        callback,
+        interval: int = 1,
+        priority: int = 0,
+        wake_on: tuple = (),
+    ):
+        """ Run callback every interval ticks.
+
+            Args:
+                game_object: The object the callback updates, used to find where it
+                             is on the map. Can be None for callbacks that never
+                             sleep.
+                callback: A callable taking (context, elapsed_ticks), where
+                          elapsed_ticks is the number of ticks since it last ran.
+                interval(int): Run every this many ticks (1 for every tick.)
+                priority(int): Which due callbacks to run first when there isn't
+                               time for all of them, lower first.
+                wake_on(tuple): Names of events which wake the callback from sleep.
+
+            Returns:
+                The ScheduledUpdate, which can be passed to cancel()."""
+
+        if interval < 1:
+            raise ValueError(f"Updates can't run more than once a tick ({interval}).")
+
+        update = ScheduledUpdate(game_object, callback, interval, priority, wake_on)
+        update.due = self.tick_count + 1
+        self._push(update)
+
+        for event in wake_on:
+            self._waiting_on.setdefault(event, set()).add(update)
+
+        return update
+
+    def cancel(self, update: ScheduledUpdate):
+        """ Stop running an update. It's dropped from the queue when next reached."""
+
+        update.cancelled = True
+        for event in update.wake_on:
+            self._waiting_on.get(event, set()).discard(update)
+
+    def wake(self, game_object):
+        """ Wake every sleeping update of game_object, to run on the next tick."""
+
+        for sleeps, update in self._sleeping:
+            if (
+                update.asleep
+                and update.sleeps == sleeps
+                and update.game_object is game_object
+            ):
+                self._wake(update)
+
+    def post(self, event):
+        """ Wake every sleeping update waiting on event, to run on the next tick."""
+
+        for update in list(self._waiting_on.get(event, ())):
+            if update.asleep:
+                self._wake(update)
+
+    def tick(self, context):
+        """ Run the due updates that fit in the frame budget.
+
+            Args:
+                context(BaseGame): The game, passed on to each callback."""
+
+        self.tick_count += 1
+        self.updates_run = 0
+        deadline = self.clock() + self.frame_budget
+
+        self._check_sleepers(context)
+
+        while self._queue and self._queue[0][0] <= self.tick_count:
+            if self.updates_run and self.clock() >= deadline:
+                break
+
+            _, _, _, update = heappop(self._queue)
+            if update.cancelled:
+                continue
+
+            if update.woken:
+                update.woken = False
+            elif self._should_sleep(update, context):
+                update.asleep = True
+                update.sleeps += 1
+                self._sleeping.append((update.sleeps, update))
+                continue
+
+            elapsed = (
+                self.tick_count - update.last_run
+                if update.last_run is not None
+                else update.interval
+            )
+            update.last_run = self.tick_count
+            update.callback(context, elapsed)
+            self.updates_run += 1
+
+            update.due = self.tick_count + update.interval
+            self._push(update)
+
+        self.behind = bool(self._queue) and self._queue[0][0] <= self.tick_count
+        if self.behind:
+            logging.debug(
+                f"Ran out of time after {self.updates_run} updates, leaving the "
+                f"rest for the next tick."
+            )
+
+    def _push(self, update):
+        heappush(
+            self._queue, (update.due, update.priority, next(self._sequence), update)
+        )
+
+    def _wake(self, update):
+        # Woken updates are left in the sleeping queue, and dropped from it when
+        # it's next checked.
+        update.asleep = False
+        update.woken = True
+        update.due = self.tick_count + 1
+        self._push(update)
+
+    def _check_sleepers(self, context):
+        """ Wake any of the next few sleepers that a camera has come close to."""
+
+        for _ in range(min(self.wake_checks_per_tick, len(self._sleeping))):
+            sleeps, update = self._sleeping.popleft()
+
+            if update.cancelled or not update.asleep or update.sleeps != sleeps:
+                continue
+
+            if self._should_sleep(update, context):
+                self._sleeping.append((sleeps, update))
+            else:
+                update.asleep = False
+                update.due = self.tick_count
+                self._push(update)
+
+    def _should_sleep(self, update, context):
+        if self.sleep_distance is None or update.game_object is None:
+            return False
+
+        entities = getattr(context, "entities", None)
+        entity = entities.entity_of(update.game_object) if entities else None
+        if entity is None:
+            return False
+
+        x, y = entities.position[entity].tolist()
+        for viewport in context.viewports:
+            camera = viewport.camera
+            outside_x = abs(x - camera.camera_x) - camera.visible_columns // 2
+            outside_y = abs(y - camera.camera_y) - camera.visible_rows // 2
+
+            if max(outside_x, outside_y) <= self.sleep_distance:
+                return False
+
+        return True
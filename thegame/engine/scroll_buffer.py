@@ -0,0 +1,341 @@
+""" An offscreen buffer used by the engine to scroll a camera's view of a map
+    without redrawing every tile each time the camera moves."""
+import logging
+
+from .camera import Camera
+from .map import Map
+from .startup import lazy_import
+from .tile_renderer import BACKGROUND_COLOUR, TileRenderer
+
+pygame = lazy_import("pygame")
+
+
+class ScrollBuffer:
+    """ A wrap-around (ring) buffer of tiles around a camera's view.
+
+        The buffer is one cell wider and one cell taller than what the camera
+        shows, so that the partially visible cells on each edge of a sub-tile
+        scroll are always drawn. Each cell is drawn into the buffer at
+        (x % columns, y % rows), meaning that when the camera moves only the
+        newly exposed columns and rows need to be drawn, overwriting the ones that
+        just scrolled out of view. Drawing the buffer to the screen then takes
+        one blit, or two per axis when the view wraps around the buffer's edge.
+
+        A cell is normally a single tile. When the camera is zoomed out far enough
+        that its tiles are tiny, each cell is instead a chunk of tiles drawn from
+        the tile renderer's chunk thumbnails."""
+
+    def __init__(self, camera: Camera, tile_renderer: TileRenderer):
+        """ Args:
+                camera(Camera): The camera whose view this buffer holds.
+                tile_renderer(TileRenderer): The renderer tile surfaces are taken
+                                             from, shared with any other buffers."""
+        self.camera = camera
+        self.tile_renderer = tile_renderer
+
+        self.tile_width = camera.tile_width
+        self.tile_height = camera.tile_height
+        self.visible_columns = camera.visible_columns
+        self.visible_rows = camera.visible_rows
+
+        if min(self.tile_width, self.tile_height) <= tile_renderer.THUMBNAIL_TILE_SIZE:
+            self.cell_tiles = tile_renderer.CHUNK_SIZE
+        else:
+            self.cell_tiles = 1
+
+        self.cell_width = self.cell_tiles * self.tile_width
+        self.cell_height = self.cell_tiles * self.tile_height
+        self.columns = -(-self.visible_columns // self.cell_tiles) + 1
+        self.rows = -(-self.visible_rows // self.cell_tiles) + 1
+
+        self.surface = pygame.Surface(
+            (self.columns * self.cell_width, self.rows * self.cell_height)
+        )
+
+        # The map currently drawn in the buffer, and the coordinates of the top
+        # left cell held by the buffer.
+        self._game_map = None
+        self._left = None
+        self._top = None
+
+        # Cells which have had a tile change on the map since they were drawn.
+        self._dirty_cells = set()
+
+        # The cell held in each slot of the buffer which shows an animation, and
+        # the names of its animations, as {(slot x, slot y): (x, y, names)}.
+        self._animated_slots = {}
+
+        # The number of cells drawn by the last update, useful for seeing what
+        # scrolling is costing.
+        self.tiles_drawn = 0
+
+    @property
+    def fits_camera(self):
+        """ False once the camera has been zoomed since this buffer was made, in
+            which case a new buffer is needed."""
+        return (
+            self.camera.tile_width == self.tile_width
+            and self.camera.tile_height == self.tile_height
+            and self.camera.visible_columns == self.visible_columns
+            and self.camera.visible_rows == self.visible_rows
+        )
+
+    def update(self, game_map: Map):
+        """ Bring the buffer up to date with the camera's position on game_map,
+            drawing only the cells which have been exposed or changed since the
+            last update."""
+
+        self.tiles_drawn = 0
+        left = self.camera.leftmost_tile // self.cell_tiles
+        top = self.camera.topmost_tile // self.cell_tiles
+
+        self.tile_renderer.set_map(game_map)
+
+        if game_map is not self._game_map:
+            self._set_map(game_map)
+            self._redraw(left, top)
+            return
+
+        delta_x = left - self._left
+        delta_y = top - self._top
+
+        # If the camera jumped further than the buffer holds, nothing in the buffer
+        # can be reused.
+        if abs(delta_x) >= self.columns or abs(delta_y) >= self.rows:
+            self._redraw(left, top)
+            return
+
+        self._invalidate_animated_cells()
+
+        previous_left = self._left
+        previous_top = self._top
+        self._left = left
+        self._top = top
+
+        if delta_x > 0:
+            exposed_columns = range(previous_left + self.columns, left + self.columns)
+        else:
+            exposed_columns = range(left, previous_left)
+
+        if delta_y > 0:
+            exposed_rows = range(previous_top + self.rows, top + self.rows)
+        else:
+            exposed_rows = range(top, previous_top)
+
+        for cell_x in exposed_columns:
+            for cell_y in range(top, top + self.rows):
+                self._draw_cell(cell_x, cell_y)
+
+        # The corners were drawn with the exposed columns.
+        for cell_y in exposed_rows:
+            for cell_x in range(left, left + self.columns):
+                if cell_x not in exposed_columns:
+                    self._draw_cell(cell_x, cell_y)
+
+        self._draw_dirty_cells()
+
+    def draw(self, target, position=(0, 0), sprites=()):
+        """ Draw the camera's view from the buffer onto target.
+
+            Args:
+                target: The surface to draw onto.
+                position(tuple): The x,y pixel position on target to draw the view at.
+                sprites(iterable): (x, y, sprite_location) tuples to draw over the
+                                   view, where x and y are tiles but may be
+                                   fractional (ie ClientPrediction.sprites().)
+
+            Returns:
+                The number of blits it took to draw the view."""
+
+        view_width = self.visible_columns * self.tile_width
+        view_height = self.visible_rows * self.tile_height
+
+        # The position of the view in the buffer is that of the cell it starts
+        # in, plus however many tiles and pixels into that cell it starts.
+        source_x = (
+            (self._left % self.columns) * self.cell_width
+            + (self.camera.leftmost_tile - self._left * self.cell_tiles)
+            * self.tile_width
+            + self.camera.offset_x
+        )
+        source_y = (
+            (self._top % self.rows) * self.cell_height
+            + (self.camera.topmost_tile - self._top * self.cell_tiles)
+            * self.tile_height
+            + self.camera.offset_y
+        )
+
+        blits = 0
+        for span_x, span_width, target_x in self._wrap_spans(
+            source_x, view_width, self.columns * self.cell_width
+        ):
+            for span_y, span_height, target_y in self._wrap_spans(
+                source_y, view_height, self.rows * self.cell_height
+            ):
+                target.blit(
+                    self.surface,
+                    (position[0] + target_x, position[1] + target_y),
+                    pygame.Rect(span_x, span_y, span_width, span_height),
+                )
+                blits += 1
+
+        if sprites:
+            blits += self._draw_sprites(target, position, sprites)
+
+        return blits
+
+    def invalidate_tile(self, sheet, x, y):
+        """ Mark the tile at x,y as needing to be redrawn. The signature matches
+            that of a Map tile listener."""
+        self._dirty_cells.add((x // self.cell_tiles, y // self.cell_tiles))
+
+    def invalidate_region(self, region):
+        """ Mark every tile of a TileRegion as needing to be redrawn. Registered
+            as a region listener of the map."""
+
+        cell_tiles = self.cell_tiles
+        self._dirty_cells.update(
+            (cell_x, cell_y)
+            for cell_y in range(
+                region.y // cell_tiles, (region.y + region.height - 1) // cell_tiles + 1
+            )
+            for cell_x in range(
+                region.x // cell_tiles, (region.x + region.width - 1) // cell_tiles + 1
+            )
+        )
+
+    def invalidate(self):
+        """ Force the whole buffer to be redrawn on the next update."""
+        self._set_map(None)
+
+    def _invalidate_animated_cells(self):
+        """ Mark the animated cells whose animations changed frame on the last
+            tick as needing to be redrawn. Only the cells held by the buffer are
+            checked, so this costs the same however many animated tiles the map
+            has."""
+
+        animations = self.tile_renderer.animations
+        if animations is None or not animations.changed:
+            return
+
+        for cell_x, cell_y, names in self._animated_slots.values():
+            if not animations.changed.isdisjoint(names):
+                self._dirty_cells.add((cell_x, cell_y))
+
+    def _set_map(self, game_map):
+        if self._game_map is not None:
+            self._game_map.deregister_region_listener(self.invalidate_region)
+
+        self._game_map = game_map
+
+        if game_map is not None:
+            game_map.register_region_listener(self.invalidate_region)
+
+    def _redraw(self, left, top):
+        logging.debug(f"Redrawing the whole scroll buffer at ({left}, {top}).")
+
+        self._left = left
+        self._top = top
+        self._dirty_cells.clear()
+
+        for cell_y in range(top, top + self.rows):
+            for cell_x in range(left, left + self.columns):
+                self._draw_cell(cell_x, cell_y)
+
+    def _draw_dirty_cells(self):
+        for cell_x, cell_y in self._dirty_cells:
+            if (
+                self._left <= cell_x < self._left + self.columns
+                and self._top <= cell_y < self._top + self.rows
+            ):
+                self._draw_cell(cell_x, cell_y)
+
+        self._dirty_cells.clear()
+
+    def _draw_cell(self, cell_x, cell_y):
+        """ Draw the tile, or chunk of tiles, at cell_x, cell_y into its slot in
+            the buffer."""
+
+        buffer_x = (cell_x % self.columns) * self.cell_width
+        buffer_y = (cell_y % self.rows) * self.cell_height
+        self.tiles_drawn += 1
+
+        if self.cell_tiles == 1:
+            cell_surface = self.tile_renderer.tile_surface(
+                cell_x, cell_y, self.tile_width, self.tile_height
+            )
+
+            slot = (cell_x % self.columns, cell_y % self.rows)
+            names = self.tile_renderer.cell_animations(cell_x, cell_y)
+            if names:
+                self._animated_slots[slot] = (cell_x, cell_y, names)
+            else:
+                self._animated_slots.pop(slot, None)
+        else:
+            cell_surface = self.tile_renderer.chunk_surface(
+                cell_x, cell_y, self.tile_width, self.tile_height
+            )
+
+        if cell_surface is None:
+            self.surface.fill(
+                BACKGROUND_COLOUR,
+                (buffer_x, buffer_y, self.cell_width, self.cell_height),
+            )
+        else:
+            self.surface.blit(cell_surface, (buffer_x, buffer_y))
+
+    def _draw_sprites(self, target, position, sprites):
+        """ Draw the sprites within the view onto target, clipped to the view.
+
+            Returns:
+                The number of sprites drawn."""
+
+        view = pygame.Rect(
+            position,
+            (
+                self.visible_columns * self.tile_width,
+                self.visible_rows * self.tile_height,
+            ),
+        )
+        left = self.camera.leftmost_tile
+        top = self.camera.topmost_tile
+
+        previous_clip = target.get_clip()
+        target.set_clip(view.clip(previous_clip))
+
+        drawn = 0
+        for x, y, sprite_location in sprites:
+            sprite_rect = pygame.Rect(
+                view.x + round((x - left) * self.tile_width) - self.camera.offset_x,
+                view.y + round((y - top) * self.tile_height) - self.camera.offset_y,
+                self.tile_width,
+                self.tile_height,
+            )
+            if not sprite_rect.colliderect(view):
+                continue
+
+            target.blit(
+                self.tile_renderer.scaled_image(
+                    sprite_location, self.tile_width, self.tile_height
+                ),
+                sprite_rect,
+            )
+            drawn += 1
+
+        target.set_clip(previous_clip)
+
+        return drawn
+
+    @staticmethod
+    def _wrap_spans(start, length, size):
+        """ Split a span of length pixels starting at start into the pieces that
+            lie inside a buffer of the given size, wrapping around its edge.
+
+            Returns:
+                A list of (buffer start, length, offset into the span) tuples."""
+
+        if start + length <= size:
+            return [(start, length, 0)]
+
+        first_length = size - start
+        return [(start, first_length, 0), (0, length - first_length, first_length)]
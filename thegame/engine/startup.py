@@ -0,0 +1,161 @@
+""" Keeping the engine quick to start: modules imported only once they're used,
+    pygame subsystems initialized only once they're needed, and a report of how
+    long starting up took (see report().)"""
+import importlib.util
+import logging
+import subprocess
+import sys
+import time
+from collections import namedtuple
+
+# The seconds a module took to import, less its imports (own) and with them
+# (cumulative.)
+ImportTime = namedtuple("ImportTime", ["module", "own", "cumulative"])
+
+StartupReport = namedtuple("StartupReport", ["imports", "subsystems", "marks"])
+
+# When the engine package started being imported, which marks are timed from.
+_started = time.perf_counter()
+
+# The seconds from _started to each mark.
+_marks = {}
+
+# The seconds each pygame subsystem took to initialize.
+_subsystems = {}
+
+
+def lazy_import(name: str):
+    """ Return the module called name without running it, if it isn't already
+        imported. It is imported the first time one of its attributes is used, so
+        importing a module which might use it costs nothing until it does.
+
+        Modules whose import has side effects that must happen straight away
+        shouldn't be imported lazily."""
+
+    module = sys.modules.get(name)
+    if module is not None:
+        return module
+
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+
+    spec.loader = importlib.util.LazyLoader(spec.loader)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    spec.loader.exec_module(module)
+
+    return module
+
+
+pygame = lazy_import("pygame")
+
+
+def init_subsystem(name: str):
+    """ Initialize one of pygame's subsystems, if it isn't already, rather than
+        all of them with pygame.init().
+
+        Args:
+            name(str): The name of the subsystem's pygame module, ie "display" or
+                       "mixer"."""
+
+    subsystem = getattr(pygame, name)
+    if subsystem.get_init():
+        return
+
+    started = time.perf_counter()
+    subsystem.init()
+
+    _subsystems[name] = time.perf_counter() - started
+    logging.info(f"Initialized pygame's {name} in {_subsystems[name]:.3f}s.")
+
+
+def mark(name: str):
+    """ Record the time since the engine started being imported, the first time
+        name happens (ie "first frame".)"""
+
+    if name not in _marks:
+        _marks[name] = time.perf_counter() - _started
+        logging.info(f"Startup: {name} after {_marks[name]:.3f}s.")
+
+
+def marks():
+    """ Returns:
+            A dictionary of each mark to its seconds since the engine started
+            being imported."""
+    return dict(_marks)
+
+
+def subsystems():
+    """ Returns:
+            A dictionary of each pygame subsystem initialized by init_subsystem()
+            to the seconds it took."""
+    return dict(_subsystems)
+
+
+def import_times(module: str = "thegame.engine"):
+    """ Time a cold import of module, in a new interpreter so nothing is already
+        imported.
+
+        Returns:
+            A list of the ImportTime of module and everything it imports, slowest
+            (cumulatively) first. Pythons before 3.7 can't time imports, so the
+            list is empty on them."""
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        universal_newlines=True,
+        check=True,
+    )
+
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+
+        own, cumulative, name = line[len("import time:") :].split("|")
+        if not own.strip().isdigit():
+            # The header line.
+            continue
+
+        times.append(
+            ImportTime(
+                name.strip(), int(own) / 1_000_000, int(cumulative) / 1_000_000
+            )
+        )
+
+    return sorted(times, key=lambda import_time: -import_time.cumulative)
+
+
+def report(module: str = "thegame.engine"):
+    """ Returns:
+            A StartupReport of the import times of module, the initialized pygame
+            subsystems and the marks so far."""
+    return StartupReport(import_times(module), subsystems(), marks())
+
+
+def format_report(startup_report, slowest: int = 20):
+    """ Returns:
+            startup_report as text, with only the slowest imports."""
+
+    lines = ["Imports (cumulative / own seconds):"]
+    for import_time in startup_report.imports[:slowest]:
+        lines.append(
+            f"  {import_time.cumulative:8.4f} {import_time.own:8.4f} "
+            f"{import_time.module}"
+        )
+
+    if startup_report.subsystems:
+        lines.append("pygame subsystems initialized (seconds):")
+        for name, seconds in startup_report.subsystems.items():
+            lines.append(f"  {seconds:8.4f} {name}")
+
+    if startup_report.marks:
+        lines.append("Since the engine was imported (seconds):")
+        for name, seconds in startup_report.marks.items():
+            lines.append(f"  {seconds:8.4f} {name}")
+
+    return "\n".join(lines)
+
@@ -0,0 +1,422 @@
+""" The tile renderer is shared between every viewport the engine draws, so that
+    looking up and drawing a tile is only ever paid for once no matter how many
+    cameras can see it."""
+import logging
+from collections import OrderedDict
+
+from .animation import AnimationClock, AnimationLayer
+from .map import Map
+from .startup import lazy_import
+
+pygame = lazy_import("pygame")
+
+BACKGROUND_COLOUR = (0, 0, 0)
+
+# The number of bytes each pixel of a cached surface is assumed to take.
+BYTES_PER_PIXEL = 4
+
+
+def image_is_opaque(image):
+    """ Return True if every pixel of image is fully opaque, meaning nothing
+        drawn underneath it could ever be seen."""
+
+    width, height = image.get_size()
+    return pygame.mask.from_surface(image, 254).count() == width * height
+
+
+class SurfaceCache:
+    """ A least recently used cache of surfaces, which drops the oldest surfaces
+        once the ones it holds would take more than memory_budget bytes."""
+
+    def __init__(self, memory_budget: int):
+        self.memory_budget = memory_budget
+        self.memory_used = 0
+        self.evictions = 0
+
+        self._surfaces = OrderedDict()
+
+    def __len__(self):
+        return len(self._surfaces)
+
+    def get(self, key):
+        entry = self._surfaces.get(key)
+        if entry is None:
+            return None
+
+        self._surfaces.move_to_end(key)
+        return entry[0]
+
+    def put(self, key, surface, width, height):
+        """ Cache a width x height surface under key."""
+
+        size = width * height * BYTES_PER_PIXEL
+        previous = self._surfaces.pop(key, None)
+        if previous is not None:
+            self.memory_used -= previous[1]
+
+        self._surfaces[key] = (surface, size)
+        self.memory_used += size
+
+        # Always keep the surface just added, even if it alone is over budget.
+        while self.memory_used > self.memory_budget and len(self._surfaces) > 1:
+            _, (_, evicted_size) = self._surfaces.popitem(last=False)
+            self.memory_used -= evicted_size
+            self.evictions += 1
+
+    def clear(self):
+        self._surfaces.clear()
+        self.memory_used = 0
+
+
+class TileRenderer:
+    """ Turns map tiles into single surfaces ready to be blitted.
+
+        Each map tile is made of up to four layers. Rather than blitting each layer
+        of each tile every time it's drawn, the layers are composed once into a
+        single opaque surface for each distinct combination of layers and tile size,
+        and that surface is reused by every tile and every viewport that needs it.
+        The layers at each map position are also remembered, and forgotten only when
+        the map reports that tile has changed. Any layers underneath an opaque layer
+        are culled when they're looked up, as they'd never be seen.
+
+        Images are scaled for each zoom level through a mipmap chain (each level
+        half the size of the last), and when zoomed far out whole chunks of the map
+        are drawn into thumbnails so they can be blitted as one. Scaled images,
+        composed tiles and thumbnails all share one memory budget.
+
+        A layer whose object has a registered animation is looked up as an
+        AnimationLayer, and swapped for the animation's current frame whenever the
+        tile is drawn. Composed tiles are keyed by the frames they show, so every
+        tile on the same frame of an animation shares one surface. Thumbnails show
+        whichever frame was current when they were drawn."""
+
+    # The width and height, in tiles, of each chunk drawn as a thumbnail.
+    CHUNK_SIZE = 16
+
+    # Tiles this many pixels or smaller are drawn from chunk thumbnails.
+    THUMBNAIL_TILE_SIZE = 4
+
+    def __init__(
+        self,
+        tile_images: dict,
+        image_opacity: dict = None,
+        memory_budget: int = 64 * 1024 * 1024,
+        animations: AnimationClock = None,
+        skipped_sheets=(),
+    ):
+        """ Args:
+                tile_images(dict): The loaded images of each tile, keyed by
+                                   sprite_location (ie BaseGame.object_images.)
+                image_opacity(dict): Whether each image is fully opaque, keyed by
+                                     sprite_location (ie BaseGame.object_opacity.)
+                                     Images missing from it are never culled under.
+                memory_budget(int): The most bytes of scaled images, composed tiles
+                                    and thumbnails to keep before the least recently
+                                    used are dropped.
+                animations(AnimationClock): The clock animated layers are played
+                                            from. Without one, every object is
+                                            drawn with its sprite.
+                skipped_sheets(iterable): The indexes of sheets not to draw, ie the
+                                          character sheet when characters are
+                                          drawn from a ClientPrediction's
+                                          positions instead (see
+                                          ScrollBuffer.draw().)"""
+        self.tile_images = tile_images
+        self.image_opacity = image_opacity if image_opacity is not None else {}
+        self.cache = SurfaceCache(memory_budget)
+        self.animations = animations
+        self.skipped_sheets = frozenset(skipped_sheets)
+
+        self._game_map = None
+        self._cell_layers = {}
+
+        # The names of the animations at each map position with any, kept
+        # alongside the remembered layers.
+        self._cell_animations = {}
+
+        self._chunk_versions = {}
+        self._map_generation = 0
+
+        # Counters to see how much work is being shared.
+        self.composites_built = 0
+        self.composite_hits = 0
+        self.thumbnails_built = 0
+
+        # Overdraw counters. See overdraw_stats().
+        self.layers_seen = 0
+        self.layers_culled = 0
+        self.layer_blits = 0
+
+    def set_map(self, game_map: Map):
+        """ Set the map tiles are looked up from. Switching maps forgets the
+            remembered layers of the previous one."""
+
+        if game_map is self._game_map:
+            return
+
+        if self._game_map is not None:
+            self._game_map.deregister_region_listener(self.invalidate_region)
+
+        self._game_map = game_map
+        self._cell_layers.clear()
+        self._cell_animations.clear()
+
+        # Thumbnails are of a specific map, so they're keyed by which map has been
+        # set to avoid using ones drawn from the previous map.
+        self._map_generation += 1
+        self._chunk_versions.clear()
+
+        if game_map is not None:
+            game_map.register_region_listener(self.invalidate_region)
+
+    def invalidate_tile(self, sheet, x, y):
+        """ Forget the layers at x,y. The signature matches a Map tile listener."""
+        self._cell_layers.pop((x, y), None)
+        self._cell_animations.pop((x, y), None)
+
+        chunk = (x // self.CHUNK_SIZE, y // self.CHUNK_SIZE)
+        self._chunk_versions[chunk] = self._chunk_versions.get(chunk, 0) + 1
+
+    def invalidate_region(self, region):
+        """ Forget the layers of every tile of a TileRegion. Registered as a
+            region listener of the map."""
+
+        right = region.x + region.width
+        bottom = region.y + region.height
+        if region.width * region.height > len(self._cell_layers):
+            # Looking through what's remembered is cheaper than popping every
+            # tile of a big region.
+            def outside(position):
+                x, y = position
+                return not (region.x <= x < right and region.y <= y < bottom)
+
+            self._cell_layers = {
+                position: layers
+                for position, layers in self._cell_layers.items()
+                if outside(position)
+            }
+            self._cell_animations = {
+                position: animations
+                for position, animations in self._cell_animations.items()
+                if outside(position)
+            }
+        else:
+            for y in range(region.y, bottom):
+                for x in range(region.x, right):
+                    self._cell_layers.pop((x, y), None)
+                    self._cell_animations.pop((x, y), None)
+
+        chunk_size = self.CHUNK_SIZE
+        for chunk_y in range(region.y // chunk_size, (bottom - 1) // chunk_size + 1):
+            for chunk_x in range(region.x // chunk_size, (right - 1) // chunk_size + 1):
+                chunk = (chunk_x, chunk_y)
+                self._chunk_versions[chunk] = self._chunk_versions.get(chunk, 0) + 1
+
+    def cell_layers(self, x, y):
+        """ Return a tuple of the sprite locations (or AnimationLayers) at x,y,
+            bottom layer first. Tiles outside of the map have no layers."""
+
+        layers = self._cell_layers.get((x, y))
+        if layers is not None:
+            return layers
+
+        game_map = self._game_map
+        if 0 <= x < game_map.width and 0 <= y < game_map.height:
+            layers = tuple(
+                self._layer(sheet[y][x])
+                for index, sheet in reversed(tuple(enumerate(game_map.tile_sheets)))
+                if sheet[y][x] is not None and index not in self.skipped_sheets
+            )
+        else:
+            layers = ()
+
+        self.layers_seen += len(layers)
+
+        # Nothing below the topmost opaque layer can be seen, so don't draw it.
+        for index in range(len(layers) - 1, 0, -1):
+            if self.image_opacity.get(layers[index], False):
+                self.layers_culled += index
+                layers = layers[index:]
+                break
+
+        self._cell_layers[(x, y)] = layers
+
+        animations = tuple(
+            layer.name for layer in layers if isinstance(layer, AnimationLayer)
+        )
+        if animations:
+            self._cell_animations[(x, y)] = animations
+
+        return layers
+
+    def cell_animations(self, x, y):
+        """ Return a tuple of the names of the animations showing at x,y."""
+
+        if (x, y) not in self._cell_layers:
+            self.cell_layers(x, y)
+
+        return self._cell_animations.get((x, y), ())
+
+    def overdraw_stats(self):
+        """ Return a dictionary of how much drawing has been saved by culling.
+
+            layers_seen: The number of layers in every tile looked up.
+            layers_culled: How many of those were hidden under an opaque layer.
+            layer_blits: The number of layers actually drawn into composed tiles.
+            culled_ratio: The fraction of layers seen which were culled."""
+        return {
+            "layers_seen": self.layers_seen,
+            "layers_culled": self.layers_culled,
+            "layer_blits": self.layer_blits,
+            "culled_ratio": (
+                self.layers_culled / self.layers_seen if self.layers_seen else 0.0
+            ),
+        }
+
+    def tile_surface(self, x, y, width, height):
+        """ Return an opaque width x height surface of every layer at x,y, or None
+            if there is nothing there to draw."""
+
+        layers = self.cell_layers(x, y)
+        if not layers:
+            return None
+
+        if (x, y) in self._cell_animations:
+            layers = tuple(
+                self.animations.frame_key(layer.name)
+                if isinstance(layer, AnimationLayer)
+                else layer
+                for layer in layers
+            )
+
+        key = ("composite", layers, width, height)
+        composite = self.cache.get(key)
+
+        if composite is not None:
+            self.composite_hits += 1
+            return composite
+
+        composite = pygame.Surface((width, height))
+        if not self.image_opacity.get(layers[0], False):
+            composite.fill(BACKGROUND_COLOUR)
+
+        for sprite_location in layers:
+            composite.blit(self.scaled_image(sprite_location, width, height), (0, 0))
+            self.layer_blits += 1
+
+        self.composites_built += 1
+        self.cache.put(key, composite, width, height)
+
+        return composite
+
+    def chunk_surface(self, chunk_x, chunk_y, tile_width, tile_height):
+        """ Return a thumbnail of the CHUNK_SIZE x CHUNK_SIZE tiles of the chunk at
+            chunk_x, chunk_y, with each tile drawn tile_width x tile_height. The
+            thumbnail is rebuilt only after a tile within it has changed."""
+
+        version = self._chunk_versions.get((chunk_x, chunk_y), 0)
+        key = (
+            "chunk",
+            self._map_generation,
+            chunk_x,
+            chunk_y,
+            version,
+            tile_width,
+            tile_height,
+        )
+
+        thumbnail = self.cache.get(key)
+        if thumbnail is not None:
+            return thumbnail
+
+        width = self.CHUNK_SIZE * tile_width
+        height = self.CHUNK_SIZE * tile_height
+        thumbnail = pygame.Surface((width, height))
+        thumbnail.fill(BACKGROUND_COLOUR)
+
+        first_x = chunk_x * self.CHUNK_SIZE
+        first_y = chunk_y * self.CHUNK_SIZE
+        for y in range(first_y, first_y + self.CHUNK_SIZE):
+            for x in range(first_x, first_x + self.CHUNK_SIZE):
+                tile_surface = self.tile_surface(x, y, tile_width, tile_height)
+                if tile_surface is not None:
+                    thumbnail.blit(
+                        tile_surface,
+                        ((x - first_x) * tile_width, (y - first_y) * tile_height),
+                    )
+
+        self.thumbnails_built += 1
+        self.cache.put(key, thumbnail, width, height)
+
+        return thumbnail
+
+    def prescale(self, width, height):
+        """ Scale every loaded image to width x height ahead of time, ie when a
+            camera changes zoom, rather than as each tile is first drawn."""
+
+        for sprite_location in self.tile_images:
+            self.scaled_image(sprite_location, width, height)
+
+    def scaled_image(self, sprite_location, width, height):
+        """ Return the image for sprite_location scaled to width x height. Images
+            are only scaled once for each size they're asked for in, and shrinking
+            is done from the closest level of the image's mipmap chain."""
+
+        image = self.tile_images[sprite_location]
+        native_width, native_height = image.get_size()
+        if (native_width, native_height) == (width, height):
+            return image
+
+        key = ("image", sprite_location, width, height)
+        scaled = self.cache.get(key)
+        if scaled is not None:
+            return scaled
+
+        # Find the smallest mipmap level which is still at least the requested size.
+        level = 0
+        while (
+            native_width >> (level + 1) >= width
+            and native_height >> (level + 1) >= height
+        ):
+            level += 1
+
+        source = self._mipmap(sprite_location, level)
+        logging.debug(f"Scaling {sprite_location} to {width}x{height}.")
+        scaled = self._scale(source, width, height)
+        self.cache.put(key, scaled, width, height)
+
+        return scaled
+
+    def _mipmap(self, sprite_location, level):
+        """ Return the image for sprite_location halved in size level times."""
+
+        image = self.tile_images[sprite_location]
+        if level == 0:
+            return image
+
+        width, height = image.get_size()
+        width = max(1, width >> level)
+        height = max(1, height >> level)
+
+        key = ("image", sprite_location, width, height)
+        mipmap = self.cache.get(key)
+        if mipmap is None:
+            larger = self._mipmap(sprite_location, level - 1)
+            mipmap = self._scale(larger, width, height)
+            self.cache.put(key, mipmap, width, height)
+
+        return mipmap
+
+    def _layer(self, game_object):
+        if self.animations is not None and game_object.animation in self.animations:
+            return AnimationLayer(game_object.animation)
+
+        return game_object.sprite_location
+
+    @staticmethod
+    def _scale(image, width, height):
+        try:
+            return pygame.transform.smoothscale(image, (width, height))
+        except ValueError:
+            # Smooth scaling only works for 24 and 32 bit images.
+            return pygame.transform.scale(image, (width, height))
@@ -0,0 +1,33 @@
+""" A viewport pairs a camera with the part of the screen its view is drawn on,
+    allowing a game to show several cameras at once (split screen, minimaps, etc.)"""
+from .camera import Camera
+
+
+class Viewport:
+    """ A camera, and the position on the screen its view is drawn at."""
+
+    def __init__(self, camera: Camera, screen_x: int = 0, screen_y: int = 0):
+        """ Args:
+                camera(Camera): The camera whose view is drawn.
+                screen_x(int): The x pixel position of the view's left edge.
+                screen_y(int): The y pixel position of the view's top edge."""
+        self.camera = camera
+        self.screen_x = screen_x
+        self.screen_y = screen_y
+
+        # The camera controller moving this viewport's camera, if any.
+        self.controller = None
+
+    @property
+    def screen_position(self):
+        return self.screen_x, self.screen_y
+
+    @property
+    def width(self):
+        """ The width of the view on the screen in pixels."""
+        return self.camera.visible_columns * self.camera.tile_width
+
+    @property
+    def height(self):
+        """ The height of the view on the screen in pixels."""
+        return self.camera.visible_rows * self.camera.tile_height
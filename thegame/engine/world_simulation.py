@@ -0,0 +1,228 @@
+""" Simulation of the maps the player isn't on, run in worker processes so that a
+    world of many maps can use every core without holding up the frame."""
+import logging
+from multiprocessing import Pool
+
+import numpy
+
+from .map import Map
+
+# The id of an empty tile in the shared tile arrays.
+EMPTY_TILE = -1
+
+# The shared memory each worker process has attached to, keyed by name.
+_attached_memory = {}
+
+
+def _shared_memory():
+    """ Returns:
+            The multiprocessing.shared_memory module. It's only in Python 3.8 and
+            newer, so it's imported when a simulation needs it, rather than with the
+            engine."""
+
+    try:
+        from multiprocessing import shared_memory
+    except ImportError:
+        raise WorldSimulation.SharedMemoryUnavailableException(
+            "Simulating the world needs multiprocessing.shared_memory, which is in"
+            " Python 3.8 and newer."
+        )
+
+    return shared_memory
+
+
+def _simulate_map(memory_name, shape, palette, step, map_name, tick):
+    """ Run one step of a map's simulation in a worker process.
+
+        Returns:
+            The list of (sheet, tile one, tile two) swaps the step made."""
+
+    memory = _attached_memory.get(memory_name)
+    if memory is None:
+        memory = _shared_memory().SharedMemory(name=memory_name)
+        _attached_memory[memory_name] = memory
+
+    tiles = numpy.ndarray(shape, dtype=numpy.int32, buffer=memory.buf)
+
+    # The step only reads the tiles; the main process makes the changes it asks
+    # for, which then reach the shared tiles through the map's tile listener.
+    tiles.flags.writeable = False
+    return step(map_name, tiles, palette, tick)
+
+
+class SimulatedMap:
+    """ A map's tiles in shared memory, and the step of its simulation in flight."""
+
+    def __init__(self, name: str, game_map: Map, palette: dict):
+        self.name = name
+        self.game_map = game_map
+        self.shape = (len(game_map.tile_sheets), game_map.height, game_map.width)
+
+        self.memory = _shared_memory().SharedMemory(
+            create=True, size=max(1, int(numpy.prod(self.shape)) * 4)
+        )
+        self.tiles = numpy.ndarray(
+            self.shape, dtype=numpy.int32, buffer=self.memory.buf
+        )
+
+        self._palette = palette
+        for sheet_index, sheet in enumerate(game_map.tile_sheets):
+            for y, row in enumerate(sheet):
+                for x, tile in enumerate(row):
+                    self.tiles[sheet_index, y, x] = self._tile_id(tile)
+
+        self.pending = None
+        self.pending_version = None
+
+        game_map.register_tile_listener(self.update_tile)
+
+    def update_tile(self, sheet, x, y):
+        """ Copy a changed tile into shared memory. Registered as a tile listener."""
+        self.tiles[sheet, y, x] = self._tile_id(self.game_map.tile_sheets[sheet][y][x])
+
+    def close(self):
+        self.game_map.deregister_tile_listener(self.update_tile)
+
+        # The array has to go before the memory under it can be closed.
+        self.tiles = None
+        self.memory.close()
+        self.memory.unlink()
+
+    def _tile_id(self, tile):
+        if tile is None:
+            return EMPTY_TILE
+
+        tile_id = self._palette.get(tile.sprite_location)
+        if tile_id is None:
+            tile_id = len(self._palette)
+            self._palette[tile.sprite_location] = tile_id
+
+        return tile_id
+
+
+class WorldSimulation:
+    """ Keeps every registered map other than the active one simulating in a pool
+        of worker processes.
+
+        Each map's tiles are kept in shared memory as arrays of tile ids (see
+        palette), so a step of a map's simulation never has to send the map to a
+        worker. The step sends back only the swaps it wants to make, and those are
+        made on the map in the main process the next time update() finds the step
+        finished. update() never waits for a worker, so the frame isn't held up.
+
+        The step is any picklable callable (ie a function at the top level of a
+        module) taking (map_name, tiles, palette, tick), where tiles is a read only
+        (sheet, y, x) array of tile ids, palette is a tuple of the sprite location
+        of each tile id, and tick is the number of steps the map has had. It returns
+        a list of (sheet, (x, y), (x, y)) swaps."""
+
+    class SharedMemoryUnavailableException(Exception):
+        """ Raised when a simulation is made on a Python without
+            multiprocessing.shared_memory (before 3.8.)"""
+
+        pass
+
+    def __init__(self, maps: dict, step, processes: int = None):
+        """ Args:
+                maps(dict): The maps to simulate, keyed by name (ie BaseGame.maps.)
+                step: The simulation step, as above.
+                processes(int): The number of worker processes, None for one per
+                                CPU.
+
+            Raises:
+                SharedMemoryUnavailableException: If this Python doesn't have
+                                                  multiprocessing.shared_memory."""
+
+        # Fail when the simulation is made, not on its first update.
+        _shared_memory()
+
+        self.maps = maps
+        self.step = step
+        self.processes = processes
+
+        # The id of each sprite location in the shared tile arrays.
+        self.palette = {}
+        self.simulated_maps = {}
+        self.ticks = {}
+
+        self._pool = None
+
+        # Counters to see how the simulation is keeping up.
+        self.steps_applied = 0
+        self.steps_discarded = 0
+
+    def start(self):
+        if self._pool is None:
+            self._pool = Pool(processes=self.processes)
+
+    def close(self):
+        """ Stop the workers and free the shared memory."""
+
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+
+        for simulated_map in self.simulated_maps.values():
+            simulated_map.close()
+        self.simulated_maps.clear()
+
+    def update(self, active_map=None):
+        """ Make the changes of any finished steps, and start the next step of every
+            inactive map that isn't already stepping.
+
+            Args:
+                active_map(Map): The map the player is on, which isn't simulated."""
+
+        self.start()
+
+        for name, game_map in self.maps.items():
+            simulated_map = self.simulated_maps.get(name)
+            if simulated_map is None:
+                simulated_map = SimulatedMap(name, game_map, self.palette)
+                self.simulated_maps[name] = simulated_map
+
+            if simulated_map.pending is not None:
+                if not simulated_map.pending.ready():
+                    continue
+
+                self._apply(simulated_map, game_map is not active_map)
+
+            if game_map is not active_map:
+                self._submit(simulated_map)
+
+    def _submit(self, simulated_map):
+        tick = self.ticks.get(simulated_map.name, 0)
+        self.ticks[simulated_map.name] = tick + 1
+
+        simulated_map.pending_version = simulated_map.game_map.version
+        simulated_map.pending = self._pool.apply_async(
+            _simulate_map,
+            (
+                simulated_map.memory.name,
+                simulated_map.shape,
+                tuple(self.palette),
+                self.step,
+                simulated_map.name,
+                tick,
+            ),
+        )
+
+    def _apply(self, simulated_map, still_inactive):
+        """ Make the swaps of a finished step, unless the map has changed some other
+            way since the step started (or has become the active map.)"""
+
+        swaps = simulated_map.pending.get()
+        simulated_map.pending = None
+
+        if not still_inactive or (
+            simulated_map.game_map.version != simulated_map.pending_version
+        ):
+            logging.debug(f"Discarding a stale step of {simulated_map.name}.")
+            self.steps_discarded += 1
+            return
+
+        for sheet, tile_one, tile_two in swaps:
+            simulated_map.game_map.swap(tuple(tile_one), tuple(tile_two), sheet)
+
+        self.steps_applied += 1
@@ -0,0 +1 @@
+""" Command line tools for making games, run as `python -m thegame.tools`."""
@@ -0,0 +1,108 @@
+""" The command line tools for making games with thegame:
+
+    python -m thegame.tools compile SOURCE... -o OUTPUT
+        Compile maps (files, or directories of them) into OUTPUT.
+    python -m thegame.tools validate SOURCE...
+        Check maps without compiling them.
+    python -m thegame.tools startup [MODULE]
+        Time a cold import of MODULE, module by module."""
+import argparse
+import sys
+import time
+
+from thegame.engine import startup
+from thegame.tools.compiler import compile_all
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="python -m thegame.tools", description="Tools for making games."
+    )
+    # Set after the fact, as add_subparsers() only takes required from 3.7 on.
+    commands = parser.add_subparsers(dest="command")
+    commands.required = True
+
+    for name, help_text in (
+        ("compile", "Compile maps into the compiled map format."),
+        ("validate", "Check maps without compiling them."),
+    ):
+        command = commands.add_parser(name, help=help_text)
+        command.add_argument(
+            "sources", nargs="+", help="Map files, or directories of map files."
+        )
+        command.add_argument(
+            "-r",
+            "--resources",
+            default=None,
+            help="The directory sprite locations are relative to, to check that"
+            " every sprite exists.",
+        )
+        command.add_argument(
+            "-j",
+            "--jobs",
+            type=int,
+            default=None,
+            help="The number of processes to use. Defaults to one per core.",
+        )
+
+        if name == "compile":
+            command.add_argument(
+                "-o", "--output", required=True, help="Where to write the maps."
+            )
+            command.add_argument(
+                "-f",
+                "--force",
+                action="store_true",
+                help="Compile maps even if they are up to date.",
+            )
+
+    command = commands.add_parser("startup", help="Time importing a module.")
+    command.add_argument("module", nargs="?", default="thegame.engine")
+
+    return parser
+
+
+def main(arguments=None):
+    """ Run the tool named by arguments (sys.argv by default.)
+
+        Returns:
+            The exit status: 0 if nothing went wrong, otherwise 1."""
+
+    arguments = build_parser().parse_args(arguments)
+
+    if arguments.command == "startup":
+        print(startup.format_report(startup.report(arguments.module)))
+        return 0
+
+    started = time.perf_counter()
+    results = compile_all(
+        arguments.sources,
+        output_directory=getattr(arguments, "output", None),
+        resource_root=arguments.resources,
+        force=getattr(arguments, "force", False),
+        processes=arguments.jobs,
+    )
+
+    failed = 0
+    for result in results:
+        if result.problems:
+            failed += 1
+            for problem in result.problems:
+                print(f"error: {problem}", file=sys.stderr)
+        elif result.skipped:
+            print(f"up to date: {result.source}")
+        elif result.output is not None:
+            print(f"compiled: {result.source} -> {result.output}")
+        else:
+            print(f"ok: {result.source}")
+
+    print(
+        f"{len(results)} maps, {failed} with problems, in"
+        f" {time.perf_counter() - started:.2f}s."
+    )
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
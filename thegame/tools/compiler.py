@@ -0,0 +1,183 @@
+""" Checking and compiling map sources (see map_sources) into compiled maps, with
+    the maps shared out over every core."""
+import functools
+import logging
+import os
+from collections import namedtuple
+from multiprocessing import Pool
+
+from thegame.engine.compiled_map import (
+    COMPILED_MAP_EXTENSION,
+    PLAYER_KIND,
+    CompiledMap,
+)
+
+from .map_sources import LAYERS, MapSource, csv_layer_files, find_sources
+
+# What happened to a map: its compiled file (None if it wasn't written), the
+# problems found with it, and whether it was skipped as already up to date.
+CompileResult = namedtuple("CompileResult", ["source", "output", "problems", "skipped"])
+
+
+def validate(source: MapSource, resource_root: str = None):
+    """ Look for problems with a map which it can be read in spite of.
+
+        Args:
+            source(MapSource): The map to check.
+            resource_root(str): The directory sprite locations are relative to,
+                                to check that every sprite exists. Not checked if
+                                None.
+
+        Returns:
+            A list of the problems found, as messages."""
+
+    problems = []
+    foreground = source.layers[LAYERS.index("foreground")]
+    sprites = set()
+    for layer, rows in zip(LAYERS, source.layers):
+        for y, row in enumerate(rows):
+            for x, tile in enumerate(row):
+                if tile is None:
+                    continue
+
+                kind, location = tile
+                sprites.add(location)
+                if kind == PLAYER_KIND and layer != "character":
+                    problems.append(
+                        f"{source.name}: The player at {x},{y} is on the {layer}"
+                        " layer rather than the character layer."
+                    )
+                elif kind == PLAYER_KIND and foreground[y][x] is not None:
+                    problems.append(
+                        f"{source.name}: The player at {x},{y} is under a"
+                        " foreground tile, so can't move."
+                    )
+
+    if resource_root is not None:
+        for location in sorted(sprites):
+            if not os.path.isfile(os.path.join(resource_root, location)):
+                problems.append(f"{source.name}: The sprite {location} doesn't exist.")
+
+    return problems
+
+
+def compile_source(
+    path: str,
+    output_directory: str = None,
+    resource_root: str = None,
+    force: bool = False,
+):
+    """ Read, check and compile one map.
+
+        Args:
+            path(str): A file of the map. See MapSource.read().
+            output_directory(str): Where to write the compiled map, named after
+                                   the map. If None, the map is only checked.
+            resource_root(str): See validate().
+            force(bool): If True, compile the map even if its compiled file is
+                         newer than its sources.
+
+        Returns:
+            A CompileResult."""
+
+    try:
+        source_paths = [path]
+        if path.endswith(".csv"):
+            source_paths = list(csv_layer_files(path).values())
+
+        output = None
+        if output_directory is not None:
+            output = os.path.join(output_directory, _compiled_name(path))
+            if not force and _up_to_date(output, source_paths):
+                return CompileResult(path, output, [], True)
+
+        source = MapSource.read(path)
+    except (MapSource.InvalidMapSourceException, OSError, ValueError) as e:
+        return CompileResult(path, None, [str(e)], False)
+
+    problems = validate(source, resource_root)
+    if problems or output is None:
+        return CompileResult(path, None, problems, False)
+
+    CompiledMap.compile(source.layers).write(output)
+    logging.info(f"Compiled {path} to {output}.")
+
+    return CompileResult(path, output, [], False)
+
+
+def compile_all(
+    paths,
+    output_directory: str = None,
+    resource_root: str = None,
+    force: bool = False,
+    processes: int = None,
+):
+    """ Compile (or only check, without an output_directory) every map in paths,
+        in parallel.
+
+        Args:
+            paths(list): Map files, and directories to find map files in.
+            output_directory(str): See compile_source().
+            resource_root(str): See validate().
+            force(bool): See compile_source().
+            processes(int): The number of worker processes, by default one per
+                            core. With 1 the maps are compiled in this process.
+
+        Returns:
+            A list of the CompileResult of each map, in the order found."""
+
+    sources = [source for path in paths for source in find_sources(path)]
+
+    # Maps compile to files named after them, so two maps can't share a name.
+    results = {}
+    names = {}
+    for source in sources:
+        name = _compiled_name(source)
+        if name in names:
+            results[source] = CompileResult(
+                source,
+                None,
+                [f"{source} has the same name as {names[name]}."],
+                False,
+            )
+        else:
+            names[name] = source
+
+    if output_directory is not None:
+        os.makedirs(output_directory, exist_ok=True)
+
+    compile_one = functools.partial(
+        compile_source,
+        output_directory=output_directory,
+        resource_root=resource_root,
+        force=force,
+    )
+    to_compile = [source for source in sources if source not in results]
+    if processes == 1 or len(to_compile) < 2:
+        compiled = map(compile_one, to_compile)
+    else:
+        with Pool(processes) as pool:
+            compiled = pool.map(compile_one, to_compile)
+
+    for result in compiled:
+        results[result.source] = result
+
+    return [results[source] for source in sources]
+
+
+def _compiled_name(path: str):
+    file_name = os.path.basename(path)
+    stem = os.path.splitext(file_name)[0]
+    if file_name.endswith(".csv"):
+        stem = stem.rpartition(".")[0] or stem
+
+    return stem + COMPILED_MAP_EXTENSION
+
+
+def _up_to_date(output: str, source_paths):
+    try:
+        compiled_time = os.path.getmtime(output)
+    except OSError:
+        return False
+
+    return all(os.path.getmtime(path) <= compiled_time for path in source_paths)
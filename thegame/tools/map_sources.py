@@ -0,0 +1,320 @@
+""" Reading the files maps are written in, for the compiler.
+
+    A map's tiles are written as [player:]sprite location, where the player:
+    prefix makes the tile a PlayerCharacter rather than a plain GameObject. The
+    layers are named after the sheets they fill: foreground, character, path and
+    background. A layer not given is empty. Three formats are read:
+
+    Text (.txt), with a legend of one character symbols, and a section of rows of
+    symbols for each layer. A "." is an empty tile, and "#" starts a comment line:
+        [legend]
+        w = thegame/resources/TestBoxOne.png
+        @ = player:thegame/resources/PC.png
+        [foreground]
+        w..w
+        [character]
+        .@..
+
+    CSV, as one file per layer named <map>.<layer>.csv, with a tile or nothing in
+    each cell.
+
+    TMX, as saved by the Tiled editor, with CSV encoded layers and an embedded
+    tileset of images. A tile whose type (or class) is "player" is a
+    PlayerCharacter. Flipped and rotated tiles can't be compiled."""
+import csv
+import os
+import xml.etree.ElementTree as ElementTree
+
+from thegame.engine.compiled_map import PLAYER_KIND, TILE_KIND
+
+LAYERS = ("foreground", "character", "path", "background")
+
+PLAYER_PREFIX = "player:"
+
+# The bits of a TMX tile id Tiled sets for a tile flipped horizontally,
+# vertically or diagonally (rotated.)
+TMX_FLIP_FLAGS = 0xE0000000
+
+EMPTY_SYMBOL = "."
+COMMENT_SYMBOL = "#"
+
+
+def parse_tile(text: str):
+    """ Returns:
+            The (kind, sprite location) written as text, or None if it is blank."""
+
+    text = text.strip()
+    if not text:
+        return None
+
+    if text.startswith(PLAYER_PREFIX):
+        return (PLAYER_KIND, text[len(PLAYER_PREFIX) :].strip())
+
+    return (TILE_KIND, text)
+
+
+class MapSource:
+    """ A map as read from its source files, before it is compiled."""
+
+    class InvalidMapSourceException(Exception):
+        pass
+
+    def __init__(self, name: str, paths: list, layers: dict):
+        """ Args:
+                name(str): The map's name, which its compiled file is named for.
+                paths(list): The files the map was read from.
+                layers(dict): The rows of tiles (see parse_tile()) of each layer
+                              given."""
+        self.name = name
+        self.paths = list(paths)
+
+        sizes = {
+            (len(rows[0]) if rows else 0, len(rows))
+            for rows in layers.values()
+        }
+        if len(sizes) > 1:
+            raise self.InvalidMapSourceException(
+                f"The layers of {name} aren't all the same size: "
+                + ", ".join(
+                    f"{layer} is {len(rows[0]) if rows else 0}x{len(rows)}"
+                    for layer, rows in layers.items()
+                )
+            )
+        if not sizes or (0, 0) in sizes:
+            raise self.InvalidMapSourceException(f"{name} has no tiles.")
+
+        (self.width, self.height) = sizes.pop()
+        for layer, rows in layers.items():
+            for y, row in enumerate(rows):
+                if len(row) != self.width:
+                    raise self.InvalidMapSourceException(
+                        f"Row {y} of {name}'s {layer} layer is {len(row)} tiles"
+                        f" long, not {self.width}."
+                    )
+
+        empty_rows = [[None] * self.width for _ in range(self.height)]
+        self.layers = [layers.get(layer, empty_rows) for layer in LAYERS]
+
+    @classmethod
+    def read(cls, path: str):
+        """ Read the map at path, which is a .txt or .tmx file, or one of a map's
+            .csv layer files."""
+
+        if path.endswith(".txt"):
+            return cls.from_text(path)
+        elif path.endswith(".tmx"):
+            return cls.from_tmx(path)
+        elif path.endswith(".csv"):
+            return cls.from_csv(csv_layer_files(path))
+
+        raise cls.InvalidMapSourceException(f"Don't know how to read {path}.")
+
+    @classmethod
+    def from_text(cls, path: str):
+        with open(path, encoding="utf-8") as source:
+            lines = source.read().splitlines()
+
+        legend = {EMPTY_SYMBOL: None}
+        layers = {}
+        section = None
+        for line_number, line in enumerate(lines, start=1):
+            if not line.strip() or line.startswith(COMMENT_SYMBOL):
+                continue
+
+            stripped = line.strip()
+            if stripped.startswith("[") and stripped.endswith("]"):
+                section = stripped[1:-1].strip().lower()
+                if section != "legend" and section not in LAYERS:
+                    raise cls.InvalidMapSourceException(
+                        f"{path}:{line_number}: Unknown section [{section}]."
+                    )
+                if section in layers:
+                    raise cls.InvalidMapSourceException(
+                        f"{path}:{line_number}: [{section}] is given twice."
+                    )
+                if section != "legend":
+                    layers[section] = []
+                continue
+
+            if section is None:
+                raise cls.InvalidMapSourceException(
+                    f"{path}:{line_number}: Tiles given before any [section]."
+                )
+
+            if section == "legend":
+                symbol, equals, tile = line.partition("=")
+                symbol = symbol.strip()
+                if not equals or len(symbol) != 1:
+                    raise cls.InvalidMapSourceException(
+                        f"{path}:{line_number}: Legend lines should be"
+                        f" '<symbol> = [player:]<sprite>', not '{line}'."
+                    )
+                legend[symbol] = parse_tile(tile)
+                continue
+
+            row = []
+            for column, symbol in enumerate(line.rstrip()):
+                if symbol not in legend:
+                    raise cls.InvalidMapSourceException(
+                        f"{path}:{line_number}:{column + 1}: '{symbol}' isn't in"
+                        " the legend."
+                    )
+                row.append(legend[symbol])
+            layers[section].append(row)
+
+        return cls(_map_name(path), [path], layers)
+
+    @classmethod
+    def from_csv(cls, layer_files: dict):
+        """ Args:
+                layer_files(dict): The path of the file of each layer given."""
+
+        layers = {}
+        for layer, path in layer_files.items():
+            with open(path, newline="", encoding="utf-8") as source:
+                layers[layer] = [
+                    [parse_tile(cell) for cell in row]
+                    for row in csv.reader(source)
+                    if row
+                ]
+
+        path = next(iter(layer_files.values()))
+        return cls(_map_name(path), list(layer_files.values()), layers)
+
+    @classmethod
+    def from_tmx(cls, path: str):
+        try:
+            root = ElementTree.parse(path).getroot()
+        except ElementTree.ParseError as e:
+            raise cls.InvalidMapSourceException(f"{path} isn't valid XML: {e}")
+
+        directory = os.path.dirname(path)
+        tiles = {0: None}
+        for tileset in root.iter("tileset"):
+            if "source" in tileset.attrib:
+                raise cls.InvalidMapSourceException(
+                    f"{path} uses the external tileset {tileset.get('source')}."
+                    " Embed it in the map to compile it."
+                )
+
+            first_id = int(tileset.get("firstgid", 1))
+            for tile in tileset.iter("tile"):
+                image = tile.find("image")
+                if image is None:
+                    continue
+
+                kind = TILE_KIND
+                if (tile.get("type") or tile.get("class")) == "player":
+                    kind = PLAYER_KIND
+
+                location = os.path.normpath(
+                    os.path.join(directory, image.get("source"))
+                )
+                tiles[first_id + int(tile.get("id"))] = (kind, location)
+
+        layers = {}
+        for layer in root.iter("layer"):
+            name = layer.get("name", "").lower()
+            if name not in LAYERS:
+                raise cls.InvalidMapSourceException(
+                    f"{path} has a layer named '{name}', which isn't one of"
+                    f" {', '.join(LAYERS)}."
+                )
+
+            data = layer.find("data")
+            if data is None or data.get("encoding") != "csv":
+                raise cls.InvalidMapSourceException(
+                    f"The {name} layer of {path} isn't CSV encoded."
+                )
+
+            width = int(layer.get("width"))
+            ids = [int(tile_id) for tile_id in data.text.replace("\n", "").split(",")]
+
+            # Tiles are always drawn as their sprite is, so a flipped tile would
+            # come out wrong.
+            flipped = [
+                index for index, tile_id in enumerate(ids) if tile_id & TMX_FLIP_FLAGS
+            ]
+            if flipped:
+                raise cls.InvalidMapSourceException(
+                    f"The {name} layer of {path} has {len(flipped)} flipped or"
+                    f" rotated tiles (the first at {flipped[0] % width},"
+                    f"{flipped[0] // width}), which can't be compiled. Give them"
+                    " sprites of their own instead."
+                )
+
+            unknown = set(ids) - set(tiles)
+            if unknown:
+                raise cls.InvalidMapSourceException(
+                    f"The {name} layer of {path} uses tile ids {sorted(unknown)},"
+                    " which aren't in its tilesets."
+                )
+
+            layers[name] = [
+                [tiles[tile_id] for tile_id in ids[start : start + width]]
+                for start in range(0, len(ids), width)
+            ]
+
+        return cls(_map_name(path), [path], layers)
+
+
+def csv_layer_files(path: str):
+    """ Returns:
+            The path of each of the layer files of the map path is a layer file
+            of, keyed by layer."""
+
+    directory, file_name = os.path.split(path)
+    name, layer, extension = _split_csv_name(file_name)
+    if layer is None:
+        raise MapSource.InvalidMapSourceException(
+            f"CSV layer files should be named <map>.<layer>.csv, not {file_name}."
+        )
+
+    layer_files = {}
+    for layer in LAYERS:
+        layer_path = os.path.join(directory, f"{name}.{layer}{extension}")
+        if os.path.exists(layer_path):
+            layer_files[layer] = layer_path
+
+    return layer_files
+
+
+def find_sources(path: str):
+    """ Returns:
+            The path of one file of each map in path (a map file, or a directory
+            searched recursively), so each map is only read once."""
+
+    if not os.path.isdir(path):
+        return [path]
+
+    sources = []
+    for directory, directories, file_names in os.walk(path):
+        directories.sort()
+        csv_maps = set()
+        for file_name in sorted(file_names):
+            if file_name.endswith((".txt", ".tmx")):
+                sources.append(os.path.join(directory, file_name))
+            elif file_name.endswith(".csv"):
+                name, layer, _ = _split_csv_name(file_name)
+                if layer is not None and name not in csv_maps:
+                    csv_maps.add(name)
+                    sources.append(os.path.join(directory, file_name))
+
+    return sources
+
+
+def _split_csv_name(file_name: str):
+    stem, extension = os.path.splitext(file_name)
+    name, _, layer = stem.rpartition(".")
+    if not name or layer not in LAYERS:
+        return stem, None, extension
+
+    return name, layer, extension
+
+
+def _map_name(path: str):
+    file_name = os.path.basename(path)
+    if file_name.endswith(".csv"):
+        return _split_csv_name(file_name)[0]
+
+    return os.path.splitext(file_name)[0]